@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Адаптивный планировщик матрицы документ × промт с ранней остановкой
+Матрица прогоняется раундами: в каждом раунде активная ячейка (тип документа ×
+промт × формат) получает еще один документ. По каждой ячейке ведутся
+доверительные интервалы доли успехов (Вильсон), средней оценки и средней
+задержки (t-интервал); ячейка перестает получать запросы, как только все
+интервалы уже целевых. Бюджет запросов в раунде достается сначала ячейкам
+с самыми широкими интервалами. Цели по умолчанию достижимы на сокращенной выборке
+(по 5 документов на тип): при одних успехах интервал доли успехов сужается до ±0.25
+за 4 документа
+"""
+
+import math
+from dataclasses import dataclass, field
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+# Квантили t-распределения 0.975 по числу степеней свободы; между ключами берется меньший ключ
+T_QUANTILES_975 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306,
+                   9: 2.262, 10: 2.228, 12: 2.179, 15: 2.131, 20: 2.086, 25: 2.060, 30: 2.042}
+Z_975 = 1.96
+
+DEFAULT_MIN_SAMPLES = 3
+
+
+def t_quantile(degrees_of_freedom: int) -> float:
+    """Квантиль 0.975 t-распределения (консервативно для степеней свободы между ключами таблицы)"""
+    if degrees_of_freedom > max(T_QUANTILES_975):
+        return Z_975
+    return T_QUANTILES_975[max(key for key in T_QUANTILES_975 if key <= degrees_of_freedom)]
+
+
+def wilson_interval(successes: int, trials: int, z: float = Z_975) -> Tuple[float, float]:
+    """95% интервал Вильсона для доли успехов"""
+    if trials == 0:
+        return 0.0, 1.0
+    rate = successes / trials
+    denominator = 1 + z ** 2 / trials
+    center = (rate + z ** 2 / (2 * trials)) / denominator
+    spread = z * math.sqrt(rate * (1 - rate) / trials + z ** 2 / (4 * trials ** 2)) / denominator
+    return max(0.0, center - spread), min(1.0, center + spread)
+
+
+def best_case_trials(target: float, min_samples: int = DEFAULT_MIN_SAMPLES, limit: int = 10000) -> Optional[int]:
+    """Наименьшее число наблюдений, после которого ячейка может остановиться: при одних успехах
+    полуширина интервала Вильсона не больше target; None, если цель недостижима до limit"""
+    for trials in range(max(1, min_samples), limit + 1):
+        low, high = wilson_interval(trials, trials)
+        if (high - low) / 2 <= target:
+            return trials
+    return None
+
+
+def mean_interval(values: List[float]) -> Tuple[Optional[float], float]:
+    """Среднее и полуширина 95% t-интервала; для меньше чем двух значений полуширина бесконечна"""
+    if not values:
+        return None, math.inf
+    mean = sum(values) / len(values)
+    if len(values) < 2:
+        return mean, math.inf
+    variance = sum((value - mean) ** 2 for value in values) / (len(values) - 1)
+    return mean, t_quantile(len(values) - 1) * math.sqrt(variance / len(values))
+
+
+@dataclass
+class StoppingTargets:
+    """Целевые полуширины интервалов: доля успехов и оценка — абсолютные, задержка — доля от среднего"""
+    success: float = 0.25
+    score: float = 0.05
+    latency: float = 0.2
+
+
+@dataclass
+class CellStats:
+    """Накопленные наблюдения одной ячейки матрицы"""
+    trials: int = 0
+    successes: int = 0
+    calls: int = 0
+    scores: List[float] = field(default_factory=list)
+    latencies: List[float] = field(default_factory=list)
+
+    def intervals(self) -> Dict[str, Any]:
+        low, high = wilson_interval(self.successes, self.trials)
+        score, score_half = mean_interval(self.scores)
+        latency, latency_half = mean_interval(self.latencies)
+        return {
+            "success_rate": self.successes / self.trials if self.trials else None,
+            "success_low": low,
+            "success_high": high,
+            "score": score,
+            "score_half_width": score_half,
+            "latency": latency,
+            "latency_half_width": latency_half
+        }
+
+    def widths(self, targets: StoppingTargets) -> Dict[str, float]:
+        """Полуширины интервалов в долях целевых; метрика без наблюдений (нет успехов, нет задержек) не мешает остановке"""
+        intervals = self.intervals()
+        widths = {"success": (intervals["success_high"] - intervals["success_low"]) / 2 / targets.success}
+        if self.scores:
+            widths["score"] = intervals["score_half_width"] / targets.score
+        if self.latencies:
+            latency, half_width = intervals["latency"], intervals["latency_half_width"]
+            if latency > 0:
+                widths["latency"] = half_width / (targets.latency * latency)
+            else:
+                widths["latency"] = 0.0 if half_width == 0 else math.inf
+        return widths
+
+
+class AdaptiveScheduler:
+    """Раунды по ячейкам матрицы с остановкой по ширине доверительных интервалов
+
+    add() регистрирует задачу ячейки, next_round() выдает по задаче каждой активной ячейке
+    (самые неопределенные первыми, в пределах бюджета запросов), record() учитывает результат
+    """
+
+    def __init__(self, targets: Optional[StoppingTargets] = None, min_samples: int = DEFAULT_MIN_SAMPLES,
+                 budget: Optional[int] = None):
+        self.targets = targets or StoppingTargets()
+        self.min_samples = min_samples
+        self.budget = budget
+        self.pending: Dict[Hashable, List[Any]] = {}
+        self.stats: Dict[Hashable, CellStats] = {}
+        self.tasks_total = 0
+        self.rounds = 0
+
+    def add(self, cell: Hashable, task: Any):
+        """Добавляет задачу в очередь ячейки (задачи ячейки выдаются в порядке добавления)"""
+        self.pending.setdefault(cell, []).append(task)
+        self.stats.setdefault(cell, CellStats())
+        self.tasks_total += 1
+
+    def converged(self, cell: Hashable) -> bool:
+        stats = self.stats[cell]
+        if stats.trials < self.min_samples:
+            return False
+        return all(width <= 1 for width in stats.widths(self.targets).values())
+
+    def priority(self, cell: Hashable) -> float:
+        """Наибольшая ширина интервала в долях цели; ячейки без минимума наблюдений — первыми"""
+        stats = self.stats[cell]
+        if stats.trials < self.min_samples:
+            return math.inf
+        return max(stats.widths(self.targets).values())
+
+    def unstoppable_cells(self) -> List[Hashable]:
+        """Ячейки, которые не остановятся раньше исчерпания задач даже при одних успехах"""
+        needed = best_case_trials(self.targets.success, self.min_samples)
+        return [cell for cell, tasks in self.pending.items()
+                if needed is None or self.stats[cell].trials + len(tasks) <= needed]
+
+    @property
+    def calls(self) -> int:
+        return sum(stats.calls for stats in self.stats.values())
+
+    def next_round(self) -> List[Tuple[Hashable, Any]]:
+        """Следующий раунд: (ячейка, задача) для активных ячеек; пустой список — матрица завершена"""
+        active = [cell for cell, tasks in self.pending.items() if tasks and not self.converged(cell)]
+        active.sort(key=self.priority, reverse=True)
+        if self.budget is not None:
+            active = active[:max(0, self.budget - self.calls)]
+        if active:
+            self.rounds += 1
+        return [(cell, self.pending[cell].pop(0)) for cell in active]
+
+    def record(self, cell: Hashable, success: bool, score: Optional[float] = None,
+               latency: Optional[float] = None, calls: int = 1):
+        """Учитывает результат задачи; calls=0 для ответов, полученных без обращения к API"""
+        stats = self.stats[cell]
+        stats.trials += 1
+        stats.successes += int(bool(success))
+        stats.calls += calls
+        if success and score is not None:
+            stats.scores.append(score)
+        if success and latency is not None:
+            stats.latencies.append(latency)
+
+    def status(self, cell: Hashable) -> str:
+        if self.converged(cell):
+            return "converged"
+        if not self.pending[cell]:
+            return "exhausted"
+        return "budget"
+
+    def summary(self) -> Dict[str, Any]:
+        """Итоги: выполнено и сэкономлено задач, состояние и интервалы каждой ячейки"""
+        cells = []
+        for cell, stats in self.stats.items():
+            cells.append({
+                "cell": list(cell) if isinstance(cell, tuple) else cell,
+                "status": self.status(cell),
+                "trials": stats.trials,
+                "skipped": len(self.pending[cell]),
+                **self.intervals_payload(stats)
+            })
+        tasks_run = sum(stats.trials for stats in self.stats.values())
+        return {
+            "targets": {"success": self.targets.success, "score": self.targets.score, "latency": self.targets.latency},
+            "min_samples": self.min_samples,
+            "best_case_trials": best_case_trials(self.targets.success, self.min_samples),
+            "budget": self.budget,
+            "rounds": self.rounds,
+            "tasks_total": self.tasks_total,
+            "tasks_run": tasks_run,
+            "calls": self.calls,
+            "calls_saved": self.tasks_total - tasks_run,
+            "converged_cells": sum(1 for cell in cells if cell["status"] == "converged"),
+            "cells": cells
+        }
+
+    @staticmethod
+    def intervals_payload(stats: CellStats) -> Dict[str, Any]:
+        """Интервалы ячейки для JSON (бесконечная полуширина — None)"""
+        return {key: (None if isinstance(value, float) and math.isinf(value) else value)
+                for key, value in stats.intervals().items()}
+
+
+def print_adaptive_summary(summary: Dict[str, Any]):
+    """Итоги ранней остановки в консоль"""
+    print(f"⏹️ Ранняя остановка: {summary['tasks_run']}/{summary['tasks_total']} тестов за {summary['rounds']} раундов, "
+          f"сэкономлено {summary['calls_saved']} запросов; сошлось ячеек "
+          f"{summary['converged_cells']}/{len(summary['cells'])}")
+
+
+def write_adaptive_report(f, summary: Dict[str, Any]):
+    """Раздел markdown-отчета о ранней остановке"""
+    targets = summary["targets"]
+    budget = summary["budget"] if summary["budget"] is not None else "—"
+    f.write("\n## Ранняя остановка\n\n")
+    f.write(f"- **Цели (полуширина 95% интервала):** успех ±{targets['success']}, оценка ±{targets['score']}, "
+            f"задержка ±{targets['latency']:.0%}\n")
+    f.write(f"- **Минимум наблюдений на ячейку:** {summary['min_samples']}, бюджет запросов: {budget}\n")
+    f.write(f"- **Раундов:** {summary['rounds']}\n")
+    f.write(f"- **Тестов выполнено:** {summary['tasks_run']} из {summary['tasks_total']} (запросов к API {summary['calls']})\n")
+    f.write(f"- **Запросов сэкономлено:** {summary['calls_saved']}\n")
+    f.write("\n| Ячейка | Статус | Тестов | Пропущено | Успех (95% ДИ) | Оценка | Задержка, с |\n"
+            "|--------|--------|--------|-----------|----------------|--------|-------------|\n")
+
+    def mean_text(value, half_width, digits):
+        if value is None:
+            return "-"
+        return f"{value:.{digits}f}" + (f" ± {half_width:.{digits}f}" if half_width is not None else "")
+
+    for cell in summary["cells"]:
+        name = " × ".join(cell["cell"]) if isinstance(cell["cell"], list) else str(cell["cell"])
+        success = (f"{cell['success_rate']:.0%} [{cell['success_low']:.0%}; {cell['success_high']:.0%}]"
+                   if cell["success_rate"] is not None else "-")
+        f.write(f"| {name} | {cell['status']} | {cell['trials']} | {cell['skipped']} | {success} | "
+                f"{mean_text(cell['score'], cell['score_half_width'], 3)} | "
+                f"{mean_text(cell['latency'], cell['latency_half_width'], 2)} |\n")
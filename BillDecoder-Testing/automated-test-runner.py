@@ -4,15 +4,27 @@
 Использует сгенерированные тестовые данные для проверки всех промтов
 """
 
+import argparse
 import json
 import os
 import time
 import requests
 import subprocess
+import uuid
 from typing import Dict, List, Any, Tuple
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 from datetime import datetime
-import statistics
+
+from document_formatter import format_document
+from response_scorer import RESPONSE_SCORER
+from results_analytics import performance_summary, quality_summary, results_frame
+from results_sink import PostgresResultsSink
+from runner_pipeline import (
+    PipelineStage, PreparedDocument, RunnerPipeline, fan_out, load_document, prepare_document,
+    print_pipeline_metrics, stage_map
+)
+from sampling_planner import load_documents, sample_corpus
+from sqlite_store import DEFAULT_SQLITE_PATH, SQLiteResultsStore
 
 @dataclass
 class TestResult:
@@ -35,9 +47,12 @@ class TestResult:
 class PromptTester:
     """Тестер промтов для BillDecoder/LabDecoder"""
     
-    def __init__(self, hathr_config: Dict[str, str]):
+    def __init__(self, hathr_config: Dict[str, str], sink: PostgresResultsSink = None):
         self.hathr_config = hathr_config
+        self.sink = sink
+        self.session_id = str(uuid.uuid4())
         self.test_results: List[TestResult] = []
+        self.pipeline_metrics: List[Dict[str, Any]] = None
         self.prompts = self._load_prompts()
         
     def _load_prompts(self) -> Dict[str, str]:
@@ -209,153 +224,18 @@ Check for:
         except Exception as e:
             return False, f"Exception: {str(e)}", 0.0
     
-    def analyze_response_quality(self, response: str, document_type: str) -> Dict[str, Any]:
-        """Анализирует качество ответа"""
-        metrics = {
-            "has_plain_english": False,
-            "has_financial_breakdown": False,
-            "has_error_detection": False,
-            "has_action_items": False,
-            "uses_formatting": False,
-            "has_disclaimers": False,
-            "confidence_mentioned": False,
-            "medical_advice_avoided": True,
-            "hipaa_compliant": True
-        }
-        
-        response_lower = response.lower()
-        
-        # Check for key elements
-        if "plain english" in response_lower or "simple language" in response_lower:
-            metrics["has_plain_english"] = True
-        
-        if "financial" in response_lower or "cost" in response_lower or "payment" in response_lower or "charge" in response_lower:
-            metrics["has_financial_breakdown"] = True
-        
-        if "error" in response_lower or "❌" in response:
-            metrics["has_error_detection"] = True
-        
-        if "action" in response_lower or "next step" in response_lower or "recommend" in response_lower:
-            metrics["has_action_items"] = True
-        
-        if "✅" in response or "⚠️" in response or "❌" in response:
-            metrics["uses_formatting"] = True
-        
-        if "disclaimer" in response_lower or "not medical advice" in response_lower:
-            metrics["has_disclaimers"] = True
-        
-        if "confidence" in response_lower:
-            metrics["confidence_mentioned"] = True
-        
-        # Check for medical advice
-        medical_advice_indicators = [
-            "you should take",
-            "prescribe",
-            "diagnosis",
-            "you need to"
-        ]
-        
-        for indicator in medical_advice_indicators:
-            if indicator in response_lower:
-                metrics["medical_advice_avoided"] = False
-                break
-        
-        # Check for potential data leaks
-        privacy_indicators = [
-            "ssn", "social security",
-            "phone number",
-            "address"
-        ]
-        
-        for indicator in privacy_indicators:
-            if indicator in response_lower:
-                metrics["hipaa_compliant"] = False
-                break
-        
-        return metrics
-    
-    def calculate_scores(self, response: str, metrics: Dict[str, Any]) -> Tuple[float, float, float]:
-        """Вычисляет оценки качества ответа"""
-        # Оценка точности (0-10)
-        accuracy_score = 0.0
-        if metrics["has_plain_english"]:
-            accuracy_score += 2.0
-        if metrics["has_financial_breakdown"]:
-            accuracy_score += 2.0
-        if metrics["has_error_detection"]:
-            accuracy_score += 2.0
-        if metrics["has_action_items"]:
-            accuracy_score += 2.0
-        if metrics["uses_formatting"]:
-            accuracy_score += 1.0
-        if metrics["confidence_mentioned"]:
-            accuracy_score += 1.0
-        
-        # Оценка ясности (0-10)
-        clarity_score = 0.0
-        if metrics["has_plain_english"]:
-            clarity_score += 3.0
-        if metrics["uses_formatting"]:
-            clarity_score += 2.0
-        if metrics["has_disclaimers"]:
-            clarity_score += 2.0
-        if len(response) > 200:  # Достаточно подробный ответ
-            clarity_score += 2.0
-        if "consult" in response.lower() or "консультация" in response.lower():
-            clarity_score += 1.0
-        
-        # Оценка уверенности (0-10)
-        confidence_score = 5.0  # Базовая оценка
-        if metrics["medical_advice_avoided"]:
-            confidence_score += 2.0
-        if metrics["hipaa_compliant"]:
-            confidence_score += 2.0
-        if metrics["confidence_mentioned"]:
-            confidence_score += 1.0
-        
-        return accuracy_score, clarity_score, confidence_score
-    
-    def test_prompt(self, prompt_name: str, document_data: Dict[str, Any]) -> TestResult:
-        """Тестирует конкретный промт на документе"""
-        test_id = f"{prompt_name}_{document_data['document_type']}_{int(time.time())}"
-        
-        # Определяем сложность документа
-        complexity = "simple"
-        if document_data["document_type"] == "medical_bill":
-            if len(document_data.get("services", [])) > 3:
-                complexity = "complex"
-            elif len(document_data.get("services", [])) > 1:
-                complexity = "medium"
-        elif document_data["document_type"] == "lab_results":
-            if len(document_data.get("lab_values", [])) > 8:
-                complexity = "complex"
-            elif len(document_data.get("lab_values", [])) > 4:
-                complexity = "medium"
-        
-        # Формируем данные документа для промта
-        document_text = self._format_document_for_prompt(document_data)
-        
-        # Вызываем API
-        success, response, response_time = self.call_hathr_api(
-            self.prompts[prompt_name], 
-            document_text
-        )
+    def _score_response(self, prompt_name: str, document: PreparedDocument, success: bool, response: str,
+                        response_time: float) -> TestResult:
+        """Анализирует ответ API и собирает результат теста"""
+        document_data = document.data
+        complexity = document.complexity
+        test_id = str(uuid.uuid4())
         
         # Анализируем результат
         if success:
-            metrics = self.analyze_response_quality(response, document_data["document_type"])
-            accuracy_score, clarity_score, confidence_score = self.calculate_scores(response, metrics)
-            
-            # Извлекаем найденные проблемы
-            issues_found = []
-            if "❌" in response:
-                issues_found.append("definite_errors")
-            if "⚠️" in response:
-                issues_found.append("concerns")
-            if "duplicate" in response.lower() or "дублир" in response.lower():
-                issues_found.append("duplicate_charges")
-            if "overcharge" in response.lower() or "завышен" in response.lower():
-                issues_found.append("overcharges")
+            # Флаги, оценки и найденные проблемы за одно сканирование ответа
+            metrics, (accuracy_score, clarity_score, confidence_score), issues_found = \
+                RESPONSE_SCORER.score_quality(response)
             
             return TestResult(
                 test_id=test_id,
@@ -386,66 +266,18 @@ Check for:
     
     def _format_document_for_prompt(self, document_data: Dict[str, Any]) -> str:
         """Форматирует данные документа для передачи в промт"""
-        if document_data["document_type"] == "medical_bill":
-            result = f"""
-MEDICAL BILL
-
-Provider: {document_data['provider']['name']}
-Patient: {document_data['patient']['name']}
-Service Date: {document_data['service_date']}
-
-Services:
-"""
-            for service in document_data.get("services", []):
-                result += f"""
-Code: {service['code']}
-Description: {service['description']}
-Charge: ${service['charge']}
-"""
-            result += f"""
-Total Charges: ${document_data['financial_summary']['total_charges']}
-Insurance Payment: ${document_data['financial_summary']['insurance_payment']}
-Patient Responsibility: ${document_data['financial_summary']['patient_responsibility']}
-"""
-            return result
-        
-        elif document_data["document_type"] == "lab_results":
-            result = f"""
-LABORATORY RESULTS
-
-Patient: {document_data['patient']['name']}
-Test Date: {document_data['test_date']}
-
-Results:
-"""
-            for value in document_data.get("lab_values", []):
-                status_symbol = "✅" if value["status"] == "normal" else "⚠️" if value["status"] in ["high", "low"] else "❌"
-                result += f"{status_symbol} {value['test_name']}: {value['value']} {value['unit']} (normal: {value['reference_range']})\n"
-            
-            return result
-        
-        elif document_data["document_type"] == "eob":
-            result = f"""
-EOB (EXPLANATION OF BENEFITS)
-
-Insurance Company: {document_data['insurance_company']['name']}
-Patient: {document_data['patient']['name']}
-Service Date: {document_data['service_date']}
-
-Coverage Details:
-"""
-            for service in document_data.get("services", []):
-                status_symbol = "✅" if service["coverage_status"] == "covered" else "❌"
-                result += f"{status_symbol} {service['code']}: ${service['billed_amount']} -> Insurance: ${service['insurance_payment']}, Patient: ${service['patient_responsibility']}\n"
-                if service.get("denial_reason"):
-                    result += f"   Denial Reason: {service['denial_reason']}\n"
-            
-            return result
-        
-        return json.dumps(document_data, ensure_ascii=False, indent=2)
+        return format_document(document_data)
     
-    def run_comprehensive_tests(self, test_data_dir: str = "test-data") -> None:
-        """Runs comprehensive testing of all prompts"""
+    def run_comprehensive_tests(self, test_data_dir: str = "test-data", stratified: bool = False,
+                                sample_budget: int = None, sample_per_stratum: int = 1,
+                                call_workers: int = 1) -> None:
+        """Runs comprehensive testing of all prompts
+
+        With stratified=True documents are picked by the sampling planner (smallest set covering
+        document type × complexity × error type × abnormal flag within sample_budget calls)
+        instead of the first 3 files of each type. Calls run through the load → format → fan-out →
+        call → score → persist pipeline with call_workers parallel API calls
+        """
         print("🚀 Starting comprehensive prompt testing...")
         
         # Define which prompts to test for which document types
@@ -472,30 +304,58 @@ Coverage Details:
         
         # Load test data
         test_files = self._load_test_files(test_data_dir)
+        if stratified:
+            calls_per_document = {doc_type: len(prompts) for doc_type, prompts in test_matrix.items()}
+            plan = sample_corpus(load_documents(test_data_dir), calls_per_document, sample_budget,
+                                 sample_per_stratum, os.path.join(test_data_dir, "ground_truth.json"))
+            test_files = {doc_type: [] for doc_type in test_files}
+            for file_path, document_data in plan["selected"]:
+                test_files.setdefault(document_data["document_type"], []).append(file_path)
+        
+        # Pipeline: each document is parsed and formatted once, then fanned out to its prompts
+        def call(task: Tuple[PreparedDocument, str]) -> Tuple[PreparedDocument, str, Tuple[bool, str, float]]:
+            document, prompt_name = task
+            print(f"📋 Testing: {prompt_name} on {document.document_type} ({document.file_path})")
+            response = self.call_hathr_api(self.prompts[prompt_name], document.text("prompt"))
+            # Small pause between requests
+            time.sleep(1)
+            return document, prompt_name, response
+        
+        def score(called: Tuple[PreparedDocument, str, Tuple[bool, str, float]]) -> TestResult:
+            document, prompt_name, (success, response, response_time) = called
+            result = self._score_response(prompt_name, document, success, response, response_time)
+            if result.success:
+                print(f"   ✅ Success - Time: {result.response_time:.2f}s, Accuracy: {result.accuracy_score:.1f}/10")
+            else:
+                print(f"   ❌ Error: {result.error_message}")
+            return result
         
-        total_tests = 0
-        for doc_type, files in test_files.items():
-            for file_path in files[:3]:  # Test 3 files of each type
-                for prompt_name in test_matrix.get(doc_type, []):
-                    print(f"📋 Testing: {prompt_name} on {doc_type} ({file_path})")
-                    
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        document_data = json.load(f)
-                    
-                    result = self.test_prompt(prompt_name, document_data)
-                    self.test_results.append(result)
-                    total_tests += 1
-                    
-                    if result.success:
-                        print(f"   ✅ Success - Time: {result.response_time:.2f}s, Accuracy: {result.accuracy_score:.1f}/10")
-                    else:
-                        print(f"   ❌ Error: {result.error_message}")
-                    
-                    # Small pause between requests
-                    time.sleep(1)
+        formatters = {"prompt": self._format_document_for_prompt}
+        pipeline = RunnerPipeline([
+            PipelineStage("load", stage_map(lambda item: (item[0], item[1], load_document(item[1])))),
+            PipelineStage("format", stage_map(lambda item: (item[0], prepare_document(item[1], item[2], formatters)))),
+            PipelineStage("fan-out", lambda item: fan_out(item[1], test_matrix.get(item[0], []))),
+            PipelineStage("call", stage_map(call), workers=call_workers),
+            PipelineStage("score", stage_map(score)),
+            PipelineStage("persist", stage_map(self._persist_result))
+        ])
+        started_results = len(self.test_results)
+        self.pipeline_metrics = pipeline.run(
+            (doc_type, file_path)
+            for doc_type, files in test_files.items()
+            for file_path in (files if stratified else files[:3])  # Test 3 files of each type
+        )
+        total_tests = len(self.test_results) - started_results
+        print_pipeline_metrics(self.pipeline_metrics)
         
         print(f"\n📊 Testing completed! Total tests: {total_tests}")
     
+    def _persist_result(self, result: TestResult):
+        """Saves a result to the session (and to the database in batches when a sink is set)"""
+        self.test_results.append(result)
+        if self.sink:
+            self.sink.add(asdict(result), self.session_id, "automated")
+    
     def _load_test_files(self, test_data_dir: str) -> Dict[str, List[str]]:
         """Loads paths to test files"""
         test_files = {
@@ -524,6 +384,7 @@ Coverage Details:
         os.makedirs(os.path.dirname(output_file), exist_ok=True)
         
         # Prepare data for report
+        frame = self._results_frame()
         report_data = {
             "test_summary": {
                 "total_tests": len(self.test_results),
@@ -531,8 +392,9 @@ Coverage Details:
                 "failed_tests": len([r for r in self.test_results if not r.success]),
                 "test_date": datetime.now().isoformat()
             },
-            "performance_metrics": self._calculate_performance_metrics(),
-            "quality_metrics": self._calculate_quality_metrics(),
+            "performance_metrics": self._calculate_performance_metrics(frame),
+            "quality_metrics": self._calculate_quality_metrics(frame),
+            "pipeline_metrics": self.pipeline_metrics,
             "detailed_results": [
                 {
                     "test_id": r.test_id,
@@ -560,54 +422,21 @@ Coverage Details:
         
         print(f"📄 Report saved: {output_file}")
     
-    def _calculate_performance_metrics(self) -> Dict[str, Any]:
+    def _results_frame(self):
+        """Таблица результатов для векторной аналитики"""
+        return results_frame([asdict(r) for r in self.test_results], source="automated")
+    
+    def _calculate_performance_metrics(self, frame=None) -> Dict[str, Any]:
         """Calculates performance metrics"""
-        successful_results = [r for r in self.test_results if r.success]
-        
-        if not successful_results:
+        if not self.test_results:
             return {"error": "No successful tests"}
-        
-        response_times = [r.response_time for r in successful_results]
-        
-        return {
-            "average_response_time": statistics.mean(response_times),
-            "median_response_time": statistics.median(response_times),
-            "min_response_time": min(response_times),
-            "max_response_time": max(response_times),
-            "success_rate": len(successful_results) / len(self.test_results) * 100
-        }
+        return performance_summary(self._results_frame() if frame is None else frame)
     
-    def _calculate_quality_metrics(self) -> Dict[str, Any]:
+    def _calculate_quality_metrics(self, frame=None) -> Dict[str, Any]:
         """Calculates quality metrics"""
-        successful_results = [r for r in self.test_results if r.success and r.accuracy_score is not None]
-        
-        if not successful_results:
+        if not self.test_results:
             return {"error": "No successful tests with scores"}
-        
-        accuracy_scores = [r.accuracy_score for r in successful_results]
-        clarity_scores = [r.clarity_score for r in successful_results]
-        confidence_scores = [r.confidence_score for r in successful_results]
-        
-        return {
-            "accuracy": {
-                "average": statistics.mean(accuracy_scores),
-                "median": statistics.median(accuracy_scores),
-                "min": min(accuracy_scores),
-                "max": max(accuracy_scores)
-            },
-            "clarity": {
-                "average": statistics.mean(clarity_scores),
-                "median": statistics.median(clarity_scores),
-                "min": min(clarity_scores),
-                "max": max(clarity_scores)
-            },
-            "confidence": {
-                "average": statistics.mean(confidence_scores),
-                "median": statistics.median(confidence_scores),
-                "min": min(confidence_scores),
-                "max": max(confidence_scores)
-            }
-        }
+        return quality_summary(self._results_frame() if frame is None else frame)
     
     def _generate_text_report(self, report_data: Dict[str, Any], output_file: str) -> None:
         """Generates text report"""
@@ -666,6 +495,19 @@ Coverage Details:
 
 def main():
     """Main function for running tests"""
+    parser = argparse.ArgumentParser(description="Comprehensive BillDecoder prompt testing")
+    parser.add_argument("--stratified", action="store_true",
+                        help="stratified sample (type × complexity × error × abnormal) instead of 3 files per type")
+    parser.add_argument("--sample-budget", type=int, help="call budget for --stratified")
+    parser.add_argument("--sample-per-stratum", type=int, default=1, help="documents per stratum for --stratified")
+    parser.add_argument("--call-workers", type=int, default=1, help="parallel API calls in the pipeline call stage")
+    parser.add_argument("--db", action="store_true",
+                        help="write results to PostgreSQL (database/init.sql schema) in COPY batches")
+    parser.add_argument("--database-url", help="PostgreSQL connection string (defaults to DATABASE_URL)")
+    parser.add_argument("--sqlite", nargs="?", const=DEFAULT_SQLITE_PATH,
+                        help=f"write results to the embedded SQLite store (defaults to {DEFAULT_SQLITE_PATH})")
+    args = parser.parse_args()
+    
     # Hathr API configuration (from existing scripts)
     hathr_config = {
         "client_id": "your_client_id_here",
@@ -676,7 +518,12 @@ def main():
     }
     
     # Create tester
-    tester = PromptTester(hathr_config)
+    sink = None
+    if args.db:
+        sink = PostgresResultsSink(args.database_url)
+    elif args.sqlite:
+        sink = SQLiteResultsStore(args.sqlite)
+    tester = PromptTester(hathr_config, sink=sink)
     
     # Check for test data
     if not os.path.exists("test-data"):
@@ -686,7 +533,10 @@ def main():
     
     # Run testing
     try:
-        tester.run_comprehensive_tests()
+        tester.run_comprehensive_tests(stratified=args.stratified or args.sample_budget is not None,
+                                       sample_budget=args.sample_budget,
+                                       sample_per_stratum=args.sample_per_stratum,
+                                       call_workers=args.call_workers)
         tester.generate_report()
         
         print("\n🎉 Testing completed successfully!")
@@ -694,6 +544,9 @@ def main():
         
     except Exception as e:
         print(f"❌ Error during testing: {e}")
+    finally:
+        if tester.sink:
+            tester.sink.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Локальная предпроверка документов до обращения к API
+Детерминированные правила: дубли услуг по хэшу строки, пары кодов для завышения
+и дробления панелей из справочника medical_codes, даты услуг относительно дат
+самого счета, сверка указанного итога с суммой строк, референсные интервалы
+анализов, отказы EOB. Неверно посчитанную сумму отдельной строки правила не видят,
+поэтому счета без находок не считаются чистыми и всегда идут в модель. Политика
+решает, каким документам все еще нужна модель; для остальных считаются
+сэкономленные запросы и токены
+"""
+
+import datetime
+import hashlib
+import re
+from collections import Counter
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from medical_codes import BUNDLED_PANELS, service_descriptions, upcoding_pairs
+from token_estimator import TokenEstimator
+
+# Строка счета старше самой поздней даты счета больше чем на столько дней — ошибка даты
+STATEMENT_WINDOW_DAYS = 30
+
+# Типы документов, которые пропускаются без находок. Для счетов отсутствие находок
+# ничего не доказывает: ошибку в сумме строки и дату, сдвинутую вместе с остальными датами
+# счета, правила не отличают от верных
+SKIPPABLE_TYPES = ("lab_results", "eob")
+
+# Допуск при сверке денежных сумм
+AMOUNT_TOLERANCE = 0.01
+
+_RANGE = re.compile(r"^\s*([<>])?\s*(\d+(?:\.\d+)?)\s*(?:-\s*(\d+(?:\.\d+)?))?\s*$")
+
+
+@dataclass
+class PrescreenFinding:
+    """Находка правила предпроверки"""
+    rule: str
+    line: Optional[int]
+    detail: str
+
+
+def _parse_date(value: Any) -> Optional[datetime.date]:
+    if value is None:
+        return None
+    try:
+        return datetime.datetime.strptime(str(value), '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def _has_fractional_cents(amount: float) -> bool:
+    return abs(amount * 100 - round(amount * 100)) > 1e-6
+
+
+def in_reference_range(value: float, reference_range: str) -> Optional[bool]:
+    """Значение в референсном интервале ("70-100", "<200", ">40"); None, если интервал не разобран"""
+    match = _RANGE.match(str(reference_range))
+    if not match:
+        return None
+    comparison, low, high = match.groups()
+    if comparison == "<":
+        return value < float(low)
+    if comparison == ">":
+        return value > float(low)
+    if high is None:
+        return None
+    return float(low) <= value <= float(high)
+
+
+class BillingPrescreen:
+    """Правила предпроверки; таблицы кодов строятся один раз из справочника"""
+
+    def __init__(self, statement_window_days: int = STATEMENT_WINDOW_DAYS):
+        self.statement_window = datetime.timedelta(days=statement_window_days)
+        self.descriptions = service_descriptions()
+        # Завышенный код -> описания исходных кодов, под которыми он встречается при подмене
+        self.upcoded_from: Dict[str, set] = {}
+        for source, target in upcoding_pairs():
+            self.upcoded_from.setdefault(target, set()).update(self.descriptions.get(source, ()))
+        self.panel_components = {panel: frozenset(component["code"] for component in components)
+                                 for panel, components in BUNDLED_PANELS.items()}
+
+    def screen(self, document: Dict[str, Any]) -> List[PrescreenFinding]:
+        """Находки правил для документа; пустой список — документ тривиально чистый"""
+        doc_type = document.get("document_type")
+        if doc_type == "medical_bill":
+            return self._screen_bill(document)
+        if doc_type == "lab_results":
+            return self._screen_lab(document)
+        if doc_type == "eob":
+            return self._screen_eob(document)
+        return [PrescreenFinding("unsupported_document", None, f"нет правил для типа {doc_type}")]
+
+    def _screen_bill(self, bill: Dict[str, Any]) -> List[PrescreenFinding]:
+        findings = []
+        services = bill.get("services", [])
+        service_dates = [_parse_date(service.get("date")) for service in services]
+        # Период счета отсчитывается от его самой поздней даты: выставления, обслуживания или строки
+        bill_dates = [date for date in service_dates + [_parse_date(bill.get("billing_date")),
+                                                         _parse_date(bill.get("service_date"))] if date]
+        period_start = max(bill_dates) - self.statement_window if bill_dates else None
+        seen_lines: Dict[str, int] = {}
+
+        for index, service in enumerate(services):
+            code = service.get("code", "")
+            description = str(service.get("description", "")).lower()
+            charge = float(service.get("charge", 0))
+
+            # Повтор строки: одинаковые код, описание и дата
+            line_hash = hashlib.blake2b(f"{code}\0{description}\0{service.get('date')}".encode("utf-8"),
+                                        digest_size=8).hexdigest()
+            if line_hash in seen_lines:
+                findings.append(PrescreenFinding("duplicate_charge", index,
+                                                 f"{code} повторяет строку {seen_lines[line_hash] + 1}"))
+            else:
+                seen_lines[line_hash] = index
+
+            known = self.descriptions.get(code)
+            if known is None:
+                findings.append(PrescreenFinding("unknown_code", index, f"{code} нет в справочнике"))
+            elif description not in known:
+                if description in self.upcoded_from.get(code, ()):
+                    findings.append(PrescreenFinding("upcoding", index, f"{code} с описанием более простой услуги"))
+                else:
+                    findings.append(PrescreenFinding("description_mismatch", index,
+                                                     f"{code}: описание не совпадает со справочником"))
+
+            if _has_fractional_cents(charge):
+                findings.append(PrescreenFinding("fractional_cents", index, f"{code}: сумма {charge} не в центах"))
+
+            service_date = service_dates[index]
+            if period_start and service_date and service_date < period_start:
+                findings.append(PrescreenFinding("service_date_window", index,
+                                                 f"{code}: дата {service_date} вне периода счета"))
+
+        codes = {service.get("code") for service in services}
+        for panel, components in self.panel_components.items():
+            if components <= codes:
+                findings.append(PrescreenFinding("unbundling", None,
+                                                 f"компоненты панели {panel} выставлены отдельно"))
+
+        summary = bill.get("financial_summary", {})
+        if "total_charges" in summary:
+            line_total = round(sum(float(service.get("charge", 0)) for service in services), 2)
+            if abs(summary["total_charges"] - line_total) > AMOUNT_TOLERANCE:
+                findings.append(PrescreenFinding("total_mismatch", None,
+                                                 f"итог {summary['total_charges']} ≠ сумма строк {line_total}"))
+            paid = summary.get("insurance_payment", 0) + summary.get("patient_responsibility", 0)
+            if abs(paid - summary["total_charges"]) > AMOUNT_TOLERANCE:
+                findings.append(PrescreenFinding("payment_split_mismatch", None,
+                                                 f"оплата {paid:.2f} ≠ итог {summary['total_charges']}"))
+        return findings
+
+    def _screen_lab(self, lab: Dict[str, Any]) -> List[PrescreenFinding]:
+        findings = []
+        for index, value in enumerate(lab.get("lab_values", [])):
+            name = value.get("test_name")
+            if value.get("status") != "normal":
+                findings.append(PrescreenFinding("abnormal_status", index, f"{name}: статус {value.get('status')}"))
+                continue
+            within = in_reference_range(float(value.get("value", 0)), value.get("reference_range", ""))
+            if within is None:
+                findings.append(PrescreenFinding("unparsed_range", index,
+                                                 f"{name}: интервал {value.get('reference_range')} не разобран"))
+            elif not within:
+                findings.append(PrescreenFinding("out_of_range", index,
+                                                 f"{name}: {value.get('value')} вне {value.get('reference_range')}"))
+        return findings
+
+    def _screen_eob(self, eob: Dict[str, Any]) -> List[PrescreenFinding]:
+        findings = []
+        for index, service in enumerate(eob.get("services", [])):
+            code = service.get("code")
+            if service.get("coverage_status") != "covered":
+                findings.append(PrescreenFinding("denied_service", index,
+                                                 f"{code}: {service.get('denial_reason') or service.get('coverage_status')}"))
+            paid = service.get("insurance_payment", 0) + service.get("patient_responsibility", 0)
+            if abs(paid - service.get("billed_amount", 0)) > AMOUNT_TOLERANCE:
+                findings.append(PrescreenFinding("payment_split_mismatch", index,
+                                                 f"{code}: оплата {paid:.2f} ≠ счет {service.get('billed_amount')}"))
+        return findings
+
+
+class PrescreenPolicy:
+    """Какие документы все еще отправляются в модель
+
+    Документ с находками блокирующих правил и документ типа не из skippable_types
+    идут в модель всегда. Чистые документы остальных типов пропускаются, кроме
+    детерминированной контрольной доли (по хэшу пути), чтобы следить, что модель
+    на них действительно ничего не находит
+    """
+
+    def __init__(self, keep_clean_share: float = 0.0, blocking_rules: Optional[Iterable[str]] = None,
+                 skippable_types: Iterable[str] = SKIPPABLE_TYPES):
+        self.keep_clean_share = keep_clean_share
+        self.blocking_rules = set(blocking_rules) if blocking_rules is not None else None
+        self.skippable_types = set(skippable_types)
+
+    def needs_model(self, document_file: str, findings: List[PrescreenFinding],
+                    document_type: Optional[str] = None) -> bool:
+        if document_type not in self.skippable_types:
+            return True
+        if any(self.blocking_rules is None or finding.rule in self.blocking_rules for finding in findings):
+            return True
+        digest = hashlib.blake2b(document_file.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big") / 2 ** 64 < self.keep_clean_share
+
+
+def screen_documents(test_files: List[Tuple[str, Dict[str, Any]]], prescreen: BillingPrescreen,
+                     policy: PrescreenPolicy) -> Tuple[List[Tuple[str, Dict[str, Any]]],
+                                                       List[Tuple[str, Dict[str, Any]]],
+                                                       Dict[str, List[PrescreenFinding]]]:
+    """Делит документы на требующие модели и пропускаемые; возвращает и находки по файлам"""
+    kept, skipped, findings_by_file = [], [], {}
+    for file_path, document_data in test_files:
+        findings = prescreen.screen(document_data)
+        findings_by_file[file_path] = findings
+        needs_model = policy.needs_model(file_path, findings, document_data.get("document_type"))
+        (kept if needs_model else skipped).append((file_path, document_data))
+    return kept, skipped, findings_by_file
+
+
+def prescreen_summary(estimator: TokenEstimator, findings_by_file: Dict[str, List[PrescreenFinding]],
+                      skipped: List[Tuple[str, Dict[str, Any]]],
+                      avoided_calls: List[Tuple[str, str]]) -> Dict[str, Any]:
+    """Сводка предпроверки: документы, находки по правилам, сэкономленные запросы/токены/время
+
+    avoided_calls — (prompt_type, message) запросов, которые не были отправлены
+    """
+    estimates = [estimator.estimate_call(message, prompt_type) for prompt_type, message in avoided_calls]
+    rules = Counter(finding.rule for findings in findings_by_file.values() for finding in findings)
+    clean = sum(1 for findings in findings_by_file.values() if not findings)
+    return {
+        "documents": len(findings_by_file),
+        "clean_documents": clean,
+        "skipped_documents": len(skipped),
+        "skipped_files": [file_path for file_path, _ in skipped],
+        "findings_by_rule": dict(rules.most_common()),
+        "calls_avoided": len(estimates),
+        "input_tokens_avoided": sum(estimate["input_tokens"] for estimate in estimates),
+        "output_tokens_avoided": sum(estimate["output_tokens"] for estimate in estimates),
+        "tokens_avoided": sum(estimate["total_tokens"] for estimate in estimates),
+        "response_time_avoided": sum(estimate["response_time"] for estimate in estimates)
+    }
+
+
+def findings_payload(findings: List[PrescreenFinding]) -> List[Dict[str, Any]]:
+    """Находки в виде словарей для JSON результатов"""
+    return [asdict(finding) for finding in findings]
+
+
+def print_prescreen_summary(summary: Dict[str, Any]):
+    """Итоги предпроверки в консоль"""
+    print(f"🧹 Предпроверка: {summary['documents']} документов, чистых {summary['clean_documents']}, "
+          f"пропущено {summary['skipped_documents']}")
+    print(f"   Сэкономлено: {summary['calls_avoided']} запросов, ~{summary['tokens_avoided']} токенов, "
+          f"~{summary['response_time_avoided']:.0f}с")
+
+
+def write_prescreen_report(f, summary: Dict[str, Any]):
+    """Раздел markdown-отчета о предпроверке"""
+    f.write("\n## Локальная предпроверка\n\n")
+    f.write(f"- **Документов проверено:** {summary['documents']}\n")
+    f.write(f"- **Без находок:** {summary['clean_documents']}\n")
+    f.write(f"- **Пропущено (без модели):** {summary['skipped_documents']}\n")
+    f.write(f"- **Запросов сэкономлено:** {summary['calls_avoided']}\n")
+    f.write(f"- **Токенов сэкономлено (оценка):** {summary['tokens_avoided']} "
+            f"(вход {summary['input_tokens_avoided']}, выход {summary['output_tokens_avoided']})\n")
+    f.write(f"- **Время сэкономлено (оценка):** {summary['response_time_avoided']:.1f}с\n")
+    if summary["findings_by_rule"]:
+        f.write("\n| Правило | Находок |\n|---------|---------|\n")
+        for rule, count in summary["findings_by_rule"].items():
+            f.write(f"| {rule} | {count} |\n")
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк хранилища блобов на сохраненных ответах
+Сравнивает zlib, zstd и zstd со словарем: дедупликацию, степень сжатия,
+скорость записи и задержку чтения без кэша и с кэшем. С --train обучает словарь
+на рабочем хранилище и пересжимает его блобы
+"""
+
+import argparse
+import glob
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import Dict, List
+
+from blob_store import BLOB_FIELDS, DEFAULT_BLOB_PATH, DEFAULT_DICTIONARY_SIZE, BlobStore, load_blob_texts, result_text, zstandard
+
+
+def load_texts(pattern: str) -> List[str]:
+    """Все тексты ответов и промтов сохраненных сессий, с повторами"""
+    texts = []
+    for results_file in sorted(glob.glob(pattern)):
+        with open(results_file, 'r', encoding='utf-8') as f:
+            session = json.load(f)
+        if not isinstance(session, dict) or not isinstance(session.get("results"), list):
+            continue
+        resolved = load_blob_texts(session["results"])
+        texts.extend(text for result in session["results"] for field in BLOB_FIELDS
+                     if (text := result_text(result, field, resolved)))
+    return texts
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run_variant(texts: List[str], codec: str, dictionary: bool, dictionary_size: int, directory: str) -> Dict[str, float]:
+    """Пишет тексты в новое хранилище и читает каждый блоб по одному: без кэша и повторно"""
+    path = os.path.join(directory, f"{codec}{'-dict' if dictionary else ''}.sqlite")
+    store = BlobStore(path, codec=codec, cache_size=len(texts))
+    started = time.perf_counter()
+    keys = store.put_many(texts)
+    write_seconds = time.perf_counter() - started
+    if dictionary:
+        # Словарь обучается на уже записанных ответах, затем блобы пересжимаются с ним
+        store.train_dictionary(dictionary_size)
+        started = time.perf_counter()
+        store.recompress()
+        write_seconds = time.perf_counter() - started
+    stats = store.stats()
+    store.close()
+
+    unique_keys = list(dict.fromkeys(keys))
+    store = BlobStore(path, codec=codec, cache_size=len(unique_keys))
+    cold, warm = [], []
+    for latencies in (cold, warm):
+        for key in unique_keys:
+            started = time.perf_counter()
+            store.get(key)
+            latencies.append((time.perf_counter() - started) * 1000)
+    store.close()
+    return {
+        "blobs": stats["blobs"],
+        "raw_bytes": stats["raw_bytes"],
+        "stored_bytes": stats["stored_bytes"],
+        "ratio": stats["compression_ratio"],
+        "write_mb_s": stats["raw_bytes"] / 1024 / 1024 / write_seconds if write_seconds else 0.0,
+        "cold_p50": statistics.median(cold),
+        "cold_p99": percentile(cold, 0.99),
+        "warm_p50": statistics.median(warm),
+        "warm_p99": percentile(warm, 0.99)
+    }
+
+
+def train_store(path: str, dictionary_size: int):
+    """Обучает словарь на блобах рабочего хранилища и пересжимает их"""
+    with BlobStore(path, codec="zstd") as store:
+        before = store.stats()
+        try:
+            dictionary_id = store.train_dictionary(dictionary_size)
+        except zstandard.ZstdError as e:
+            print(f"❌ Словарь не обучен ({e}): мало сохраненных ответов для словаря {dictionary_size} байт")
+            return
+        recompressed = store.recompress()
+        after = store.stats()
+    print(f"📚 Словарь {dictionary_id}: пересжато блобов {recompressed}, "
+          f"{before['stored_bytes'] / 1024:.1f} КБ -> {after['stored_bytes'] / 1024:.1f} КБ "
+          f"(сжатие {after['compression_ratio']:.2f}x, словарь учтен)")
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description="Бенчмарк хранилища блобов на сохраненных ответах")
+    parser.add_argument("--results", default="test-results/*_test_*.json", help="шаблон файлов с результатами")
+    parser.add_argument("--dictionary-size", type=int, default=DEFAULT_DICTIONARY_SIZE, help="размер словаря zstd, байт")
+    parser.add_argument("--train", nargs="?", const=DEFAULT_BLOB_PATH,
+                        help=f"обучить словарь на рабочем хранилище и пересжать его (по умолчанию {DEFAULT_BLOB_PATH})")
+    args = parser.parse_args()
+
+    if args.train:
+        if zstandard is None:
+            print("❌ zstandard не установлен: pip install zstandard")
+            return
+        train_store(args.train, args.dictionary_size)
+        return
+
+    texts = load_texts(args.results)
+    if not texts:
+        print(f"❌ Ответы не найдены по шаблону {args.results}! Запустите сначала тестирование")
+        return
+
+    inline_bytes = sum(len(json.dumps(text, ensure_ascii=False).encode("utf-8")) for text in texts)
+    variants = [("zlib", False)]
+    if zstandard is not None:
+        variants += [("zstd", False), ("zstd", True)]
+    else:
+        print("⚠️ zstandard не установлен: сравнивается только zlib (pip install zstandard)")
+
+    print(f"🚀 Бенчмарк блобов: {len(texts)} текстов, {inline_bytes / 1024:.1f} КБ в JSON-файлах\n")
+    print("| Кодек | Блобов | Дедупликация | Сжатие | Итого к JSON | Запись, МБ/с | Чтение p50/p99, мс | С кэшем p50/p99, мс |")
+    print("|-------|--------|--------------|--------|--------------|--------------|--------------------|---------------------|")
+    # Словарь не обучается на слишком малом корпусе — вариант пропускается
+    training_errors = (zstandard.ZstdError,) if zstandard is not None else ()
+    with tempfile.TemporaryDirectory() as directory:
+        for codec, dictionary in variants:
+            try:
+                stats = run_variant(texts, codec, dictionary, args.dictionary_size, directory)
+            except training_errors as e:
+                print(f"| {codec}+словарь | ⚠️ {e} |")
+                continue
+            print(f"| {codec}{'+словарь' if dictionary else ''} | {stats['blobs']} "
+                  f"| {len(texts) / stats['blobs']:.2f}x | {stats['ratio']:.2f}x "
+                  f"| {inline_bytes / stats['stored_bytes']:.2f}x | {stats['write_mb_s']:.1f} "
+                  f"| {stats['cold_p50']:.3f} / {stats['cold_p99']:.3f} "
+                  f"| {stats['warm_p50']:.4f} / {stats['warm_p99']:.4f} |")
+
+
+if __name__ == "__main__":
+    main()
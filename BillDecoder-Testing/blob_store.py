@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Хранилище текстов ответов и промтов по содержимому
+Текст сохраняется один раз под SHA-256 хэшем своего содержимого, сжатый zstd
+(с обученным словарем, если он есть) или zlib без пакета zstandard. Результаты
+хранят вместо текста хэш (<поле>_blob), загрузчики подставляют текст только
+когда он нужен. Блобы лежат в одном файле SQLite
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_BLOB_PATH = "test-results/blobs.sqlite"
+
+# Поля результатов, которые выносятся в хранилище
+BLOB_FIELDS = ("response_text", "prompt_text", "raw_response")
+
+DEFAULT_ZSTD_LEVEL = 9
+DEFAULT_DICTIONARY_SIZE = 16 * 1024
+DEFAULT_CACHE_SIZE = 1024
+
+_IN_CHUNK = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    codec TEXT NOT NULL,
+    dictionary_id INTEGER,
+    raw_size INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS dictionaries (
+    id INTEGER PRIMARY KEY,
+    data BLOB NOT NULL,
+    samples INTEGER NOT NULL,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+
+def blob_hash(text: str) -> str:
+    """Адрес блоба: SHA-256 текста в UTF-8"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def blob_key(field: str) -> str:
+    return f"{field}_blob"
+
+
+class BlobStore:
+    """Блобы текстов по хэшу содержимого
+
+    put()/put_many() сжимают и сохраняют только новые тексты; get()/get_many() распаковывают
+    с LRU-кэшем. codec="zstd" требует пакета zstandard; по умолчанию zstd, если он установлен,
+    иначе zlib. Новые блобы сжимаются последним обученным словарем (train_dictionary)
+    """
+
+    def __init__(self, path: str = DEFAULT_BLOB_PATH, codec: Optional[str] = None, level: int = DEFAULT_ZSTD_LEVEL,
+                 use_dictionary: bool = True, cache_size: int = DEFAULT_CACHE_SIZE):
+        if codec is None:
+            codec = "zstd" if zstandard is not None else "zlib"
+        if codec == "zstd" and zstandard is None:
+            raise RuntimeError("zstandard не установлен: pip install zstandard")
+        if codec not in ("zstd", "zlib"):
+            raise ValueError(f"Неизвестный кодек: {codec}")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.codec = codec
+        self.level = level
+        self.cache_size = cache_size
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._dictionaries: Dict[int, Any] = {}
+        self._decompressors: Dict[Optional[int], Any] = {}
+        self.dictionary_id = None
+        if codec == "zstd" and use_dictionary:
+            row = self.conn.execute("SELECT MAX(id) FROM dictionaries").fetchone()
+            self.dictionary_id = row[0]
+        self._compressor = self._make_compressor()
+
+    def _dictionary(self, dictionary_id: int):
+        if dictionary_id not in self._dictionaries:
+            row = self.conn.execute("SELECT data FROM dictionaries WHERE id = ?", (dictionary_id,)).fetchone()
+            if row is None:
+                raise KeyError(f"Словарь {dictionary_id} не найден")
+            self._dictionaries[dictionary_id] = zstandard.ZstdCompressionDict(row[0])
+        return self._dictionaries[dictionary_id]
+
+    def _make_compressor(self):
+        if self.codec != "zstd":
+            return None
+        if self.dictionary_id is None:
+            return zstandard.ZstdCompressor(level=self.level)
+        return zstandard.ZstdCompressor(level=self.level, dict_data=self._dictionary(self.dictionary_id))
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.codec == "zstd":
+            return self._compressor.compress(data)
+        return zlib.compress(data, 9)
+
+    def _decompress(self, codec: str, dictionary_id: Optional[int], data: bytes) -> bytes:
+        if codec == "zlib":
+            return zlib.decompress(data)
+        if zstandard is None:
+            raise RuntimeError("Блоб сжат zstd, а zstandard не установлен: pip install zstandard")
+        if dictionary_id not in self._decompressors:
+            self._decompressors[dictionary_id] = (
+                zstandard.ZstdDecompressor() if dictionary_id is None
+                else zstandard.ZstdDecompressor(dict_data=self._dictionary(dictionary_id))
+            )
+        return self._decompressors[dictionary_id].decompress(data)
+
+    def _remember(self, key: str, text: str):
+        self._cache[key] = text
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def put(self, text: str) -> str:
+        return self.put_many([text])[0]
+
+    def put_many(self, texts: List[str]) -> List[str]:
+        """Сохраняет тексты одной транзакцией; возвращает их хэши в том же порядке"""
+        keys = [blob_hash(text) for text in texts]
+        unique = dict(zip(keys, texts))
+        with self._lock, self.conn:
+            known = set()
+            pending = list(unique)
+            for start in range(0, len(pending), _IN_CHUNK):
+                chunk = pending[start:start + _IN_CHUNK]
+                known.update(row[0] for row in self.conn.execute(
+                    f"SELECT hash FROM blobs WHERE hash IN ({','.join('?' * len(chunk))})", chunk))
+            rows = []
+            for key, text in unique.items():
+                if key in known:
+                    continue
+                data = text.encode("utf-8")
+                rows.append((key, self.codec, self.dictionary_id, len(data), self._compress(data)))
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO blobs (hash, codec, dictionary_id, raw_size, data) VALUES (?, ?, ?, ?, ?)", rows)
+        return keys
+
+    def get(self, key: str) -> str:
+        return self.get_many([key])[key]
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, str]:
+        """Тексты по хэшам; неизвестный хэш — KeyError"""
+        keys = list(dict.fromkeys(keys))
+        texts = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    texts[key] = self._cache[key]
+                else:
+                    missing.append(key)
+            for start in range(0, len(missing), _IN_CHUNK):
+                chunk = missing[start:start + _IN_CHUNK]
+                for key, codec, dictionary_id, data in self.conn.execute(
+                        f"SELECT hash, codec, dictionary_id, data FROM blobs WHERE hash IN ({','.join('?' * len(chunk))})",
+                        chunk):
+                    texts[key] = self._decompress(codec, dictionary_id, data).decode("utf-8")
+                    self._remember(key, texts[key])
+        absent = [key for key in keys if key not in texts]
+        if absent:
+            raise KeyError(f"Блоб не найден: {absent[0]}")
+        return texts
+
+    def train_dictionary(self, size: int = DEFAULT_DICTIONARY_SIZE, sample_limit: int = 20000) -> int:
+        """Обучает словарь zstd на сохраненных текстах и делает его текущим для новых блобов"""
+        if self.codec != "zstd":
+            raise RuntimeError("Словарь поддерживается только кодеком zstd")
+        with self._lock:
+            rows = self.conn.execute("SELECT codec, dictionary_id, data FROM blobs ORDER BY RANDOM() LIMIT ?",
+                                     (sample_limit,)).fetchall()
+            samples = [self._decompress(codec, dictionary_id, data) for codec, dictionary_id, data in rows]
+            dictionary = zstandard.train_dictionary(size, samples)
+            with self.conn:
+                cursor = self.conn.execute("INSERT INTO dictionaries (data, samples) VALUES (?, ?)",
+                                           (dictionary.as_bytes(), len(samples)))
+            self.dictionary_id = cursor.lastrowid
+            self._compressor = self._make_compressor()
+        return self.dictionary_id
+
+    def recompress(self) -> int:
+        """Пересжимает блобы, сжатые не текущим кодеком или словарем, и удаляет ненужные словари
+
+        Возвращает число пересжатых блобов
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT hash, codec, dictionary_id, data FROM blobs WHERE codec != ? OR dictionary_id IS NOT ?",
+                (self.codec, self.dictionary_id)).fetchall()
+            with self.conn:
+                self.conn.executemany(
+                    "UPDATE blobs SET codec = ?, dictionary_id = ?, data = ? WHERE hash = ?",
+                    [(self.codec, self.dictionary_id, self._compress(self._decompress(codec, dictionary_id, data)), key)
+                     for key, codec, dictionary_id, data in rows])
+                self.conn.execute("DELETE FROM dictionaries WHERE id IS NOT ? AND id NOT IN "
+                                  "(SELECT dictionary_id FROM blobs WHERE dictionary_id IS NOT NULL)",
+                                  (self.dictionary_id,))
+        return len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        """Число блобов, байты до и после сжатия (со словарями), степень сжатия"""
+        with self._lock:
+            blobs, raw_bytes, blob_bytes = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(raw_size), 0), COALESCE(SUM(LENGTH(data)), 0) FROM blobs").fetchone()
+            dictionary_bytes = self.conn.execute(
+                "SELECT COALESCE(SUM(LENGTH(data)), 0) FROM dictionaries").fetchone()[0]
+        stored_bytes = blob_bytes + dictionary_bytes
+        return {
+            "blobs": blobs,
+            "raw_bytes": raw_bytes,
+            "stored_bytes": stored_bytes,
+            "dictionary_bytes": dictionary_bytes,
+            "compression_ratio": raw_bytes / stored_bytes if stored_bytes else 0.0,
+            "codec": self.codec,
+            "dictionary_id": self.dictionary_id
+        }
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+
+def externalize_results(results: List[Dict[str, Any]], store: BlobStore,
+                        fields: Iterable[str] = BLOB_FIELDS) -> List[Dict[str, Any]]:
+    """Копии результатов, в которых тексты заменены хэшами <поле>_blob; тексты пишутся одной пачкой"""
+    fields = tuple(fields)
+    texts = [result[field] for result in results for field in fields if isinstance(result.get(field), str)]
+    keys = iter(store.put_many(texts))
+    externalized = []
+    for result in results:
+        copy = dict(result)
+        for field in fields:
+            if isinstance(copy.get(field), str):
+                del copy[field]
+                copy[blob_key(field)] = next(keys)
+        externalized.append(copy)
+    return externalized
+
+
+def load_blob_texts(results: List[Dict[str, Any]], store: Optional[BlobStore] = None,
+                    path: str = DEFAULT_BLOB_PATH, fields: Iterable[str] = BLOB_FIELDS) -> Dict[str, str]:
+    """Тексты по хэшам из ссылок результатов; хранилище открывается, только если ссылки есть"""
+    fields = tuple(fields)
+    keys = [result[blob_key(field)] for result in results for field in fields if blob_key(field) in result]
+    if not keys:
+        return {}
+    own_store = store is None
+    store = store or BlobStore(path)
+    try:
+        return store.get_many(keys)
+    finally:
+        if own_store:
+            store.close()
+
+
+def result_text(result: Dict[str, Any], field: str, texts: Dict[str, str]) -> Optional[str]:
+    """Текст поля результата: встроенный или по ссылке из load_blob_texts"""
+    if result.get(field) is not None:
+        return result[field]
+    return texts.get(result.get(blob_key(field)))
+
+
+def resolve_results(results: List[Dict[str, Any]], store: Optional[BlobStore] = None,
+                    path: str = DEFAULT_BLOB_PATH, fields: Iterable[str] = BLOB_FIELDS) -> List[Dict[str, Any]]:
+    """Подставляет тексты вместо хэшей на месте"""
+    fields = tuple(fields)
+    texts = load_blob_texts(results, store, path, fields)
+    if texts:
+        for result in results:
+            for field in fields:
+                if blob_key(field) in result:
+                    result[field] = texts[result.pop(blob_key(field))]
+    return results
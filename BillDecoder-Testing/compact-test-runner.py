@@ -4,238 +4,127 @@
 Тестирует по 5 файлов каждого типа документов (45 запросов вместо 114)
 """
 
+import argparse
 import json
-import requests
-import time
 import os
 import glob
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import partial
 from typing import Dict, List, Any, Tuple
 import uuid
 
+import pandas as pd
+
+from adaptive_scheduler import (
+    DEFAULT_MIN_SAMPLES, AdaptiveScheduler, StoppingTargets, best_case_trials, print_adaptive_summary,
+    write_adaptive_report
+)
+from billing_prescreen import (
+    BillingPrescreen, PrescreenPolicy, findings_payload, prescreen_summary, print_prescreen_summary,
+    screen_documents, write_prescreen_report
+)
+from document_chunker import ChunkedAnalyzer
+from document_formatter import format_document
+from runner_pipeline import (
+    DEFAULT_QUEUE_SIZE, PipelineStage, PreparedDocument, RunnerPipeline, fan_out, load_document,
+    prepare_document, print_pipeline_metrics, stage_map, write_pipeline_report
+)
+from hathr_client import HathrClient
+from near_duplicates import DEFAULT_THRESHOLD, dedupe_summary, near_duplicate_representatives, write_dedupe_report
+from response_scorer import RESPONSE_SCORER
+from blob_store import DEFAULT_BLOB_PATH, BlobStore, externalize_results
+from results_sink import PostgresResultsSink
+from sampling_planner import sample_corpus, write_sample_report
+from sqlite_store import DEFAULT_SQLITE_PATH, SQLiteResultsStore
+from results_analytics import aggregate, results_frame, to_markdown
+from token_estimator import (
+    DEFAULT_INPUT_PRICE_PER_1K, DEFAULT_OUTPUT_PRICE_PER_1K,
+    TokenBudget, TokenEstimator, build_message, plan_calls, print_plan
+)
+
+# Метрики quality_metrics, усредняемые в оценку A/B сравнения
+QUALITY_SCORE_COLUMNS = ("length_score", "structure_score", "safety_score", "accuracy_score", "helpfulness_score")
+
+# Форматы документа в сообщении: имя в отчетах -> стиль document_formatter
+DOCUMENT_FORMATS = {
+    "verbose": "prompt",
+    "compact": "compact"
+}
+
 class CompactPromptTester:
-    def __init__(self, hathr_config: Dict[str, str]):
+    def __init__(self, hathr_config: Dict[str, str], data_dir: str = "test-data",
+                 chunked: bool = False, chunk_budget: int = 2000, workers: int = 4,
+                 document_formats: List[str] = None, budget: TokenBudget = None,
+                 estimator: TokenEstimator = None, prescreen_policy: PrescreenPolicy = None,
+                 dedupe: str = None, dedupe_threshold: float = DEFAULT_THRESHOLD,
+                 stratified: bool = False, sample_budget: int = None, sample_per_stratum: int = 1,
+                 scheduler: AdaptiveScheduler = None, call_workers: int = 1, queue_size: int = DEFAULT_QUEUE_SIZE,
+                 sink: PostgresResultsSink = None, blobs: BlobStore = None):
         self.hathr_config = hathr_config
-        self.access_token = None
-        self.token_expires_at = None
+        self.client = HathrClient(hathr_config)
+        self.budget = budget
+        self.estimator = estimator or TokenEstimator.from_results(blobs=blobs)
+        self.prescreen_policy = prescreen_policy
+        self.prescreen = BillingPrescreen() if prescreen_policy else None
+        self.prescreen_findings = {}
+        self.dedupe = dedupe
+        self.dedupe_threshold = dedupe_threshold
+        self.representatives = {}
+        self._responses = {}
+        self._representative_calls = {}
+        self._cluster_representatives = set()
+        self.stratified = stratified
+        self.sample_budget = sample_budget
+        self.sample_per_stratum = sample_per_stratum
+        self.sample_plan = None
+        self.scheduler = scheduler
+        self.call_workers = call_workers
+        self.queue_size = queue_size
+        self.pipeline_metrics = None
+        self.sink = sink
+        self.blobs = blobs
+        self.prompts = self._load_prompts()
+        self.data_dir = data_dir
+        self.document_formats = document_formats or ["verbose"]
+        self.chunked = chunked
+        self.chunked_analyzer = ChunkedAnalyzer(self.call_api, self.format_document_for_prompt, chunk_budget, workers)
         self.results = []
         self.session_id = str(uuid.uuid4())
         
-    def get_access_token(self) -> str:
-        """Получает токен доступа к Hathr API"""
-        if self.access_token and self.token_expires_at and time.time() < self.token_expires_at:
-            return self.access_token
-            
-        print("🔑 Получение нового токена доступа...")
+    def call_api(self, message: str, prompt_type: str = None) -> Tuple[bool, str, float, Dict[str, Any]]:
+        """Отправляет сообщение в Hathr API (потокобезопасно, токен кэшируется клиентом)"""
+        if not self.budget:
+            return self.client.chat(message)
         
-        token_data = {
-            "grant_type": "client_credentials",
-            "client_id": self.hathr_config["client_id"],
-            "client_secret": self.hathr_config["client_secret"],
-            "scope": self.hathr_config["scope"]
-        }
+        # Запросы сверх бюджета отклоняются до отправки
+        estimated_tokens = self.estimator.estimate_call(message, prompt_type)["total_tokens"]
+        refusal = self.budget.reserve(estimated_tokens)
+        if refusal:
+            return False, f"Бюджет превышен: {refusal}", 0.0, {}
         
-        try:
-            response = requests.post(self.hathr_config["token_url"], data=token_data)
-            if response.status_code == 200:
-                token_info = response.json()
-                self.access_token = token_info["access_token"]
-                # Токен действителен 24 часа, но обновляем за час до истечения
-                self.token_expires_at = time.time() + (token_info.get("expires_in", 86400) - 3600)
-                print(f"✅ Токен получен (действителен до {datetime.fromtimestamp(self.token_expires_at)})")
-                return self.access_token
-            else:
-                raise Exception(f"Ошибка получения токена: {response.status_code} - {response.text}")
-        except Exception as e:
-            raise Exception(f"Ошибка получения токена: {str(e)}")
+        success, ai_response, response_time, usage = self.client.chat(message)
+        self.budget.commit(estimated_tokens, usage.get("total_tokens", 0))
+        return success, ai_response, response_time, usage
     
-    def test_prompt(self, document_data: Dict[str, Any], prompt_type: str, prompt_text: str) -> Tuple[bool, str, float, Dict[str, Any]]:
-        """Тестирует один промт на одном документе"""
-        try:
-            # Получаем токен
-            token = self.get_access_token()
-            
-            # Форматируем документ
-            document_text = self.format_document_for_prompt(document_data)
-            
-            # Формируем сообщение
-            message = f"{prompt_text}\n\n[DOCUMENT]\n{document_text}"
-            
-            # Отправляем запрос
-            payload = {
-                "messages": [{"role": "user", "text": message}],
-                "temperature": 0.2,
-                "topP": 1.0
-            }
-            
-            headers = {
-                "Authorization": f"Bearer {token}",
-                "Content-Type": "application/json"
-            }
-            
-            start_time = time.time()
-            response = requests.post(self.hathr_config["api_url"], json=payload, headers=headers)
-            response_time = time.time() - start_time
-            
-            if response.status_code == 200:
-                response_data = response.json()
-                
-                # Извлекаем текст ответа
-                if "response" in response_data and "text" in response_data["response"]:
-                    ai_response = response_data["response"]["text"]
-                    usage = response_data["response"].get("usage", {})
-                    
-                    # Оцениваем качество ответа
-                    quality_metrics = self.evaluate_response_metrics(ai_response, document_data, prompt_type)
-                    
-                    return True, ai_response, response_time, {
-                        "input_tokens": usage.get("inputTokens", 0),
-                        "output_tokens": usage.get("outputTokens", 0),
-                        "total_tokens": usage.get("totalTokens", 0),
-                        "quality_metrics": quality_metrics
-                    }
-                else:
-                    return False, f"Неожиданная структура ответа: {response_data}", response_time, {}
-            else:
-                return False, f"API Error: {response.status_code} - {response.text}", response_time, {}
-                
-        except Exception as e:
-            return False, f"Exception: {str(e)}", 0.0, {}
+    def test_prompt_chunked(self, document_data: Dict[str, Any], prompt_type: str, prompt_text: str) -> Tuple[bool, str, float, Dict[str, Any]]:
+        """Тестирует промт через map-reduce по частям документа"""
+        success, ai_response, response_time, metrics = self.chunked_analyzer.analyze(document_data, prompt_text)
+        if success:
+            metrics["quality_metrics"] = self.evaluate_response_metrics(ai_response, document_data, prompt_type)
+        return success, ai_response, response_time, metrics
     
-    def format_document_for_prompt(self, document_data: Dict[str, Any]) -> str:
+    def format_document_for_prompt(self, document_data: Dict[str, Any], document_format: str = "verbose") -> str:
         """Форматирует документ для промта"""
-        doc_type = document_data.get("document_type", "unknown")
-        
-        if doc_type == "medical_bill":
-            return self._format_bill_as_text(document_data)
-        elif doc_type == "lab_results":
-            return self._format_lab_as_text(document_data)
-        elif doc_type == "eob":
-            return self._format_eob_as_text(document_data)
-        else:
-            return json.dumps(document_data, indent=2, ensure_ascii=False)
-    
-    def _format_bill_as_text(self, bill_data: Dict[str, Any]) -> str:
-        """Форматирует медицинский счет как текст"""
-        text = f"""
-MEDICAL BILL
-
-Provider: {bill_data['provider']['name']}
-Patient: {bill_data['patient']['name']}
-Service Date: {bill_data['service_date']}
-
-Services:
-"""
-        for service in bill_data.get("services", []):
-            text += f"""
-Code: {service['code']}
-Description: {service['description']}
-Charge: ${service['charge']}
-"""
-        
-        text += f"""
-Total Charges: ${bill_data['financial_summary']['total_charges']}
-Insurance Payment: ${bill_data['financial_summary']['insurance_payment']}
-Patient Responsibility: ${bill_data['financial_summary']['patient_responsibility']}
-"""
-        return text
-    
-    def _format_lab_as_text(self, lab_data: Dict[str, Any]) -> str:
-        """Форматирует лабораторные результаты как текст"""
-        text = f"""
-LABORATORY RESULTS
-
-Patient: {lab_data['patient']['name']}
-Test Date: {lab_data['test_date']}
-Laboratory: {lab_data['provider']['name']}
-
-Results:
-"""
-        for value in lab_data.get("lab_values", []):
-            status_symbol = "✅" if value["status"] == "normal" else "⚠️" if value["status"] in ["high", "low"] else "❌"
-            text += f"{status_symbol} {value['test_name']}: {value['value']} {value['unit']} (normal: {value['reference_range']})\n"
-        
-        if lab_data.get('clinical_notes'):
-            text += f"\nClinical Notes: {lab_data['clinical_notes']}"
-        
-        return text
-    
-    def _format_eob_as_text(self, eob_data: Dict[str, Any]) -> str:
-        """Форматирует EOB как текст"""
-        text = f"""
-EXPLANATION OF BENEFITS (EOB)
-
-Patient: {eob_data['patient']['name']}
-Member ID: {eob_data['patient']['member_id']}
-Date of Service: {eob_data['service_date']}
-Provider: {eob_data['provider']['name']}
-Insurance: {eob_data['insurance_company']['name']}
-Claim Number: {eob_data['claim_number']}
-
-Claim Details:
-"""
-        for service in eob_data.get("services", []):
-            text += f"""
-Service: {service['description']}
-Code: {service['code']}
-Date: {service.get('date', 'N/A')}
-Billed Amount: ${service['billed_amount']}
-Insurance Paid: ${service['insurance_payment']}
-Patient Responsibility: ${service['patient_responsibility']}
-Coverage Status: {service['coverage_status']}
-"""
-        
-        # Вычисляем общие суммы
-        total_billed = sum(service['billed_amount'] for service in eob_data.get("services", []))
-        total_insurance = sum(service['insurance_payment'] for service in eob_data.get("services", []))
-        total_patient = sum(service['patient_responsibility'] for service in eob_data.get("services", []))
-        
-        text += f"""
-Financial Summary:
-Total Billed: ${total_billed:.2f}
-Insurance Payment: ${total_insurance:.2f}
-Patient Responsibility: ${total_patient:.2f}
-"""
-        return text
+        return format_document(document_data, DOCUMENT_FORMATS[document_format])
     
     def evaluate_response_metrics(self, response_text: str, document_data: Dict[str, Any], prompt_type: str) -> Dict[str, float]:
         """Оценивает качество ответа по различным метрикам"""
-        metrics = {
-            "length_score": min(len(response_text) / 500, 1.0),  # Оптимальная длина ~500 символов
-            "structure_score": 0.0,
-            "safety_score": 0.0,
-            "accuracy_score": 0.0,
-            "helpfulness_score": 0.0
-        }
-        
-        # Проверка структуры ответа
-        if prompt_type == "document_classification":
-            if any(keyword in response_text.lower() for keyword in ["document type", "type:", "classification"]):
-                metrics["structure_score"] += 0.3
-            if any(keyword in response_text.lower() for keyword in ["provider", "patient", "date"]):
-                metrics["structure_score"] += 0.3
-            if any(keyword in response_text.lower() for keyword in ["services", "charges", "financial"]):
-                metrics["structure_score"] += 0.4
-        
-        # Проверка безопасности
-        if any(keyword in response_text.lower() for keyword in ["not medical advice", "consult", "healthcare provider", "doctor"]):
-            metrics["safety_score"] = 1.0
-        elif any(keyword in response_text.lower() for keyword in ["medical advice", "diagnosis", "treatment"]):
-            metrics["safety_score"] = 0.3
-        
-        # Проверка точности (базовая)
-        doc_type = document_data.get("document_type", "")
-        if doc_type in response_text.lower():
-            metrics["accuracy_score"] += 0.5
-        
-        # Проверка полезности
-        if len(response_text) > 100 and any(keyword in response_text.lower() for keyword in ["explain", "help", "understand", "information"]):
-            metrics["helpfulness_score"] = 1.0
-        
-        return metrics
+        return RESPONSE_SCORER.response_metrics(response_text, document_data.get("document_type", ""), prompt_type)
     
     def load_compact_test_files(self) -> List[Tuple[str, Dict[str, Any]]]:
-        """Загружает сокращенный набор тестовых файлов (по 5 каждого типа)"""
+        """Загружает сокращенный набор тестовых файлов (по 5 каждого типа или стратифицированную выборку)"""
         test_files = []
         
         # Определяем типы документов и их файлы
@@ -246,17 +135,26 @@ Patient Responsibility: ${total_patient:.2f}
         }
         
         # Собираем файлы по типам
-        for pattern in ["test-data/**/*.json"]:
+        for pattern in [os.path.join(self.data_dir, "**", "*.json")]:
             for file_path in glob.glob(pattern, recursive=True):
                 try:
                     with open(file_path, 'r', encoding='utf-8') as f:
                         data = json.load(f)
+                        if not isinstance(data, dict):
+                            continue  # manifest.json и прочие служебные файлы
                         doc_type = data.get("document_type", "unknown")
                         if doc_type in doc_types:
                             doc_types[doc_type].append((file_path, data))
                 except Exception as e:
                     print(f"⚠️ Ошибка загрузки {file_path}: {e}")
         
+        if self.stratified:
+            # Наименьший набор, покрывающий тип × сложность × ошибку × отклонение, в пределах бюджета
+            all_files = sorted((item for files in doc_types.values() for item in files), key=lambda x: x[0])
+            self.sample_plan = sample_corpus(all_files, len(self._build_prompt_cases()), self.sample_budget,
+                                             self.sample_per_stratum, os.path.join(self.data_dir, "ground_truth.json"))
+            return self.sample_plan["selected"]
+        
         # Берем по 5 файлов каждого типа
         for doc_type, files in doc_types.items():
             # Сортируем файлы для предсказуемости
@@ -268,17 +166,9 @@ Patient Responsibility: ${total_patient:.2f}
         
         return test_files
     
-    def run_compact_tests(self) -> Dict[str, Any]:
-        """Запускает сокращенные тесты"""
-        print("🚀 Запуск сокращенного тестирования промтов...")
-        print(f"📋 Session ID: {self.session_id}")
-        
-        # Загружаем сокращенный набор тестовых файлов
-        test_files = self.load_compact_test_files()
-        print(f"📁 Всего выбрано {len(test_files)} тестовых файлов")
-        
-        # Определяем промты для тестирования
-        prompts = {
+    def _load_prompts(self) -> Dict[str, str]:
+        """Загружает промты для тестирования"""
+        return {
             "document_classification": """Classify this healthcare document and extract key metadata:
 
 Document types to identify:
@@ -316,49 +206,297 @@ Use clear, non-technical language. Always remind patients to consult their healt
 
 Provide reasoning for each score and highlight any concerns or missing information."""
         }
+    
+    def _build_prompt_cases(self) -> List[Tuple[str, str, str]]:
+        """Каждый промт прогоняется в каждом формате документа (A/B при нескольких форматах)"""
+        return [
+            (prompt_name, prompt_text, document_format)
+            for prompt_name, prompt_text in self.prompts.items()
+            for document_format in self.document_formats
+        ]
+    
+    def _apply_prescreen(self, test_files: List[Tuple[str, Dict[str, Any]]]) -> Tuple[List[Tuple[str, Dict[str, Any]]], Dict[str, Any]]:
+        """Локальная предпроверка: оставляет документы, которым нужна модель, и считает сэкономленное"""
+        if not self.prescreen:
+            return test_files, None
         
-        # Запускаем тесты
-        total_tests = len(test_files) * len(prompts)
-        current_test = 0
-        successful_tests = 0
+        kept, skipped, self.prescreen_findings = screen_documents(test_files, self.prescreen, self.prescreen_policy)
+        avoided_calls = [
+            (prompt_name, build_message(prompt_text, self.format_document_for_prompt(document_data, document_format)))
+            for _, document_data in skipped
+            for prompt_name, prompt_text, document_format in self._build_prompt_cases()
+        ]
+        summary = prescreen_summary(self.estimator, self.prescreen_findings, skipped, avoided_calls)
+        print_prescreen_summary(summary)
+        return kept, summary
+    
+    def _apply_dedupe(self, test_files: List[Tuple[str, Dict[str, Any]]]) -> Tuple[List[Tuple[str, Dict[str, Any]]], Dict[str, Any]]:
+        """Кластеры почти одинаковых документов: в режиме sample остается по представителю, в reuse — все"""
+        if not self.dedupe:
+            return test_files, None
         
-        print(f"🎯 Планируется {total_tests} тестов ({len(test_files)} файлов × {len(prompts)} промтов)")
+        documents = [
+            (file_path, document_data.get("document_type", "unknown"),
+             self.format_document_for_prompt(document_data, self.document_formats[0]))
+            for file_path, document_data in test_files
+        ]
+        self.representatives = near_duplicate_representatives(documents, self.dedupe_threshold)
+        self._cluster_representatives = {representative for file_path, representative in self.representatives.items()
+                                         if file_path != representative}
+        duplicates = sum(1 for file_path, representative in self.representatives.items() if file_path != representative)
+        summary = dedupe_summary(self.representatives, self.dedupe, self.dedupe_threshold,
+                                 duplicates * len(self._build_prompt_cases()))
+        print(f"🪞 Почти одинаковых документов: {duplicates} из {len(test_files)} "
+              f"(кластеров {summary['clusters']}, порог {self.dedupe_threshold})")
         
-        for file_path, document_data in test_files:
+        if self.dedupe == "sample":
+            test_files = [(file_path, data) for file_path, data in test_files
+                          if self.representatives[file_path] == file_path]
+        else:
+            # Представители идут первыми: их запросы начинаются раньше запросов почти дубликатов
+            test_files.sort(key=lambda item: self.representatives[item[0]] != item[0])
+        return test_files, summary
+    
+    def _near_duplicate_result(self, file_path: str, prompt_name: str, document_format: str) -> Dict[str, Any]:
+        """Успешный результат представителя кластера для того же промта и формата (режим reuse)
+
+        Сходство документа с представителем не ниже порога: кластеры строятся от представителя.
+        Если запрос представителя еще выполняется, ответ ждется, а не запрашивается повторно
+        """
+        representative = self.representatives.get(file_path, file_path)
+        if self.dedupe != "reuse" or representative == file_path:
+            return None
+        key = (representative, prompt_name, document_format)
+        pending = self._representative_calls.get(key)
+        if pending:
+            pending.wait()
+        return self._responses.get(key)
+    
+    def _fan_out(self, document: PreparedDocument, prompt_cases: List[Tuple[str, str, str]]) -> List[Tuple[PreparedDocument, Tuple[str, str, str]]]:
+        """Стадия разветвления; для представителя кластера заводит события готовности его ответов
+
+        Разветвление идет в одном потоке в порядке документов, поэтому событие представителя
+        появляется раньше, чем задачи его почти дубликатов доходят до стадии запроса
+        """
+        if self.dedupe == "reuse" and document.file_path in self._cluster_representatives:
+            for prompt_name, _, document_format in prompt_cases:
+                self._representative_calls[(document.file_path, prompt_name, document_format)] = threading.Event()
+        return fan_out(document, prompt_cases)
+    
+    def plan_tests(self, concurrency: int = 1, input_price_per_1k: float = DEFAULT_INPUT_PRICE_PER_1K,
+                   output_price_per_1k: float = DEFAULT_OUTPUT_PRICE_PER_1K) -> Dict[str, Any]:
+        """Dry-run: оценивает токены, стоимость и время матрицы без обращения к API"""
+        test_files, _ = self._apply_dedupe(self.load_compact_test_files())
+        # В плане ответы почти дубликатов считаются переиспользованными в обоих режимах
+        test_files = [(file_path, data) for file_path, data in test_files
+                      if self.representatives.get(file_path, file_path) == file_path]
+        test_files, _ = self._apply_prescreen(test_files)
+        calls = []
+        for _, document_data in test_files:
             doc_type = document_data.get("document_type", "unknown")
-            print(f"\n📋 Тестирование файла: {os.path.basename(file_path)} ({doc_type})")
-            
-            for prompt_name, prompt_text in prompts.items():
-                current_test += 1
-                print(f"  🔍 Тестирование промта: {prompt_name} ({current_test}/{total_tests})")
-                
-                success, response, response_time, metrics = self.test_prompt(
-                    document_data, prompt_name, prompt_text
-                )
-                
-                # Сохраняем результат
-                result = {
-                    "test_id": str(uuid.uuid4()),
-                    "session_id": self.session_id,
-                    "document_type": doc_type,
-                    "document_file": file_path,
-                    "prompt_type": prompt_name,
-                    "test_timestamp": datetime.now().isoformat(),
-                    "success": success,
-                    "response_time": response_time,
-                    "response_text": response,
-                    "metrics": metrics,
-                    "prompt_text": prompt_text
-                }
-                
-                self.results.append(result)
-                
+            for prompt_name, prompt_text, document_format in self._build_prompt_cases():
+                message = build_message(prompt_text, self.format_document_for_prompt(document_data, document_format))
+                calls.append((doc_type, prompt_name, message))
+        
+        # План использует копию лимитов, чтобы не расходовать бюджет реального прогона
+        budget = None
+        if self.budget:
+            budget = TokenBudget(self.budget.max_call_tokens, self.budget.max_session_tokens)
+        
+        plan = plan_calls(self.estimator, calls, concurrency, budget, input_price_per_1k, output_price_per_1k)
+        print_plan(plan, self.estimator)
+        return plan
+    
+    def _formatters(self) -> Dict[str, Any]:
+        """Формат документа -> функция форматирования (для стадии форматирования конвейера)"""
+        return {document_format: partial(self.format_document_for_prompt, document_format=document_format)
+                for document_format in self.document_formats}
+    
+    def _call_case(self, task: Tuple[PreparedDocument, Tuple[str, str, str]]) -> Dict[str, Any]:
+        """Стадия запроса: промт на подготовленном документе (или ответ почти дубликата без API)"""
+        document, prompt_case = task
+        prompt_name, prompt_text, document_format = prompt_case
+        test_id = str(uuid.uuid4())
+        call = {"test_id": test_id, "document": document, "prompt_case": prompt_case, "chunked": None,
+                "original": self._near_duplicate_result(document.file_path, prompt_name, document_format)}
+        
+        if call["original"]:
+            # Ответ на почти одинаковый документ: API не вызывается, результат помечается
+            call.update(success=True, response=call["original"]["response_text"], response_time=None, usage={})
+        else:
+            key = (document.file_path, prompt_name, document_format)
+            message = build_message(prompt_text, document.text(document_format))
+            try:
+                success, response, response_time, usage = self.call_api(message, prompt_name)
+                call.update(success=success, response=response, response_time=response_time, usage=usage,
+                            message_chars=len(message))
                 if success:
-                    successful_tests += 1
-                    tokens_used = metrics.get("total_tokens", 0)
-                    print(f"    ✅ Успешно ({response_time:.2f}с, {tokens_used} токенов)")
-                else:
-                    print(f"    ❌ Ошибка: {response}")
+                    self._responses[key] = {
+                        "test_id": test_id, "response_text": response, "document_file": document.file_path
+                    }
+            finally:
+                # Почти дубликаты, ждущие этот ответ, продолжают и при ошибке запроса
+                if key in self._representative_calls:
+                    self._representative_calls[key].set()
+            # Сравниваем с map-reduce по частям документа
+            if self.chunked:
+                call["chunked"] = self.test_prompt_chunked(document.data, prompt_name, prompt_text)
+        call["test_timestamp"] = datetime.now().isoformat()
+        return call
+    
+    def _score_case(self, call: Dict[str, Any], progress: str = None) -> Dict[str, Any]:
+        """Стадия оценки: метрики качества и запись результата"""
+        document = call["document"]
+        prompt_name, prompt_text, document_format = call["prompt_case"]
+        success, response, response_time, original = call["success"], call["response"], call["response_time"], call["original"]
+        
+        metrics = {}
+        if success:
+            usage = call["usage"]
+            metrics = {
+                "input_tokens": usage.get("input_tokens", 0),
+                "output_tokens": usage.get("output_tokens", 0),
+                "total_tokens": usage.get("total_tokens", 0),
+                "quality_metrics": self.evaluate_response_metrics(response, document.data, prompt_name)
+            }
+            if "message_chars" in call:
+                # Длина отправленного сообщения калибрует TokenEstimator без переформатирования документа
+                metrics["message_chars"] = call["message_chars"]
+        
+        # Сохраняем результат
+        result = {
+            "test_id": call["test_id"],
+            "session_id": self.session_id,
+            "document_type": document.document_type,
+            "document_file": document.file_path,
+            "document_format": document_format,
+            "prompt_type": prompt_name,
+            "test_timestamp": call["test_timestamp"],
+            "success": success,
+            "response_time": response_time,
+            "response_text": response,
+            "metrics": metrics,
+            "prompt_text": prompt_text
+        }
+        if self.prescreen:
+            result["prescreen_findings"] = findings_payload(self.prescreen_findings[document.file_path])
+        if original:
+            result["reused_from"] = original["test_id"]
+            result["reused_document"] = original["document_file"]
+        
+        print(f"  🔍 {os.path.basename(document.file_path)} ({document.document_type}): "
+              f"{prompt_name} [{document_format}]" + (f" ({progress})" if progress else ""))
+        if original:
+            print(f"    ♻️ Ответ переиспользован: {os.path.basename(original['document_file'])}")
+        elif success:
+            print(f"    ✅ Успешно ({response_time:.2f}с, {metrics['total_tokens']} токенов)")
+        else:
+            print(f"    ❌ Ошибка: {response}")
+        
+        if call["chunked"]:
+            chunk_success, chunk_response, chunk_time, chunk_metrics = call["chunked"]
+            result["chunked"] = {
+                "success": chunk_success,
+                "response_time": chunk_time,
+                "response_text": chunk_response,
+                "metrics": chunk_metrics
+            }
+            if chunk_success:
+                print(f"    🧩 Map-reduce: {chunk_metrics['chunk_count']} частей, {chunk_time:.2f}с "
+                      f"(single-shot {response_time:.2f}с)")
+            else:
+                print(f"    ❌ Map-reduce ошибка: {chunk_response}")
+        return result
+    
+    def _persist_result(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Стадия сохранения: результат в сессию (и пачкой в базу, если задан сток)"""
+        self.results.append(result)
+        if self.sink:
+            self.sink.add(result, self.session_id, "compact")
+        return result
+    
+    def _run_pipeline(self, test_files: List[Tuple[str, Dict[str, Any]]], prompt_cases: List[Tuple[str, str, str]]):
+        """Матрица целиком через конвейер: документ форматируется один раз и расходится по промтам"""
+        formatters = self._formatters()
+        total_tests = len(test_files) * len(prompt_cases)
+        progress = {"done": 0}
+        
+        def score(call: Dict[str, Any]) -> Dict[str, Any]:
+            progress["done"] += 1
+            return self._score_case(call, f"{progress['done']}/{total_tests}")
+        
+        pipeline = RunnerPipeline([
+            PipelineStage("load", stage_map(lambda item: (item[0], item[1] if item[1] is not None else load_document(item[0])))),
+            PipelineStage("format", stage_map(lambda item: prepare_document(item[0], item[1], formatters))),
+            PipelineStage("fan-out", lambda document: self._fan_out(document, prompt_cases)),
+            PipelineStage("call", stage_map(self._call_case), workers=self.call_workers),
+            PipelineStage("score", stage_map(score)),
+            PipelineStage("persist", stage_map(self._persist_result))
+        ], self.queue_size)
+        self.pipeline_metrics = pipeline.run(test_files)
+        print_pipeline_metrics(self.pipeline_metrics)
+    
+    def _run_adaptive(self, test_files: List[Tuple[str, Dict[str, Any]]], prompt_cases: List[Tuple[str, str, str]]):
+        """Матрица раундами: ячейки (тип × промт × формат) с узкими интервалами перестают получать запросы
+
+        Запросы раунда идут параллельно (call_workers), результаты учитываются в порядке раунда
+        """
+        formatters = self._formatters()
+        for file_path, document_data in test_files:
+            document = prepare_document(file_path, document_data, formatters)
+            for prompt_case in prompt_cases:
+                self.scheduler.add((document.document_type, prompt_case[0], prompt_case[2]), (document, prompt_case))
+        
+        unstoppable = self.scheduler.unstoppable_cells()
+        if unstoppable:
+            needed = best_case_trials(self.scheduler.targets.success, self.scheduler.min_samples)
+            print(f"⚠️ Ранняя остановка невозможна для {len(unstoppable)} из {len(self.scheduler.stats)} ячеек: "
+                  f"интервал доли успехов сужается до ±{self.scheduler.targets.success} не раньше чем за "
+                  f"{needed or '∞'} документов, а у этих ячеек их не больше. "
+                  f"Увеличьте --ci-success или выборку (--stratified --sample-per-stratum)")
+        
+        with ThreadPoolExecutor(max_workers=max(1, self.call_workers)) as executor:
+            while True:
+                batch = self.scheduler.next_round()
+                if not batch:
+                    break
+                print(f"\n🔁 Раунд {self.scheduler.rounds}: {len(batch)} активных ячеек")
+                calls = executor.map(self._call_case, [task for _, task in batch])
+                for position, ((cell, _), call) in enumerate(zip(batch, calls), 1):
+                    result = self._persist_result(self._score_case(call, f"{position}/{len(batch)}"))
+                    quality = result["metrics"].get("quality_metrics", {}) if result["success"] else {}
+                    scores = [quality[column] for column in QUALITY_SCORE_COLUMNS if column in quality]
+                    self.scheduler.record(cell, result["success"], sum(scores) / len(scores) if scores else None,
+                                          result["response_time"], calls=0 if "reused_from" in result else 1)
+        print_adaptive_summary(self.scheduler.summary())
+    
+    def run_compact_tests(self) -> Dict[str, Any]:
+        """Запускает сокращенные тесты"""
+        print("🚀 Запуск сокращенного тестирования промтов...")
+        print(f"📋 Session ID: {self.session_id}")
+        
+        # Загружаем сокращенный набор тестовых файлов
+        test_files = self.load_compact_test_files()
+        print(f"📁 Всего выбрано {len(test_files)} тестовых файлов")
+        test_files, dedupe = self._apply_dedupe(test_files)
+        test_files, prescreen = self._apply_prescreen(test_files)
+        
+        prompt_cases = self._build_prompt_cases()
+        
+        # Запускаем тесты
+        total_tests = len(test_files) * len(prompt_cases)
+        
+        print(f"🎯 Планируется {total_tests} тестов ({len(test_files)} файлов × {len(self.prompts)} промтов"
+              f" × {len(self.document_formats)} форматов)")
+        
+        if self.scheduler:
+            self._run_adaptive(test_files, prompt_cases)
+        else:
+            self._run_pipeline(test_files, prompt_cases)
+        
+        total_tests = len(self.results)
+        successful_tests = sum(1 for result in self.results if result["success"])
+        reused_tests = sum(1 for result in self.results if "reused_from" in result)
         
         # Генерируем отчет
         summary = {
@@ -370,6 +508,18 @@ Provide reasoning for each score and highlight any concerns or missing informati
             "success_rate": successful_tests / total_tests if total_tests > 0 else 0,
             "results": self.results
         }
+        if prescreen:
+            summary["prescreen"] = prescreen
+        if self.pipeline_metrics:
+            summary["pipeline"] = self.pipeline_metrics
+        if self.scheduler:
+            summary["adaptive"] = self.scheduler.summary()
+        if self.sample_plan:
+            summary["sampling"] = {key: value for key, value in self.sample_plan.items() if key != "selected"}
+        if dedupe:
+            if self.dedupe == "reuse":
+                dedupe["calls_avoided"] = reused_tests
+            summary["dedupe"] = dedupe
         
         return summary
     
@@ -380,8 +530,12 @@ Provide reasoning for each score and highlight any concerns or missing informati
         
         # Сохраняем полные результаты
         results_file = f"test-results/compact_test_{self.session_id}.json"
+        saved = summary
+        if self.blobs:
+            # Тексты ответов и промтов — в хранилище блобов, в файле только их хэши
+            saved = {**summary, "results": externalize_results(summary["results"], self.blobs)}
         with open(results_file, 'w', encoding='utf-8') as f:
-            json.dump(summary, f, indent=2, ensure_ascii=False)
+            json.dump(saved, f, indent=2, ensure_ascii=False)
         
         # Создаем краткий отчет
         report_file = f"test-results/compact_summary_{self.session_id}.md"
@@ -394,45 +548,144 @@ Provide reasoning for each score and highlight any concerns or missing informati
             f.write(f"**Неудачных:** {summary['failed_tests']}\n")
             f.write(f"**Процент успеха:** {summary['success_rate']*100:.1f}%\n\n")
             
-            # Группируем по типам документов
-            doc_types = {}
-            for result in summary['results']:
-                doc_type = result['document_type']
-                if doc_type not in doc_types:
-                    doc_types[doc_type] = {'total': 0, 'successful': 0, 'avg_time': 0, 'total_tokens': 0}
-                doc_types[doc_type]['total'] += 1
-                if result['success']:
-                    doc_types[doc_type]['successful'] += 1
-                    doc_types[doc_type]['avg_time'] += result['response_time']
-                    doc_types[doc_type]['total_tokens'] += result['metrics'].get('total_tokens', 0)
+            # Все группировки считаются по одной таблице результатов
+            frame = results_frame(summary['results'], summary['session_id'])
             
             f.write("## Результаты по типам документов\n\n")
-            for doc_type, stats in doc_types.items():
-                success_rate = stats['successful'] / stats['total'] * 100 if stats['total'] > 0 else 0
-                avg_time = stats['avg_time'] / stats['successful'] if stats['successful'] > 0 else 0
-                f.write(f"- **{doc_type}**: {stats['successful']}/{stats['total']} ({success_rate:.1f}%) - {avg_time:.2f}с, {stats['total_tokens']} токенов\n")
-            
-            # Группируем по типам промтов
-            prompt_types = {}
-            for result in summary['results']:
-                prompt_type = result['prompt_type']
-                if prompt_type not in prompt_types:
-                    prompt_types[prompt_type] = {'total': 0, 'successful': 0}
-                prompt_types[prompt_type]['total'] += 1
-                if result['success']:
-                    prompt_types[prompt_type]['successful'] += 1
+            for row in aggregate(frame, ['document_type'], sort=False).itertuples(index=False):
+                avg_time = 0 if pd.isna(row.latency_mean) else row.latency_mean
+                f.write(f"- **{row.document_type}**: {row.successful}/{row.tests} ({row.success_rate * 100:.1f}%) - {avg_time:.2f}с, {row.total_tokens_sum} токенов\n")
             
             f.write("\n## Результаты по типам промтов\n\n")
-            for prompt_type, stats in prompt_types.items():
-                success_rate = stats['successful'] / stats['total'] * 100 if stats['total'] > 0 else 0
-                f.write(f"- **{prompt_type}**: {stats['successful']}/{stats['total']} ({success_rate:.1f}%)\n")
+            for row in aggregate(frame, ['prompt_type'], sort=False).itertuples(index=False):
+                f.write(f"- **{row.prompt_type}**: {row.successful}/{row.tests} ({row.success_rate * 100:.1f}%)\n")
+            
+            f.write("\n## Промт × тип документа × сложность\n\n")
+            breakdown = aggregate(frame, ['prompt_type', 'document_type', 'complexity'])
+            f.write(to_markdown(breakdown[['prompt_type', 'document_type', 'complexity', 'tests', 'success_rate',
+                                           'latency_p50', 'latency_p95', 'total_tokens_sum']]))
+            
+            if summary.get('prescreen'):
+                write_prescreen_report(f, summary['prescreen'])
+            if summary.get('dedupe'):
+                write_dedupe_report(f, summary['dedupe'])
+            if summary.get('sampling'):
+                write_sample_report(f, summary['sampling'])
+            if summary.get('adaptive'):
+                write_adaptive_report(f, summary['adaptive'])
+            if summary.get('pipeline'):
+                write_pipeline_report(f, summary['pipeline'])
+            
+            # A/B сравнение форматов документа на одной и той же матрице
+            formats = sorted({r.get('document_format', 'verbose') for r in summary['results']})
+            if len(formats) > 1:
+                self._write_format_comparison(f, frame, formats)
+            
+            # Сравнение map-reduce с single-shot
+            chunked_results = [r for r in summary['results'] if r.get('chunked')]
+            if chunked_results:
+                f.write("\n## Map-reduce vs single-shot\n\n")
+                f.write("| Файл | Промт | Частей | Single-shot, с | Map-reduce, с | Токены single/map-reduce |\n")
+                f.write("|------|-------|--------|----------------|---------------|--------------------------|\n")
+                for result in chunked_results:
+                    chunked = result['chunked']
+                    single_time = f"{result['response_time']:.2f}" if result['success'] else "ошибка"
+                    chunked_time = f"{chunked['response_time']:.2f}" if chunked['success'] else "ошибка"
+                    f.write(f"| {os.path.basename(result['document_file'])} | {result['prompt_type']} | "
+                            f"{chunked['metrics'].get('chunk_count', '-')} | {single_time} | {chunked_time} | "
+                            f"{result['metrics'].get('total_tokens', 0)}/{chunked['metrics'].get('total_tokens', 0)} |\n")
         
         print(f"\n📊 Результаты сохранены:")
         print(f"   Полные данные: {results_file}")
         print(f"   Краткий отчет: {report_file}")
 
+    def _write_format_comparison(self, f, frame: pd.DataFrame, formats: List[str]):
+        """Пишет таблицу A/B: входные токены, задержка и оценки по форматам документа"""
+        successful = frame[frame['success']]
+        quality_columns = [column for column in QUALITY_SCORE_COLUMNS if column in successful]
+        successful = successful.assign(score=successful[quality_columns].mean(axis=1) if quality_columns else 0.0)
+        grouped = successful.groupby(['document_type', 'document_format']).agg(
+            count=('success', 'size'), input_tokens=('input_tokens', 'mean'),
+            response_time=('response_time', 'mean'), score=('score', 'mean'))
+        stats = {key: row for key, row in zip(grouped.index, grouped.to_dict(orient='records'))}
+        
+        baseline = "verbose" if "verbose" in formats else formats[0]
+        f.write(f"\n## A/B форматов документа (база: {baseline})\n\n")
+        f.write("| Тип документа | Формат | Тестов | Входные токены (ср.) | Время, с (ср.) | Оценка (ср.) | Δ токенов | Δ времени | Δ оценки |\n")
+        f.write("|---------------|--------|--------|----------------------|----------------|--------------|-----------|-----------|----------|\n")
+        for doc_type in sorted({doc_type for doc_type, _ in stats}):
+            base = stats.get((doc_type, baseline))
+            for document_format in formats:
+                cell = stats.get((doc_type, document_format))
+                if not cell:
+                    continue
+                if base and document_format != baseline:
+                    deltas = (f"{(cell['input_tokens'] / base['input_tokens'] - 1) * 100:+.1f}%" if base['input_tokens'] else "-",
+                              f"{cell['response_time'] - base['response_time']:+.2f}с",
+                              f"{cell['score'] - base['score']:+.3f}")
+                else:
+                    deltas = ("-", "-", "-")
+                f.write(f"| {doc_type} | {document_format} | {cell['count']} | {cell['input_tokens']:.0f} | "
+                        f"{cell['response_time']:.2f} | {cell['score']:.3f} | {' | '.join(deltas)} |\n")
+
 def main():
     """Основная функция"""
+    parser = argparse.ArgumentParser(description="Сокращенное тестирование промтов BillDecoder/LabDecoder")
+    parser.add_argument("--data-dir", default="test-data", help="директория с тестовыми документами")
+    parser.add_argument("--chunked", action="store_true",
+                        help="дополнительно прогнать map-reduce по частям и сравнить с single-shot")
+    parser.add_argument("--chunk-budget", type=int, default=2000, help="бюджет токенов на одну часть документа")
+    parser.add_argument("--workers", type=int, default=4, help="параллельных запросов для частей документа")
+    parser.add_argument("--format", choices=sorted(DOCUMENT_FORMATS), default="verbose",
+                        help="формат документа в сообщении")
+    parser.add_argument("--ab-format", action="store_true",
+                        help="прогнать матрицу во всех форматах и сравнить токены, время и оценки")
+    parser.add_argument("--plan", action="store_true",
+                        help="dry-run: оценить токены, стоимость и время без обращения к API")
+    parser.add_argument("--concurrency", type=int, default=1, help="параллельность для оценки времени в --plan")
+    parser.add_argument("--price-input", type=float, default=DEFAULT_INPUT_PRICE_PER_1K,
+                        help="стоимость 1000 входных токенов, USD")
+    parser.add_argument("--price-output", type=float, default=DEFAULT_OUTPUT_PRICE_PER_1K,
+                        help="стоимость 1000 выходных токенов, USD")
+    parser.add_argument("--max-call-tokens", type=int, help="отклонять запросы дороже этого числа токенов")
+    parser.add_argument("--max-session-tokens", type=int, help="отклонять запросы сверх бюджета токенов сессии")
+    parser.add_argument("--prescreen", action="store_true",
+                        help="локальная предпроверка: документы без находок не отправляются в модель")
+    parser.add_argument("--prescreen-keep", type=float, default=0.0,
+                        help="доля чистых документов, которые все равно отправляются в модель для контроля")
+    parser.add_argument("--dedupe", choices=["reuse", "sample"],
+                        help="почти одинаковые документы: reuse — переиспользовать ответ представителя, "
+                             "sample — оставить по одному документу на кластер")
+    parser.add_argument("--dedupe-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="порог сходства (Жаккар по MinHash) для почти дубликатов")
+    parser.add_argument("--stratified", action="store_true",
+                        help="стратифицированная выборка (тип × сложность × ошибка × отклонение) вместо первых 5 файлов")
+    parser.add_argument("--sample-budget", type=int, help="бюджет запросов для --stratified")
+    parser.add_argument("--sample-per-stratum", type=int, default=1, help="документов на страту для --stratified")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="матрица раундами с ранней остановкой ячеек, чьи доверительные интервалы уже целевых")
+    parser.add_argument("--ci-success", type=float, default=StoppingTargets.success,
+                        help="целевая полуширина 95%% интервала доли успехов")
+    parser.add_argument("--ci-score", type=float, default=StoppingTargets.score,
+                        help="целевая полуширина 95%% интервала средней оценки")
+    parser.add_argument("--ci-latency", type=float, default=StoppingTargets.latency,
+                        help="целевая полуширина 95%% интервала задержки, доля от среднего")
+    parser.add_argument("--min-samples", type=int, default=DEFAULT_MIN_SAMPLES,
+                        help="минимум документов на ячейку до ранней остановки")
+    parser.add_argument("--adaptive-budget", type=int, help="бюджет запросов для --adaptive")
+    parser.add_argument("--db", action="store_true",
+                        help="писать результаты в PostgreSQL (схема database/init.sql) пачками через COPY")
+    parser.add_argument("--database-url", help="строка подключения PostgreSQL (по умолчанию DATABASE_URL)")
+    parser.add_argument("--sqlite", nargs="?", const=DEFAULT_SQLITE_PATH,
+                        help=f"писать результаты во встроенную базу SQLite (по умолчанию {DEFAULT_SQLITE_PATH})")
+    parser.add_argument("--blobs", nargs="?", const=DEFAULT_BLOB_PATH,
+                        help=f"хранить тексты ответов сжатыми блобами по хэшу (по умолчанию {DEFAULT_BLOB_PATH})")
+    parser.add_argument("--call-workers", type=int, default=1,
+                        help="параллельных запросов в стадии запроса конвейера и в раунде --adaptive")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="размер очередей между стадиями конвейера")
+    args = parser.parse_args()
+    
     # Конфигурация Hathr API (рабочие ключи)
     hathr_config = {
         "client_id": "4vau54clia0s5esf9ahojcn7kv",
@@ -443,13 +696,47 @@ def main():
     }
     
     # Создаем тестер
-    tester = CompactPromptTester(hathr_config)
+    # Dry-run ничего не записывает: хранилище результатов для --plan не открывается
+    sink = None
+    if args.db and not args.plan:
+        sink = PostgresResultsSink(args.database_url)
+    elif args.sqlite and not args.plan:
+        sink = SQLiteResultsStore(args.sqlite)
+    document_formats = list(DOCUMENT_FORMATS) if args.ab_format else [args.format]
+    budget = None
+    if args.max_call_tokens or args.max_session_tokens:
+        budget = TokenBudget(args.max_call_tokens, args.max_session_tokens)
+    scheduler = None
+    if args.adaptive or args.adaptive_budget is not None:
+        scheduler = AdaptiveScheduler(StoppingTargets(args.ci_success, args.ci_score, args.ci_latency),
+                                      args.min_samples, args.adaptive_budget)
+    tester = CompactPromptTester(hathr_config, data_dir=args.data_dir, chunked=args.chunked,
+                                 chunk_budget=args.chunk_budget, workers=args.workers,
+                                 document_formats=document_formats, budget=budget,
+                                 prescreen_policy=PrescreenPolicy(args.prescreen_keep) if args.prescreen else None,
+                                 dedupe=args.dedupe, dedupe_threshold=args.dedupe_threshold,
+                                 stratified=args.stratified or args.sample_budget is not None,
+                                 sample_budget=args.sample_budget, sample_per_stratum=args.sample_per_stratum,
+                                 scheduler=scheduler, call_workers=args.call_workers, queue_size=args.queue_size,
+                                 sink=sink, blobs=BlobStore(args.blobs) if args.blobs else None)
+    
+    if args.plan:
+        tester.plan_tests(args.concurrency, args.price_input, args.price_output)
+        if tester.blobs:
+            tester.blobs.close()
+        return
     
     # Запускаем тесты
-    summary = tester.run_compact_tests()
+    try:
+        summary = tester.run_compact_tests()
+    finally:
+        if tester.sink:
+            tester.sink.close()
     
     # Сохраняем результаты
     tester.save_results(summary)
+    if tester.blobs:
+        tester.blobs.close()
     
     # Выводим итоги
     print(f"\n🎉 Сокращенное тестирование завершено!")
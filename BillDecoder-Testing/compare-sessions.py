@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Поиск регрессий задержки, токенов и оценок между сессиями тестирования
+Первая сессия — база, остальные сравниваются с ней по ячейкам (промт × тип документа):
+критерий Манна-Уитни, бутстреп-интервал разницы средних, поправка Бенджамини-Хохберга.
+Ответы, переиспользованные для почти одинаковых документов (reused_from), в выборки
+не входят: у них нет своих задержки и токенов. Код выхода 1, если найдена значимая
+регрессия сверх порога — для гейта выкатки
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from results_analytics import load_results, score_columns
+
+# Метрики, рост которых — регрессия; для оценок регрессия — падение
+COST_METRICS = ("response_time", "output_tokens", "input_tokens", "total_tokens")
+
+
+def mann_whitney(baseline: np.ndarray, candidate: np.ndarray) -> float:
+    """Двусторонний p-value критерия Манна-Уитни (нормальное приближение с поправкой на связки)"""
+    n1, n2 = len(baseline), len(candidate)
+    combined = np.concatenate([baseline, candidate])
+    ranks = pd.Series(combined).rank().to_numpy()
+    u = ranks[:n1].sum() - n1 * (n1 + 1) / 2
+
+    n = n1 + n2
+    _, tie_counts = np.unique(combined, return_counts=True)
+    tie_term = (tie_counts ** 3 - tie_counts).sum() / (n * (n - 1))
+    sigma = math.sqrt(n1 * n2 / 12 * ((n + 1) - tie_term))
+    if sigma == 0:
+        return 1.0
+
+    delta = u - n1 * n2 / 2
+    z = (abs(delta) - 0.5) / sigma  # поправка на непрерывность
+    return min(1.0, math.erfc(max(z, 0.0) / math.sqrt(2)))
+
+
+def bootstrap_mean_diff(baseline: np.ndarray, candidate: np.ndarray, iterations: int,
+                        confidence: float, rng: np.random.Generator) -> Tuple[float, float]:
+    """Бутстреп-интервал разницы средних (кандидат - база), векторно по всем итерациям"""
+    baseline_means = baseline[rng.integers(0, len(baseline), (iterations, len(baseline)))].mean(axis=1)
+    candidate_means = candidate[rng.integers(0, len(candidate), (iterations, len(candidate)))].mean(axis=1)
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(candidate_means - baseline_means, [tail, 100 - tail])
+    return float(low), float(high)
+
+
+def benjamini_hochberg(p_values: List[float]) -> List[float]:
+    """q-значения по Бенджамини-Хохбергу"""
+    if not p_values:
+        return []
+    p = np.asarray(p_values)
+    order = np.argsort(p)
+    ranked = p[order] * len(p) / np.arange(1, len(p) + 1)
+    q = np.minimum.accumulate(ranked[::-1])[::-1]
+    result = np.empty_like(q)
+    result[order] = np.minimum(q, 1.0)
+    return result.tolist()
+
+
+def measured(frame: pd.DataFrame) -> pd.DataFrame:
+    """Успешные тесты с собственным запросом к API (без переиспользованных ответов)"""
+    return frame[frame["success"] & ~frame["reused"]]
+
+
+def compare_cells(baseline: pd.DataFrame, candidate: pd.DataFrame, group_by: List[str], metrics: List[str],
+                  min_samples: int, iterations: int, confidence: float, seed: int) -> List[Dict[str, Any]]:
+    """Сравнивает каждую ячейку группировки по каждой метрике (по тестам из measured)"""
+    rng = np.random.default_rng(seed)
+    baseline_groups = dict(iter(measured(baseline).groupby(group_by)))
+    comparisons = []
+
+    for key, candidate_cell in measured(candidate).groupby(group_by):
+        baseline_cell = baseline_groups.get(key)
+        if baseline_cell is None:
+            continue
+        cell = dict(zip(group_by, key if isinstance(key, tuple) else (key,)))
+        for metric in metrics:
+            if metric not in baseline_cell or metric not in candidate_cell:
+                continue
+            x = pd.to_numeric(baseline_cell[metric], errors="coerce").dropna().to_numpy(dtype=float)
+            y = pd.to_numeric(candidate_cell[metric], errors="coerce").dropna().to_numpy(dtype=float)
+            comparison = {**cell, "metric": metric, "baseline_n": len(x), "candidate_n": len(y)}
+            if len(x) < min_samples or len(y) < min_samples:
+                comparisons.append({**comparison, "status": "insufficient"})
+                continue
+            if x.min() == x.max() == y.min() == y.max():
+                # Одинаковая константа в обеих сессиях — проверять нечего
+                continue
+
+            baseline_mean, candidate_mean = float(x.mean()), float(y.mean())
+            ci_low, ci_high = bootstrap_mean_diff(x, y, iterations, confidence, rng)
+            comparisons.append({
+                **comparison,
+                "status": "tested",
+                "baseline_mean": baseline_mean,
+                "candidate_mean": candidate_mean,
+                "baseline_median": float(np.median(x)),
+                "candidate_median": float(np.median(y)),
+                "diff": candidate_mean - baseline_mean,
+                "relative_change": (candidate_mean / baseline_mean - 1) if baseline_mean else None,
+                "ci_low": ci_low,
+                "ci_high": ci_high,
+                "p_value": mann_whitney(x, y)
+            })
+
+    return comparisons
+
+
+def classify(comparisons: List[Dict[str, Any]], alpha: float, latency_threshold: float, tokens_threshold: float,
+             score_threshold: float):
+    """Проставляет q-значения и вердикт: regression / improvement / no_change
+
+    Поправка на множественные сравнения делается внутри каждой метрики по всем ячейкам
+    """
+    tested = [comparison for comparison in comparisons if comparison["status"] == "tested"]
+    for metric in {comparison["metric"] for comparison in tested}:
+        family = [comparison for comparison in tested if comparison["metric"] == metric]
+        for comparison, q_value in zip(family, benjamini_hochberg([comparison["p_value"] for comparison in family])):
+            comparison["q_value"] = q_value
+
+    for comparison in tested:
+        q_value = comparison["q_value"]
+        metric = comparison["metric"]
+        significant = q_value < alpha
+
+        if metric in COST_METRICS:
+            # Рост задержки/токенов; порог относительный, интервал не должен включать 0
+            threshold = latency_threshold if metric == "response_time" else tokens_threshold
+            change = comparison["relative_change"] if comparison["relative_change"] is not None else 0.0
+            worse = significant and comparison["ci_low"] > 0 and change > threshold
+            better = significant and comparison["ci_high"] < 0
+        else:
+            # Падение оценки; порог абсолютный
+            worse = significant and comparison["ci_high"] < 0 and -comparison["diff"] > score_threshold
+            better = significant and comparison["ci_low"] > 0
+
+        comparison["status"] = "regression" if worse else "improvement" if better else "no_change"
+
+
+def _format_value(value: Optional[float], pattern: str = "{:.2f}") -> str:
+    return "-" if value is None else pattern.format(value)
+
+
+def print_comparisons(label: str, comparisons: List[Dict[str, Any]], group_by: List[str], show_all: bool):
+    """Таблица сравнения в консоль"""
+    symbols = {"regression": "❌", "improvement": "✅", "no_change": "➖", "insufficient": "⚪"}
+    rows = [comparison for comparison in comparisons if show_all or comparison["status"] != "no_change"]
+    print(f"\n## {label}\n")
+    if not rows:
+        print("Значимых изменений нет")
+        return
+    print("| " + " | ".join(group_by) + " | Метрика | База (ср.) | Кандидат (ср.) | Изменение | ДИ разницы | q | Вердикт |")
+    print("|" + "---|" * (len(group_by) + 7))
+    for comparison in rows:
+        cells = " | ".join(str(comparison[column]) for column in group_by)
+        if comparison["status"] == "insufficient":
+            print(f"| {cells} | {comparison['metric']} | n={comparison['baseline_n']} | n={comparison['candidate_n']} "
+                  f"| - | - | - | {symbols['insufficient']} мало данных |")
+            continue
+        print(f"| {cells} | {comparison['metric']} | {comparison['baseline_mean']:.2f} | {comparison['candidate_mean']:.2f} "
+              f"| {_format_value(comparison['relative_change'], '{:+.1%}')} "
+              f"| [{comparison['ci_low']:+.2f}; {comparison['ci_high']:+.2f}] | {comparison['q_value']:.3f} "
+              f"| {symbols[comparison['status']]} {comparison['status']} |")
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description="Сравнение сессий тестирования и поиск регрессий")
+    parser.add_argument("sessions", nargs="+",
+                        help="файлы или шаблоны результатов: первый — база, остальные — кандидаты")
+    parser.add_argument("--group-by", default="prompt_type,document_type", help="колонки ячеек через запятую")
+    parser.add_argument("--metrics", help="метрики через запятую (по умолчанию response_time, output_tokens и оценки)")
+    parser.add_argument("--alpha", type=float, default=0.05, help="уровень значимости после поправки")
+    parser.add_argument("--latency-threshold", type=float, default=0.10, help="допустимый рост задержки (доля)")
+    parser.add_argument("--tokens-threshold", type=float, default=0.10, help="допустимый рост токенов (доля)")
+    parser.add_argument("--score-threshold", type=float, default=0.05, help="допустимое падение оценки (абсолютное)")
+    parser.add_argument("--min-samples", type=int, default=5, help="минимум успешных тестов в ячейке")
+    parser.add_argument("--bootstrap", type=int, default=2000, help="итераций бутстрепа")
+    parser.add_argument("--confidence", type=float, default=0.95, help="уровень доверительного интервала")
+    parser.add_argument("--seed", type=int, default=42, help="seed бутстрепа")
+    parser.add_argument("--show-all", action="store_true", help="показывать и ячейки без изменений")
+    parser.add_argument("--output", help="сохранить сравнение в JSON-файл")
+    args = parser.parse_args()
+
+    if len(args.sessions) < 2:
+        parser.error("нужны минимум две сессии: база и кандидат")
+
+    group_by = [column.strip() for column in args.group_by.split(",") if column.strip()]
+    frames = []
+    for pattern in args.sessions:
+        frame = load_results([pattern])
+        if frame.empty:
+            print(f"❌ Результаты не найдены: {pattern}")
+            sys.exit(2)
+        frames.append(frame)
+
+    baseline = frames[0]
+    if args.metrics:
+        metrics = [metric.strip() for metric in args.metrics.split(",") if metric.strip()]
+    else:
+        metrics = ["response_time", "output_tokens", *score_columns(baseline)]
+
+    print(f"🔬 База: {args.sessions[0]} ({len(baseline)} тестов), метрики: {', '.join(metrics)}")
+    if baseline["reused"].any():
+        print(f"♻️ Переиспользованных ответов в базе: {int(baseline['reused'].sum())}, в сравнение не входят")
+
+    report = {"baseline": args.sessions[0], "baseline_reused_excluded": int(baseline["reused"].sum()),
+              "candidates": []}
+    regressions = 0
+    for pattern, candidate in zip(args.sessions[1:], frames[1:]):
+        comparisons = compare_cells(baseline, candidate, group_by, metrics, args.min_samples,
+                                    args.bootstrap, args.confidence, args.seed)
+        classify(comparisons, args.alpha, args.latency_threshold, args.tokens_threshold, args.score_threshold)
+        print_comparisons(f"{pattern} ({len(candidate)} тестов)", comparisons, group_by, args.show_all)
+        reused = int(candidate["reused"].sum())
+        if reused:
+            print(f"♻️ Переиспользованных ответов: {reused}, в сравнение не входят")
+
+        candidate_regressions = sum(1 for comparison in comparisons if comparison["status"] == "regression")
+        regressions += candidate_regressions
+        report["candidates"].append({"session": pattern, "regressions": candidate_regressions,
+                                     "reused_excluded": reused, "comparisons": comparisons})
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False, default=str)
+        print(f"\n📄 Сравнение сохранено: {args.output}")
+
+    if regressions:
+        print(f"\n❌ Найдено регрессий: {regressions}")
+        sys.exit(1)
+    print("\n✅ Регрессий не найдено")
+
+
+if __name__ == "__main__":
+    main()
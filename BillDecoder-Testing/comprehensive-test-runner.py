@@ -4,6 +4,7 @@
 Работает локально без Docker, сохраняет результаты в JSON файлы
 """
 
+import argparse
 import json
 import requests
 import time
@@ -13,11 +14,35 @@ from datetime import datetime
 from typing import Dict, List, Any, Tuple
 import uuid
 
+from billing_prescreen import (
+    BillingPrescreen, PrescreenPolicy, findings_payload, prescreen_summary, print_prescreen_summary,
+    screen_documents, write_prescreen_report
+)
+from document_formatter import format_document
+from response_scorer import RESPONSE_SCORER
+from blob_store import DEFAULT_BLOB_PATH, BlobStore, externalize_results
+from results_sink import PostgresResultsSink
+from sqlite_store import DEFAULT_SQLITE_PATH, SQLiteResultsStore
+from token_estimator import (
+    DEFAULT_INPUT_PRICE_PER_1K, DEFAULT_OUTPUT_PRICE_PER_1K,
+    TokenBudget, TokenEstimator, build_message, plan_calls, print_plan
+)
+
 class ComprehensivePromptTester:
-    def __init__(self, hathr_config: Dict[str, str]):
+    def __init__(self, hathr_config: Dict[str, str], budget: TokenBudget = None,
+                 estimator: TokenEstimator = None, prescreen_policy: PrescreenPolicy = None,
+                 sink: PostgresResultsSink = None, blobs: BlobStore = None):
         self.hathr_config = hathr_config
         self.access_token = None
         self.token_expires_at = None
+        self.budget = budget
+        self.estimator = estimator or TokenEstimator.from_results(blobs=blobs)
+        self.prescreen_policy = prescreen_policy
+        self.prescreen = BillingPrescreen() if prescreen_policy else None
+        self.prescreen_findings = {}
+        self.sink = sink
+        self.blobs = blobs
+        self.prompts = self._load_prompts()
         self.results = []
         self.session_id = str(uuid.uuid4())
         
@@ -51,16 +76,32 @@ class ComprehensivePromptTester:
     
     def test_prompt(self, document_data: Dict[str, Any], prompt_type: str, prompt_text: str) -> Tuple[bool, str, float, Dict[str, Any]]:
         """Тестирует один промт на одном документе"""
+        # Форматируем документ
+        document_text = self.format_document_for_prompt(document_data)
+        
+        # Формируем сообщение
+        message = build_message(prompt_text, document_text)
+        
+        # Запросы сверх бюджета отклоняются до отправки
+        estimated_tokens = 0
+        if self.budget:
+            estimated_tokens = self.estimator.estimate_call(message, prompt_type)["total_tokens"]
+            refusal = self.budget.reserve(estimated_tokens)
+            if refusal:
+                return False, f"Бюджет превышен: {refusal}", 0.0, {}
+        
+        success, ai_response, response_time, metrics = self._send_message(message, document_data, prompt_type)
+        if self.budget:
+            self.budget.commit(estimated_tokens, metrics.get("total_tokens", 0))
+        return success, ai_response, response_time, metrics
+    
+    def _send_message(self, message: str, document_data: Dict[str, Any],
+                      prompt_type: str) -> Tuple[bool, str, float, Dict[str, Any]]:
+        """Отправляет сообщение в Hathr API и оценивает ответ"""
         try:
             # Получаем токен
             token = self.get_access_token()
             
-            # Форматируем документ
-            document_text = self.format_document_for_prompt(document_data)
-            
-            # Формируем сообщение
-            message = f"{prompt_text}\n\n[DOCUMENT]\n{document_text}"
-            
             # Отправляем запрос
             payload = {
                 "messages": [{"role": "user", "text": message}],
@@ -92,6 +133,7 @@ class ComprehensivePromptTester:
                         "input_tokens": usage.get("inputTokens", 0),
                         "output_tokens": usage.get("outputTokens", 0),
                         "total_tokens": usage.get("totalTokens", 0),
+                        "message_chars": len(message),
                         "quality_metrics": quality_metrics
                     }
                 else:
@@ -104,135 +146,11 @@ class ComprehensivePromptTester:
     
     def format_document_for_prompt(self, document_data: Dict[str, Any]) -> str:
         """Форматирует документ для промта"""
-        doc_type = document_data.get("document_type", "unknown")
-        
-        if doc_type == "bill":
-            return self._format_bill_as_text(document_data)
-        elif doc_type == "lab":
-            return self._format_lab_as_text(document_data)
-        elif doc_type == "eob":
-            return self._format_eob_as_text(document_data)
-        else:
-            return json.dumps(document_data, indent=2, ensure_ascii=False)
-    
-    def _format_bill_as_text(self, bill_data: Dict[str, Any]) -> str:
-        """Форматирует медицинский счет как текст"""
-        text = f"""
-MEDICAL BILL
-
-Provider: {bill_data['provider']['name']}
-Patient: {bill_data['patient']['name']}
-Service Date: {bill_data['service_date']}
-
-Services:
-"""
-        for service in bill_data.get("services", []):
-            text += f"""
-Code: {service['code']}
-Description: {service['description']}
-Charge: ${service['charge']}
-"""
-        
-        text += f"""
-Total Charges: ${bill_data['financial_summary']['total_charges']}
-Insurance Payment: ${bill_data['financial_summary']['insurance_payment']}
-Patient Responsibility: ${bill_data['financial_summary']['patient_responsibility']}
-"""
-        return text
-    
-    def _format_lab_as_text(self, lab_data: Dict[str, Any]) -> str:
-        """Форматирует лабораторные результаты как текст"""
-        text = f"""
-LABORATORY RESULTS
-
-Patient: {lab_data['patient']['name']}
-Test Date: {lab_data['test_date']}
-Laboratory: {lab_data['provider']['name']}
-
-Results:
-"""
-        for value in lab_data.get("lab_values", []):
-            status_symbol = "✅" if value["status"] == "normal" else "⚠️" if value["status"] in ["high", "low"] else "❌"
-            text += f"{status_symbol} {value['test_name']}: {value['value']} {value['unit']} (normal: {value['reference_range']})\n"
-        
-        if lab_data.get('clinical_notes'):
-            text += f"\nClinical Notes: {lab_data['clinical_notes']}"
-        
-        return text
-    
-    def _format_eob_as_text(self, eob_data: Dict[str, Any]) -> str:
-        """Форматирует EOB как текст"""
-        text = f"""
-EXPLANATION OF BENEFITS (EOB)
-
-Patient: {eob_data['patient']['name']}
-Member ID: {eob_data['patient']['member_id']}
-Date of Service: {eob_data['service_date']}
-Provider: {eob_data['provider']['name']}
-Insurance: {eob_data['insurance_company']['name']}
-Claim Number: {eob_data['claim_number']}
-
-Claim Details:
-"""
-        for service in eob_data.get("services", []):
-            text += f"""
-Service: {service['description']}
-Code: {service['code']}
-Date: {service.get('date', 'N/A')}
-Billed Amount: ${service['billed_amount']}
-Insurance Paid: ${service['insurance_payment']}
-Patient Responsibility: ${service['patient_responsibility']}
-Coverage Status: {service['coverage_status']}
-"""
-        
-        # Вычисляем общие суммы
-        total_billed = sum(service['billed_amount'] for service in eob_data.get("services", []))
-        total_insurance = sum(service['insurance_payment'] for service in eob_data.get("services", []))
-        total_patient = sum(service['patient_responsibility'] for service in eob_data.get("services", []))
-        
-        text += f"""
-Financial Summary:
-Total Billed: ${total_billed:.2f}
-Insurance Payment: ${total_insurance:.2f}
-Patient Responsibility: ${total_patient:.2f}
-"""
-        return text
+        return format_document(document_data)
     
     def evaluate_response_metrics(self, response_text: str, document_data: Dict[str, Any], prompt_type: str) -> Dict[str, float]:
         """Оценивает качество ответа по различным метрикам"""
-        metrics = {
-            "length_score": min(len(response_text) / 500, 1.0),  # Оптимальная длина ~500 символов
-            "structure_score": 0.0,
-            "safety_score": 0.0,
-            "accuracy_score": 0.0,
-            "helpfulness_score": 0.0
-        }
-        
-        # Проверка структуры ответа
-        if prompt_type == "document_classification":
-            if any(keyword in response_text.lower() for keyword in ["document type", "type:", "classification"]):
-                metrics["structure_score"] += 0.3
-            if any(keyword in response_text.lower() for keyword in ["provider", "patient", "date"]):
-                metrics["structure_score"] += 0.3
-            if any(keyword in response_text.lower() for keyword in ["services", "charges", "financial"]):
-                metrics["structure_score"] += 0.4
-        
-        # Проверка безопасности
-        if any(keyword in response_text.lower() for keyword in ["not medical advice", "consult", "healthcare provider", "doctor"]):
-            metrics["safety_score"] = 1.0
-        elif any(keyword in response_text.lower() for keyword in ["medical advice", "diagnosis", "treatment"]):
-            metrics["safety_score"] = 0.3
-        
-        # Проверка точности (базовая)
-        doc_type = document_data.get("document_type", "")
-        if doc_type in response_text.lower():
-            metrics["accuracy_score"] += 0.5
-        
-        # Проверка полезности
-        if len(response_text) > 100 and any(keyword in response_text.lower() for keyword in ["explain", "help", "understand", "information"]):
-            metrics["helpfulness_score"] = 1.0
-        
-        return metrics
+        return RESPONSE_SCORER.response_metrics(response_text, document_data.get("document_type", ""), prompt_type)
     
     def load_test_files(self) -> List[Tuple[str, Dict[str, Any]]]:
         """Загружает все тестовые файлы"""
@@ -244,23 +162,17 @@ Patient Responsibility: ${total_patient:.2f}
                 try:
                     with open(file_path, 'r', encoding='utf-8') as f:
                         data = json.load(f)
+                        if not isinstance(data, dict) or "document_type" not in data:
+                            continue  # ground_truth.json и прочие служебные файлы
                         test_files.append((file_path, data))
                 except Exception as e:
                     print(f"⚠️ Ошибка загрузки {file_path}: {e}")
         
         return test_files
     
-    def run_comprehensive_tests(self) -> Dict[str, Any]:
-        """Запускает комплексные тесты"""
-        print("🚀 Запуск комплексного тестирования промтов...")
-        print(f"📋 Session ID: {self.session_id}")
-        
-        # Загружаем тестовые файлы
-        test_files = self.load_test_files()
-        print(f"📁 Найдено {len(test_files)} тестовых файлов")
-        
-        # Определяем промты для тестирования
-        prompts = {
+    def _load_prompts(self) -> Dict[str, str]:
+        """Загружает промты для тестирования"""
+        return {
             "document_classification": """Classify this healthcare document and extract key metadata:
 
 Document types to identify:
@@ -298,6 +210,53 @@ Use clear, non-technical language. Always remind patients to consult their healt
 
 Provide reasoning for each score and highlight any concerns or missing information."""
         }
+    
+    def _apply_prescreen(self, test_files: List[Tuple[str, Dict[str, Any]]]) -> Tuple[List[Tuple[str, Dict[str, Any]]], Dict[str, Any]]:
+        """Локальная предпроверка: оставляет документы, которым нужна модель, и считает сэкономленное"""
+        if not self.prescreen:
+            return test_files, None
+        
+        kept, skipped, self.prescreen_findings = screen_documents(test_files, self.prescreen, self.prescreen_policy)
+        avoided_calls = [
+            (prompt_name, build_message(prompt_text, self.format_document_for_prompt(document_data)))
+            for _, document_data in skipped
+            for prompt_name, prompt_text in self.prompts.items()
+        ]
+        summary = prescreen_summary(self.estimator, self.prescreen_findings, skipped, avoided_calls)
+        print_prescreen_summary(summary)
+        return kept, summary
+    
+    def plan_tests(self, concurrency: int = 1, input_price_per_1k: float = DEFAULT_INPUT_PRICE_PER_1K,
+                   output_price_per_1k: float = DEFAULT_OUTPUT_PRICE_PER_1K) -> Dict[str, Any]:
+        """Dry-run: оценивает токены, стоимость и время матрицы без обращения к API"""
+        test_files, _ = self._apply_prescreen(self.load_test_files())
+        calls = []
+        for _, document_data in test_files:
+            doc_type = document_data.get("document_type", "unknown")
+            document_text = self.format_document_for_prompt(document_data)
+            for prompt_name, prompt_text in self.prompts.items():
+                calls.append((doc_type, prompt_name, build_message(prompt_text, document_text)))
+        
+        # План использует копию лимитов, чтобы не расходовать бюджет реального прогона
+        budget = None
+        if self.budget:
+            budget = TokenBudget(self.budget.max_call_tokens, self.budget.max_session_tokens)
+        
+        plan = plan_calls(self.estimator, calls, concurrency, budget, input_price_per_1k, output_price_per_1k)
+        print_plan(plan, self.estimator)
+        return plan
+    
+    def run_comprehensive_tests(self) -> Dict[str, Any]:
+        """Запускает комплексные тесты"""
+        print("🚀 Запуск комплексного тестирования промтов...")
+        print(f"📋 Session ID: {self.session_id}")
+        
+        # Загружаем тестовые файлы
+        test_files = self.load_test_files()
+        print(f"📁 Найдено {len(test_files)} тестовых файлов")
+        test_files, prescreen = self._apply_prescreen(test_files)
+        
+        prompts = self.prompts
         
         # Запускаем тесты
         total_tests = len(test_files) * len(prompts)
@@ -330,8 +289,12 @@ Provide reasoning for each score and highlight any concerns or missing informati
                     "metrics": metrics,
                     "prompt_text": prompt_text
                 }
+                if self.prescreen:
+                    result["prescreen_findings"] = findings_payload(self.prescreen_findings[file_path])
                 
                 self.results.append(result)
+                if self.sink:
+                    self.sink.add(result, self.session_id, "comprehensive")
                 
                 if success:
                     successful_tests += 1
@@ -349,6 +312,8 @@ Provide reasoning for each score and highlight any concerns or missing informati
             "success_rate": successful_tests / total_tests if total_tests > 0 else 0,
             "results": self.results
         }
+        if prescreen:
+            summary["prescreen"] = prescreen
         
         return summary
     
@@ -359,8 +324,12 @@ Provide reasoning for each score and highlight any concerns or missing informati
         
         # Сохраняем полные результаты
         results_file = f"test-results/comprehensive_test_{self.session_id}.json"
+        saved = summary
+        if self.blobs:
+            # Тексты ответов и промтов — в хранилище блобов, в файле только их хэши
+            saved = {**summary, "results": externalize_results(summary["results"], self.blobs)}
         with open(results_file, 'w', encoding='utf-8') as f:
-            json.dump(summary, f, indent=2, ensure_ascii=False)
+            json.dump(saved, f, indent=2, ensure_ascii=False)
         
         # Создаем краткий отчет
         report_file = f"test-results/summary_{self.session_id}.md"
@@ -387,6 +356,9 @@ Provide reasoning for each score and highlight any concerns or missing informati
             for doc_type, stats in doc_types.items():
                 success_rate = stats['successful'] / stats['total'] * 100 if stats['total'] > 0 else 0
                 f.write(f"- **{doc_type}**: {stats['successful']}/{stats['total']} ({success_rate:.1f}%)\n")
+            
+            if summary.get('prescreen'):
+                write_prescreen_report(f, summary['prescreen'])
         
         print(f"\n📊 Результаты сохранены:")
         print(f"   Полные данные: {results_file}")
@@ -394,6 +366,29 @@ Provide reasoning for each score and highlight any concerns or missing informati
 
 def main():
     """Основная функция"""
+    parser = argparse.ArgumentParser(description="Комплексное тестирование промтов BillDecoder/LabDecoder")
+    parser.add_argument("--plan", action="store_true",
+                        help="dry-run: оценить токены, стоимость и время без обращения к API")
+    parser.add_argument("--concurrency", type=int, default=1, help="параллельность для оценки времени в --plan")
+    parser.add_argument("--price-input", type=float, default=DEFAULT_INPUT_PRICE_PER_1K,
+                        help="стоимость 1000 входных токенов, USD")
+    parser.add_argument("--price-output", type=float, default=DEFAULT_OUTPUT_PRICE_PER_1K,
+                        help="стоимость 1000 выходных токенов, USD")
+    parser.add_argument("--max-call-tokens", type=int, help="отклонять запросы дороже этого числа токенов")
+    parser.add_argument("--max-session-tokens", type=int, help="отклонять запросы сверх бюджета токенов сессии")
+    parser.add_argument("--prescreen", action="store_true",
+                        help="локальная предпроверка: документы без находок не отправляются в модель")
+    parser.add_argument("--prescreen-keep", type=float, default=0.0,
+                        help="доля чистых документов, которые все равно отправляются в модель для контроля")
+    parser.add_argument("--db", action="store_true",
+                        help="писать результаты в PostgreSQL (схема database/init.sql) пачками через COPY")
+    parser.add_argument("--database-url", help="строка подключения PostgreSQL (по умолчанию DATABASE_URL)")
+    parser.add_argument("--sqlite", nargs="?", const=DEFAULT_SQLITE_PATH,
+                        help=f"писать результаты во встроенную базу SQLite (по умолчанию {DEFAULT_SQLITE_PATH})")
+    parser.add_argument("--blobs", nargs="?", const=DEFAULT_BLOB_PATH,
+                        help=f"хранить тексты ответов сжатыми блобами по хэшу (по умолчанию {DEFAULT_BLOB_PATH})")
+    args = parser.parse_args()
+    
     # Конфигурация Hathr API (рабочие ключи)
     hathr_config = {
         "client_id": "4vau54clia0s5esf9ahojcn7kv",
@@ -404,13 +399,36 @@ def main():
     }
     
     # Создаем тестер
-    tester = ComprehensivePromptTester(hathr_config)
+    # Dry-run ничего не записывает: хранилище результатов для --plan не открывается
+    sink = None
+    if args.db and not args.plan:
+        sink = PostgresResultsSink(args.database_url)
+    elif args.sqlite and not args.plan:
+        sink = SQLiteResultsStore(args.sqlite)
+    budget = None
+    if args.max_call_tokens or args.max_session_tokens:
+        budget = TokenBudget(args.max_call_tokens, args.max_session_tokens)
+    tester = ComprehensivePromptTester(hathr_config, budget=budget,
+                                       prescreen_policy=PrescreenPolicy(args.prescreen_keep) if args.prescreen else None,
+                                       sink=sink, blobs=BlobStore(args.blobs) if args.blobs else None)
+    
+    if args.plan:
+        tester.plan_tests(args.concurrency, args.price_input, args.price_output)
+        if tester.blobs:
+            tester.blobs.close()
+        return
     
     # Запускаем тесты
-    summary = tester.run_comprehensive_tests()
+    try:
+        summary = tester.run_comprehensive_tests()
+    finally:
+        if tester.sink:
+            tester.sink.close()
     
     # Сохраняем результаты
     tester.save_results(summary)
+    if tester.blobs:
+        tester.blobs.close()
     
     # Выводим итоги
     print(f"\n🎉 Тестирование завершено!")
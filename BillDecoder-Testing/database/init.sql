@@ -1,13 +1,14 @@
 -- Инициализация базы данных для тестирования промтов
 
--- Создание таблицы для результатов тестов
+-- Создание таблицы для результатов тестов, секционированной по месяцам test_timestamp.
+-- Ключ секционирования входит в первичный ключ и ограничение уникальности test_id
 CREATE TABLE IF NOT EXISTS test_results (
-    id SERIAL PRIMARY KEY,
-    test_id VARCHAR(255) UNIQUE NOT NULL,
+    id SERIAL,
+    test_id VARCHAR(255) NOT NULL,
     document_type VARCHAR(50) NOT NULL,
     document_file VARCHAR(255) NOT NULL,
     prompt_type VARCHAR(100) NOT NULL,
-    test_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    test_timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     success BOOLEAN NOT NULL,
     response_time FLOAT,
     input_tokens INTEGER,
@@ -18,25 +19,68 @@ CREATE TABLE IF NOT EXISTS test_results (
     quality_score FLOAT,
     safety_score FLOAT,
     performance_score FLOAT,
-    metadata JSONB
-);
+    metadata JSONB,
+    PRIMARY KEY (id, test_timestamp),
+    UNIQUE (test_id, test_timestamp)
+) PARTITION BY RANGE (test_timestamp);
 
 -- Создание индексов для быстрого поиска
 CREATE INDEX IF NOT EXISTS idx_test_results_document_type ON test_results(document_type);
 CREATE INDEX IF NOT EXISTS idx_test_results_prompt_type ON test_results(prompt_type);
 CREATE INDEX IF NOT EXISTS idx_test_results_timestamp ON test_results(test_timestamp);
 CREATE INDEX IF NOT EXISTS idx_test_results_success ON test_results(success);
+CREATE INDEX IF NOT EXISTS idx_test_results_session ON test_results((metadata->>'session_id'));
+
+-- Полнотекстовый поиск по ответам и ошибкам (results_api.py search). tsvector хранится в строке:
+-- ранжирование читает его, а не разбирает текст заново; колонка и GIN-индекс обновляются при вставке,
+-- а после архивации секции (тексты очищены) ее результаты не ищутся
+ALTER TABLE test_results ADD COLUMN IF NOT EXISTS search_vector TSVECTOR GENERATED ALWAYS AS (
+    to_tsvector('english', COALESCE(response_text, '') || ' ' || COALESCE(error_message, ''))
+) STORED;
+CREATE INDEX IF NOT EXISTS idx_test_results_search ON test_results USING GIN (search_vector);
+
+-- Секция test_results_<ГГГГ>_<ММ> на месяц; результаты вне месячных секций попадают в test_results_default,
+-- partition-maintenance.py ensure заранее создает секции и переносит в них строки из секции по умолчанию
+CREATE OR REPLACE FUNCTION create_test_results_partition(month_start DATE) RETURNS TEXT
+LANGUAGE plpgsql AS $$
+DECLARE
+    first_day DATE := date_trunc('month', month_start)::DATE;
+    partition_name TEXT := 'test_results_' || to_char(first_day, 'YYYY_MM');
+BEGIN
+    EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF test_results FOR VALUES FROM (%L) TO (%L)',
+                   partition_name, first_day, (first_day + INTERVAL '1 month')::DATE);
+    RETURN partition_name;
+END
+$$;
+
+CREATE TABLE IF NOT EXISTS test_results_default PARTITION OF test_results DEFAULT;
+
+SELECT create_test_results_partition((CURRENT_DATE + make_interval(months => m))::DATE)
+FROM generate_series(-1, 2) AS m;
+
+-- Секции, тексты ответов которых вынесены в сжатые архивы (partition-maintenance.py archive);
+-- числовые колонки и metadata остаются в базе
+CREATE TABLE IF NOT EXISTS test_results_archives (
+    partition_name VARCHAR(63) PRIMARY KEY,
+    archive_path TEXT NOT NULL,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    rows_archived INTEGER NOT NULL,
+    bytes_archived BIGINT NOT NULL
+);
 
--- Создание таблицы для метрик
+-- Создание таблицы для метрик. Связь с test_results по test_id без внешнего ключа:
+-- в секционированной таблице test_id уникален только вместе с test_timestamp
 CREATE TABLE IF NOT EXISTS test_metrics (
     id SERIAL PRIMARY KEY,
     test_id VARCHAR(255) NOT NULL,
     metric_name VARCHAR(100) NOT NULL,
     metric_value FLOAT NOT NULL,
-    metric_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (test_id) REFERENCES test_results(test_id)
+    metric_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Метрики теста
+CREATE INDEX IF NOT EXISTS idx_test_metrics_test_id ON test_metrics(test_id);
+
 -- Создание таблицы для сессий тестирования
 CREATE TABLE IF NOT EXISTS test_sessions (
     id SERIAL PRIMARY KEY,
@@ -52,21 +96,226 @@ CREATE TABLE IF NOT EXISTS test_sessions (
     status VARCHAR(50) DEFAULT 'running'
 );
 
--- Создание представления для статистики
-CREATE OR REPLACE VIEW test_statistics AS
-SELECT 
+-- Скетч задержки: счетчики по логарифмическим корзинам (те же, что в results_rollups.py).
+-- Корзина 0 — до 0.01 с, корзина i — (0.01·1.25^(i-1); 0.01·1.25^i], всего 48 корзин
+CREATE OR REPLACE FUNCTION latency_bucket(seconds FLOAT) RETURNS INTEGER
+LANGUAGE SQL IMMUTABLE AS $$
+    SELECT CASE
+        WHEN seconds IS NULL THEN NULL
+        WHEN seconds <= 0.01 THEN 0
+        ELSE LEAST(47, CEIL(LN(seconds / 0.01) / LN(1.25))::INTEGER)
+    END
+$$;
+
+CREATE OR REPLACE FUNCTION latency_sketch(seconds FLOAT) RETURNS INTEGER[]
+LANGUAGE SQL IMMUTABLE AS $$
+    SELECT CASE
+        WHEN seconds IS NULL THEN array_fill(0, ARRAY[48])
+        ELSE array_fill(0, ARRAY[latency_bucket(seconds)]) || 1 || array_fill(0, ARRAY[47 - latency_bucket(seconds)])
+    END
+$$;
+
+CREATE OR REPLACE FUNCTION sketch_add(a INTEGER[], b INTEGER[]) RETURNS INTEGER[]
+LANGUAGE SQL IMMUTABLE AS $$
+    SELECT COALESCE(array_agg(COALESCE(x, 0) + COALESCE(y, 0) ORDER BY n), '{}')
+    FROM unnest(a, b) WITH ORDINALITY AS t(x, y, n)
+$$;
+
+CREATE OR REPLACE FUNCTION sketch_scale(a INTEGER[], factor INTEGER) RETURNS INTEGER[]
+LANGUAGE SQL IMMUTABLE AS $$
+    SELECT COALESCE(array_agg(x * factor ORDER BY n), '{}') FROM unnest(a) WITH ORDINALITY AS t(x, n)
+$$;
+
+CREATE OR REPLACE AGGREGATE sketch_sum(INTEGER[]) (SFUNC = sketch_add, STYPE = INTEGER[], INITCOND = '{}');
+
+-- Квантиль задержки по скетчу: геометрическая середина корзины (ошибка не больше ~12%)
+CREATE OR REPLACE FUNCTION sketch_quantile(sketch INTEGER[], q FLOAT) RETURNS FLOAT
+LANGUAGE SQL IMMUTABLE AS $$
+    SELECT CASE WHEN n = 1 THEN 0.01 ELSE 0.01 * POWER(1.25, n - 1.5) END
+    FROM (
+        SELECT n, SUM(c) OVER (ORDER BY n) AS cumulative, SUM(c) OVER () AS total
+        FROM unnest(sketch) WITH ORDINALITY AS t(c, n)
+    ) buckets
+    WHERE total > 0 AND cumulative >= q * total
+    ORDER BY n
+    LIMIT 1
+$$;
+
+-- Сводки результатов по (сессия, тип документа, промт, час) и итоги по (тип документа, промт).
+-- Обновляются триггером при вставке и удалении результатов; средние — сумма / число значений,
+-- скетч задержки — по успешным тестам
+CREATE TABLE IF NOT EXISTS test_rollups (
+    session_id VARCHAR(255) NOT NULL,
+    document_type VARCHAR(50) NOT NULL,
+    prompt_type VARCHAR(100) NOT NULL,
+    hour TIMESTAMP NOT NULL,
+    total_tests BIGINT NOT NULL DEFAULT 0,
+    successful_tests BIGINT NOT NULL DEFAULT 0,
+    response_time_sum FLOAT NOT NULL DEFAULT 0,
+    response_time_count BIGINT NOT NULL DEFAULT 0,
+    quality_score_sum FLOAT NOT NULL DEFAULT 0,
+    quality_score_count BIGINT NOT NULL DEFAULT 0,
+    safety_score_sum FLOAT NOT NULL DEFAULT 0,
+    safety_score_count BIGINT NOT NULL DEFAULT 0,
+    performance_score_sum FLOAT NOT NULL DEFAULT 0,
+    performance_score_count BIGINT NOT NULL DEFAULT 0,
+    total_tokens_used BIGINT NOT NULL DEFAULT 0,
+    latency_sketch INTEGER[] NOT NULL DEFAULT '{}',
+    PRIMARY KEY (session_id, document_type, prompt_type, hour)
+);
+
+CREATE INDEX IF NOT EXISTS idx_test_rollups_hour ON test_rollups(hour);
+
+CREATE TABLE IF NOT EXISTS test_rollup_totals (
+    document_type VARCHAR(50) NOT NULL,
+    prompt_type VARCHAR(100) NOT NULL,
+    total_tests BIGINT NOT NULL DEFAULT 0,
+    successful_tests BIGINT NOT NULL DEFAULT 0,
+    response_time_sum FLOAT NOT NULL DEFAULT 0,
+    response_time_count BIGINT NOT NULL DEFAULT 0,
+    quality_score_sum FLOAT NOT NULL DEFAULT 0,
+    quality_score_count BIGINT NOT NULL DEFAULT 0,
+    safety_score_sum FLOAT NOT NULL DEFAULT 0,
+    safety_score_count BIGINT NOT NULL DEFAULT 0,
+    performance_score_sum FLOAT NOT NULL DEFAULT 0,
+    performance_score_count BIGINT NOT NULL DEFAULT 0,
+    total_tokens_used BIGINT NOT NULL DEFAULT 0,
+    latency_sketch INTEGER[] NOT NULL DEFAULT '{}',
+    PRIMARY KEY (document_type, prompt_type)
+);
+
+-- Запрос приращения сводок из таблицы source с множителем $1 (1 — вставка, -1 — удаление).
+-- Выполняется через EXECUTE в триггере, где source — переходная таблица оператора
+CREATE OR REPLACE FUNCTION rollup_delta_sql(source TEXT) RETURNS TEXT
+LANGUAGE SQL IMMUTABLE AS $f$
+    SELECT format($q$
+        WITH delta AS (
+            SELECT COALESCE(metadata->>'session_id', '') AS session_id, document_type, prompt_type,
+                   date_trunc('hour', COALESCE(test_timestamp, CURRENT_TIMESTAMP)) AS hour,
+                   $1 * COUNT(*) AS total_tests,
+                   $1 * COUNT(*) FILTER (WHERE success) AS successful_tests,
+                   $1 * COALESCE(SUM(response_time), 0) AS response_time_sum,
+                   $1 * COUNT(response_time) AS response_time_count,
+                   $1 * COALESCE(SUM(quality_score), 0) AS quality_score_sum,
+                   $1 * COUNT(quality_score) AS quality_score_count,
+                   $1 * COALESCE(SUM(safety_score), 0) AS safety_score_sum,
+                   $1 * COUNT(safety_score) AS safety_score_count,
+                   $1 * COALESCE(SUM(performance_score), 0) AS performance_score_sum,
+                   $1 * COUNT(performance_score) AS performance_score_count,
+                   $1 * COALESCE(SUM(total_tokens), 0) AS total_tokens_used,
+                   sketch_scale(sketch_sum(latency_sketch(response_time)) FILTER (WHERE success), $1) AS latency_sketch
+            FROM %I
+            GROUP BY 1, 2, 3, 4
+        ), hourly AS (
+            INSERT INTO test_rollups AS r
+            SELECT * FROM delta ORDER BY session_id, document_type, prompt_type, hour
+            ON CONFLICT (session_id, document_type, prompt_type, hour) DO UPDATE SET
+                total_tests = r.total_tests + EXCLUDED.total_tests,
+                successful_tests = r.successful_tests + EXCLUDED.successful_tests,
+                response_time_sum = r.response_time_sum + EXCLUDED.response_time_sum,
+                response_time_count = r.response_time_count + EXCLUDED.response_time_count,
+                quality_score_sum = r.quality_score_sum + EXCLUDED.quality_score_sum,
+                quality_score_count = r.quality_score_count + EXCLUDED.quality_score_count,
+                safety_score_sum = r.safety_score_sum + EXCLUDED.safety_score_sum,
+                safety_score_count = r.safety_score_count + EXCLUDED.safety_score_count,
+                performance_score_sum = r.performance_score_sum + EXCLUDED.performance_score_sum,
+                performance_score_count = r.performance_score_count + EXCLUDED.performance_score_count,
+                total_tokens_used = r.total_tokens_used + EXCLUDED.total_tokens_used,
+                latency_sketch = sketch_add(r.latency_sketch, EXCLUDED.latency_sketch)
+        )
+        INSERT INTO test_rollup_totals AS t
+        SELECT document_type, prompt_type, SUM(total_tests), SUM(successful_tests), SUM(response_time_sum),
+               SUM(response_time_count), SUM(quality_score_sum), SUM(quality_score_count), SUM(safety_score_sum),
+               SUM(safety_score_count), SUM(performance_score_sum), SUM(performance_score_count),
+               SUM(total_tokens_used), sketch_sum(latency_sketch)
+        FROM delta
+        GROUP BY document_type, prompt_type
+        ORDER BY document_type, prompt_type
+        ON CONFLICT (document_type, prompt_type) DO UPDATE SET
+            total_tests = t.total_tests + EXCLUDED.total_tests,
+            successful_tests = t.successful_tests + EXCLUDED.successful_tests,
+            response_time_sum = t.response_time_sum + EXCLUDED.response_time_sum,
+            response_time_count = t.response_time_count + EXCLUDED.response_time_count,
+            quality_score_sum = t.quality_score_sum + EXCLUDED.quality_score_sum,
+            quality_score_count = t.quality_score_count + EXCLUDED.quality_score_count,
+            safety_score_sum = t.safety_score_sum + EXCLUDED.safety_score_sum,
+            safety_score_count = t.safety_score_count + EXCLUDED.safety_score_count,
+            performance_score_sum = t.performance_score_sum + EXCLUDED.performance_score_sum,
+            performance_score_count = t.performance_score_count + EXCLUDED.performance_score_count,
+            total_tokens_used = t.total_tokens_used + EXCLUDED.total_tokens_used,
+            latency_sketch = sketch_add(t.latency_sketch, EXCLUDED.latency_sketch)
+    $q$, source)
+$f$;
+
+-- Один проход на оператор (пачку результатов), а не на строку
+CREATE OR REPLACE FUNCTION apply_test_rollups() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        EXECUTE rollup_delta_sql('new_rows') USING 1;
+    ELSE
+        EXECUTE rollup_delta_sql('old_rows') USING -1;
+        -- Опустевшие сводки ищутся только среди ключей удаленных строк (по первичному ключу), не по всей таблице
+        DELETE FROM test_rollups r
+        USING (SELECT DISTINCT COALESCE(metadata->>'session_id', '') AS session_id, document_type, prompt_type,
+                      date_trunc('hour', COALESCE(test_timestamp, CURRENT_TIMESTAMP)) AS hour
+               FROM old_rows) k
+        WHERE r.session_id = k.session_id AND r.document_type = k.document_type
+          AND r.prompt_type = k.prompt_type AND r.hour = k.hour AND r.total_tests = 0;
+        DELETE FROM test_rollup_totals t
+        USING (SELECT DISTINCT document_type, prompt_type FROM old_rows) k
+        WHERE t.document_type = k.document_type AND t.prompt_type = k.prompt_type AND t.total_tests = 0;
+    END IF;
+    RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS test_results_rollup_insert ON test_results;
+CREATE TRIGGER test_results_rollup_insert
+    AFTER INSERT ON test_results REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_test_rollups();
+
+DROP TRIGGER IF EXISTS test_results_rollup_delete ON test_results;
+CREATE TRIGGER test_results_rollup_delete
+    AFTER DELETE ON test_results REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_test_rollups();
+
+-- Пересчет сводок по всей истории (для базы, созданной до появления сводок)
+CREATE OR REPLACE FUNCTION rebuild_test_rollups() RETURNS VOID
+LANGUAGE plpgsql AS $$
+BEGIN
+    TRUNCATE test_rollups, test_rollup_totals;
+    EXECUTE rollup_delta_sql('test_results') USING 1;
+END
+$$;
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM test_results) AND NOT EXISTS (SELECT 1 FROM test_rollup_totals) THEN
+        PERFORM rebuild_test_rollups();
+    END IF;
+END
+$$;
+
+-- Представление для статистики: читает итоги сводок, число строк не зависит от объема истории
+DROP VIEW IF EXISTS test_statistics;
+CREATE VIEW test_statistics AS
+SELECT
     document_type,
     prompt_type,
-    COUNT(*) as total_tests,
-    COUNT(CASE WHEN success = true THEN 1 END) as successful_tests,
-    COUNT(CASE WHEN success = false THEN 1 END) as failed_tests,
-    ROUND(AVG(response_time)::numeric, 2) as avg_response_time,
-    ROUND(AVG(quality_score)::numeric, 2) as avg_quality_score,
-    ROUND(AVG(safety_score)::numeric, 2) as avg_safety_score,
-    ROUND(AVG(performance_score)::numeric, 2) as avg_performance_score,
-    SUM(total_tokens) as total_tokens_used
-FROM test_results
-GROUP BY document_type, prompt_type;
+    total_tests,
+    successful_tests,
+    total_tests - successful_tests AS failed_tests,
+    ROUND((response_time_sum / NULLIF(response_time_count, 0))::numeric, 2) AS avg_response_time,
+    ROUND((quality_score_sum / NULLIF(quality_score_count, 0))::numeric, 2) AS avg_quality_score,
+    ROUND((safety_score_sum / NULLIF(safety_score_count, 0))::numeric, 2) AS avg_safety_score,
+    ROUND((performance_score_sum / NULLIF(performance_score_count, 0))::numeric, 2) AS avg_performance_score,
+    total_tokens_used,
+    ROUND(sketch_quantile(latency_sketch, 0.5)::numeric, 2) AS p50_response_time,
+    ROUND(sketch_quantile(latency_sketch, 0.95)::numeric, 2) AS p95_response_time,
+    ROUND(sketch_quantile(latency_sketch, 0.99)::numeric, 2) AS p99_response_time
+FROM test_rollup_totals
+WHERE total_tests > 0;
 
 -- Вставка тестовых данных (если нужно)
 INSERT INTO test_sessions (session_id, session_name) 
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Map-reduce анализ документов, не помещающихся в бюджет контекста
+Делит счет/EOB/анализы по строкам услуг, панелям тестов или датам истории анализов,
+анализирует части параллельно и сводит частичные ответы reduce-промтом. Итоги счета
+в части не попадают (они не сходятся со строками части) и передаются reduce-промту
+"""
+
+import copy
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+from document_formatter import format_trend_data
+from token_estimator import estimate_tokens
+
+# Панели лабораторных тестов (совпадают с категориями генератора тестовых данных)
+LAB_TEST_PANELS = {
+    "Glucose": "metabolic",
+    "Total Cholesterol": "lipid",
+    "HDL Cholesterol": "lipid",
+    "LDL Cholesterol": "lipid",
+    "Triglycerides": "lipid",
+    "Hemoglobin": "CBC",
+    "Hematocrit": "CBC",
+    "White Blood Cells": "CBC",
+    "Platelets": "CBC",
+    "Creatinine": "renal",
+    "ALT": "liver",
+    "AST": "liver",
+    "TSH": "thyroid",
+    "Free T4": "thyroid"
+}
+
+REDUCE_PROMPT = """You previously analyzed a long healthcare document in several parts. Below are the partial analyses, one per part.
+
+Merge them into a single response to the original task:
+- Combine duplicate findings and keep every distinct issue, service or test mentioned
+- Recompute overall totals and conclusions for the whole document
+- Do not mention that the document was split into parts
+
+Original task:
+{prompt_text}
+{document_totals}
+Partial analyses:
+{partial_analyses}"""
+
+MAP_PREFIX = "[DOCUMENT PART {index}/{count} — analyze only this part, other parts are analyzed separately]"
+
+DOCUMENT_TOTALS = """
+Totals stated on the whole document (the parts were sent without them):
+Total Charges: ${total_charges}
+Insurance Payment: ${insurance_payment}
+Patient Responsibility: ${patient_responsibility}
+"""
+
+
+def _document_units(document_data: Dict[str, Any]) -> Tuple[Dict[str, Any], List[Tuple[str, List[Any]]]]:
+    """Возвращает заголовок документа без строк и список неделимых единиц (ключ списка, элементы)"""
+    doc_type = document_data.get("document_type", "unknown")
+    header = {key: value for key, value in document_data.items()
+              if key not in ("services", "lab_values", "trend_data")}
+
+    units = []
+    if doc_type == "lab_results":
+        # Панель тестов — неделимая единица, точки истории делятся по датам
+        panels = {}
+        for value in document_data.get("lab_values", []):
+            panels.setdefault(LAB_TEST_PANELS.get(value["test_name"], "other"), []).append(value)
+        units.extend(("lab_values", values) for values in panels.values())
+        units.extend(("trend_data", [trend]) for trend in document_data.get("trend_data", []))
+    else:
+        units.extend(("services", [service]) for service in document_data.get("services", []))
+
+    return header, units
+
+
+def _build_chunk(header: Dict[str, Any], units: List[Tuple[str, List[Any]]]) -> Dict[str, Any]:
+    """Собирает документ-часть из заголовка и набора единиц"""
+    chunk = copy.deepcopy(header)
+    for key in ("services", "lab_values", "trend_data"):
+        chunk[key] = []
+    for key, items in units:
+        chunk[key].extend(items)
+    return chunk
+
+
+def format_chunk(chunk: Dict[str, Any], format_fn: Callable[[Dict[str, Any]], str]) -> str:
+    """Текст части: документ в стиле format_fn и история анализов, которую стили промта не выводят"""
+    text = format_fn(chunk)
+    if chunk.get("trend_data"):
+        text += format_trend_data(chunk["trend_data"])
+    return text
+
+
+def document_totals(document_data: Dict[str, Any]) -> str:
+    """Итоги всего счета для reduce-промта; пусто, если в документе их нет"""
+    summary = document_data.get("financial_summary")
+    return DOCUMENT_TOTALS.format(**summary) if summary else ""
+
+
+def split_document(document_data: Dict[str, Any], format_fn: Callable[[Dict[str, Any]], str],
+                   token_budget: int) -> List[Dict[str, Any]]:
+    """Делит документ на части, каждая из которых укладывается в token_budget (по возможности)"""
+    header, units = _document_units(document_data)
+    if not units or estimate_tokens(format_chunk(document_data, format_fn)) <= token_budget:
+        return [document_data]
+    # Итоги всего счета в части противоречили бы ее строкам
+    header.pop("financial_summary", None)
+
+    base_tokens = estimate_tokens(format_chunk(_build_chunk(header, []), format_fn))
+
+    chunks = []
+    current_units = []
+    current_tokens = base_tokens
+    for unit in units:
+        unit_tokens = estimate_tokens(format_chunk(_build_chunk(header, [unit]), format_fn)) - base_tokens
+        # Единица больше бюджета все равно уходит отдельной частью — резать строку услуги нельзя
+        if current_units and current_tokens + unit_tokens > token_budget:
+            chunks.append(_build_chunk(header, current_units))
+            current_units = []
+            current_tokens = base_tokens
+        current_units.append(unit)
+        current_tokens += unit_tokens
+
+    if not chunks:
+        # Единственная единица больше бюджета — часть совпадает с документом, итоги остаются
+        return [document_data]
+    chunks.append(_build_chunk(header, current_units))
+    return chunks
+
+
+class ChunkedAnalyzer:
+    """Map-reduce анализ документа: части параллельно, затем сведение"""
+
+    def __init__(self, call_fn: Callable[[str], Tuple[bool, str, float, Dict[str, Any]]],
+                 format_fn: Callable[[Dict[str, Any]], str], token_budget: int = 2000, max_workers: int = 4):
+        self.call_fn = call_fn
+        self.format_fn = format_fn
+        self.token_budget = token_budget
+        self.max_workers = max_workers
+
+    def analyze(self, document_data: Dict[str, Any], prompt_text: str) -> Tuple[bool, str, float, Dict[str, Any]]:
+        """Анализирует документ по частям и возвращает (успех, ответ, сквозное время, метрики)"""
+        start_time = time.time()
+        chunks = split_document(document_data, self.format_fn, self.token_budget)
+
+        messages = []
+        for index, chunk in enumerate(chunks, 1):
+            prefix = MAP_PREFIX.format(index=index, count=len(chunks)) if len(chunks) > 1 else "[DOCUMENT]"
+            messages.append(f"{prompt_text}\n\n{prefix}\n{format_chunk(chunk, self.format_fn)}")
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            map_results = list(executor.map(self.call_fn, messages))
+        map_latency = time.time() - start_time
+
+        usages = [usage for _, _, _, usage in map_results]
+        failed = [text for success, text, _, _ in map_results if not success]
+        if failed:
+            return False, f"Map error ({len(failed)}/{len(chunks)} parts): {failed[0]}", time.time() - start_time, {}
+
+        reduce_latency = 0.0
+        if len(chunks) == 1:
+            final_text = map_results[0][1]
+        else:
+            partial_analyses = "\n\n".join(
+                f"--- Part {index}/{len(chunks)} ---\n{text}"
+                for index, (_, text, _, _) in enumerate(map_results, 1)
+            )
+            reduce_message = REDUCE_PROMPT.format(prompt_text=prompt_text, partial_analyses=partial_analyses,
+                                                  document_totals=document_totals(document_data))
+            success, final_text, reduce_latency, reduce_usage = self.call_fn(reduce_message)
+            if not success:
+                return False, f"Reduce error: {final_text}", time.time() - start_time, {}
+            usages.append(reduce_usage)
+
+        return True, final_text, time.time() - start_time, {
+            "chunk_count": len(chunks),
+            "map_latency": map_latency,
+            "reduce_latency": reduce_latency,
+            "input_tokens": sum(usage.get("input_tokens", 0) for usage in usages),
+            "output_tokens": sum(usage.get("output_tokens", 0) for usage in usages),
+            "total_tokens": sum(usage.get("total_tokens", 0) for usage in usages)
+        }
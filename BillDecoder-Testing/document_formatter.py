@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Единый форматтер медицинских документов для промтов и текстовых файлов
+Шаблоны компилируются один раз вместе с модулем, текст собирается через list/join
+"""
+
+import json
+from typing import Any, Callable, Dict, List
+
+# Синонимы типов документов, встречавшиеся в разных тестировщиках
+DOCUMENT_TYPE_ALIASES = {
+    "medical_bill": "medical_bill",
+    "bill": "medical_bill",
+    "lab_results": "lab_results",
+    "lab": "lab_results",
+    "eob": "eob"
+}
+
+# Стили: "prompt" — документ для отправки в API, "compact" — табличный вариант с минимумом токенов,
+# "document" — полный текст как в test-data/*.txt
+FORMAT_STYLES = ("prompt", "compact", "document")
+
+
+def normalize_document_type(document_type: str) -> str:
+    """Приводит тип документа к каноническому виду (medical_bill, lab_results, eob)"""
+    return DOCUMENT_TYPE_ALIASES.get(document_type, document_type)
+
+
+_LAB_STATUS_SYMBOLS = {"normal": "✅", "high": "⚠️", "low": "⚠️"}
+_COVERAGE_STATUS_SYMBOLS = {"covered": "✅"}
+
+# Однобуквенные флаги компактного стиля (расшифровка выводится в легенде документа)
+_LAB_STATUS_FLAGS = {"normal": "N", "high": "H", "low": "L", "critical": "C"}
+_COVERAGE_STATUS_FLAGS = {"covered": "C", "denied": "D"}
+
+
+def lab_status_symbol(status: str) -> str:
+    """Символ статуса лабораторного значения"""
+    return _LAB_STATUS_SYMBOLS.get(status, "❌")
+
+
+def coverage_status_symbol(status: str) -> str:
+    """Символ статуса покрытия услуги в EOB"""
+    return _COVERAGE_STATUS_SYMBOLS.get(status, "❌")
+
+
+def format_trend_data(trend_data: List[Dict[str, Any]]) -> str:
+    """История значений анализов по датам (стили "prompt" и "compact" ее не выводят)"""
+    parts = ["\nTREND DATA:\n"]
+    for trend in trend_data:
+        parts.append(f"\nDate: {trend['date']}\n")
+        parts.extend([f"  {value['test_name']}: {value['value']} {value['unit']}\n" for value in trend['values']])
+    return "".join(parts)
+
+
+# Стиль "prompt"
+# Шаблоны — f-строки, скомпилированные вместе с модулем; строки документа собираются списком
+
+
+def _prompt_bill(bill: Dict[str, Any]) -> str:
+    # Части счета из document_chunker идут без итогов: итоги всего счета не сходятся со строками части
+    summary = bill.get('financial_summary')
+    return "".join([
+        f"""
+MEDICAL BILL
+
+Provider: {bill['provider']['name']}
+Patient: {bill['patient']['name']}
+Service Date: {bill['service_date']}
+
+Services:
+""",
+        *[f"""
+Code: {service['code']}
+Description: {service['description']}
+Charge: ${service['charge']}
+""" for service in bill.get("services", [])],
+        f"""
+Total Charges: ${summary['total_charges']}
+Insurance Payment: ${summary['insurance_payment']}
+Patient Responsibility: ${summary['patient_responsibility']}
+""" if summary else ""
+    ])
+
+
+def _prompt_lab(lab: Dict[str, Any]) -> str:
+    parts = [
+        f"""
+LABORATORY RESULTS
+
+Patient: {lab['patient']['name']}
+Test Date: {lab['test_date']}
+Laboratory: {lab['provider']['name']}
+
+Results:
+""",
+        *[f"{lab_status_symbol(value['status'])} {value['test_name']}: {value['value']} {value['unit']} "
+          f"(normal: {value['reference_range']})\n" for value in lab.get("lab_values", [])]
+    ]
+    if lab.get('clinical_notes'):
+        parts.append(f"\nClinical Notes: {lab['clinical_notes']}")
+    return "".join(parts)
+
+
+def _prompt_eob(eob: Dict[str, Any]) -> str:
+    services = eob.get("services", [])
+    total_billed = sum(service['billed_amount'] for service in services)
+    total_insurance = sum(service['insurance_payment'] for service in services)
+    total_patient = sum(service['patient_responsibility'] for service in services)
+    return "".join([
+        f"""
+EXPLANATION OF BENEFITS (EOB)
+
+Patient: {eob['patient']['name']}
+Member ID: {eob['patient']['member_id']}
+Date of Service: {eob['service_date']}
+Provider: {eob['provider']['name']}
+Insurance: {eob['insurance_company']['name']}
+Claim Number: {eob['claim_number']}
+
+Claim Details:
+""",
+        *[f"""
+Service: {service['description']}
+Code: {service['code']}
+Date: {service.get('date', 'N/A')}
+Billed Amount: ${service['billed_amount']}
+Insurance Paid: ${service['insurance_payment']}
+Patient Responsibility: ${service['patient_responsibility']}
+Coverage Status: {service['coverage_status']}
+""" for service in services],
+        f"""
+Financial Summary:
+Total Billed: ${total_billed:.2f}
+Insurance Payment: ${total_insurance:.2f}
+Patient Responsibility: ${total_patient:.2f}
+"""
+    ])
+
+
+# Стиль "compact"
+# Заголовок колонок выводится один раз, повторяющиеся описания кодов — в легенде
+
+
+def _code_legend(services: List[Dict[str, Any]]) -> str:
+    descriptions = {}
+    for service in services:
+        descriptions.setdefault(service['code'], service['description'])
+    return "; ".join([f"{code}={description}" for code, description in descriptions.items()])
+
+
+def _compact_bill(bill: Dict[str, Any]) -> str:
+    services = bill.get("services", [])
+    summary = bill.get('financial_summary')
+    return "".join([
+        f"MEDICAL BILL\nProvider: {bill['provider']['name']} | Patient: {bill['patient']['name']} | "
+        f"Service Date: {bill['service_date']}\n"
+        f"Codes: {_code_legend(services)}\n"
+        "code|charge\n",
+        *[f"{service['code']}|{service['charge']}\n" for service in services],
+        f"Totals: charges ${summary['total_charges']}; insurance ${summary['insurance_payment']}; "
+        f"patient ${summary['patient_responsibility']}\n" if summary else ""
+    ])
+
+
+def _compact_lab(lab: Dict[str, Any]) -> str:
+    parts = [
+        f"LAB RESULTS\nPatient: {lab['patient']['name']} | Test Date: {lab['test_date']} | "
+        f"Laboratory: {lab['provider']['name']}\n"
+        "Flags: N=normal H=high L=low C=critical\n"
+        "test|value|unit|normal|flag\n",
+        *[f"{value['test_name']}|{value['value']}|{value['unit']}|{value['reference_range']}|"
+          f"{_LAB_STATUS_FLAGS.get(value['status'], 'C')}\n" for value in lab.get("lab_values", [])]
+    ]
+    if lab.get('clinical_notes'):
+        parts.append(f"Notes: {lab['clinical_notes']}\n")
+    return "".join(parts)
+
+
+def _compact_eob(eob: Dict[str, Any]) -> str:
+    services = eob.get("services", [])
+    total_billed = sum(service['billed_amount'] for service in services)
+    total_insurance = sum(service['insurance_payment'] for service in services)
+    total_patient = sum(service['patient_responsibility'] for service in services)
+    parts = [
+        f"EOB\nPatient: {eob['patient']['name']} | Member ID: {eob['patient']['member_id']} | "
+        f"Date of Service: {eob['service_date']} | Provider: {eob['provider']['name']} | "
+        f"Insurance: {eob['insurance_company']['name']} | Claim: {eob['claim_number']}\n"
+        f"Codes: {_code_legend(services)}\n"
+        "Status: C=covered D=denied\n"
+        "code|date|billed|ins_paid|patient|status\n",
+        *[f"{service['code']}|{service.get('date', 'N/A')}|{service['billed_amount']}|{service['insurance_payment']}|"
+          f"{service['patient_responsibility']}|{_COVERAGE_STATUS_FLAGS.get(service['coverage_status'], 'D')}\n"
+          for service in services]
+    ]
+    denials = [f"{service['code']}: {service['denial_reason']}" for service in services if service.get('denial_reason')]
+    if denials:
+        parts.append(f"Denials: {'; '.join(denials)}\n")
+    parts.append(f"Totals: billed ${total_billed:.2f}; insurance ${total_insurance:.2f}; patient ${total_patient:.2f}\n")
+    return "".join(parts)
+
+
+# Стиль "document"
+
+
+def _document_bill(bill: Dict[str, Any]) -> str:
+    provider, patient, insurance = bill['provider'], bill['patient'], bill['insurance']
+    summary = bill['financial_summary']
+    return "".join([
+        f"""
+MEDICAL BILL
+
+Provider: {provider['name']}
+NPI: {provider['npi']}
+Specialty: {provider['specialty']}
+
+Patient: {patient['name']}
+Date of Birth: {patient['dob']}
+Member ID: {patient['member_id']}
+Address: {patient['address']}
+
+Insurance Company: {insurance['company']['name']}
+Policy Number: {insurance['policy_number']}
+Group Number: {insurance['group_number']}
+
+Service Date: {bill['service_date']}
+Billing Date: {bill['billing_date']}
+
+SERVICES:
+""",
+        *[f"""
+Code: {service['code']}
+Description: {service['description']}
+Date: {service.get('date', 'N/A')}
+Quantity: {service.get('quantity', 1)}
+Charge: ${service['charge']}
+""" for service in bill['services']],
+        f"""
+FINANCIAL SUMMARY:
+Total Charges: ${summary['total_charges']}
+Insurance Payment: ${summary['insurance_payment']}
+Patient Responsibility: ${summary['patient_responsibility']}
+Deductible: ${summary['deductible']}
+Copay: ${summary['copay']}
+
+Diagnosis Codes: {', '.join(bill['billing_codes']['diagnosis_codes'])}
+Procedure Codes: {', '.join(bill['billing_codes']['procedure_codes'])}
+"""
+    ])
+
+
+def _document_lab(lab: Dict[str, Any]) -> str:
+    provider, patient, physician = lab['provider'], lab['patient'], lab['ordering_physician']
+    parts = [
+        f"""
+LABORATORY RESULTS
+
+Laboratory: {provider['name']}
+NPI: {provider['npi']}
+
+Patient: {patient['name']}
+Date of Birth: {patient['dob']}
+Gender: {patient['gender']}
+Member ID: {patient['member_id']}
+
+Test Date: {lab['test_date']}
+Report Date: {lab['report_date']}
+
+Ordering Physician: {physician['name']}
+NPI: {physician['npi']}
+Specialty: {physician['specialty']}
+
+RESULTS:
+""",
+        *[f"""
+{lab_status_symbol(value['status'])} {value['test_name']}: {value['value']} {value['unit']} (normal: {value['reference_range']})
+""" for value in lab['lab_values']]
+    ]
+
+    if lab['trend_data']:
+        parts.append(format_trend_data(lab['trend_data']))
+
+    parts.append(f"\nCLINICAL NOTES:\n{lab['clinical_notes']}\n")
+    return "".join(parts)
+
+
+def _document_eob(eob: Dict[str, Any]) -> str:
+    parts = [f"""
+EXPLANATION OF BENEFITS (EOB)
+
+Insurance Company: {eob['insurance_company']['name']}
+Claim Number: {eob['claim_number']}
+
+Patient: {eob['patient']['name']}
+Member ID: {eob['patient']['member_id']}
+
+Provider: {eob['provider']['name']}
+NPI: {eob['provider']['npi']}
+
+Service Date: {eob['service_date']}
+Processed Date: {eob['processed_date']}
+
+COVERAGE DETAILS:
+"""]
+    current_page = None
+    for service in eob['services']:
+        if service.get('page') and service['page'] != current_page:
+            current_page = service['page']
+            parts.append(f"\n--- Page {current_page} of {eob['total_pages']} ---\n")
+        parts.append(f"""
+{coverage_status_symbol(service['coverage_status'])} Code: {service['code']}
+   Description: {service['description']}
+   Date: {service['date']}
+   Billed Amount: ${service['billed_amount']}
+   Insurance Payment: ${service['insurance_payment']}
+   Patient Responsibility: ${service['patient_responsibility']}
+""")
+        if service['denial_reason']:
+            parts.append(f"   Denial Reason: {service['denial_reason']}\n")
+    return "".join(parts)
+
+
+FORMATTERS: Dict[str, Dict[str, Callable[[Dict[str, Any]], str]]] = {
+    "prompt": {
+        "medical_bill": _prompt_bill,
+        "lab_results": _prompt_lab,
+        "eob": _prompt_eob
+    },
+    "compact": {
+        "medical_bill": _compact_bill,
+        "lab_results": _compact_lab,
+        "eob": _compact_eob
+    },
+    "document": {
+        "medical_bill": _document_bill,
+        "lab_results": _document_lab,
+        "eob": _document_eob
+    }
+}
+
+
+def format_document(document_data: Dict[str, Any], style: str = "prompt") -> str:
+    """Форматирует документ в текст выбранного стиля; неизвестные типы — как JSON"""
+    doc_type = normalize_document_type(document_data.get("document_type", "unknown"))
+    formatter = FORMATTERS[style].get(doc_type)
+    if formatter is None:
+        return json.dumps(document_data, indent=2, ensure_ascii=False)
+    return formatter(document_data)
+
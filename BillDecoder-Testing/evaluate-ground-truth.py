@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Precision/recall ответов по эталонной разметке корпуса
+Находки каждого ответа (типы ошибок счета, коды и строки, критические анализы,
+отклоненные услуги EOB) сверяются с манифестом генератора без ручной проверки
+"""
+
+import argparse
+import glob
+import json
+import os
+from typing import Any, Dict, List
+
+import pandas as pd
+
+from blob_store import DEFAULT_BLOB_PATH, resolve_results
+from ground_truth import DEFAULT_MANIFEST_PATH, LABEL_FAMILIES, GroundTruthIndex, evaluate_result, precision_recall
+from results_analytics import to_markdown
+
+DEFAULT_MANIFESTS = (DEFAULT_MANIFEST_PATH, "stress-data/manifest.json")
+
+
+def load_results(patterns: List[str], blobs_path: str = DEFAULT_BLOB_PATH) -> List[Dict[str, Any]]:
+    """Результаты всех сессий по шаблонам (файлы с полем results); ответы-хэши читаются из хранилища блобов"""
+    results = []
+    for results_file in sorted({path for pattern in patterns for path in glob.glob(pattern)}):
+        with open(results_file, 'r', encoding='utf-8') as f:
+            session = json.load(f)
+        if isinstance(session, dict) and isinstance(session.get("results"), list):
+            results.extend(session["results"])
+    return resolve_results(results, path=blobs_path, fields=("response_text",))
+
+
+def summarize(rows: pd.DataFrame, group_by: List[str]) -> pd.DataFrame:
+    """Микро-усредненные precision/recall/F1 по семействам меток в каждой группе"""
+    records = []
+    for key, group in rows.groupby(group_by, dropna=False, sort=True):
+        cell = dict(zip(group_by, key if isinstance(key, tuple) else (key,)))
+        families = {family for document_type in group["document_type"].unique()
+                    for family in LABEL_FAMILIES.get(document_type, ())}
+        for family in sorted(families):
+            counts = group[[f"{family}_tp", f"{family}_fp", f"{family}_fn"]].fillna(0).sum()
+            true_positives, false_positives, false_negatives = (int(value) for value in counts)
+            records.append({
+                **cell,
+                "family": family,
+                "responses": int(group[f"{family}_tp"].notna().sum()),
+                "tp": true_positives,
+                "fp": false_positives,
+                "fn": false_negatives,
+                **precision_recall(true_positives, false_positives, false_negatives)
+            })
+    return pd.DataFrame(records)
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description="Precision/recall ответов по эталонной разметке корпуса")
+    parser.add_argument("--results", action="append",
+                        help="шаблон файлов результатов (по умолчанию test-results/*_test_*.json)")
+    parser.add_argument("--manifest", action="append",
+                        help=f"манифест разметки (по умолчанию {', '.join(DEFAULT_MANIFESTS)})")
+    parser.add_argument("--group-by", default="prompt_type,document_type", help="колонки группировки через запятую")
+    parser.add_argument("--blobs", default=DEFAULT_BLOB_PATH, help="хранилище блобов для ответов, сохраненных хэшами")
+    parser.add_argument("--output", help="сохранить построчную сверку и сводку в JSON-файл")
+    args = parser.parse_args()
+
+    results = load_results(args.results or ["test-results/*_test_*.json"], args.blobs)
+    if not results:
+        print("❌ Результаты не найдены!")
+        return
+
+    # Документы без манифеста (старые корпуса) размечаются по данным: анализы и EOB
+    index = GroundTruthIndex.load(args.manifest or DEFAULT_MANIFESTS,
+                                  {result.get("document_file") for result in results if result.get("document_file")})
+    print(f"🏷️ Размечено документов: {len(index)}, ответов: {len(results)}")
+
+    rows = [row for row in (evaluate_result(result, index) for result in results) if row is not None]
+    if not rows:
+        print("❌ Нет ответов по размеченным документам")
+        return
+
+    group_by = [column.strip() for column in args.group_by.split(",") if column.strip()]
+    frame = pd.DataFrame(rows)
+    summary = summarize(frame, group_by)
+    print(f"📏 Сверено ответов: {len(frame)}\n")
+    print(to_markdown(summary))
+
+    overall = summarize(frame.assign(scope="all"), ["scope"])
+    print(to_markdown(overall.drop(columns=["scope"])))
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                "summary": summary.astype(object).where(summary.notna(), None).to_dict(orient="records"),
+                "overall": overall.astype(object).where(overall.notna(), None).to_dict(orient="records"),
+                "responses": frame.astype(object).where(frame.notna(), None).to_dict(orient="records")
+            }, f, ensure_ascii=False, indent=2, default=str)
+        print(f"📄 Сверка сохранена: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк форматирования документов: пропускная способность и размер в токенах
+Сравнивает единый форматтер с прежней сборкой через `text +=` и JSON-фолбэком
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List
+
+from document_formatter import FORMAT_STYLES, format_document, normalize_document_type
+from token_estimator import estimate_tokens
+
+
+def legacy_format(document_data: Dict[str, Any]) -> str:
+    """Прежний форматтер тестировщиков (конкатенация `text +=`), оставлен как эталон скорости"""
+    doc_type = document_data.get("document_type", "unknown")
+
+    if doc_type == "medical_bill":
+        text = f"""
+MEDICAL BILL
+
+Provider: {document_data['provider']['name']}
+Patient: {document_data['patient']['name']}
+Service Date: {document_data['service_date']}
+
+Services:
+"""
+        for service in document_data.get("services", []):
+            text += f"""
+Code: {service['code']}
+Description: {service['description']}
+Charge: ${service['charge']}
+"""
+        text += f"""
+Total Charges: ${document_data['financial_summary']['total_charges']}
+Insurance Payment: ${document_data['financial_summary']['insurance_payment']}
+Patient Responsibility: ${document_data['financial_summary']['patient_responsibility']}
+"""
+        return text
+
+    if doc_type == "lab_results":
+        text = f"""
+LABORATORY RESULTS
+
+Patient: {document_data['patient']['name']}
+Test Date: {document_data['test_date']}
+Laboratory: {document_data['provider']['name']}
+
+Results:
+"""
+        for value in document_data.get("lab_values", []):
+            status_symbol = "✅" if value["status"] == "normal" else "⚠️" if value["status"] in ["high", "low"] else "❌"
+            text += f"{status_symbol} {value['test_name']}: {value['value']} {value['unit']} (normal: {value['reference_range']})\n"
+        if document_data.get('clinical_notes'):
+            text += f"\nClinical Notes: {document_data['clinical_notes']}"
+        return text
+
+    if doc_type == "eob":
+        text = f"""
+EXPLANATION OF BENEFITS (EOB)
+
+Patient: {document_data['patient']['name']}
+Member ID: {document_data['patient']['member_id']}
+Date of Service: {document_data['service_date']}
+Provider: {document_data['provider']['name']}
+Insurance: {document_data['insurance_company']['name']}
+Claim Number: {document_data['claim_number']}
+
+Claim Details:
+"""
+        for service in document_data.get("services", []):
+            text += f"""
+Service: {service['description']}
+Code: {service['code']}
+Date: {service.get('date', 'N/A')}
+Billed Amount: ${service['billed_amount']}
+Insurance Paid: ${service['insurance_payment']}
+Patient Responsibility: ${service['patient_responsibility']}
+Coverage Status: {service['coverage_status']}
+"""
+        total_billed = sum(service['billed_amount'] for service in document_data.get("services", []))
+        total_insurance = sum(service['insurance_payment'] for service in document_data.get("services", []))
+        total_patient = sum(service['patient_responsibility'] for service in document_data.get("services", []))
+        text += f"""
+Financial Summary:
+Total Billed: ${total_billed:.2f}
+Insurance Payment: ${total_insurance:.2f}
+Patient Responsibility: ${total_patient:.2f}
+"""
+        return text
+
+    return json.dumps(document_data, indent=2, ensure_ascii=False)
+
+
+def load_documents(data_dirs: List[str]) -> List[Dict[str, Any]]:
+    """Загружает все JSON-документы из указанных директорий"""
+    documents = []
+    for data_dir in data_dirs:
+        for file_path in sorted(glob.glob(os.path.join(data_dir, "**", "*.json"), recursive=True)):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if isinstance(data, dict) and "document_type" in data:
+                documents.append(data)
+    return documents
+
+
+def measure_throughput(documents: List[Dict[str, Any]], format_fn: Callable[[Dict[str, Any]], str],
+                       iterations: int) -> float:
+    """Возвращает число отформатированных документов в секунду"""
+    start_time = time.perf_counter()
+    for _ in range(iterations):
+        for document_data in documents:
+            format_fn(document_data)
+    elapsed = time.perf_counter() - start_time
+    return len(documents) * iterations / elapsed if elapsed > 0 else 0.0
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description="Бенчмарк форматирования документов")
+    parser.add_argument("--data-dir", action="append", help="директория с документами (можно несколько раз)")
+    parser.add_argument("--iterations", type=int, default=200, help="проходов по корпусу")
+    args = parser.parse_args()
+
+    documents = load_documents(args.data_dir or ["test-data"])
+    if not documents:
+        print("❌ Документы не найдены! Запустите сначала test-data-generator.py")
+        return
+
+    print(f"🚀 Бенчмарк форматирования: {len(documents)} документов × {args.iterations} проходов\n")
+
+    formatters = {
+        "legacy (text +=)": legacy_format,
+        "json (indent=2)": lambda document_data: json.dumps(document_data, indent=2, ensure_ascii=False)
+    }
+    for style in FORMAT_STYLES:
+        formatters[f"formatter:{style}"] = lambda document_data, style=style: format_document(document_data, style)
+
+    print("## Пропускная способность\n")
+    print("| Форматтер | Документов/с |")
+    print("|-----------|--------------|")
+    for name, format_fn in formatters.items():
+        print(f"| {name} | {measure_throughput(documents, format_fn, args.iterations):,.0f} |")
+
+    print("\n## Оценка входных токенов на документ\n")
+    token_totals = defaultdict(lambda: defaultdict(list))
+    for document_data in documents:
+        doc_type = normalize_document_type(document_data["document_type"])
+        for name, format_fn in formatters.items():
+            token_totals[doc_type][name].append(estimate_tokens(format_fn(document_data)))
+
+    names = list(formatters)
+    print("| Тип документа | " + " | ".join(names) + " |")
+    print("|" + "---|" * (len(names) + 1))
+    for doc_type, per_format in sorted(token_totals.items()):
+        averages = [sum(per_format[name]) / len(per_format[name]) for name in names]
+        print(f"| {doc_type} | " + " | ".join(f"{average:.0f}" for average in averages) + " |")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1013 @@
+#!/usr/bin/env python3
+"""
+Генератор веб-презентации результатов тестирования
+Вместо одной страницы со всеми ответами пишет маленькую страницу-оболочку,
+готовую сводку (summary.json), страницы списка результатов по промтам
+и файлы с полными ответами, которые загружаются при открытии результата.
+Каждый файл данных сохраняется и в сжатом виде (.gz рядом): сервер презентаций
+отдает его без сжатия на лету. Размер страницы и сводки не зависит от числа
+результатов в сессии
+"""
+
+import argparse
+import glob
+import gzip
+import json
+import os
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from blob_store import BLOB_FIELDS, DEFAULT_BLOB_PATH, BlobStore, blob_key, load_blob_texts, result_text
+
+DEFAULT_RESULTS_PATTERNS = ("test-results/comprehensive_test_*.json", "test-results/compact_test_*.json")
+# Страница по умолчанию для языка интерфейса (английскую открывает start-presentation-server.py)
+DEFAULT_OUTPUTS = {"ru": "test-results/web-presentation.html", "en": "test-results/web-presentation-english.html"}
+
+# Строк списка в файле страницы и полных результатов в файле деталей
+PAGE_SIZE = 100
+DETAIL_CHUNK_SIZE = 50
+PREVIEW_LENGTH = 200
+
+# Поля результата, которые показывает окно с деталями
+DETAIL_FIELDS = ("test_id", "document_type", "document_file", "prompt_type", "test_timestamp",
+                 "success", "response_time", "metrics")
+
+LABELS = {
+    "ru": {
+        "title": "BillDecoder/LabDecoder - Результаты тестирования промтов",
+        "subtitle": "Результаты тестирования AI промтов",
+        "date": "Дата",
+        "total_tests": "Всего тестов",
+        "success_rate": "Успешность",
+        "avg_time": "Среднее время ответа",
+        "tokens_used": "Использовано токенов",
+        "tab_overview": "📊 Обзор",
+        "tab_prompts": "🤖 Промты",
+        "tab_documents": "📄 Документы",
+        "overall": "📈 Общая статистика",
+        "by_document": "🎯 Результаты по типам документов",
+        "by_prompt": "🤖 Результаты по типам промтов",
+        "prompts_title": "🤖 Детальные результаты по промтам",
+        "documents_title": "📄 Анализ по типам документов",
+        "search": "🔍 Поиск по файлам и загруженным ответам...",
+        "all": "Все",
+        "tests": "тестов",
+        "success": "успешно",
+        "avg": "ср. время",
+        "tokens": "токенов",
+        "seconds": "с",
+        "ok": "✅ Успешно",
+        "failed": "❌ Ошибка",
+        "load_more": "Показать еще",
+        "loading": "⏳ Загрузка...",
+        "load_error": "❌ Не удалось загрузить данные",
+        "details": "Полные детали теста",
+        "sent_prompt": "📝 Отправленный промт",
+        "sent_document": "📄 Отправленный документ",
+        "no_document": "Данные документа недоступны",
+        "ai_response": "🤖 Ответ AI",
+        "test_metrics": "📊 Метрики теста",
+        "input_tokens": "Входных токенов",
+        "output_tokens": "Выходных токенов",
+        "response_time": "Время ответа",
+        "test_date": "Дата теста",
+        "locale": "ru-RU"
+    },
+    "en": {
+        "title": "BillDecoder/LabDecoder - Prompt Testing Results",
+        "subtitle": "AI Prompt Testing Results",
+        "date": "Date",
+        "total_tests": "Total Tests",
+        "success_rate": "Success Rate",
+        "avg_time": "Avg Response Time",
+        "tokens_used": "Tokens Used",
+        "tab_overview": "📊 Overview",
+        "tab_prompts": "🤖 Prompts",
+        "tab_documents": "📄 Documents",
+        "overall": "📈 Overall Statistics",
+        "by_document": "🎯 Results by Document Types",
+        "by_prompt": "🤖 Results by Prompt Types",
+        "prompts_title": "🤖 Detailed Results by Prompts",
+        "documents_title": "📄 Analysis by Document Types",
+        "search": "🔍 Search by files or loaded responses...",
+        "all": "All",
+        "tests": "tests",
+        "success": "success",
+        "avg": "avg time",
+        "tokens": "tokens",
+        "seconds": "s",
+        "ok": "✅ Success",
+        "failed": "❌ Error",
+        "load_more": "Show more",
+        "loading": "⏳ Loading...",
+        "load_error": "❌ Failed to load data",
+        "details": "Full Test Details",
+        "sent_prompt": "📝 Sent Prompt",
+        "sent_document": "📄 Sent Document",
+        "no_document": "Document data not available",
+        "ai_response": "🤖 AI Response",
+        "test_metrics": "📊 Test Metrics",
+        "input_tokens": "Input Tokens",
+        "output_tokens": "Output Tokens",
+        "response_time": "Response Time",
+        "test_date": "Test Date",
+        "locale": "en-US"
+    }
+}
+
+
+def latest_results_file(patterns=DEFAULT_RESULTS_PATTERNS) -> Optional[str]:
+    """Самый свежий файл сессии из test-results"""
+    files = [path for pattern in patterns for path in glob.glob(pattern)]
+    return max(files, key=os.path.getmtime) if files else None
+
+
+def page_key(prompt_type: str) -> str:
+    """Безопасная часть имени файла для типа промта"""
+    return re.sub(r"[^A-Za-z0-9_-]+", "_", prompt_type or "unknown")
+
+
+def write_json(path: str, payload: Any) -> Tuple[int, int]:
+    """Пишет JSON и его gzip-копию (.gz); возвращает размеры обоих файлов"""
+    data = json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+    compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    with open(path, "wb") as f:
+        f.write(data)
+    with open(path + ".gz", "wb") as f:
+        f.write(compressed)
+    return len(data), len(compressed)
+
+
+class GroupStats:
+    """Счетчики группы результатов для сводки"""
+
+    def __init__(self):
+        self.tests = 0
+        self.successful = 0
+        self.response_time = 0.0
+        self.tokens = 0
+
+    def add(self, result: Dict[str, Any]):
+        self.tests += 1
+        self.successful += bool(result.get("success"))
+        self.response_time += result.get("response_time") or 0.0
+        self.tokens += (result.get("metrics") or {}).get("total_tokens") or 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "tests": self.tests,
+            "successful": self.successful,
+            "success_rate": self.successful / self.tests if self.tests else 0.0,
+            "avg_response_time": self.response_time / self.tests if self.tests else 0.0,
+            "tokens": self.tokens
+        }
+
+
+def clear_data_dir(data_dir: str):
+    """Удаляет файлы прошлой генерации: в сессии могло стать меньше результатов"""
+    for pattern in ("summary.json*", "rows-*.json*", "details-*.json*"):
+        for path in glob.glob(os.path.join(data_dir, pattern)):
+            os.remove(path)
+
+
+def write_presentation_data(session: Dict[str, Any], data_dir: str,
+                            blobs_path: str = DEFAULT_BLOB_PATH) -> Dict[str, Any]:
+    """Пишет сводку, страницы списка и файлы деталей; возвращает сводку
+
+    Результаты упорядочиваются по типу промта (в порядке первого появления), номер
+    результата в этом порядке определяет файл деталей: i // DETAIL_CHUNK_SIZE
+    """
+    results = session.get("results", [])
+    prompt_order = list(dict.fromkeys(result.get("prompt_type") for result in results))
+    rank = {prompt_type: position for position, prompt_type in enumerate(prompt_order)}
+    ordered = sorted(results, key=lambda result: rank[result.get("prompt_type")])
+
+    os.makedirs(data_dir, exist_ok=True)
+    clear_data_dir(data_dir)
+
+    total = GroupStats()
+    by_document: Dict[str, GroupStats] = {}
+    by_prompt: Dict[str, GroupStats] = {prompt_type: GroupStats() for prompt_type in prompt_order}
+    rows: Dict[str, List[Dict[str, Any]]] = {prompt_type: [] for prompt_type in prompt_order}
+    written = [0, 0]
+
+    # Тексты по ссылкам на блобы читаются пачками по файлу деталей, а не все сразу
+    has_refs = any(blob_key(field) in result for result in results for field in BLOB_FIELDS)
+    store = BlobStore(blobs_path) if has_refs else None
+    try:
+        for chunk_index, start in enumerate(range(0, len(ordered), DETAIL_CHUNK_SIZE)):
+            chunk = ordered[start:start + DETAIL_CHUNK_SIZE]
+            texts = load_blob_texts(chunk, store) if store else {}
+            details = []
+            for offset, result in enumerate(chunk):
+                total.add(result)
+                by_document.setdefault(result.get("document_type"), GroupStats()).add(result)
+                by_prompt[result.get("prompt_type")].add(result)
+
+                response = result_text(result, "response_text", texts) or ""
+                if not result.get("success"):
+                    # Тестировщики пишут текст ошибки в response_text, хранилища — в error_message
+                    response = response or str(result.get("error_message") or result.get("error") or "")
+                detail = {field: result.get(field) for field in DETAIL_FIELDS if field in result}
+                detail["response_text"] = response
+                detail["error"] = None if result.get("success") else response
+                detail["prompt_text"] = result_text(result, "prompt_text", texts)
+                detail["formatted_document"] = result.get("formatted_document")
+                details.append(detail)
+
+                rows[result.get("prompt_type")].append({
+                    "i": start + offset,
+                    "document_type": result.get("document_type"),
+                    "file": os.path.basename(result.get("document_file") or ""),
+                    "success": bool(result.get("success")),
+                    "response_time": round(result.get("response_time") or 0.0, 2),
+                    "tokens": (result.get("metrics") or {}).get("total_tokens") or 0,
+                    "timestamp": result.get("test_timestamp"),
+                    "preview": response[:PREVIEW_LENGTH],
+                    "truncated": len(response) > PREVIEW_LENGTH
+                })
+            sizes = write_json(os.path.join(data_dir, f"details-{chunk_index:04d}.json"), details)
+            written = [written[0] + sizes[0], written[1] + sizes[1]]
+    finally:
+        if store:
+            store.close()
+
+    prompts = []
+    for prompt_type in prompt_order:
+        prompt_rows = rows[prompt_type]
+        pages = max(1, -(-len(prompt_rows) // PAGE_SIZE))
+        for page in range(pages):
+            sizes = write_json(os.path.join(data_dir, f"rows-{page_key(prompt_type)}-{page:04d}.json"),
+                               prompt_rows[page * PAGE_SIZE:(page + 1) * PAGE_SIZE])
+            written = [written[0] + sizes[0], written[1] + sizes[1]]
+        prompts.append({"prompt_type": prompt_type, "key": page_key(prompt_type), "pages": pages,
+                        **by_prompt[prompt_type].to_dict()})
+
+    summary = {
+        "session_id": session.get("session_id"),
+        "test_timestamp": session.get("test_timestamp"),
+        **total.to_dict(),
+        "by_document_type": [{"document_type": document_type, **stats.to_dict()}
+                             for document_type, stats in by_document.items()],
+        "by_prompt_type": prompts,
+        "page_size": PAGE_SIZE,
+        "detail_chunk_size": DETAIL_CHUNK_SIZE,
+        "data_bytes": written[0],
+        "compressed_bytes": written[1]
+    }
+    write_json(os.path.join(data_dir, "summary.json"), summary)
+    return summary
+
+
+def render_shell(data_url: str, lang: str) -> str:
+    """Страница-оболочка: стили, разметка и скрипт без данных сессии"""
+    labels = LABELS[lang]
+    config = json.dumps({"data": data_url, "labels": labels}, ensure_ascii=False)
+    return (SHELL_TEMPLATE.replace("__LANG__", lang)
+            .replace("__TITLE__", labels["title"])
+            .replace("__STYLE__", SHELL_STYLE)
+            .replace("__CONFIG__", config.replace("</", "<\\/")))
+
+
+def generate(results_file: str, output: str, lang: str, blobs_path: str = DEFAULT_BLOB_PATH) -> Dict[str, Any]:
+    """Генерирует презентацию сессии: оболочку output и данные в каталоге рядом с ней"""
+    with open(results_file, "r", encoding="utf-8") as f:
+        session = json.load(f)
+
+    output_dir = os.path.dirname(output) or "."
+    data_url = f"{os.path.splitext(os.path.basename(output))[0]}-data/{session.get('session_id', 'session')}"
+    summary = write_presentation_data(session, os.path.join(output_dir, data_url), blobs_path)
+    shell = render_shell(data_url, lang)
+    with open(output, "w", encoding="utf-8") as f:
+        f.write(shell)
+    summary["shell_bytes"] = len(shell.encode("utf-8"))
+    summary["data_dir"] = os.path.join(output_dir, data_url)
+    return summary
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description="Генератор веб-презентации результатов тестирования")
+    parser.add_argument("--results", help="файл сессии (по умолчанию самый свежий в test-results)")
+    parser.add_argument("--lang", choices=sorted(LABELS), default="ru", help="язык интерфейса")
+    parser.add_argument("--output", help="страница презентации (по умолчанию test-results/web-presentation.html, "
+                                         "для --lang en — web-presentation-english.html)")
+    parser.add_argument("--blobs", default=DEFAULT_BLOB_PATH, help="хранилище блобов для результатов со ссылками")
+    args = parser.parse_args()
+
+    results_file = args.results or latest_results_file()
+    if not results_file or not os.path.exists(results_file):
+        print("❌ Файл результатов не найден! Запустите сначала тестирование")
+        return
+
+    output = args.output or DEFAULT_OUTPUTS[args.lang]
+    started = datetime.now()
+    summary = generate(results_file, output, args.lang, args.blobs)
+    seconds = (datetime.now() - started).total_seconds()
+    print(f"✅ Презентация создана: {output} ({summary['shell_bytes'] / 1024:.1f} КБ)")
+    print(f"📁 Данные: {summary['data_dir']} — {summary['tests']} результатов, "
+          f"{summary['data_bytes'] / 1024:.1f} КБ, сжатых {summary['compressed_bytes'] / 1024:.1f} КБ")
+    print(f"⏱️ Время генерации: {seconds:.2f}с")
+    print("💡 Данные загружаются через fetch: откройте презентацию через start-presentation-server.py")
+
+
+SHELL_STYLE = """        * {
+            margin: 0;
+            padding: 0;
+            box-sizing: border-box;
+        }
+
+        body {
+            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+            min-height: 100vh;
+            color: #333;
+        }
+
+        .container {
+            max-width: 1200px;
+            margin: 0 auto;
+            padding: 20px;
+        }
+
+        .header {
+            text-align: center;
+            color: white;
+            margin-bottom: 40px;
+        }
+
+        .header h1 {
+            font-size: 2.5em;
+            margin-bottom: 10px;
+            text-shadow: 2px 2px 4px rgba(0,0,0,0.3);
+        }
+
+        .header p {
+            font-size: 1.2em;
+            opacity: 0.9;
+        }
+
+        .stats-grid {
+            display: grid;
+            grid-template-columns: repeat(auto-fit, minmax(250px, 1fr));
+            gap: 20px;
+            margin-bottom: 40px;
+        }
+
+        .stat-card {
+            background: white;
+            border-radius: 15px;
+            padding: 25px;
+            text-align: center;
+            box-shadow: 0 10px 30px rgba(0,0,0,0.1);
+            transition: transform 0.3s ease;
+        }
+
+        .stat-card:hover {
+            transform: translateY(-5px);
+        }
+
+        .stat-number {
+            font-size: 3em;
+            font-weight: bold;
+            color: #4CAF50;
+            margin-bottom: 10px;
+        }
+
+        .stat-label {
+            font-size: 1.1em;
+            color: #666;
+        }
+
+        .tabs {
+            display: flex;
+            background: white;
+            border-radius: 15px;
+            margin-bottom: 30px;
+            overflow: hidden;
+            box-shadow: 0 5px 15px rgba(0,0,0,0.1);
+        }
+
+        .tab {
+            flex: 1;
+            padding: 20px;
+            text-align: center;
+            cursor: pointer;
+            background: #f8f9fa;
+            border: none;
+            font-size: 1.1em;
+            font-weight: 500;
+            transition: all 0.3s ease;
+        }
+
+        .tab.active {
+            background: #4CAF50;
+            color: white;
+        }
+
+        .tab:hover {
+            background: #45a049;
+            color: white;
+        }
+
+        .tab-content {
+            display: none;
+            background: white;
+            border-radius: 15px;
+            padding: 30px;
+            box-shadow: 0 10px 30px rgba(0,0,0,0.1);
+        }
+
+        .tab-content.active {
+            display: block;
+        }
+
+        .prompt-section {
+            margin-bottom: 40px;
+            padding: 25px;
+            border: 2px solid #e0e0e0;
+            border-radius: 15px;
+            background: #fafafa;
+        }
+
+        .prompt-header {
+            display: flex;
+            justify-content: space-between;
+            align-items: center;
+            margin-bottom: 20px;
+            padding-bottom: 15px;
+            border-bottom: 2px solid #4CAF50;
+        }
+
+        .prompt-title {
+            font-size: 1.5em;
+            font-weight: bold;
+            color: #2c3e50;
+        }
+
+        .prompt-stats {
+            display: flex;
+            gap: 20px;
+        }
+
+        .prompt-stat {
+            text-align: center;
+        }
+
+        .prompt-stat-number {
+            font-size: 1.8em;
+            font-weight: bold;
+            color: #4CAF50;
+        }
+
+        .prompt-stat-label {
+            font-size: 0.9em;
+            color: #666;
+        }
+
+        .test-results {
+            display: grid;
+            gap: 15px;
+        }
+
+        .test-item {
+            background: white;
+            border-radius: 10px;
+            padding: 20px;
+            border-left: 5px solid #4CAF50;
+            box-shadow: 0 3px 10px rgba(0,0,0,0.1);
+            cursor: pointer;
+            transition: all 0.3s ease;
+        }
+
+        .test-item:hover {
+            transform: translateX(5px);
+            box-shadow: 0 5px 15px rgba(0,0,0,0.15);
+        }
+
+        .test-header {
+            display: flex;
+            justify-content: space-between;
+            align-items: center;
+            margin-bottom: 10px;
+        }
+
+        .test-file {
+            font-weight: bold;
+            color: #2c3e50;
+        }
+
+        .test-status {
+            background: #4CAF50;
+            color: white;
+            padding: 5px 15px;
+            border-radius: 20px;
+            font-size: 0.9em;
+        }
+
+        .test-meta {
+            display: flex;
+            gap: 20px;
+            font-size: 0.9em;
+            color: #666;
+            margin-bottom: 15px;
+        }
+
+        .test-response {
+            background: #f8f9fa;
+            border-radius: 8px;
+            padding: 15px;
+            border-left: 3px solid #4CAF50;
+            font-family: 'Courier New', monospace;
+            font-size: 0.9em;
+            line-height: 1.6;
+            max-height: 200px;
+            overflow-y: auto;
+        }
+
+        .modal {
+            display: none;
+            position: fixed;
+            z-index: 1000;
+            left: 0;
+            top: 0;
+            width: 100%;
+            height: 100%;
+            background-color: rgba(0,0,0,0.5);
+        }
+
+        .modal-content {
+            background-color: white;
+            margin: 2% auto;
+            padding: 30px;
+            border-radius: 15px;
+            width: 95%;
+            max-width: 1000px;
+            max-height: 90vh;
+            overflow-y: auto;
+            box-shadow: 0 20px 60px rgba(0,0,0,0.3);
+        }
+
+        .modal-header {
+            display: flex;
+            justify-content: space-between;
+            align-items: center;
+            margin-bottom: 20px;
+            padding-bottom: 15px;
+            border-bottom: 2px solid #4CAF50;
+        }
+
+        .close {
+            color: #aaa;
+            font-size: 28px;
+            font-weight: bold;
+            cursor: pointer;
+        }
+
+        .close:hover {
+            color: #000;
+        }
+
+        .modal-section {
+            margin-bottom: 30px;
+            padding: 20px;
+            border-radius: 10px;
+            background: #f8f9fa;
+        }
+
+        .modal-section h3 {
+            color: #2c3e50;
+            margin-bottom: 15px;
+            padding-bottom: 10px;
+            border-bottom: 2px solid #4CAF50;
+        }
+
+        .modal-content-text {
+            background: white;
+            border-radius: 8px;
+            padding: 15px;
+            font-family: 'Courier New', monospace;
+            font-size: 0.9em;
+            line-height: 1.6;
+            white-space: pre-wrap;
+            border: 1px solid #e0e0e0;
+        }
+
+        .document-type-badge {
+            display: inline-block;
+            padding: 5px 12px;
+            border-radius: 15px;
+            font-size: 0.8em;
+            font-weight: bold;
+            margin-right: 10px;
+        }
+
+        .badge-bill { background: #e3f2fd; color: #1976d2; }
+        .badge-lab { background: #f3e5f5; color: #7b1fa2; }
+        .badge-eob { background: #e8f5e8; color: #388e3c; }
+
+        .search-box {
+            width: 100%;
+            padding: 15px;
+            border: 2px solid #e0e0e0;
+            border-radius: 10px;
+            font-size: 1.1em;
+            margin-bottom: 20px;
+        }
+
+        .search-box:focus {
+            outline: none;
+            border-color: #4CAF50;
+        }
+
+        .filter-buttons {
+            display: flex;
+            gap: 10px;
+            margin-bottom: 20px;
+            flex-wrap: wrap;
+        }
+
+        .filter-btn {
+            padding: 10px 20px;
+            border: 2px solid #4CAF50;
+            background: white;
+            color: #4CAF50;
+            border-radius: 25px;
+            cursor: pointer;
+            transition: all 0.3s ease;
+        }
+
+        .filter-btn.active {
+            background: #4CAF50;
+            color: white;
+        }
+
+        .filter-btn:hover {
+            background: #4CAF50;
+            color: white;
+        }
+
+        @media (max-width: 768px) {
+            .container {
+                padding: 10px;
+            }
+            
+            .header h1 {
+                font-size: 2em;
+            }
+            
+            .stats-grid {
+                grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
+            }
+            
+            .tabs {
+                flex-direction: column;
+            }
+            
+            .prompt-stats {
+                flex-direction: column;
+                gap: 10px;
+            }
+        }
+
+        .test-status.failed {
+            background: #ffebee;
+            color: #c62828;
+        }
+
+        .load-more {
+            display: block;
+            margin: 15px auto 0;
+        }"""
+
+SHELL_TEMPLATE = """<!DOCTYPE html>
+<html lang="__LANG__">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>__TITLE__</title>
+    <style>
+__STYLE__
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>🧪 BillDecoder/LabDecoder</h1>
+            <p id="subtitle"></p>
+            <p id="session" style="font-size: 0.9em; margin-top: 10px;"></p>
+        </div>
+
+        <div class="stats-grid" id="stats"></div>
+
+        <div class="tabs">
+            <button class="tab active" data-tab="overview"></button>
+            <button class="tab" data-tab="prompts"></button>
+            <button class="tab" data-tab="documents"></button>
+        </div>
+
+        <div id="overview" class="tab-content active"></div>
+
+        <div id="prompts" class="tab-content">
+            <h2 id="prompts-title"></h2>
+            <input type="text" class="search-box" id="search">
+            <div class="filter-buttons" id="filters"></div>
+            <div id="prompts-content"></div>
+        </div>
+
+        <div id="documents" class="tab-content"></div>
+    </div>
+
+    <!-- Окно с полными деталями теста -->
+    <div id="responseModal" class="modal">
+        <div class="modal-content">
+            <div class="modal-header">
+                <h3 id="modalTitle"></h3>
+                <span class="close" onclick="closeModal()">&times;</span>
+            </div>
+            <div id="modalBody"></div>
+        </div>
+    </div>
+
+    <script>
+        const config = __CONFIG__;
+        const L = config.labels;
+        const DOC_TYPES = {
+            'medical_bill': {badge: 'badge-bill', short: 'BILL', title: '📋 Medical Bills'},
+            'lab_results': {badge: 'badge-lab', short: 'LAB', title: '🧪 Lab Results'},
+            'eob': {badge: 'badge-eob', short: 'EOB', title: '💰 EOB'}
+        };
+        const PROMPT_NAMES = {
+            'document_classification': '📋 Document Classification',
+            'patient_education': '🎓 Patient Education',
+            'confidence_scoring': '📊 Confidence Scoring'
+        };
+
+        let summary = null;
+        let currentFilter = 'all';
+        let currentSearch = '';
+        const loadedPages = {};
+        const detailChunks = {};
+
+        function escapeHtml(text) {
+            return String(text ?? '').replace(/[&<>"']/g, c => ({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c]));
+        }
+
+        function percent(value) {
+            return `${Math.round(value * 1000) / 10}%`;
+        }
+
+        async function fetchData(name) {
+            const response = await fetch(`${config.data}/${name}`);
+            if (!response.ok) throw new Error(`${response.status} ${name}`);
+            return response.json();
+        }
+
+        function getDocumentTypeBadge(docType) {
+            const info = DOC_TYPES[docType];
+            return `<span class="document-type-badge ${info ? info.badge : ''}">${escapeHtml(info ? info.short : docType)}</span>`;
+        }
+
+        function getPromptDisplayName(promptType) {
+            return PROMPT_NAMES[promptType] || promptType;
+        }
+
+        function renderSummary() {
+            document.title = L.title;
+            document.getElementById('subtitle').textContent = L.subtitle;
+            const date = summary.test_timestamp ? new Date(summary.test_timestamp).toLocaleString(L.locale) : '';
+            document.getElementById('session').textContent = `Session ID: ${summary.session_id} | ${L.date}: ${date}`;
+
+            const cards = [
+                [summary.tests.toLocaleString(L.locale), L.total_tests],
+                [percent(summary.success_rate), L.success_rate],
+                [`${summary.avg_response_time.toFixed(1)}${L.seconds}`, L.avg_time],
+                [summary.tokens >= 1000 ? `${Math.round(summary.tokens / 1000)}K` : summary.tokens, L.tokens_used]
+            ];
+            document.getElementById('stats').innerHTML = cards.map(([number, label]) => `
+                <div class="stat-card">
+                    <div class="stat-number">${number}</div>
+                    <div class="stat-label">${label}</div>
+                </div>`).join('');
+
+            document.querySelectorAll('.tab').forEach(button => {
+                button.textContent = L[`tab_${button.dataset.tab}`];
+                button.onclick = () => showTab(button);
+            });
+
+            const item = content => `<li style="margin: 10px 0; padding: 10px; background: white; border-radius: 5px;">${content}</li>`;
+            document.getElementById('overview').innerHTML = `
+                <h2>${L.overall}</h2>
+                <div style="display: grid; grid-template-columns: repeat(auto-fit, minmax(300px, 1fr)); gap: 20px; margin-top: 20px;">
+                    <div style="background: #f8f9fa; padding: 20px; border-radius: 10px;">
+                        <h3>${L.by_document}</h3>
+                        <ul style="margin-top: 15px; list-style: none;">
+                            ${summary.by_document_type.map(group => item(`${getDocumentTypeBadge(group.document_type)}
+                                <strong>${group.successful}/${group.tests} (${percent(group.success_rate)})</strong>
+                                - ${group.avg_response_time.toFixed(2)}${L.seconds}, ${group.tokens.toLocaleString(L.locale)} ${L.tokens}`)).join('')}
+                        </ul>
+                    </div>
+                    <div style="background: #f8f9fa; padding: 20px; border-radius: 10px;">
+                        <h3>${L.by_prompt}</h3>
+                        <ul style="margin-top: 15px; list-style: none;">
+                            ${summary.by_prompt_type.map(group => item(`<strong>${escapeHtml(getPromptDisplayName(group.prompt_type))}:</strong>
+                                ${group.successful}/${group.tests} (${percent(group.success_rate)})`)).join('')}
+                        </ul>
+                    </div>
+                </div>`;
+
+            document.getElementById('documents').innerHTML = `
+                <h2>${L.documents_title}</h2>
+                <div style="display: grid; grid-template-columns: repeat(auto-fit, minmax(350px, 1fr)); gap: 20px; margin-top: 20px;">
+                    ${summary.by_document_type.map(group => `
+                    <div class="prompt-section">
+                        <div class="prompt-header">
+                            <div class="prompt-title">${escapeHtml((DOC_TYPES[group.document_type] || {}).title || group.document_type)}</div>
+                            <div class="prompt-stats">
+                                <div class="prompt-stat">
+                                    <div class="prompt-stat-number">${group.tests}</div>
+                                    <div class="prompt-stat-label">${L.tests}</div>
+                                </div>
+                                <div class="prompt-stat">
+                                    <div class="prompt-stat-number">${percent(group.success_rate)}</div>
+                                    <div class="prompt-stat-label">${L.success}</div>
+                                </div>
+                            </div>
+                        </div>
+                    </div>`).join('')}
+                </div>`;
+
+            document.getElementById('prompts-title').textContent = L.prompts_title;
+            const search = document.getElementById('search');
+            search.placeholder = L.search;
+            search.onkeyup = () => { currentSearch = search.value.toLowerCase(); applyFilters(); };
+            const filters = [['all', L.all], ...summary.by_document_type.map(group => [group.document_type, (DOC_TYPES[group.document_type] || {}).title || group.document_type])];
+            document.getElementById('filters').innerHTML = filters.map(([type, title], index) =>
+                `<button class="filter-btn${index ? '' : ' active'}" data-type="${escapeHtml(type)}">${escapeHtml(title)}</button>`).join('');
+            document.querySelectorAll('.filter-btn').forEach(button => button.onclick = () => filterByType(button));
+
+            document.getElementById('prompts-content').innerHTML = summary.by_prompt_type.map(group => `
+                <div class="prompt-section" data-prompt="${group.key}">
+                    <div class="prompt-header">
+                        <div class="prompt-title">${escapeHtml(getPromptDisplayName(group.prompt_type))}</div>
+                        <div class="prompt-stats">
+                            <div class="prompt-stat">
+                                <div class="prompt-stat-number">${group.tests}</div>
+                                <div class="prompt-stat-label">${L.tests}</div>
+                            </div>
+                            <div class="prompt-stat">
+                                <div class="prompt-stat-number">${group.avg_response_time.toFixed(2)}${L.seconds}</div>
+                                <div class="prompt-stat-label">${L.avg}</div>
+                            </div>
+                            <div class="prompt-stat">
+                                <div class="prompt-stat-number">${group.tokens}</div>
+                                <div class="prompt-stat-label">${L.tokens}</div>
+                            </div>
+                        </div>
+                    </div>
+                    <div class="test-results" id="rows-${group.key}"></div>
+                    <button class="filter-btn load-more" id="more-${group.key}" onclick="loadPage('${group.key}')">${L.load_more}</button>
+                </div>`).join('');
+        }
+
+        function renderRow(row) {
+            return `
+                <div class="test-item" data-doc-type="${escapeHtml(row.document_type)}" data-file="${escapeHtml(row.file.toLowerCase())}" data-response="${escapeHtml(row.preview.toLowerCase())}">
+                    <div class="test-header">
+                        <div class="test-file">${getDocumentTypeBadge(row.document_type)} ${escapeHtml(row.file)}</div>
+                        <div class="test-status${row.success ? '' : ' failed'}">${row.success ? L.ok : L.failed}</div>
+                    </div>
+                    <div class="test-meta">
+                        <span>⏱️ ${row.response_time}${L.seconds}</span>
+                        <span>🔢 ${row.tokens} ${L.tokens}</span>
+                        <span>📅 ${row.timestamp ? new Date(row.timestamp).toLocaleString(L.locale) : ''}</span>
+                    </div>
+                    <div class="test-response" onclick="showFullTestDetails(${row.i})">${escapeHtml(row.preview)}${row.truncated ? '...' : ''}</div>
+                </div>`;
+        }
+
+        async function loadPage(key) {
+            const group = summary.by_prompt_type.find(g => g.key === key);
+            const page = loadedPages[key] || 0;
+            const more = document.getElementById(`more-${key}`);
+            if (page >= group.pages) return;
+            more.textContent = L.loading;
+            try {
+                const rows = await fetchData(`rows-${key}-${String(page).padStart(4, '0')}.json`);
+                document.getElementById(`rows-${key}`).insertAdjacentHTML('beforeend', rows.map(renderRow).join(''));
+                loadedPages[key] = page + 1;
+                applyFilters();
+            } catch (error) {
+                console.error(error);
+                more.textContent = L.load_error;
+                return;
+            }
+            more.textContent = L.load_more;
+            more.style.display = loadedPages[key] < group.pages ? 'block' : 'none';
+        }
+
+        function loadDetails(chunk) {
+            // Файл деталей запрашивается один раз, даже если результаты из него открывают подряд
+            if (!detailChunks[chunk]) {
+                detailChunks[chunk] = fetchData(`details-${String(chunk).padStart(4, '0')}.json`)
+                    .catch(error => { delete detailChunks[chunk]; throw error; });
+            }
+            return detailChunks[chunk];
+        }
+
+        async function showFullTestDetails(index) {
+            const modalBody = document.getElementById('modalBody');
+            document.getElementById('modalTitle').textContent = L.details;
+            modalBody.innerHTML = `<div class="modal-section">${L.loading}</div>`;
+            document.getElementById('responseModal').style.display = 'block';
+
+            let test;
+            try {
+                const chunk = await loadDetails(Math.floor(index / summary.detail_chunk_size));
+                test = chunk[index % summary.detail_chunk_size];
+            } catch (error) {
+                console.error(error);
+                modalBody.innerHTML = `<div class="modal-section">${L.load_error}</div>`;
+                return;
+            }
+            const fileName = (test.document_file || '').split('/').pop();
+            const metrics = test.metrics || {};
+            document.getElementById('modalTitle').textContent = `${fileName} - ${getPromptDisplayName(test.prompt_type)}`;
+            modalBody.innerHTML = `
+                <div class="modal-section">
+                    <h3>${L.sent_prompt}</h3>
+                    <div class="modal-content-text">${escapeHtml(test.prompt_text)}</div>
+                </div>
+                <div class="modal-section">
+                    <h3>${L.sent_document}</h3>
+                    <div class="modal-content-text">${escapeHtml(test.formatted_document || L.no_document)}</div>
+                </div>
+                <div class="modal-section">
+                    <h3>${L.ai_response}</h3>
+                    <div class="modal-content-text">${escapeHtml(test.success ? test.response_text : test.error)}</div>
+                </div>
+                <div class="modal-section">
+                    <h3>${L.test_metrics}</h3>
+                    <div class="modal-content-text">${L.response_time}: ${test.response_time}${L.seconds}
+${L.input_tokens}: ${metrics.input_tokens ?? '-'}
+${L.output_tokens}: ${metrics.output_tokens ?? '-'}
+${L.tokens_used}: ${metrics.total_tokens ?? '-'}
+${L.test_date}: ${test.test_timestamp ? new Date(test.test_timestamp).toLocaleString(L.locale) : ''}</div>
+                </div>`;
+        }
+
+        function showTab(button) {
+            document.querySelectorAll('.tab-content').forEach(tab => tab.classList.remove('active'));
+            document.querySelectorAll('.tab').forEach(btn => btn.classList.remove('active'));
+            document.getElementById(button.dataset.tab).classList.add('active');
+            button.classList.add('active');
+        }
+
+        function filterByType(button) {
+            currentFilter = button.dataset.type;
+            document.querySelectorAll('.filter-btn:not(.load-more)').forEach(btn => btn.classList.remove('active'));
+            button.classList.add('active');
+            applyFilters();
+        }
+
+        function applyFilters() {
+            document.querySelectorAll('.test-item').forEach(item => {
+                const typeMatch = currentFilter === 'all' || item.dataset.docType === currentFilter;
+                const searchMatch = currentSearch === '' ||
+                    item.dataset.file.includes(currentSearch) ||
+                    item.dataset.response.includes(currentSearch);
+                item.style.display = typeMatch && searchMatch ? 'block' : 'none';
+            });
+        }
+
+        function closeModal() {
+            document.getElementById('responseModal').style.display = 'none';
+        }
+
+        window.onclick = function(event) {
+            if (event.target === document.getElementById('responseModal')) {
+                closeModal();
+            }
+        };
+
+        document.addEventListener('DOMContentLoaded', async function() {
+            try {
+                summary = await fetchData('summary.json');
+            } catch (error) {
+                console.error(error);
+                document.getElementById('subtitle').textContent = L.load_error;
+                return;
+            }
+            renderSummary();
+            // Первая страница каждого промта; остальное — по кнопке и при открытии результата
+            summary.by_prompt_type.forEach(group => loadPage(group.key));
+        });
+    </script>
+</body>
+</html>
+"""
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Эталонная разметка тестового корпуса и оценка ответов по ней
+Генератор записывает для каждого документа внесенные ошибки счета (тип, строки, коды),
+критические и отклоненные от нормы анализы, отклоненные строки EOB. Оценщик
+извлекает из ответа структурированные находки и сверяет их с разметкой через
+индексы (документ -> множества меток), считая precision/recall без ручной проверки
+"""
+
+import json
+import os
+import re
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set
+
+from response_scorer import KeywordScanner
+
+GROUND_TRUTH_VERSION = 1
+
+DEFAULT_MANIFEST_PATH = "test-data/ground_truth.json"
+
+# Типы ошибок, которые умеет вносить генератор
+BILLING_ERROR_TYPES = ("duplicate_charge", "upcoding", "mathematical_error", "wrong_date", "unbundling")
+
+# Формулировки, по которым тип ошибки распознается в свободном ответе
+ERROR_TYPE_KEYWORDS = {
+    "duplicate_charge": ("duplicate", "billed twice", "charged twice", "double billing", "double-billed",
+                         "double charge"),
+    "upcoding": ("upcod", "higher level code", "higher-level code", "more complex code", "higher level of service"),
+    "mathematical_error": ("calculation error", "math error", "mathematical error", "miscalculat", "arithmetic",
+                           "does not add up", "doesn't add up", "total does not match", "totals do not match"),
+    "wrong_date": ("wrong date", "incorrect date", "date mismatch", "date discrepancy", "different date",
+                   "outside the service date", "date of service does not match"),
+    "unbundling": ("unbundl", "billed separately", "should be bundled", "should have been bundled")
+}
+
+# Общие признаки того, что предложение сообщает о проблеме в строке счета
+ERROR_MARKERS = ("error", "incorrect", "overcharg", "discrepan", "suspicious", "mistake", "inconsisten")
+
+CRITICAL_MARKERS = ("critical", "urgent", "panic", "immediate", "emergency", "dangerous")
+
+DENIAL_MARKERS = ("denied", "denial", "not covered", "rejected")
+
+# Семейства меток: какие находки оцениваются для какого типа документа
+LABEL_FAMILIES = {
+    "medical_bill": ("error_type", "error_code", "error_line"),
+    "lab_results": ("critical_test", "abnormal_test"),
+    "eob": ("denied_code", "denied_line")
+}
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?;])\s+|\n+")
+_LINE_REFERENCE = re.compile(r"\b(?:line|item|row)\s*(?:#|no\.?|number)?\s*(\d{1,4})\b")
+_CODE_TOKEN = re.compile(r"\b[A-Z]?\d{4}[0-9A-Z]?\b")
+_JSON_BLOCK = re.compile(r"```(?:json)?\s*(\{.*?\})\s*```", re.DOTALL)
+
+
+def document_labels(document: Dict[str, Any]) -> Dict[str, Any]:
+    """Метки документа: внесенные ошибки берутся из разметки генератора, остальное выводится из данных"""
+    doc_type = document.get("document_type")
+    if doc_type == "medical_bill":
+        return {"billing_errors": list((document.get("ground_truth") or {}).get("billing_errors", []))}
+    if doc_type == "lab_results":
+        values = document.get("lab_values", [])
+        return {
+            "critical_tests": [value["test_name"] for value in values if value.get("status") == "critical"],
+            "abnormal_tests": [value["test_name"] for value in values if value.get("status") in ("high", "low")]
+        }
+    if doc_type == "eob":
+        denied = [(index, service) for index, service in enumerate(document.get("services", []))
+                  if service.get("coverage_status") == "denied"]
+        return {
+            "denied_lines": [index for index, _ in denied],
+            "denied_codes": sorted({service["code"] for _, service in denied})
+        }
+    return {}
+
+
+def _label_sets(document_type: str, labels: Dict[str, Any]) -> Dict[str, FrozenSet]:
+    """Метки в виде множеств по семействам — для сверки за O(1) на находку"""
+    if document_type == "medical_bill":
+        errors = labels.get("billing_errors", [])
+        return {
+            "error_type": frozenset(error["error_type"] for error in errors),
+            "error_code": frozenset(code for error in errors for code in error.get("codes", [])),
+            "error_line": frozenset(line for error in errors for line in error.get("affected_lines", []))
+        }
+    if document_type == "lab_results":
+        return {
+            "critical_test": frozenset(name.lower() for name in labels.get("critical_tests", [])),
+            "abnormal_test": frozenset(name.lower() for name in labels.get("abnormal_tests", []))
+        }
+    if document_type == "eob":
+        return {
+            "denied_code": frozenset(labels.get("denied_codes", [])),
+            "denied_line": frozenset(labels.get("denied_lines", []))
+        }
+    return {}
+
+
+class GroundTruthIndex:
+    """Индекс разметки корпуса: путь документа -> тип, метки и словарь документа (коды, названия анализов)"""
+
+    def __init__(self):
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.by_basename: Dict[str, str] = {}
+
+    @staticmethod
+    def _key(document_file: str) -> str:
+        return os.path.normpath(document_file)
+
+    def add(self, document_file: str, document_type: str, labels: Dict[str, Any],
+            vocabulary: Optional[Iterable[str]] = None):
+        """Добавляет документ в индекс"""
+        key = self._key(document_file)
+        self.entries[key] = {
+            "document_type": document_type,
+            "labels": labels,
+            "sets": _label_sets(document_type, labels),
+            "vocabulary": frozenset(vocabulary or ())
+        }
+        self.by_basename.setdefault(os.path.basename(key), key)
+
+    def get(self, document_file: str) -> Optional[Dict[str, Any]]:
+        """Запись документа по пути (или по имени файла, если корпус перенесен)"""
+        if not document_file:
+            return None
+        key = self._key(document_file)
+        entry = self.entries.get(key)
+        if entry is None and os.path.basename(key) in self.by_basename:
+            entry = self.entries[self.by_basename[os.path.basename(key)]]
+        return entry
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @classmethod
+    def load(cls, manifest_paths: Iterable[str], document_files: Iterable[str] = ()) -> "GroundTruthIndex":
+        """Строит индекс по манифестам генератора и (для корпусов без манифеста) по самим документам"""
+        index = cls()
+        for manifest_path in manifest_paths:
+            if not os.path.exists(manifest_path):
+                continue
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            # ground_truth.json обычного корпуса или manifest.json стресс-корпуса
+            entries = manifest.get("documents", []) if isinstance(manifest, dict) else manifest
+            for entry in entries:
+                if "ground_truth" not in entry:
+                    continue
+                index._add_file(entry["document_file"], entry["ground_truth"], entry.get("document_type"))
+
+        for document_file in document_files:
+            if index.get(document_file) is None and os.path.exists(document_file):
+                index._add_file(document_file, None)
+        return index
+
+    def _add_file(self, document_file: str, labels: Optional[Dict[str, Any]], document_type: Optional[str] = None):
+        vocabulary = ()
+        document = {}
+        if os.path.exists(document_file):
+            with open(document_file, 'r', encoding='utf-8') as f:
+                document = json.load(f)
+            vocabulary = document_vocabulary(document)
+        if labels is None:
+            if document.get("document_type") == "medical_bill":
+                # Ошибки счета без разметки генератора не восстановить — документ не оценивается
+                return
+            labels = document_labels(document)
+        self.add(document_file, document_type or document.get("document_type"), labels, vocabulary)
+
+
+def document_vocabulary(document: Dict[str, Any]) -> FrozenSet[str]:
+    """Коды услуг и названия анализов документа — для распознавания их упоминаний в ответе"""
+    if document.get("document_type") == "lab_results":
+        return frozenset(value["test_name"].lower() for value in document.get("lab_values", []))
+    return frozenset(service["code"] for service in document.get("services", []) if service.get("code"))
+
+
+def _marker_scanner() -> KeywordScanner:
+    keywords = set(ERROR_MARKERS) | set(CRITICAL_MARKERS) | set(DENIAL_MARKERS)
+    for phrases in ERROR_TYPE_KEYWORDS.values():
+        keywords.update(phrases)
+    return KeywordScanner(keywords)
+
+
+_MARKERS = _marker_scanner()
+_ERROR_PHRASES = {phrase: error_type for error_type, phrases in ERROR_TYPE_KEYWORDS.items() for phrase in phrases}
+
+
+def _structured_findings(response_text: str) -> Optional[List[Dict[str, Any]]]:
+    """Находки из JSON-блока ответа ({"findings": [...]}), если модель ответила структурированно"""
+    match = _JSON_BLOCK.search(response_text)
+    candidate = match.group(1) if match else response_text.strip()
+    if not candidate.startswith("{"):
+        return None
+    try:
+        payload = json.loads(candidate)
+    except ValueError:
+        return None
+    findings = payload.get("findings") if isinstance(payload, dict) else None
+    return findings if isinstance(findings, list) else None
+
+
+def extract_findings(response_text: str, document_type: str,
+                     vocabulary: FrozenSet[str] = frozenset()) -> Dict[str, Set]:
+    """Структурированные находки ответа по семействам меток
+
+    JSON-ответ вида {"findings": [{"type", "line", "code", "test_name"}]} разбирается
+    напрямую (строки в нем нумеруются с 1). Свободный текст режется на предложения:
+    тип ошибки — по формулировкам, коды и номера строк — только из предложений,
+    сообщающих о проблеме, анализы — из предложений с признаками критичности
+    """
+    families = {family: set() for family in LABEL_FAMILIES.get(document_type, ())}
+    if not families:
+        return families
+
+    structured = _structured_findings(response_text)
+    if structured is not None:
+        for finding in structured:
+            if not isinstance(finding, dict):
+                continue
+            finding_type = str(finding.get("type", "")).lower()
+            line = finding.get("line")
+            code = finding.get("code")
+            test_name = str(finding.get("test_name", "")).lower()
+            if document_type == "medical_bill":
+                if finding_type in BILLING_ERROR_TYPES:
+                    families["error_type"].add(finding_type)
+                if code:
+                    families["error_code"].add(str(code))
+                if isinstance(line, int):
+                    families["error_line"].add(line - 1)
+            elif document_type == "lab_results" and test_name:
+                families["critical_test" if finding_type == "critical" else "abnormal_test"].add(test_name)
+            elif document_type == "eob":
+                if code:
+                    families["denied_code"].add(str(code))
+                if isinstance(line, int):
+                    families["denied_line"].add(line - 1)
+        return families
+
+    for sentence in _SENTENCE_SPLIT.split(response_text):
+        lowered = sentence.lower()
+        found = _MARKERS.scan(lowered)
+        if not found:
+            if document_type == "lab_results":
+                # Упоминание анализа рядом со словами high/low/abnormal — отклонение от нормы
+                if "abnormal" in lowered or " high" in lowered or " low" in lowered or "elevated" in lowered:
+                    families["abnormal_test"].update(name for name in vocabulary if name in lowered)
+            continue
+
+        if document_type == "medical_bill":
+            error_types = {_ERROR_PHRASES[keyword] for keyword in found if keyword in _ERROR_PHRASES}
+            families["error_type"].update(error_types)
+            if error_types or found & set(ERROR_MARKERS):
+                families["error_code"].update(code for code in _CODE_TOKEN.findall(sentence) if code in vocabulary)
+                families["error_line"].update(int(number) - 1 for number in _LINE_REFERENCE.findall(lowered))
+        elif document_type == "lab_results":
+            mentioned = {name for name in vocabulary if name in lowered}
+            if found & set(CRITICAL_MARKERS):
+                families["critical_test"].update(mentioned)
+            else:
+                families["abnormal_test"].update(mentioned)
+        elif document_type == "eob" and found & set(DENIAL_MARKERS):
+            codes = {code for code in _CODE_TOKEN.findall(sentence) if code in vocabulary}
+            if not codes and ("all " in lowered or "both " in lowered):
+                # "Both services were denied" — отказ по всем услугам документа
+                codes = set(vocabulary)
+            families["denied_code"].update(codes)
+            families["denied_line"].update(int(number) - 1 for number in _LINE_REFERENCE.findall(lowered))
+
+    return families
+
+
+def evaluate_result(result: Dict[str, Any], index: GroundTruthIndex) -> Optional[Dict[str, Any]]:
+    """Сверка одного ответа с разметкой: tp/fp/fn по каждому семейству меток"""
+    if not result.get("success") or not result.get("response_text"):
+        return None
+    entry = index.get(result.get("document_file"))
+    if entry is None:
+        return None
+
+    findings = extract_findings(result["response_text"], entry["document_type"], entry["vocabulary"])
+    row = {
+        "test_id": result.get("test_id"),
+        "session_id": result.get("session_id"),
+        "document_file": result.get("document_file"),
+        "document_type": entry["document_type"],
+        "prompt_type": result.get("prompt_type")
+    }
+    for family, predicted in findings.items():
+        expected = entry["sets"].get(family, frozenset())
+        true_positives = len(predicted & expected)
+        row[f"{family}_tp"] = true_positives
+        row[f"{family}_fp"] = len(predicted) - true_positives
+        row[f"{family}_fn"] = len(expected) - true_positives
+    return row
+
+
+def precision_recall(true_positives: int, false_positives: int, false_negatives: int) -> Dict[str, Optional[float]]:
+    """Precision, recall и F1; None, если знаменатель нулевой"""
+    precision = true_positives / (true_positives + false_positives) if true_positives + false_positives else None
+    recall = true_positives / (true_positives + false_negatives) if true_positives + false_negatives else None
+    f1 = (2 * precision * recall / (precision + recall)
+          if precision is not None and recall is not None and precision + recall else None)
+    return {"precision": precision, "recall": recall, "f1": f1}
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Общий клиент Hathr API для тестировщиков и бенчмарков BillDecoder/LabDecoder
+Кэширует токен доступа и возвращает ответ вместе со статистикой токенов
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Tuple
+
+import requests
+
+
+def load_hathr_config() -> Dict[str, str]:
+    """Читает конфигурацию Hathr API из переменных окружения (как в docker-compose.yml)"""
+    return {
+        "client_id": os.environ.get("HATHR_CLIENT_ID", ""),
+        "client_secret": os.environ.get("HATHR_CLIENT_SECRET", ""),
+        "scope": os.environ.get("HATHR_SCOPE", "hathr/llm"),
+        "token_url": os.environ.get(
+            "HATHR_TOKEN_URL",
+            "https://hathr.auth-fips.us-gov-west-1.amazoncognito.com/oauth2/token"
+        ),
+        "api_url": os.environ.get("HATHR_API_URL", "https://api.hathr.ai/v1/chat")
+    }
+
+
+class HathrClient:
+    """Клиент Hathr API с потокобезопасным кэшированием токена"""
+
+    def __init__(self, hathr_config: Dict[str, str]):
+        self.hathr_config = hathr_config
+        self.access_token = None
+        self.token_expires_at = None
+        self._token_lock = threading.Lock()
+
+    def get_access_token(self) -> str:
+        """Получает токен доступа к Hathr API"""
+        with self._token_lock:
+            if self.access_token and self.token_expires_at and time.time() < self.token_expires_at:
+                return self.access_token
+
+            print("🔑 Получение нового токена доступа...")
+
+            token_data = {
+                "grant_type": "client_credentials",
+                "client_id": self.hathr_config["client_id"],
+                "client_secret": self.hathr_config["client_secret"],
+                "scope": self.hathr_config["scope"]
+            }
+
+            response = requests.post(self.hathr_config["token_url"], data=token_data)
+            if response.status_code != 200:
+                raise Exception(f"Ошибка получения токена: {response.status_code} - {response.text}")
+
+            token_info = response.json()
+            self.access_token = token_info["access_token"]
+            # Токен действителен 24 часа, но обновляем за час до истечения
+            self.token_expires_at = time.time() + (token_info.get("expires_in", 86400) - 3600)
+            print(f"✅ Токен получен (действителен до {datetime.fromtimestamp(self.token_expires_at)})")
+            return self.access_token
+
+    def chat(self, message: str) -> Tuple[bool, str, float, Dict[str, Any]]:
+        """Отправляет одно сообщение и возвращает (успех, текст, время ответа, usage)"""
+        try:
+            token = self.get_access_token()
+
+            payload = {
+                "messages": [{"role": "user", "text": message}],
+                "temperature": 0.2,
+                "topP": 1.0
+            }
+
+            headers = {
+                "Authorization": f"Bearer {token}",
+                "Content-Type": "application/json"
+            }
+
+            start_time = time.time()
+            response = requests.post(self.hathr_config["api_url"], json=payload, headers=headers)
+            response_time = time.time() - start_time
+
+            if response.status_code != 200:
+                return False, f"API Error: {response.status_code} - {response.text}", response_time, {}
+
+            response_data = response.json()
+            if "response" in response_data and "text" in response_data["response"]:
+                usage = response_data["response"].get("usage", {})
+                return True, response_data["response"]["text"], response_time, {
+                    "input_tokens": usage.get("inputTokens", 0),
+                    "output_tokens": usage.get("outputTokens", 0),
+                    "total_tokens": usage.get("totalTokens", 0)
+                }
+            if "data" in response_data and "message" in response_data["data"]:
+                return True, response_data["data"]["message"], response_time, {}
+
+            return False, f"Неожиданная структура ответа: {response_data}", response_time, {}
+
+        except Exception as e:
+            return False, f"Exception: {str(e)}", 0.0, {}
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Импорт сохраненных JSON-сессий в хранилище результатов
+Файлы compact/comprehensive сессий и отчеты автоматизированного тестировщика
+пишутся пачками в SQLite-хранилище (или PostgreSQL с --db). Повторный импорт
+того же файла не создает дублей: уже записанные test_id пропускаются
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+
+from blob_store import DEFAULT_BLOB_PATH, resolve_results
+from results_analytics import DEFAULT_RESULTS_PATTERNS
+from results_sink import DEFAULT_BATCH_SIZE, PostgresResultsSink
+from sqlite_store import DEFAULT_SQLITE_PATH, SQLiteResultsStore
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description="Импорт JSON-сессий в хранилище результатов")
+    parser.add_argument("--results", action="append", help="шаблон файлов результатов (можно несколько раз)")
+    parser.add_argument("--sqlite", default=DEFAULT_SQLITE_PATH, help="файл SQLite-хранилища")
+    parser.add_argument("--db", action="store_true", help="импортировать в PostgreSQL вместо SQLite")
+    parser.add_argument("--database-url", help="строка подключения PostgreSQL (по умолчанию DATABASE_URL)")
+    parser.add_argument("--blobs", default=DEFAULT_BLOB_PATH, help="хранилище блобов для ответов, сохраненных хэшами")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="результатов в одной транзакции")
+    args = parser.parse_args()
+
+    results_files = sorted({results_file for pattern in args.results or DEFAULT_RESULTS_PATTERNS
+                            for results_file in glob.glob(pattern) if not results_file.endswith(".tmp")})
+    if not results_files:
+        print("❌ Файлы результатов не найдены!")
+        return
+
+    start_time = time.time()
+    if args.db:
+        sink = PostgresResultsSink(args.database_url, batch_size=args.batch_size)
+    else:
+        sink = SQLiteResultsStore(args.sqlite, batch_size=args.batch_size)
+    print(f"🚀 Импорт {len(results_files)} файлов в {'PostgreSQL' if args.db else args.sqlite}")
+
+    imported = 0
+    try:
+        for results_file in results_files:
+            with open(results_file, 'r', encoding='utf-8') as f:
+                session = json.load(f)
+            if not isinstance(session, dict):
+                continue
+            if isinstance(session.get("results"), list):
+                source = os.path.basename(results_file).split("_test_")[0]
+                sink.add_many(resolve_results(session["results"], path=args.blobs), session.get("session_id"), source)
+                imported += len(session["results"])
+            elif isinstance(session.get("detailed_results"), list):
+                # report.json автоматизированного тестировщика: сессия — сам файл
+                session_id = os.path.splitext(os.path.basename(results_file))[0]
+                sink.add_many(session["detailed_results"], session_id, "automated")
+                imported += len(session["detailed_results"])
+            else:
+                continue
+            print(f"📥 {results_file}")
+    finally:
+        sink.close()
+
+    print(f"✅ Прочитано результатов: {imported}, записано новых: {sink.rows_written} "
+          f"за {time.time() - start_time:.2f}с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Справочник медицинских кодов и услуг
+Общий для генератора тестовых данных и локальной проверки счетов: коды с описаниями,
+каталог услуг по сложности, пары кодов для завышения (upcoding) и панели,
+которые нельзя дробить (unbundling)
+"""
+
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List
+
+
+@dataclass
+class MedicalCode:
+    """Медицинский код с описанием"""
+    code: str
+    description: str
+    category: str
+
+
+MEDICAL_CODES = (
+    # CPT codes
+    MedicalCode("99213", "Office visit, expanded problem focused", "CPT"),
+    MedicalCode("99214", "Office visit, detailed", "CPT"),
+    MedicalCode("36415", "Venipuncture", "CPT"),
+    MedicalCode("80053", "Comprehensive metabolic panel", "CPT"),
+    MedicalCode("85025", "Complete blood count with differential", "CPT"),
+    MedicalCode("93000", "Electrocardiogram", "CPT"),
+    MedicalCode("99281", "Emergency department visit, level 1", "CPT"),
+    MedicalCode("99282", "Emergency department visit, level 2", "CPT"),
+    MedicalCode("99283", "Emergency department visit, level 3", "CPT"),
+    MedicalCode("99284", "Emergency department visit, level 4", "CPT"),
+    MedicalCode("99285", "Emergency department visit, level 5", "CPT"),
+
+    # ICD-10 codes
+    MedicalCode("Z00.00", "General adult medical examination", "ICD-10"),
+    MedicalCode("I10", "Essential hypertension", "ICD-10"),
+    MedicalCode("E11.9", "Type 2 diabetes mellitus without complications", "ICD-10"),
+    MedicalCode("M79.3", "Panniculitis, unspecified", "ICD-10"),
+    MedicalCode("R50.9", "Fever, unspecified", "ICD-10"),
+    MedicalCode("K21.9", "Gastro-esophageal reflux disease without esophagitis", "ICD-10"),
+
+    # HCPCS codes
+    MedicalCode("A4253", "Blood glucose test strips", "HCPCS"),
+    MedicalCode("J1815", "Injection, insulin, per 5 units", "HCPCS"),
+    MedicalCode("G0008", "Administration of influenza virus vaccine", "HCPCS"),
+)
+
+# Услуги обычных счетов по уровню сложности (каждый уровень добавляется к предыдущему)
+SERVICE_CATALOG = {
+    "simple": (
+        {"code": "99213", "description": "Office visit", "base_charge": 150},
+        {"code": "36415", "description": "Venipuncture", "base_charge": 25},
+        {"code": "80053", "description": "Basic metabolic panel", "base_charge": 80}
+    ),
+    "medium": (
+        {"code": "93000", "description": "Electrocardiogram", "base_charge": 45},
+        {"code": "99214", "description": "Detailed office visit", "base_charge": 200},
+        {"code": "85025", "description": "Complete blood count", "base_charge": 60}
+    ),
+    "complex": (
+        {"code": "99284", "description": "Emergency department visit, level 4", "base_charge": 800},
+        {"code": "99285", "description": "Emergency department visit, level 5", "base_charge": 1200},
+        {"code": "36415", "description": "Additional venipuncture", "base_charge": 25},
+        {"code": "80053", "description": "Comprehensive metabolic panel", "base_charge": 120}
+    )
+}
+
+# Завышение уровня: исходный код -> коды, на которые его подменяют
+UPCODING_TARGETS = {
+    "99213": ("99214", "99284"),
+    "36415": ("99214", "99284")
+}
+
+# Панель -> компоненты, которые нельзя выставлять отдельно вместо панели (доля стоимости панели)
+BUNDLED_PANELS = {
+    "80053": (
+        {"code": "80048", "description": "Basic metabolic panel", "share": 0.6},
+        {"code": "80051", "description": "Electrolytes", "share": 0.4}
+    )
+}
+
+
+def service_descriptions() -> Dict[str, FrozenSet[str]]:
+    """Допустимые описания строки счета для каждого кода (справочник, каталог услуг, компоненты панелей)"""
+    descriptions: Dict[str, set] = {}
+    for medical_code in MEDICAL_CODES:
+        descriptions.setdefault(medical_code.code, set()).add(medical_code.description.lower())
+    for services in SERVICE_CATALOG.values():
+        for service in services:
+            descriptions.setdefault(service["code"], set()).add(service["description"].lower())
+    for components in BUNDLED_PANELS.values():
+        for component in components:
+            descriptions.setdefault(component["code"], set()).add(component["description"].lower())
+    return {code: frozenset(values) for code, values in descriptions.items()}
+
+
+def upcoding_pairs() -> List[tuple]:
+    """Пары (исходный код, завышенный код)"""
+    return [(source, target) for source, targets in UPCODING_TARGETS.items() for target in targets]
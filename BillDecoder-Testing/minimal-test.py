@@ -7,6 +7,8 @@ import json
 import requests
 import time
 
+from document_formatter import format_document
+
 def test_single_document():
     """Тестирует один документ с простым промтом"""
     
@@ -47,27 +49,7 @@ def test_single_document():
         return
     
     # Форматируем документ для промта
-    document_text = f"""
-MEDICAL BILL
-
-Provider: {bill_data['provider']['name']}
-Patient: {bill_data['patient']['name']}
-Service Date: {bill_data['service_date']}
-
-Services:
-"""
-    for service in bill_data.get("services", []):
-        document_text += f"""
-Code: {service['code']}
-Description: {service['description']}
-Charge: ${service['charge']}
-"""
-    
-    document_text += f"""
-Total Charges: ${bill_data['financial_summary']['total_charges']}
-Insurance Payment: ${bill_data['financial_summary']['insurance_payment']}
-Patient Responsibility: ${bill_data['financial_summary']['patient_responsibility']}
-"""
+    document_text = format_document(bill_data)
     
     # Простой промт для тестирования
     prompt = """Classify this healthcare document and extract key metadata:
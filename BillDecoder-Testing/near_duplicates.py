@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Поиск почти одинаковых документов: MinHash-сигнатуры и LSH-индекс
+Отформатированный документ нормализуется (заменяются только номера полисов и
+участников), режется на шинглы из слов; даты, суммы и коды остаются в шинглах,
+потому что именно ими отличаются счета с внесенными ошибками. Документ попадает
+в кластер представителя, только если сходство Жаккара с самим представителем не
+ниже порога. Тестировщики используют кластеры, чтобы переиспользовать ответ
+представителя или оставлять по одному документу на кластер
+"""
+
+import re
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_NUM_PERM = 128
+SHINGLE_SIZE = 3
+
+# Простое число больше 2^32 для универсального хэширования (a * x + b) mod p
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+# Даты, суммы и коды не нормализуются: дубль строки, неверная дата или завышенный код
+# отличают счет с ошибкой от чистого, и ответ на один не годится для другого
+_NORMALIZERS = (
+    (re.compile(r"\b[A-Z]{2,4}\d{5,}\b"), " <id> "),
+)
+_TOKEN = re.compile(r"[\w<>]+|[^\w\s]")
+
+
+def normalize_text(text: str) -> str:
+    """Убирает из текста номера полисов и участников, уникальные для каждого документа"""
+    for pattern, replacement in _NORMALIZERS:
+        text = pattern.sub(replacement, text)
+    return text.lower()
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> List[int]:
+    """Хэши (crc32) шинглов из size подряд идущих слов нормализованного текста"""
+    tokens = _TOKEN.findall(normalize_text(text))
+    if len(tokens) < size:
+        tokens = tokens + [""] * (size - len(tokens))
+    return sorted({zlib.crc32(" ".join(tokens[index:index + size]).encode("utf-8"))
+                   for index in range(len(tokens) - size + 1)})
+
+
+def optimal_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """Число полос и строк в полосе LSH: минимум суммарной площади ложных срабатываний и пропусков"""
+    grid = np.linspace(0, 1, 201)
+    step = grid[1] - grid[0]
+    below = grid < threshold
+    best, best_error = (1, num_perm), float("inf")
+    for bands in range(1, num_perm + 1):
+        rows = num_perm // bands
+        if rows < 1:
+            break
+        probability = 1 - (1 - grid ** rows) ** bands
+        false_positive = probability[below].sum() * step
+        false_negative = (1 - probability[~below]).sum() * step
+        if false_positive + false_negative < best_error:
+            best, best_error = (bands, rows), false_positive + false_negative
+    return best
+
+
+class NearDuplicateIndex:
+    """LSH-индекс MinHash-сигнатур; сходство кандидатов проверяется по сигнатурам"""
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, num_perm: int = DEFAULT_NUM_PERM, seed: int = 1):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands, self.rows = optimal_bands(threshold, num_perm)
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, 1 << 31, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 31, num_perm, dtype=np.uint64)
+        self.signatures: Dict[str, np.ndarray] = {}
+        self.buckets: List[Dict[bytes, List[str]]] = [{} for _ in range(self.bands)]
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash-сигнатура текста: минимум каждой хэш-перестановки по всем шинглам"""
+        values = np.asarray(shingles(text), dtype=np.uint64)
+        hashed = ((np.outer(values, self.a) + self.b) % _MERSENNE_PRIME) & _MAX_HASH
+        return hashed.min(axis=0)
+
+    def _bands(self, signature: np.ndarray) -> Iterable[Tuple[int, bytes]]:
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, key: str, text: str):
+        """Добавляет документ в индекс"""
+        signature = self.signature(text)
+        self.signatures[key] = signature
+        for band, bucket_key in self._bands(signature):
+            self.buckets[band].setdefault(bucket_key, []).append(key)
+
+    def similarity(self, first: str, second: str) -> float:
+        """Оценка сходства Жаккара двух проиндексированных документов"""
+        return float(np.mean(self.signatures[first] == self.signatures[second]))
+
+    def query(self, text: str) -> List[Tuple[str, float]]:
+        """Проиндексированные документы, похожие на текст не меньше порога, по убыванию сходства"""
+        signature = self.signature(text)
+        candidates = {key for band, bucket_key in self._bands(signature)
+                      for key in self.buckets[band].get(bucket_key, ())}
+        matches = [(key, float(np.mean(self.signatures[key] == signature))) for key in candidates]
+        return sorted([match for match in matches if match[1] >= self.threshold], key=lambda match: -match[1])
+
+    def clusters(self) -> List[List[str]]:
+        """Кластеры почти одинаковых документов; первый ключ кластера — его представитель
+
+        Документы просматриваются по порядку ключей, каждый присоединяется к самому похожему
+        представителю со сходством не ниже порога или сам становится представителем.
+        В отличие от связных компонент, цепочка похожих пар не сводит в один кластер
+        документы, непохожие на представителя
+        """
+        members: Dict[str, List[str]] = {}
+        for key in sorted(self.signatures):
+            candidates = {other for band, bucket_key in self._bands(self.signatures[key])
+                          for other in self.buckets[band].get(bucket_key, ()) if other in members}
+            matches = [(self.similarity(key, other), other) for other in sorted(candidates)]
+            matches = [match for match in matches if match[0] >= self.threshold]
+            if matches:
+                members[max(matches, key=lambda match: match[0])[1]].append(key)
+            else:
+                members[key] = [key]
+        return list(members.values())
+
+
+def near_duplicate_representatives(documents: Iterable[Tuple[str, str, str]],
+                                   threshold: float = DEFAULT_THRESHOLD,
+                                   num_perm: int = DEFAULT_NUM_PERM) -> Dict[str, str]:
+    """Ключ документа -> представитель его кластера (первый по порядку ключ)
+
+    documents — (ключ, тип документа, текст); документы разных типов в один кластер не попадают.
+    Сходство каждого документа с его представителем не ниже threshold
+    """
+    indexes: Dict[str, NearDuplicateIndex] = {}
+    for key, document_type, text in documents:
+        if document_type not in indexes:
+            indexes[document_type] = NearDuplicateIndex(threshold, num_perm)
+        indexes[document_type].add(key, text)
+
+    representatives = {}
+    for index in indexes.values():
+        for cluster in index.clusters():
+            for key in cluster:
+                representatives[key] = cluster[0]
+    return representatives
+
+
+def dedupe_summary(representatives: Dict[str, str], mode: str, threshold: float,
+                   avoided_calls: Optional[int] = None) -> Dict[str, object]:
+    """Сводка кластеризации для отчета"""
+    clusters: Dict[str, List[str]] = {}
+    for key, representative in representatives.items():
+        clusters.setdefault(representative, []).append(key)
+    duplicates = {representative: sorted(key for key in keys if key != representative)
+                  for representative, keys in clusters.items() if len(keys) > 1}
+    return {
+        "mode": mode,
+        "threshold": threshold,
+        "documents": len(representatives),
+        "clusters": len(clusters),
+        "near_duplicates": sum(len(keys) for keys in duplicates.values()),
+        "calls_avoided": avoided_calls,
+        "duplicate_clusters": duplicates
+    }
+
+
+def write_dedupe_report(f, summary: Dict[str, object]):
+    """Раздел markdown-отчета о почти одинаковых документах"""
+    mode = "переиспользование ответа" if summary["mode"] == "reuse" else "один документ на кластер"
+    f.write("\n## Почти одинаковые документы\n\n")
+    f.write(f"- **Режим:** {mode} (порог сходства {summary['threshold']})\n")
+    f.write(f"- **Документов:** {summary['documents']}, кластеров: {summary['clusters']}\n")
+    f.write(f"- **Почти дубликатов:** {summary['near_duplicates']}\n")
+    f.write(f"- **Запросов сэкономлено:** {summary['calls_avoided']}\n")
+    if summary["duplicate_clusters"]:
+        f.write("\n| Представитель | Почти дубликаты |\n|---------------|-----------------|\n")
+        for representative, keys in summary["duplicate_clusters"].items():
+            f.write(f"| {representative} | {', '.join(keys)} |\n")
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Обслуживание секций test_results в PostgreSQL
+ensure — создает месячные секции заранее и переносит в них строки из секции по умолчанию;
+archive — для секций старше срока хранения выносит тексты ответов в сжатые архивы
+(JSON Lines + gzip), оставляя в базе числовые колонки и metadata;
+restore — возвращает тексты из архива; status — секции, размеры и архивы;
+migrate — переводит несекционированную test_results из старой схемы в секционированную
+"""
+
+import argparse
+import gzip
+import json
+import os
+import re
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from results_sink import database_url, psycopg2
+
+DEFAULT_ARCHIVE_DIR = "test-results/archive"
+DEFAULT_RETENTION_DAYS = 90
+DEFAULT_MONTHS_AHEAD = 2
+
+INIT_SQL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "database", "init.sql")
+
+PARTITION_NAME = re.compile(r"^test_results_(\d{4})_(\d{2})$")
+
+ARCHIVE_FETCH_SIZE = 5000
+
+
+def month_start(day: date, months: int = 0) -> date:
+    """Первое число месяца со сдвигом на months месяцев"""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_month(name: str) -> Optional[date]:
+    """Месяц секции по имени test_results_ГГГГ_ММ (None для секции по умолчанию)"""
+    match = PARTITION_NAME.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def list_partitions(cursor) -> List[Dict[str, Any]]:
+    """Секции test_results: имя, месяц, оценка числа строк, размер, сведения об архиве"""
+    cursor.execute("""
+        SELECT c.relname, c.reltuples::BIGINT, pg_total_relation_size(c.oid), a.archive_path, a.archived_at
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        LEFT JOIN test_results_archives a ON a.partition_name = c.relname
+        WHERE i.inhparent = 'test_results'::regclass
+        ORDER BY c.relname
+    """)
+    return [
+        {"name": name, "month": partition_month(name), "rows": rows, "bytes": size,
+         "archive_path": archive_path, "archived_at": archived_at}
+        for name, rows, size, archive_path, archived_at in cursor.fetchall()
+    ]
+
+
+def is_partitioned(cursor) -> bool:
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = 'test_results'::regclass")
+    return cursor.fetchone()[0] == "p"
+
+
+def stored_columns(cursor) -> List[str]:
+    """Колонки test_results без вычисляемых (search_vector): их нельзя вставлять явно"""
+    cursor.execute("SELECT column_name FROM information_schema.columns "
+                   "WHERE table_schema = current_schema() AND table_name = 'test_results' AND is_generated = 'NEVER' "
+                   "ORDER BY ordinal_position")
+    return [row[0] for row in cursor.fetchall()]
+
+
+def ensure_partitions(connection, months_ahead: int) -> List[str]:
+    """Секции с прошлого месяца до months_ahead вперед и для месяцев, попавших в секцию по умолчанию
+
+    Строки месяца переносятся из секции по умолчанию через родительскую таблицу, поэтому
+    триггеры сводок видят удаление и вставку и итоги не меняются
+    """
+    today = date.today()
+    months = {month_start(today, offset) for offset in range(-1, months_ahead + 1)}
+    with connection:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT DISTINCT date_trunc('month', test_timestamp)::DATE FROM test_results_default")
+            stray = {row[0] for row in cursor.fetchall()}
+            existing = {partition["month"] for partition in list_partitions(cursor)}
+
+    created = []
+    for month in sorted((months | stray) - existing):
+        upper = month_start(month, 1)
+        with connection:
+            with connection.cursor() as cursor:
+                moved = 0
+                if month in stray:
+                    columns = ", ".join(stored_columns(cursor))
+                    cursor.execute(f"CREATE TEMP TABLE moving_results ON COMMIT DROP AS SELECT {columns} "
+                                   f"FROM test_results_default WHERE test_timestamp >= %s AND test_timestamp < %s",
+                                   (month, upper))
+                    cursor.execute("DELETE FROM test_results WHERE test_timestamp >= %s AND test_timestamp < %s",
+                                   (month, upper))
+                    moved = cursor.rowcount
+                cursor.execute("SELECT create_test_results_partition(%s)", (month,))
+                name = cursor.fetchone()[0]
+                if moved:
+                    cursor.execute(f"INSERT INTO test_results ({columns}) SELECT {columns} FROM moving_results")
+        created.append(name)
+        print(f"📅 Секция {name}" + (f": перенесено {moved} строк из test_results_default" if moved else ""))
+    if stray - existing:
+        vacuum(connection, "test_results_default", full=False)
+    return created
+
+
+def archive_partition(connection, partition: Dict[str, Any], archive_dir: str) -> Tuple[int, int]:
+    """Выносит тексты ответов секции в архив и очищает их в базе; возвращает (строк, байт архива)
+
+    Выгрузка и очистка идут в одной транзакции под блокировкой записи в секцию, поэтому
+    очищаются ровно выгруженные строки
+    """
+    name = partition["name"]
+    os.makedirs(archive_dir, exist_ok=True)
+    archive_path = os.path.join(archive_dir, f"{name}.jsonl.gz")
+    tmp_path = f"{archive_path}.tmp"
+
+    rows = 0
+    with connection:
+        with connection.cursor() as cursor:
+            cursor.execute(f'LOCK TABLE "{name}" IN SHARE ROW EXCLUSIVE MODE')
+        # Именованный курсор: строки читаются с сервера порциями, а не целиком в память
+        with connection.cursor(name=f"archive_{name}") as reader:
+            reader.itersize = ARCHIVE_FETCH_SIZE
+            reader.execute(f'SELECT test_id, test_timestamp, response_text, error_message FROM "{name}" '
+                           f'WHERE response_text IS NOT NULL OR error_message IS NOT NULL')
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+                for test_id, test_timestamp, response_text, error_message in reader:
+                    f.write(json.dumps({"test_id": test_id, "test_timestamp": test_timestamp.isoformat(),
+                                        "response_text": response_text, "error_message": error_message},
+                                       ensure_ascii=False))
+                    f.write("\n")
+                    rows += 1
+        os.replace(tmp_path, archive_path)
+        size = os.path.getsize(archive_path)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'UPDATE "{name}" SET response_text = NULL, error_message = NULL '
+                           f'WHERE response_text IS NOT NULL OR error_message IS NOT NULL')
+            if cursor.rowcount != rows:
+                raise RuntimeError(f"{name}: выгружено {rows} строк, очищено {cursor.rowcount}")
+            cursor.execute("""
+                INSERT INTO test_results_archives (partition_name, archive_path, rows_archived, bytes_archived)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (partition_name) DO UPDATE SET archive_path = EXCLUDED.archive_path,
+                    archived_at = CURRENT_TIMESTAMP, rows_archived = EXCLUDED.rows_archived,
+                    bytes_archived = EXCLUDED.bytes_archived
+            """, (name, os.path.abspath(archive_path), rows, size))
+    return rows, size
+
+
+def vacuum(connection, name: str, full: bool):
+    """VACUUM секции после очистки текстов (вне транзакции); FULL возвращает место системе"""
+    autocommit = connection.autocommit
+    connection.autocommit = True
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'VACUUM {"FULL " if full else ""}ANALYZE "{name}"')
+    finally:
+        connection.autocommit = autocommit
+
+
+def read_archive(archive_path: str):
+    """Строки архива секции: test_id, test_timestamp, response_text, error_message"""
+    with gzip.open(archive_path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def restore_partition(connection, name: str) -> int:
+    """Возвращает тексты ответов секции из архива"""
+    with connection:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT archive_path FROM test_results_archives WHERE partition_name = %s", (name,))
+            row = cursor.fetchone()
+            if not row:
+                raise ValueError(f"Секция {name} не архивирована")
+            cursor.execute("CREATE TEMP TABLE restored_results (test_id VARCHAR(255), test_timestamp TIMESTAMP, "
+                           "response_text TEXT, error_message TEXT) ON COMMIT DROP")
+            batch = []
+            for record in read_archive(row[0]):
+                batch.append((record["test_id"], record["test_timestamp"], record["response_text"],
+                              record["error_message"]))
+                if len(batch) >= ARCHIVE_FETCH_SIZE:
+                    cursor.executemany("INSERT INTO restored_results VALUES (%s, %s, %s, %s)", batch)
+                    batch = []
+            if batch:
+                cursor.executemany("INSERT INTO restored_results VALUES (%s, %s, %s, %s)", batch)
+            cursor.execute(f'UPDATE "{name}" p SET response_text = r.response_text, error_message = r.error_message '
+                           f'FROM restored_results r WHERE p.test_id = r.test_id AND p.test_timestamp = r.test_timestamp')
+            restored = cursor.rowcount
+            cursor.execute("DELETE FROM test_results_archives WHERE partition_name = %s", (name,))
+    return restored
+
+
+def migrate(connection):
+    """Переводит несекционированную test_results в секционированную схему init.sql
+
+    Старая таблица переименовывается, схема создается заново, строки переносятся через
+    родительскую таблицу (сводки пересчитываются триггером), старая таблица удаляется
+    """
+    with open(INIT_SQL_PATH, 'r', encoding='utf-8') as f:
+        init_sql = f.read()
+    with connection:
+        with connection.cursor() as cursor:
+            if is_partitioned(cursor):
+                print("✅ test_results уже секционирована")
+                return
+            cursor.execute("ALTER TABLE test_metrics DROP CONSTRAINT IF EXISTS test_metrics_test_id_fkey")
+            cursor.execute("DROP TRIGGER IF EXISTS test_results_rollup_insert ON test_results")
+            cursor.execute("DROP TRIGGER IF EXISTS test_results_rollup_delete ON test_results")
+            cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename = 'test_results'")
+            for (index_name,) in cursor.fetchall():
+                cursor.execute(f'ALTER INDEX "{index_name}" RENAME TO "{index_name}_legacy"')
+            cursor.execute("ALTER TABLE test_results RENAME TO test_results_legacy")
+            cursor.execute(init_sql)
+
+            cursor.execute("SELECT DISTINCT date_trunc('month', test_timestamp)::DATE FROM test_results_legacy "
+                           "WHERE test_timestamp IS NOT NULL")
+            for (month,) in cursor.fetchall():
+                cursor.execute("SELECT create_test_results_partition(%s)", (month,))
+            cursor.execute("TRUNCATE test_rollups, test_rollup_totals")
+            cursor.execute("""
+                INSERT INTO test_results (test_id, document_type, document_file, prompt_type, test_timestamp, success,
+                    response_time, input_tokens, output_tokens, total_tokens, response_text, error_message,
+                    quality_score, safety_score, performance_score, metadata)
+                SELECT test_id, document_type, document_file, prompt_type, COALESCE(test_timestamp, CURRENT_TIMESTAMP),
+                    success, response_time, input_tokens, output_tokens, total_tokens, response_text, error_message,
+                    quality_score, safety_score, performance_score, metadata
+                FROM test_results_legacy ORDER BY id
+            """)
+            moved = cursor.rowcount
+            cursor.execute("DROP TABLE test_results_legacy")
+    print(f"✅ test_results секционирована, перенесено строк: {moved}")
+
+
+def print_status(connection):
+    with connection:
+        with connection.cursor() as cursor:
+            if not is_partitioned(cursor):
+                print("⚠️ test_results не секционирована: выполните partition-maintenance.py migrate")
+                return
+            partitions = list_partitions(cursor)
+    print("| Секция | Строк (оценка) | Размер, МБ | Архив |")
+    print("|--------|----------------|------------|-------|")
+    for partition in partitions:
+        rows = partition["rows"] if partition["rows"] >= 0 else "?"
+        archived = f"{partition['archived_at']:%Y-%m-%d} {partition['archive_path']}" if partition["archive_path"] else "-"
+        print(f"| {partition['name']} | {rows} | {partition['bytes'] / 1024 / 1024:.1f} | {archived} |")
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description="Обслуживание секций test_results в PostgreSQL")
+    parser.add_argument("command", choices=("status", "ensure", "archive", "restore", "migrate"))
+    parser.add_argument("partition", nargs="?", help="секция для restore (test_results_ГГГГ_ММ)")
+    parser.add_argument("--database-url", help="строка подключения PostgreSQL (по умолчанию DATABASE_URL)")
+    parser.add_argument("--months-ahead", type=int, default=DEFAULT_MONTHS_AHEAD,
+                        help="на сколько месяцев вперед создавать секции")
+    parser.add_argument("--retention-days", type=int, default=DEFAULT_RETENTION_DAYS,
+                        help="архивировать тексты ответов секций, закончившихся раньше стольких дней назад")
+    parser.add_argument("--archive-dir", default=DEFAULT_ARCHIVE_DIR, help="каталог архивов")
+    parser.add_argument("--vacuum-full", action="store_true",
+                        help="VACUUM FULL архивированных секций (блокирует секцию, возвращает место на диске)")
+    parser.add_argument("--dry-run", action="store_true", help="только показать секции к архивированию")
+    args = parser.parse_args()
+
+    if psycopg2 is None:
+        print("❌ psycopg2 не установлен: pip install psycopg2-binary")
+        return
+    connection = psycopg2.connect(args.database_url or database_url())
+    try:
+        if args.command == "status":
+            print_status(connection)
+        elif args.command == "migrate":
+            migrate(connection)
+        elif args.command == "ensure":
+            created = ensure_partitions(connection, args.months_ahead)
+            print(f"✅ Новых секций: {len(created)}")
+        elif args.command == "restore":
+            if not args.partition:
+                parser.error("укажите секцию для restore")
+            print(f"✅ Восстановлено строк: {restore_partition(connection, args.partition)}")
+        else:
+            cutoff = datetime.now() - timedelta(days=args.retention_days)
+            with connection:
+                with connection.cursor() as cursor:
+                    partitions = [partition for partition in list_partitions(cursor)
+                                  if partition["month"] and not partition["archive_path"]
+                                  and datetime.combine(month_start(partition["month"], 1), datetime.min.time()) <= cutoff]
+            if not partitions:
+                print(f"✅ Нет секций старше {args.retention_days} дней без архива")
+            for partition in partitions:
+                if args.dry_run:
+                    print(f"🗄️ {partition['name']}: {partition['bytes'] / 1024 / 1024:.1f} МБ")
+                    continue
+                rows, size = archive_partition(connection, partition, args.archive_dir)
+                vacuum(connection, partition["name"], args.vacuum_full)
+                print(f"🗄️ {partition['name']}: {rows} ответов → {size / 1024:.0f} КБ в архиве")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк сервера презентаций
+Сравнивает прежний однопоточный socketserver.TCPServer с SimpleHTTPRequestHandler
+и многопоточный сервер со сжатием (presentation_server.py): N клиентов с keep-alive
+и Accept-Encoding: gzip загружают презентацию, считаются запросы в секунду,
+задержка p50/p99 и байт на запрос. С --slow-clients часть клиентов присылает
+незаконченный запрос и молчит, показывая блокировку остальных
+"""
+
+import argparse
+import http.client
+import socket
+import socketserver
+import statistics
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler
+from pathlib import Path
+from typing import Dict, List
+
+from presentation_server import DEFAULT_INDEX, make_server
+
+
+class QuietLegacyHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def legacy_server(directory: str):
+    """Сервер в том виде, в каком его запускал start-presentation-server.py до сжатия и потоков"""
+    socketserver.TCPServer.allow_reuse_address = True
+    return socketserver.TCPServer(("127.0.0.1", 0), partial(QuietLegacyHandler, directory=directory))
+
+
+def threaded_server(directory: str, index: str):
+    server = make_server(directory, "127.0.0.1", 0, index)
+    server.RequestHandlerClass.func.log_message = lambda *args: None
+    return server
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def client(port: int, path: str, deadline: float, latencies: List[float], sizes: List[int]):
+    """Повторяет GET до дедлайна на одном соединении; HTTP/1.0 сервер закрывает его — клиент переподключается"""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=deadline - time.perf_counter() + 30)
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        connection.request("GET", path, headers={"Accept-Encoding": "gzip"})
+        response = connection.getresponse()
+        body = response.read()
+        latencies.append((time.perf_counter() - started) * 1000)
+        sizes.append(len(body))
+    connection.close()
+
+
+def slow_client(port: int, stall: float):
+    """Отправляет только строку запроса без заголовков и держит соединение"""
+    with socket.create_connection(("127.0.0.1", port)) as sock:
+        sock.sendall(b"GET / HTTP/1.1\r\n")
+        time.sleep(stall)
+
+
+def run(server, path: str, clients: int, duration: float, slow_clients: int) -> Dict[str, float]:
+    port = server.server_address[1]
+    # Медленный клиент закрывает соединение до ответа — ошибки записи в него не печатаются
+    server.handle_error = lambda request, client_address: None
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    stalls = [threading.Thread(target=slow_client, args=(port, duration), daemon=True) for _ in range(slow_clients)]
+    for stall in stalls:
+        stall.start()
+    time.sleep(0.1 if slow_clients else 0)
+
+    latencies: List[float] = []
+    sizes: List[int] = []
+    started = time.perf_counter()
+    workers = [threading.Thread(target=client, args=(port, path, started + duration, latencies, sizes))
+               for _ in range(clients)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    for stall in stalls:
+        stall.join()
+    server.shutdown()
+    server.server_close()
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "p50": statistics.median(latencies) if latencies else 0.0,
+        "p99": percentile(latencies, 0.99) if latencies else 0.0,
+        "bytes": statistics.mean(sizes) if sizes else 0.0
+    }
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description="Бенчмарк сервера презентаций")
+    parser.add_argument("--directory", default="test-results", help="каталог с презентациями")
+    parser.add_argument("--file", default=DEFAULT_INDEX, help="загружаемый файл презентации")
+    parser.add_argument("--clients", type=int, default=8, help="число одновременных клиентов")
+    parser.add_argument("--duration", type=float, default=5.0, help="длительность каждого прогона, сек")
+    parser.add_argument("--slow-clients", type=int, default=0,
+                        help="клиентов, которые присылают незаконченный запрос и молчат весь прогон")
+    args = parser.parse_args()
+
+    if not (Path(args.directory) / args.file).is_file():
+        print(f"❌ Файл {Path(args.directory) / args.file} не найден! Запустите сначала generate-web-presentation.py")
+        return
+
+    path = f"/{args.file}"
+    print(f"🚀 Бенчмарк сервера презентаций: {path}, клиентов {args.clients}, "
+          f"медленных {args.slow_clients}, {args.duration:.0f} с на прогон\n")
+    print("| Сервер | Запросов | Запросов/с | p50, мс | p99, мс | Байт на запрос |")
+    print("|--------|----------|------------|---------|---------|----------------|")
+    for name, server in (("TCPServer + SimpleHTTPRequestHandler", legacy_server(args.directory)),
+                         ("presentation_server", threaded_server(args.directory, args.file))):
+        if name == "presentation_server":
+            server.cache.warm(args.directory)
+        stats = run(server, path, args.clients, args.duration, args.slow_clients)
+        print(f"| {name} | {stats['requests']} | {stats['rps']:.1f} | {stats['p50']:.2f} "
+              f"| {stats['p99']:.2f} | {stats['bytes']:.0f} |")
+
+
+if __name__ == "__main__":
+    main()
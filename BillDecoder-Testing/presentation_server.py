@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Статический сервер презентаций результатов
+Каждый запрос обслуживается в своем потоке, поэтому медленный клиент не задерживает
+остальных. Текстовые файлы сжимаются один раз (gzip, brotli при установленном пакете
+brotli) и хранятся в кэше до изменения файла; ответы помечаются ETag и Last-Modified,
+повторная загрузка без изменений получает 304
+"""
+
+import gzip
+import io
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from functools import partial
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULT_PORT = 8080
+DEFAULT_INDEX = "web-presentation-english.html"
+
+# Сжимаются только текстовые типы больше MIN_COMPRESS_SIZE байт
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "image/svg+xml")
+MIN_COMPRESS_SIZE = 1024
+
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+
+
+def accepted_encodings(header: str) -> Dict[str, float]:
+    """Кодировки из Accept-Encoding с их q"""
+    encodings = {}
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            encodings[name.strip().lower()] = quality
+    return encodings
+
+
+class CompressedFileCache:
+    """Содержимое файлов и их сжатые варианты по (путь, mtime, размер), LRU по объему в байтах"""
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[Tuple[int, int], Dict[str, bytes]]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.compressions = 0
+
+    @staticmethod
+    def _encode(path: str, stat: os.stat_result, data: bytes, compressible: bool) -> Dict[str, bytes]:
+        variants = {"identity": data}
+        precompressed = path + ".gz"
+        if compressible and os.path.isfile(precompressed) and os.stat(precompressed).st_mtime_ns >= stat.st_mtime_ns:
+            # Файлы данных презентации сжаты при генерации (generate-web-presentation.py)
+            with open(precompressed, "rb") as f:
+                variants["gzip"] = f.read()
+        elif compressible and len(data) >= MIN_COMPRESS_SIZE:
+            variants["gzip"] = gzip.compress(data, compresslevel=9, mtime=0)
+            if brotli is not None:
+                variants["br"] = brotli.compress(data, quality=11)
+        return variants
+
+    def get(self, path: str, stat: os.stat_result, compressible: bool) -> Dict[str, bytes]:
+        """Варианты файла: identity и, для текстовых, gzip/br; файл перечитывается при изменении
+
+        Свежая копия <файл>.gz рядом с файлом отдается как gzip без повторного сжатия
+        """
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry[0] == version:
+                self._entries.move_to_end(path)
+                return entry[1]
+
+        with open(path, "rb") as f:
+            data = f.read()
+        variants = self._encode(path, stat, data, compressible)
+        size = sum(len(value) for value in variants.values())
+        with self._lock:
+            self.compressions += len(variants) - 1
+            previous = self._entries.pop(path, None)
+            if previous:
+                self._bytes -= sum(len(value) for value in previous[1].values())
+            if size <= self.max_bytes:
+                self._entries[path] = (version, variants)
+                self._bytes += size
+                while self._bytes > self.max_bytes:
+                    _, (_, evicted) = self._entries.popitem(last=False)
+                    self._bytes -= sum(len(value) for value in evicted.values())
+        return variants
+
+    def warm(self, directory: str) -> int:
+        """Заранее сжимает текстовые файлы каталога (без подкаталогов); возвращает их число"""
+        warmed = 0
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if os.path.isfile(path) and is_compressible(mimetypes.guess_type(path)[0] or ""):
+                self.get(path, os.stat(path), True)
+                warmed += 1
+        return warmed
+
+
+def is_compressible(content_type: str) -> bool:
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class PresentationRequestHandler(SimpleHTTPRequestHandler):
+    """Файлы из кэша со сжатием и условными ответами; каталоги — как у SimpleHTTPRequestHandler"""
+
+    protocol_version = "HTTP/1.1"
+    # Заголовки и тело уходят отдельными записями: без TCP_NODELAY keep-alive ждет отложенного ACK
+    disable_nagle_algorithm = True
+    cache: CompressedFileCache = None
+    index = DEFAULT_INDEX
+
+    def end_headers(self):
+        # Заголовки CORS, как у прежнего сервера презентаций
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Access-Control-Allow-Methods", "GET, HEAD, OPTIONS")
+        self.send_header("Access-Control-Allow-Headers", "Content-Type")
+        super().end_headers()
+
+    def send_head(self):
+        if urlsplit(self.path).path in ("", "/") and self.index:
+            self.path = f"/{self.index}"
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) or not os.path.isfile(path):
+            return super().send_head()
+
+        stat = os.stat(path)
+        content_type = self.guess_type(path)
+        compressible = is_compressible(content_type)
+        variants = self.cache.get(path, stat, compressible)
+        encoding = self._choose_encoding(variants)
+        body = variants[encoding]
+        tag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{"" if encoding == "identity" else "-" + encoding}"'
+
+        if self._not_modified(tag, stat):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self._send_validators(tag, stat, compressible)
+            self.end_headers()
+            return None
+
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if encoding != "identity":
+            self.send_header("Content-Encoding", encoding)
+        self._send_validators(tag, stat, compressible)
+        self.end_headers()
+        return io.BytesIO(body)
+
+    def _choose_encoding(self, variants: Dict[str, bytes]) -> str:
+        accepted = accepted_encodings(self.headers.get("Accept-Encoding"))
+        for encoding in ("br", "gzip"):
+            if encoding in variants and accepted.get(encoding, 0) > 0:
+                return encoding
+        return "identity"
+
+    def _not_modified(self, tag: str, stat: os.stat_result) -> bool:
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return tag in (value.strip() for value in if_none_match.split(",")) or if_none_match.strip() == "*"
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                return int(stat.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _send_validators(self, tag: str, stat: os.stat_result, compressible: bool):
+        self.send_header("ETag", tag)
+        self.send_header("Last-Modified", formatdate(stat.st_mtime, usegmt=True))
+        # Презентация перегенерируется на месте: браузер хранит копию, но перепроверяет ее
+        self.send_header("Cache-Control", "no-cache")
+        if compressible:
+            self.send_header("Vary", "Accept-Encoding")
+
+
+def make_server(directory: str, bind: str = "", port: int = DEFAULT_PORT, index: Optional[str] = DEFAULT_INDEX,
+                cache: Optional[CompressedFileCache] = None) -> ThreadingHTTPServer:
+    """Многопоточный сервер каталога с кэшем сжатых файлов (доступен как server.cache)"""
+    cache = cache or CompressedFileCache()
+    handler = type("BoundPresentationRequestHandler", (PresentationRequestHandler,),
+                   {"cache": cache, "index": index})
+    server = ThreadingHTTPServer((bind, port), partial(handler, directory=directory))
+    server.daemon_threads = True
+    server.cache = cache
+    return server
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Офлайн переоценка сохраненных сессий новой версией оценщика
+Читает файлы результатов, оценивает ответы в пуле процессов и дописывает новые
+метрики рядом со старыми (metrics.quality_metrics_<версия>) без обращения к API;
+с --sqlite переоценивает результаты SQLite-хранилища (test_metrics <оценка>_<версия>)
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Any, Dict, Iterable, List, Tuple
+
+from blob_store import DEFAULT_BLOB_PATH, load_blob_texts, result_text
+from response_scorer import SCORER_VERSIONS, score_responses
+from sqlite_store import DEFAULT_SQLITE_PATH, SQLiteResultsStore
+
+DEFAULT_CACHE_PATH = "test-results/score_cache.sqlite"
+
+
+def response_hash(response_text: str, document_type: str, prompt_type: str) -> str:
+    """Ключ кэша: оценка зависит от текста ответа, типа документа и промта"""
+    return hashlib.sha256(f"{document_type}\0{prompt_type}\0{response_text}".encode("utf-8")).hexdigest()
+
+
+class ScoreCache:
+    """Кэш оценок (хэш ответа, версия оценщика) -> метрики в SQLite
+
+    Также запоминает файлы, уже переоцененные версией (по mtime и размеру),
+    чтобы повторный запуск не разбирал их заново
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS score_cache (
+                response_hash TEXT NOT NULL,
+                scorer_version TEXT NOT NULL,
+                metrics TEXT NOT NULL,
+                PRIMARY KEY (response_hash, scorer_version)
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS rescored_files (
+                path TEXT NOT NULL,
+                scorer_version TEXT NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                PRIMARY KEY (path, scorer_version)
+            )
+        """)
+
+    def get_many(self, hashes: List[str], scorer_version: str) -> Dict[str, Dict[str, float]]:
+        """Возвращает закэшированные метрики для найденных хэшей"""
+        cached = {}
+        for start in range(0, len(hashes), 500):
+            batch = hashes[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT response_hash, metrics FROM score_cache "
+                f"WHERE scorer_version = ? AND response_hash IN ({','.join('?' * len(batch))})",
+                [scorer_version, *batch]
+            )
+            cached.update((key, json.loads(metrics)) for key, metrics in rows)
+        return cached
+
+    def put_many(self, scores: Dict[str, Dict[str, float]], scorer_version: str):
+        """Сохраняет новые оценки"""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO score_cache (response_hash, scorer_version, metrics) VALUES (?, ?, ?)",
+                [(key, scorer_version, json.dumps(metrics)) for key, metrics in scores.items()]
+            )
+
+    def is_file_current(self, path: str, scorer_version: str) -> bool:
+        """Файл не менялся с последней переоценки этой версией"""
+        stat = os.stat(path)
+        row = self.conn.execute(
+            "SELECT mtime_ns, size FROM rescored_files WHERE path = ? AND scorer_version = ?",
+            (os.path.abspath(path), scorer_version)
+        ).fetchone()
+        return row == (stat.st_mtime_ns, stat.st_size)
+
+    def mark_files(self, paths: List[str], scorer_version: str):
+        """Запоминает текущее состояние переоцененных файлов"""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO rescored_files (path, scorer_version, mtime_ns, size) VALUES (?, ?, ?, ?)",
+                [(os.path.abspath(path), scorer_version, os.stat(path).st_mtime_ns, os.stat(path).st_size)
+                 for path in paths]
+            )
+
+    def close(self):
+        self.conn.close()
+
+
+def find_results_files(patterns: Iterable[str]) -> List[str]:
+    """Файлы результатов по шаблонам (без повторов)"""
+    return sorted({results_file for pattern in patterns for results_file in glob.glob(pattern)
+                   if not results_file.endswith(".tmp")})
+
+
+def load_sessions(results_files: Iterable[str]) -> List[Tuple[str, Dict[str, Any]]]:
+    """Загружает файлы результатов с полем results"""
+    sessions = []
+    for results_file in results_files:
+        with open(results_file, 'r', encoding='utf-8') as f:
+            session = json.load(f)
+        if isinstance(session, dict) and isinstance(session.get("results"), list):
+            sessions.append((results_file, session))
+    return sessions
+
+
+def score_pending(pending: Dict[str, Tuple[str, str, str]], scorer_version: str, workers: int,
+                  batch_size: int) -> Dict[str, Dict[str, float]]:
+    """Оценивает ответы, которых нет в кэше; большие объемы — в пуле процессов"""
+    keys = list(pending)
+    items = [pending[key] for key in keys]
+    batches = [items[start:start + batch_size] for start in range(0, len(items), batch_size)]
+
+    if workers <= 1 or len(batches) <= 1:
+        scored = [metrics for batch in batches for metrics in score_responses(scorer_version, batch)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            scored = [metrics for batch_scores in executor.map(partial(score_responses, scorer_version), batches)
+                      for metrics in batch_scores]
+
+    return dict(zip(keys, scored))
+
+
+def write_session(results_file: str, session: Dict[str, Any]):
+    """Атомарно перезаписывает файл результатов"""
+    tmp_file = f"{results_file}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(session, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_file, results_file)
+
+
+def score_results(results: Iterable[Dict[str, Any]], scorer_version: str, cache: ScoreCache, workers: int,
+                  batch_size: int, label: str,
+                  blobs_path: str = DEFAULT_BLOB_PATH) -> Tuple[List[Tuple[str, Dict[str, Any]]], Dict[str, Dict[str, float]]]:
+    """Оценивает успешные ответы: одинаковый ответ оценивается один раз, известные берутся из кэша
+
+    Ответы, вынесенные в хранилище блобов, читаются оттуда; сами результаты не меняются.
+    Возвращает пары (хэш ответа, результат) и оценки по хэшам
+    """
+    results = [result for result in results if result.get("success")]
+    texts = load_blob_texts(results, path=blobs_path, fields=("response_text",))
+    targets = []
+    pending = {}
+    for result in results:
+        response_text = result_text(result, "response_text", texts)
+        if not response_text:
+            continue
+        key = response_hash(response_text, result.get("document_type", ""), result.get("prompt_type", ""))
+        targets.append((key, result))
+        pending[key] = (response_text, result.get("document_type", ""), result.get("prompt_type", ""))
+
+    print(f"🚀 Переоценка оценщиком {scorer_version}: {label}, {len(targets)} ответов "
+          f"({len(pending)} уникальных)")
+
+    scores = cache.get_many(list(pending), scorer_version) if cache else {}
+    misses = {key: item for key, item in pending.items() if key not in scores}
+    print(f"💾 Из кэша: {len(scores)}, к оценке: {len(misses)}")
+
+    if misses:
+        new_scores = score_pending(misses, scorer_version, workers, batch_size)
+        scores.update(new_scores)
+        if cache:
+            cache.put_many(new_scores, scorer_version)
+    return targets, scores
+
+
+def rescore_store(path: str, scorer_version: str, cache: ScoreCache, workers: int, batch_size: int):
+    """Переоценка результатов SQLite-хранилища: новые оценки пишутся в test_metrics как <оценка>_<версия>"""
+    store = SQLiteResultsStore(path)
+    try:
+        targets, scores = score_results(store.results(success=True), scorer_version, cache, workers, batch_size,
+                                        f"база {path}")
+        store.replace_metrics([(result["test_id"], f"{name}_{scorer_version}", value)
+                               for key, result in targets for name, value in scores[key].items()])
+        print(f"✅ Обновлено результатов в базе: {len(targets)}")
+        print_comparison([(path, {"results": store.results(success=True)})], f"quality_metrics_{scorer_version}")
+    finally:
+        store.close()
+
+
+def print_comparison(sessions: List[Tuple[str, Dict[str, Any]]], column: str):
+    """Средние значения старых и новых метрик"""
+    old_totals, new_totals, count = {}, {}, 0
+    for _, session in sessions:
+        for result in session["results"]:
+            metrics = result.get("metrics") or {}
+            if "quality_metrics" not in metrics or column not in metrics:
+                continue
+            count += 1
+            for name, value in metrics["quality_metrics"].items():
+                old_totals[name] = old_totals.get(name, 0.0) + value
+            for name, value in metrics[column].items():
+                new_totals[name] = new_totals.get(name, 0.0) + value
+
+    if not count:
+        return
+    print(f"\n| Метрика | quality_metrics | {column} |")
+    print("|---------|-----------------|" + "-" * (len(column) + 2) + "|")
+    for name in sorted(set(old_totals) | set(new_totals)):
+        print(f"| {name} | {old_totals.get(name, 0.0) / count:.3f} | {new_totals.get(name, 0.0) / count:.3f} |")
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description="Переоценка сохраненных ответов без обращения к API")
+    parser.add_argument("--results", action="append",
+                        help="шаблон файлов результатов (по умолчанию test-results/compact_test_*.json)")
+    parser.add_argument("--scorer", choices=SCORER_VERSIONS, default=SCORER_VERSIONS[-1], help="версия оценщика")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="процессов для оценки")
+    parser.add_argument("--batch-size", type=int, default=2000, help="ответов в одной задаче пула")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="SQLite-кэш оценок")
+    parser.add_argument("--no-cache", action="store_true", help="не использовать кэш оценок")
+    parser.add_argument("--sqlite", nargs="?", const=DEFAULT_SQLITE_PATH,
+                        help=f"переоценить результаты SQLite-хранилища вместо файлов (по умолчанию {DEFAULT_SQLITE_PATH})")
+    parser.add_argument("--blobs", default=DEFAULT_BLOB_PATH, help="хранилище блобов для ответов, сохраненных хэшами")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    column = f"quality_metrics_{args.scorer}"
+    if args.sqlite:
+        cache = None if args.no_cache else ScoreCache(args.cache)
+        rescore_store(args.sqlite, args.scorer, cache, args.workers, args.batch_size)
+        if cache:
+            cache.close()
+        print(f"⏱️ Переоценка заняла {time.time() - start_time:.2f}с")
+        return
+
+    results_files = find_results_files(args.results or ["test-results/compact_test_*.json"])
+    if not results_files:
+        print("❌ Файлы результатов не найдены!")
+        return
+
+    cache = None if args.no_cache else ScoreCache(args.cache)
+    if cache:
+        skipped = [path for path in results_files if cache.is_file_current(path, args.scorer)]
+        results_files = [path for path in results_files if path not in skipped]
+        if skipped:
+            print(f"⏭️ Без изменений с прошлой переоценки: {len(skipped)} файлов")
+    sessions = load_sessions(results_files)
+    targets, scores = score_results([result for _, session in sessions for result in session["results"]],
+                                    args.scorer, cache, args.workers, args.batch_size, f"{len(sessions)} файлов",
+                                    args.blobs)
+
+    # Дописываем только новую колонку; неизмененные файлы не перезаписываются
+    changed_files = set()
+    for key, result in targets:
+        metrics = result.setdefault("metrics", {})
+        if metrics.get(column) != scores[key]:
+            metrics[column] = scores[key]
+            changed_files.add(id(result))
+    updated = 0
+    for results_file, session in sessions:
+        if any(id(result) in changed_files for result in session["results"]):
+            write_session(results_file, session)
+            updated += 1
+    if cache:
+        cache.mark_files([results_file for results_file, _ in sessions], args.scorer)
+        cache.close()
+
+    print(f"✅ Обновлено файлов: {updated} из {len(sessions)} за {time.time() - start_time:.2f}с")
+    print_comparison(sessions, column)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+API результатов для test-dashboard
+GET /test-results отдает summary, performance, quality и breakdown по всем результатам
+(с фильтрами session, document_type, prompt_type) и страницу detailed_results
+(limit, offset), считая их запросами к SQLite-хранилищу или PostgreSQL (--db).
+Ответ помечается ETag по версии данных и параметрам запроса: опрос без новых
+результатов получает 304 без пересчета и тела ответа.
+GET /test-results/since?cursor=ID отдает только результаты после курсора и приращения
+итогов, GET /test-results/stream — то же потоком Server-Sent Events по мере записи.
+GET /test-results/search?q=... — ранжированный полнотекстовый поиск по ответам
+с теми же фильтрами и страницами
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from results_api import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, PostgresResultsSource, ResultsSource, SQLiteResultsSource, etag
+)
+from sqlite_store import DEFAULT_SQLITE_PATH
+
+DEFAULT_PORT = 8000
+
+# Готовых ответов в памяти: опросы нескольких дашбордов с одними параметрами считаются один раз
+RESPONSE_CACHE_SIZE = 64
+
+# Как часто наблюдатель проверяет версию данных и как часто поток SSE шлет keepalive
+WATCH_INTERVAL = 1.0
+KEEPALIVE_INTERVAL = 15.0
+
+
+class ResultsWatcher:
+    """Один фоновый поток опрашивает версию данных и будит потоки SSE при ее изменении"""
+
+    def __init__(self, source: ResultsSource, interval: float = WATCH_INTERVAL):
+        self.source = source
+        self.interval = interval
+        self.version = None
+        self.changed = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="results-watcher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                version = self.source.data_version()
+            except Exception as e:
+                print(f"⚠️ Ошибка проверки версии данных: {e}")
+                version = self.version
+            if version != self.version:
+                with self.changed:
+                    self.version = version
+                    self.changed.notify_all()
+            time.sleep(self.interval)
+
+    def wait(self, version: str, timeout: float) -> str:
+        """Ждет версию, отличную от version (или таймаут), и возвращает текущую"""
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+
+class ResultsAPIHandler(BaseHTTPRequestHandler):
+    """Обработчик запросов API; источник и кэш ответов общие для потоков сервера"""
+
+    source: ResultsSource = None
+    watcher: ResultsWatcher = None
+    cache: "OrderedDict[str, bytes]" = OrderedDict()
+    cache_lock = threading.Lock()
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        # Через nginx префикс /api/ уже снят; напрямую принимаются оба пути
+        path = url.path[len("/api"):] if url.path.startswith("/api/") else url.path
+        if path == "/health":
+            self.send_json(200, {"status": "ok"})
+        elif path.rstrip("/") == "/test-results":
+            self.test_results(parse_qs(url.query))
+        elif path == "/test-results/since":
+            self.results_since(parse_qs(url.query))
+        elif path == "/test-results/stream":
+            self.results_stream(parse_qs(url.query))
+        elif path == "/test-results/search":
+            self.results_search(parse_qs(url.query))
+        else:
+            self.send_json(404, {"error": f"Unknown path: {url.path}"})
+
+    def test_results(self, params: Dict[str, list]):
+        try:
+            filters, limit, offset = parse_query(params)
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+            return
+
+        try:
+            self.respond_cached({**filters, "limit": limit, "offset": offset},
+                                lambda: self.source.dashboard(filters, limit, offset))
+        except Exception as e:
+            self.send_json(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def results_search(self, params: Dict[str, list]):
+        try:
+            filters, limit, offset = parse_query(params)
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        text = params["q"][-1].strip() if params.get("q") else ""
+        if not text:
+            self.send_json(400, {"error": "Параметр q (строка поиска) обязателен"})
+            return
+
+        try:
+            self.respond_cached({**filters, "q": text, "limit": limit, "offset": offset},
+                                lambda: self.source.search(filters, text, limit, offset))
+        except Exception as e:
+            self.send_json(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def respond_cached(self, query: Dict[str, Any], build: Callable[[], Dict[str, Any]]):
+        """Ответ с ETag по версии данных и параметрам; одинаковые запросы считаются один раз до новой записи"""
+        tag = etag(self.source.data_version(), query)
+        if tag in (value.strip() for value in self.headers.get("If-None-Match", "").split(",")):
+            self.send_response(304)
+            self.send_header("ETag", tag)
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            return
+
+        with self.cache_lock:
+            body = self.cache.get(tag)
+        if body is None:
+            payload = build()
+            body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+            with self.cache_lock:
+                self.cache[tag] = body
+                while len(self.cache) > RESPONSE_CACHE_SIZE:
+                    self.cache.popitem(last=False)
+        self.send_body(200, body, tag)
+
+    def results_since(self, params: Dict[str, list]):
+        try:
+            filters, limit, _ = parse_query(params, MAX_PAGE_SIZE)
+            cursor = parse_cursor(params)
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        try:
+            self.send_json(200, self.source.since(filters, cursor, limit))
+        except Exception as e:
+            self.send_json(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def results_stream(self, params: Dict[str, list]):
+        """Поток SSE: событие results с новыми результатами и приращениями итогов после каждой записи
+
+        id события — курсор; переподключившийся EventSource присылает его в Last-Event-ID
+        """
+        try:
+            filters, limit, _ = parse_query(params, MAX_PAGE_SIZE)
+            cursor = parse_cursor(params, self.headers.get("Last-Event-ID"))
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        # nginx не буферизует поток (см. nginx.conf)
+        self.send_header("X-Accel-Buffering", "no")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+
+        version = None
+        try:
+            while True:
+                version = self.watcher.wait(version, KEEPALIVE_INTERVAL)
+                delta = self.source.since(filters, cursor, limit)
+                while delta["results"]:
+                    cursor = delta["cursor"]
+                    self.wfile.write(f"id: {cursor}\nevent: results\ndata: "
+                                     f"{json.dumps(delta, ensure_ascii=False, default=str)}\n\n".encode("utf-8"))
+                    if not delta["more"]:
+                        break
+                    delta = self.source.since(filters, cursor, limit)
+                # Комментарий SSE держит соединение открытым через прокси и выявляет закрытые клиенты
+                self.wfile.write(b": keepalive\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def send_json(self, status: int, payload: Dict[str, Any]):
+        self.send_body(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+
+    def send_body(self, status: int, body: bytes, tag: str = None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        # no-cache: браузер хранит ответ, но каждый опрос перепроверяет его по ETag
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        if tag:
+            self.send_header("ETag", tag)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def parse_query(params: Dict[str, list], default_limit: int = DEFAULT_PAGE_SIZE) -> Tuple[Dict[str, Any], int, int]:
+    """Фильтры и пагинация из строки запроса; ошибка — ValueError"""
+    def single(name: str) -> str:
+        return params[name][-1] if params.get(name) else None
+
+    filters = {
+        "session_ids": sorted({session for value in params.get("session", [])
+                               for session in value.split(",") if session}),
+        "document_type": single("document_type"),
+        "prompt_type": single("prompt_type")
+    }
+    try:
+        limit = int(single("limit") or default_limit)
+        offset = int(single("offset") or 0)
+    except ValueError:
+        raise ValueError("limit и offset должны быть целыми числами")
+    if not 0 <= limit <= MAX_PAGE_SIZE or offset < 0:
+        raise ValueError(f"limit должен быть от 0 до {MAX_PAGE_SIZE}, offset — неотрицательным")
+    return filters, limit, offset
+
+
+def parse_cursor(params: Dict[str, list], last_event_id: str = None) -> int:
+    """Курсор из параметра cursor или заголовка Last-Event-ID; ошибка — ValueError"""
+    value = last_event_id or (params["cursor"][-1] if params.get("cursor") else "0")
+    try:
+        cursor = int(value)
+    except ValueError:
+        raise ValueError("cursor должен быть целым числом")
+    if cursor < 0:
+        raise ValueError("cursor должен быть неотрицательным")
+    return cursor
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description="API результатов для test-dashboard")
+    parser.add_argument("--host", default="0.0.0.0", help="адрес сервера")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("RESULTS_API_PORT", DEFAULT_PORT)),
+                        help=f"порт сервера (по умолчанию {DEFAULT_PORT})")
+    parser.add_argument("--sqlite", default=DEFAULT_SQLITE_PATH, help="файл SQLite-хранилища")
+    parser.add_argument("--db", action="store_true", help="читать результаты из PostgreSQL вместо SQLite")
+    parser.add_argument("--database-url", help="строка подключения PostgreSQL (по умолчанию DATABASE_URL)")
+    args = parser.parse_args()
+
+    ResultsAPIHandler.source = PostgresResultsSource(args.database_url) if args.db else SQLiteResultsSource(args.sqlite)
+    ResultsAPIHandler.watcher = ResultsWatcher(ResultsAPIHandler.source)
+    ResultsAPIHandler.watcher.start()
+    server = ThreadingHTTPServer((args.host, args.port), ResultsAPIHandler)
+    server.daemon_threads = True
+    print(f"🚀 API результатов: http://{args.host}:{args.port}/test-results "
+          f"({'PostgreSQL' if args.db else args.sqlite})")
+    print("⏹️  Для остановки сервера нажмите Ctrl+C")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n⏹️  Сервер остановлен")
+    finally:
+        server.server_close()
+        ResultsAPIHandler.source.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Сводный отчет по любому числу сессий тестирования
+Группировки считаются results_analytics по одной таблице (из файлов сессий или
+SQLite-хранилища); опционально сохраняет данные для test-dashboard
+"""
+
+import argparse
+import json
+import os
+from datetime import datetime
+
+import pandas as pd
+
+from results_analytics import (
+    DEFAULT_RESULTS_PATTERNS, aggregate, dashboard_payload, load_results, load_store, score_distribution, to_markdown
+)
+from sqlite_store import DEFAULT_SQLITE_PATH, SQLiteResultsStore
+
+GROUP_COLUMNS = ("prompt_type", "document_type", "complexity", "session_id", "document_format", "source")
+
+
+def write_report(report: str, output: str = None):
+    """Печатает отчет и при необходимости сохраняет его в markdown-файл"""
+    print(report)
+    if output:
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(report)
+        print(f"📄 Отчет сохранен: {output}")
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description="Сводный отчет по сессиям тестирования")
+    parser.add_argument("--results", action="append", help="шаблон файлов результатов (можно несколько раз)")
+    parser.add_argument("--sqlite", nargs="?", const=DEFAULT_SQLITE_PATH,
+                        help=f"читать результаты из SQLite-хранилища вместо файлов (по умолчанию {DEFAULT_SQLITE_PATH})")
+    parser.add_argument("--session", action="append", help="только эти сессии (с --sqlite, можно несколько раз)")
+    parser.add_argument("--rollups", action="store_true",
+                        help="статистика тип документа × промт из сводок SQLite-хранилища (не читает результаты)")
+    parser.add_argument("--group-by", default="prompt_type,document_type",
+                        help=f"колонки группировки через запятую ({', '.join(GROUP_COLUMNS)})")
+    parser.add_argument("--score", help="колонка оценки для гистограммы распределения")
+    parser.add_argument("--bins", type=int, default=5, help="интервалов в гистограмме")
+    parser.add_argument("--output", help="сохранить отчет в markdown-файл")
+    parser.add_argument("--dashboard-json", help="сохранить данные для test-dashboard в JSON-файл")
+    args = parser.parse_args()
+
+    group_by = [column.strip() for column in args.group_by.split(",") if column.strip()]
+    unknown = [column for column in group_by if column not in GROUP_COLUMNS]
+    if unknown:
+        parser.error(f"неизвестные колонки группировки: {', '.join(unknown)}")
+
+    if args.rollups:
+        store = SQLiteResultsStore(args.sqlite or DEFAULT_SQLITE_PATH)
+        try:
+            statistics = pd.DataFrame(store.statistics())
+        finally:
+            store.close()
+        if statistics.empty:
+            print("❌ Результаты не найдены!")
+            return
+        write_report(f"# Статистика по сводкам\n\n**Дата:** {datetime.now().isoformat()}\n\n"
+                     + to_markdown(statistics), args.output)
+        return
+
+    if args.sqlite:
+        frame = load_store(args.sqlite, args.session)
+    else:
+        frame = load_results(args.results or DEFAULT_RESULTS_PATTERNS)
+    if frame.empty:
+        print("❌ Результаты не найдены!")
+        return
+
+    lines = [
+        "# Сводный отчет по сессиям тестирования\n\n",
+        f"**Дата:** {datetime.now().isoformat()}\n",
+        f"**Сессий:** {frame['session_id'].nunique()}\n",
+        f"**Всего тестов:** {len(frame)}\n",
+        f"**Процент успеха:** {frame['success'].mean() * 100:.1f}%\n\n",
+        f"## Группировка: {' × '.join(group_by)}\n\n",
+        to_markdown(aggregate(frame, group_by))
+    ]
+    if args.score:
+        if args.score not in frame:
+            parser.error(f"колонка оценки {args.score} не найдена")
+        distribution = score_distribution(frame, args.score, group_by, args.bins)
+        lines.append(f"\n## Распределение {args.score}\n\n")
+        lines.append(to_markdown(distribution.reset_index().rename(columns=str)))
+
+    write_report("".join(lines), args.output)
+
+    if args.dashboard_json:
+        os.makedirs(os.path.dirname(args.dashboard_json) or ".", exist_ok=True)
+        with open(args.dashboard_json, 'w', encoding='utf-8') as f:
+            json.dump(dashboard_payload(frame, group_by), f, ensure_ascii=False, indent=2, default=str)
+        print(f"📊 Данные дашборда сохранены: {args.dashboard_json}")
+
+
+if __name__ == "__main__":
+    main()
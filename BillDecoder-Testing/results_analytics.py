@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Аналитика результатов тестирования на pandas
+Загружает любое число сессий в одну колоночную таблицу и считает группировки
+(промт × тип документа × сложность × сессия) векторно: число тестов, успешность,
+перцентили задержки, суммы токенов и распределения оценок
+"""
+
+import glob
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from sqlite_store import DEFAULT_SQLITE_PATH, SQLiteResultsStore
+
+DEFAULT_RESULTS_PATTERNS = ("test-results/*_test_*.json", "test-results/report*.json")
+
+LATENCY_PERCENTILES = (0.5, 0.9, 0.95, 0.99)
+
+TOKEN_COLUMNS = ("input_tokens", "output_tokens", "total_tokens")
+
+# Оценки автоматизированного тестировщика, шкала 0-10
+AUTOMATED_SCORE_COLUMNS = ("accuracy_score", "clarity_score", "confidence_score")
+
+BASE_COLUMNS = (
+    "session_id", "test_id", "source", "prompt_type", "document_type", "document_format",
+    "complexity", "document_file", "test_timestamp", "success", "reused", "response_time", *TOKEN_COLUMNS
+)
+
+
+def _result_row(result: Dict[str, Any], session_id: Optional[str], source: str) -> Dict[str, Any]:
+    """Плоская строка таблицы из результата compact/comprehensive или автоматизированного тестировщика"""
+    metrics = result.get("metrics") or {}
+    row = {
+        "session_id": result.get("session_id", session_id),
+        "test_id": result.get("test_id"),
+        "source": source,
+        "prompt_type": result.get("prompt_type"),
+        "document_type": result.get("document_type"),
+        "document_format": result.get("document_format", "verbose"),
+        "complexity": result.get("complexity"),
+        "document_file": result.get("document_file"),
+        "test_timestamp": result.get("test_timestamp", result.get("timestamp")),
+        "success": bool(result.get("success")),
+        # Ответ почти дубликата без вызова API: задержки нет
+        "reused": bool(result.get("reused_from")),
+        "response_time": result.get("response_time")
+    }
+    for column in TOKEN_COLUMNS:
+        row[column] = metrics.get(column, 0) if isinstance(metrics, dict) else 0
+
+    # quality_metrics -> колонки оценок, переоцененные quality_metrics_<версия> -> <оценка>_<версия>
+    for key, values in metrics.items():
+        if key == "quality_metrics" and isinstance(values, dict):
+            row.update(values)
+        elif key.startswith("quality_metrics_") and isinstance(values, dict):
+            version = key[len("quality_metrics_"):]
+            row.update({f"{name}_{version}": value for name, value in values.items()})
+    for column in AUTOMATED_SCORE_COLUMNS:
+        if result.get(column) is not None:
+            row[column] = result[column]
+    return row
+
+
+def results_frame(results: Iterable[Dict[str, Any]], session_id: Optional[str] = None,
+                  source: str = "compact") -> pd.DataFrame:
+    """Таблица из списка результатов в памяти"""
+    frame = pd.DataFrame([_result_row(result, session_id, source) for result in results])
+    for column in BASE_COLUMNS:
+        if column not in frame:
+            frame[column] = None
+    if frame.empty:
+        return frame
+
+    frame["success"] = frame["success"].astype(bool)
+    frame["reused"] = frame["reused"].fillna(False).astype(bool)
+    frame["response_time"] = pd.to_numeric(frame["response_time"], errors="coerce")
+    for column in TOKEN_COLUMNS:
+        frame[column] = pd.to_numeric(frame[column], errors="coerce").fillna(0).astype("int64")
+
+    # Сложность compact-результатов берется из имени файла (bill_001_medium.json, lab_002_full.json)
+    from_file = frame["document_file"].astype("string").str.extract(
+        r"_(simple|medium|complex|basic|comprehensive|full)\.json$")[0]
+    frame["complexity"] = frame["complexity"].fillna(from_file).fillna("unknown")
+    frame["document_format"] = frame["document_format"].fillna("verbose")
+    return frame
+
+
+def load_results(patterns: Iterable[str] = DEFAULT_RESULTS_PATTERNS) -> pd.DataFrame:
+    """Загружает все файлы сессий по шаблонам в одну таблицу"""
+    frames = []
+    seen = set()
+    for pattern in patterns:
+        for results_file in sorted(glob.glob(pattern)):
+            if results_file in seen:
+                continue
+            seen.add(results_file)
+            with open(results_file, 'r', encoding='utf-8') as f:
+                session = json.load(f)
+            if not isinstance(session, dict):
+                continue
+            if isinstance(session.get("results"), list):
+                source = os.path.basename(results_file).split("_test_")[0]
+                frames.append(results_frame(session["results"], session.get("session_id"), source))
+            elif isinstance(session.get("detailed_results"), list):
+                # report.json автоматизированного тестировщика: сессия — сам файл
+                session_id = os.path.splitext(os.path.basename(results_file))[0]
+                frames.append(results_frame(session["detailed_results"], session_id, "automated"))
+
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return results_frame([])
+    return pd.concat(frames, ignore_index=True, sort=False)
+
+
+def load_store(path: str = DEFAULT_SQLITE_PATH, session_ids: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """Загружает результаты из SQLite-хранилища (sqlite_store) в ту же таблицу, что и load_results"""
+    store = SQLiteResultsStore(path)
+    try:
+        results = store.results(session_ids)
+    finally:
+        store.close()
+
+    by_source: Dict[str, List[Dict[str, Any]]] = {}
+    for result in results:
+        by_source.setdefault(result.get("source") or "compact", []).append(result)
+    frames = [results_frame(source_results, source=source) for source, source_results in by_source.items()]
+    if not frames:
+        return results_frame([])
+    return pd.concat(frames, ignore_index=True, sort=False)
+
+
+def score_columns(frame: pd.DataFrame) -> List[str]:
+    """Колонки оценок, присутствующие в таблице"""
+    return [column for column in frame.columns
+            if "_score" in column and pd.api.types.is_numeric_dtype(frame[column])]
+
+
+def aggregate(frame: pd.DataFrame, by: List[str], scores: Optional[List[str]] = None,
+              sort: bool = True) -> pd.DataFrame:
+    """Группировка: тесты, успешность, перцентили задержки успешных тестов, суммы токенов, средние оценки
+
+    sort=False сохраняет порядок первого появления групп, как в прежних отчетах
+    """
+    scores = score_columns(frame) if scores is None else scores
+    working = frame.assign(successful_time=frame["response_time"].where(frame["success"]))
+    grouped = working.groupby(by, dropna=False, sort=sort)
+
+    stats = grouped.agg(
+        tests=("success", "size"),
+        successful=("success", "sum"),
+        latency_mean=("successful_time", "mean"),
+        **{f"{column}_sum": (column, "sum") for column in TOKEN_COLUMNS},
+        **{f"{column}_mean": (column, "mean") for column in scores}
+    )
+    stats["success_rate"] = stats["successful"] / stats["tests"]
+
+    percentiles = grouped["successful_time"].quantile(list(LATENCY_PERCENTILES)).unstack()
+    percentiles.columns = [f"latency_p{int(q * 100)}" for q in percentiles.columns]
+    return stats.join(percentiles).reset_index()
+
+
+def score_distribution(frame: pd.DataFrame, column: str, by: List[str], bins: int = 10) -> pd.DataFrame:
+    """Гистограмма оценки по группам: строки — группы, колонки — интервалы значений"""
+    values = frame[column].dropna()
+    if values.empty:
+        return pd.DataFrame()
+    edges = np.linspace(values.min(), values.max(), bins + 1) if values.max() > values.min() else bins
+    intervals = pd.cut(frame[column], bins=edges, include_lowest=True)
+    return frame.assign(bin=intervals).groupby([*by, "bin"], observed=False).size().unstack(fill_value=0)
+
+
+def _describe(values: pd.Series) -> Dict[str, float]:
+    return {
+        "average": float(values.mean()),
+        "median": float(values.median()),
+        "min": float(values.min()),
+        "max": float(values.max())
+    }
+
+
+def performance_summary(frame: pd.DataFrame) -> Dict[str, Any]:
+    """Сводка задержки в формате отчета автоматизированного тестировщика"""
+    response_times = frame.loc[frame["success"], "response_time"].dropna()
+    if response_times.empty:
+        return {"error": "No successful tests"}
+    summary = _describe(response_times)
+    return {
+        "average_response_time": summary["average"],
+        "median_response_time": summary["median"],
+        "min_response_time": summary["min"],
+        "max_response_time": summary["max"],
+        **{f"p{int(q * 100)}_response_time": float(response_times.quantile(q)) for q in LATENCY_PERCENTILES},
+        "success_rate": float(frame["success"].sum() / len(frame) * 100)
+    }
+
+
+def quality_summary(frame: pd.DataFrame, columns: Iterable[str] = AUTOMATED_SCORE_COLUMNS) -> Dict[str, Any]:
+    """Сводка оценок: {accuracy: {average, median, min, max}, ...}"""
+    present = [column for column in columns if column in frame]
+    scored = frame.loc[frame["success"], present].dropna() if present else pd.DataFrame()
+    if scored.empty:
+        return {"error": "No successful tests with scores"}
+    return {column.replace("_score", ""): _describe(scored[column]) for column in present}
+
+
+def detailed_results(frame: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Строки таблицы результатов test-dashboard"""
+    if frame.empty:
+        return []
+    detailed_columns = ["test_id", "session_id", "prompt_type", "document_type", "complexity", "success",
+                        "response_time", *[column for column in AUTOMATED_SCORE_COLUMNS if column in frame]]
+    return frame[detailed_columns].replace({np.nan: None}).to_dict(orient="records")
+
+
+def dashboard_payload(frame: pd.DataFrame, by: Iterable[str] = ("prompt_type", "document_type")) -> Dict[str, Any]:
+    """Данные для test-dashboard: summary, performance, quality, breakdown и detailed_results"""
+    successful = int(frame["success"].sum()) if not frame.empty else 0
+
+    return {
+        "summary": {
+            "total_tests": len(frame),
+            "successful_tests": successful,
+            "failed_tests": len(frame) - successful,
+            "success_rate": successful / len(frame) if len(frame) else 0,
+            "sessions": int(frame["session_id"].nunique()) if not frame.empty else 0
+        },
+        "performance": performance_summary(frame) if not frame.empty else {},
+        "quality": quality_summary(frame) if not frame.empty else {},
+        "breakdown": (aggregate(frame, list(by)).replace({np.nan: None}).to_dict(orient="records")
+                      if not frame.empty else []),
+        "detailed_results": detailed_results(frame)
+    }
+
+
+def to_markdown(table: pd.DataFrame, float_format: str = "{:.2f}") -> str:
+    """Markdown-таблица без зависимости от tabulate"""
+    def cell(value):
+        if value is None:
+            return "-"
+        if isinstance(value, float):
+            return "-" if np.isnan(value) else float_format.format(value)
+        return str(value)
+
+    header = "| " + " | ".join(str(column) for column in table.columns) + " |\n"
+    separator = "|" + "|".join("---" for _ in table.columns) + "|\n"
+    rows = "".join("| " + " | ".join(cell(value) for value in row) + " |\n"
+                   for row in table.itertuples(index=False, name=None))
+    return header + separator + rows
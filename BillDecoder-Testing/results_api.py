@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Чтение результатов для API дашборда (results-api-server.py)
+Страница результатов и агрегаты считаются запросами к индексированному хранилищу —
+SQLite (sqlite_store) или PostgreSQL (database/init.sql) — с фильтрами по сессии,
+типу документа и промту; число тестов, успешных, токенов, сессий и перцентили задержки
+берутся из сводок test_rollups / test_rollup_totals.
+Версия данных (data_version) меняется при любой записи и служит основой ETag.
+id результатов растут в порядке видимости (в PostgreSQL вставки пачек сериализуются
+results_sink), поэтому «результаты после id» — надежный курсор для дельт дашборда
+"""
+
+import hashlib
+import json
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from results_analytics import detailed_results, results_frame
+from results_rollups import latency_bucket, sketch_add, sketch_quantile
+from results_sink import AUTOMATED_SCORE_NAMES, RESULT_COLUMNS, database_url, psycopg2
+from sqlite_store import DEFAULT_SQLITE_PATH, SQLiteResultsStore, fts_query, stored_result
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+_IN_CHUNK = 500
+
+# Границы совпадений во фрагменте ответа: символы, которых нет в ответах, —
+# клиент экранирует фрагмент и заменяет их разметкой
+SNIPPET_MARKERS = ("\u27e6", "\u27e7")
+SNIPPET_WORDS = 24
+
+_SEARCH_FIELDS = ("id", "test_id", "session_id", "document_type", "prompt_type", "document_file",
+                  "test_timestamp", "success", "score", "snippet")
+
+
+def _mean(total: Optional[float], count: int) -> Optional[float]:
+    return total / count if count else None
+
+
+def result_totals(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Итоги дашборда по результатам в том же виде, что totals в aggregates: их можно складывать"""
+    totals: Dict[str, Any] = {"tests": len(results), "successful": 0, "response_time_sum": 0.0,
+                              "response_time_count": 0, "scores": {}}
+    for result in results:
+        if not result.get("success"):
+            continue
+        totals["successful"] += 1
+        if result.get("response_time") is not None:
+            totals["response_time_sum"] += result["response_time"]
+            totals["response_time_count"] += 1
+        for name in AUTOMATED_SCORE_NAMES:
+            if result.get(name) is not None:
+                score = totals["scores"].setdefault(name.replace("_score", ""), {"sum": 0.0, "count": 0})
+                score["sum"] += result[name]
+                score["count"] += 1
+    return totals
+
+
+class ResultsSource(ABC):
+    """Запросы API поверх одного из хранилищ; подклассы задают диалект и выполнение запроса
+
+    filters — словарь session_ids (список), document_type, prompt_type; пустые значения не фильтруют.
+    Внутренние ключи since_id / max_id ограничивают диапазон id
+    """
+
+    placeholder = "?"
+    session_column = "json_extract(metadata, '$.session_id')"
+    source_column = "json_extract(r.metadata, '$.source')"
+
+    @abstractmethod
+    def query(self, sql: str, params: Sequence[Any] = ()) -> List[Tuple[Any, ...]]:
+        """Строки запроса на чтение в диалекте источника"""
+
+    def close(self):
+        pass
+
+    def _where(self, filters: Dict[str, Any], prefix: str = "", session_column: Optional[str] = None,
+               conditions: Sequence[str] = ()) -> Tuple[str, List[Any]]:
+        conditions, params = list(conditions), []
+        if filters.get("session_ids"):
+            session_ids = list(filters["session_ids"])
+            column = session_column or self.session_column.replace("metadata", f"{prefix}metadata")
+            conditions.append(f"{column} IN ({', '.join([self.placeholder] * len(session_ids))})")
+            params.extend(session_ids)
+        for column in ("document_type", "prompt_type"):
+            if filters.get(column):
+                conditions.append(f"{prefix}{column} = {self.placeholder}")
+                params.append(filters[column])
+        for key, operator in (("since_id", ">"), ("max_id", "<=")):
+            if filters.get(key) is not None:
+                conditions.append(f"{prefix}id {operator} {self.placeholder}")
+                params.append(filters[key])
+        return (f"WHERE {' AND '.join(conditions)}" if conditions else ""), params
+
+    def data_version(self) -> str:
+        """Метка состояния данных: новые результаты, переоценка и удаление меняют ее"""
+        row = self.query("SELECT (SELECT MAX(id) FROM test_results), (SELECT MAX(id) FROM test_metrics), "
+                         "(SELECT COALESCE(SUM(total_tests), 0) FROM test_rollup_totals)")[0]
+        return "-".join(str(value) for value in row)
+
+    def latest_id(self) -> int:
+        """Последний id результатов (0 в пустой базе): курсор, с которого начинаются дельты"""
+        return self.query("SELECT MAX(id) FROM test_results")[0][0] or 0
+
+    def _results(self, filters: Dict[str, Any], order: str, limit: int,
+                 offset: int = 0) -> List[Tuple[int, Dict[str, Any]]]:
+        """Пары (id, результат в формате сохраненных сессий) в порядке id"""
+        where, params = self._where(filters)
+        rows = [(row[0], dict(zip(RESULT_COLUMNS, row[1:]))) for row in self.query(
+            f"SELECT id, {', '.join(RESULT_COLUMNS)} FROM test_results {where} "
+            f"ORDER BY id {order} LIMIT {self.placeholder} OFFSET {self.placeholder}", [*params, limit, offset])]
+        metrics: Dict[str, List[Tuple[str, float]]] = {}
+        test_ids = [row["test_id"] for _, row in rows]
+        for start in range(0, len(test_ids), _IN_CHUNK):
+            chunk = test_ids[start:start + _IN_CHUNK]
+            for test_id, name, value in self.query(
+                    f"SELECT test_id, metric_name, metric_value FROM test_metrics "
+                    f"WHERE test_id IN ({', '.join([self.placeholder] * len(chunk))}) ORDER BY id", chunk):
+                metrics.setdefault(test_id, []).append((name, value))
+        return [(result_id, stored_result(row, metrics.get(row["test_id"], []))) for result_id, row in rows]
+
+    def page(self, filters: Dict[str, Any], limit: int = DEFAULT_PAGE_SIZE, offset: int = 0) -> List[Dict[str, Any]]:
+        """Результаты в формате сохраненных сессий, новые первыми"""
+        return [result for _, result in self._results(filters, "DESC", limit, offset)]
+
+    def since(self, filters: Dict[str, Any], cursor: int, limit: int = MAX_PAGE_SIZE) -> Dict[str, Any]:
+        """Результаты после курсора (старые первыми) и приращения итогов дашборда по ним
+
+        more=True — после нового курсора есть еще результаты, их нужно дочитать следующим запросом
+        """
+        rows = self._results({**filters, "since_id": cursor}, "ASC", limit)
+        results = [result for _, result in rows]
+        return {
+            "cursor": rows[-1][0] if rows else cursor,
+            "results": detailed_results(results_frame(results)),
+            "delta": result_totals(results),
+            "more": len(rows) == limit
+        }
+
+    def _rollup_counts(self, filters: Dict[str, Any]) -> Tuple[Dict[Tuple[str, str], Dict[str, Any]], int]:
+        """Счетчики по (промт, тип документа) и число сессий из сводок; без фильтра сессий — из итогов
+
+        Сводки включают все записанные результаты, поэтому результаты после max_id вычитаются:
+        они читаются по первичному ключу в том же запросе (один снимок данных), их обычно нет или единицы
+        """
+        unbounded = {**filters, "since_id": None, "max_id": None}
+        where, params = self._where(unbounded, session_column="session_id")
+        columns = ("prompt_type, document_type, total_tests, successful_tests, total_tokens_used, latency_sketch, "
+                   "CAST(NULL AS FLOAT)")
+        if filters.get("session_ids"):
+            parts = [f"SELECT 'g', session_id, {columns} FROM test_rollups {where}"]
+        else:
+            # Итоги не делятся по сессиям: сессии считаются отдельной группировкой сводок
+            parts = [f"SELECT 'g', NULL, {columns} FROM test_rollup_totals {where}",
+                     f"SELECT 's', session_id, NULL, NULL, CAST(SUM(total_tests) AS BIGINT), NULL, NULL, NULL, NULL "
+                     f"FROM test_rollups {where} GROUP BY session_id"]
+            params = params * 2
+        if filters.get("max_id") is not None:
+            tail_where, tail_params = self._where({**unbounded, "since_id": filters["max_id"]})
+            parts.append(f"SELECT 'r', COALESCE({self.session_column}, ''), prompt_type, document_type, 1, "
+                         f"CASE WHEN success THEN 1 ELSE 0 END, COALESCE(total_tokens, 0), NULL, "
+                         f"CASE WHEN success THEN response_time END FROM test_results {tail_where}")
+            params = params + tail_params
+
+        groups: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        sessions: Dict[str, int] = {}
+        for kind, session_id, prompt_type, document_type, tests, successful, tokens, sketch, response_time in \
+                self.query(" UNION ALL ".join(parts), params):
+            if kind == "s":
+                sessions[session_id] = sessions.get(session_id, 0) + tests
+                continue
+            group = groups.setdefault((prompt_type, document_type),
+                                      {"tests": 0, "successful": 0, "tokens": 0, "sketch": []})
+            if kind == "g":
+                if isinstance(sketch, str):
+                    sketch = json.loads(sketch)
+                group["tests"] += tests
+                group["successful"] += successful
+                group["tokens"] += tokens
+                group["sketch"] = sketch_add(group["sketch"], sketch or [])
+                if filters.get("session_ids"):
+                    sessions[session_id] = sessions.get(session_id, 0) + tests
+                continue
+            group["tests"] -= tests
+            group["successful"] -= successful
+            group["tokens"] -= tokens
+            if response_time is not None:
+                bucket = latency_bucket(response_time)
+                group["sketch"] = sketch_add(group["sketch"], [0] * bucket + [-1])
+            sessions[session_id] = sessions.get(session_id, 0) - tests
+        groups = {key: group for key, group in groups.items() if group["tests"] > 0}
+        return groups, sum(1 for session_id, tests in sessions.items() if session_id and tests > 0)
+
+    def aggregates(self, filters: Dict[str, Any]) -> Dict[str, Any]:
+        """summary, performance, quality, quality_metrics и breakdown по всем отфильтрованным результатам
+
+        Число тестов, успешных, токенов, сессий и скетчи задержки берутся из сводок test_rollups /
+        test_rollup_totals; по результатам считаются только средняя, минимум и максимум задержки
+        успешных тестов и оценки. Граница since_id здесь не применяется
+        """
+        counts, sessions = self._rollup_counts(filters)
+        where, params = self._where(filters, conditions=["success"])
+        timings = {(prompt_type, document_type): timing for prompt_type, document_type, *timing in self.query(
+            "SELECT prompt_type, document_type, COUNT(response_time), SUM(response_time), MIN(response_time), "
+            f"MAX(response_time) FROM test_results {where} GROUP BY prompt_type, document_type", params)}
+        quality, quality_metrics = self._quality(filters)
+        groups = [(prompt_type, document_type, group["tests"], group["successful"],
+                   *timings.get((prompt_type, document_type), (0, None, None, None)), group["tokens"])
+                  for (prompt_type, document_type), group in sorted(counts.items())]
+        sketches = {key: group["sketch"] for key, group in counts.items()}
+
+        breakdown = []
+        for prompt_type, document_type, tests, successful, timed, time_sum, _, _, tokens in groups:
+            sketch = sketches.get((prompt_type, document_type), [])
+            breakdown.append({
+                "prompt_type": prompt_type,
+                "document_type": document_type,
+                "tests": tests,
+                "successful": int(successful),
+                "success_rate": successful / tests,
+                "latency_mean": _mean(time_sum, timed),
+                **{f"latency_p{int(q * 100)}": sketch_quantile(sketch, q) for q in (0.5, 0.95, 0.99)},
+                "total_tokens_sum": int(tokens or 0)
+            })
+
+        total = sum(group[2] for group in groups)
+        successful = sum(int(group[3]) for group in groups)
+        timed = sum(group[4] for group in groups)
+        performance: Dict[str, Any] = {"error": "No successful tests"}
+        if timed:
+            sketch: List[int] = []
+            for value in sketches.values():
+                sketch = sketch_add(sketch, value)
+            performance = {
+                "average_response_time": sum(group[5] or 0 for group in groups) / timed,
+                "median_response_time": sketch_quantile(sketch, 0.5),
+                "min_response_time": min(group[6] for group in groups if group[6] is not None),
+                "max_response_time": max(group[7] for group in groups if group[7] is not None),
+                **{f"p{int(q * 100)}_response_time": sketch_quantile(sketch, q) for q in (0.5, 0.95, 0.99)},
+                "success_rate": successful / total * 100
+            }
+
+        return {
+            "summary": {
+                "total_tests": total,
+                "successful_tests": successful,
+                "failed_tests": total - successful,
+                "success_rate": successful / total if total else 0,
+                "sessions": sessions
+            },
+            "performance": performance,
+            "quality": quality,
+            "quality_metrics": quality_metrics,
+            "breakdown": breakdown,
+            "totals": {
+                "tests": total,
+                "successful": successful,
+                "response_time_sum": sum(group[5] or 0 for group in groups),
+                "response_time_count": timed,
+                "scores": {name: {"sum": summary["average"] * summary["count"], "count": summary["count"]}
+                           for name, summary in quality.items() if name != "error"}
+            }
+        }
+
+    def _quality(self, filters: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Оценки успешных тестов: автоматизированного тестировщика (0-10, как quality_summary) и quality_metrics"""
+        where, params = self._where(filters, prefix="r.", conditions=["r.success"])
+        rows = self.query(
+            f"SELECT {self.source_column} = 'automated', m.metric_name, COUNT(*), AVG(m.metric_value), "
+            f"MIN(m.metric_value), MAX(m.metric_value) "
+            f"FROM test_metrics m JOIN test_results r ON r.test_id = m.test_id {where} "
+            f"GROUP BY 1, m.metric_name ORDER BY m.metric_name", params)
+        quality: Dict[str, Any] = {}
+        quality_metrics: Dict[str, Any] = {}
+        for automated, name, count, average, minimum, maximum in rows:
+            summary = {"average": average, "min": minimum, "max": maximum, "count": count}
+            if automated and name in AUTOMATED_SCORE_NAMES:
+                quality[name.replace("_score", "")] = summary
+            else:
+                quality_metrics[name] = summary
+        return quality or {"error": "No successful tests with scores"}, quality_metrics
+
+    @abstractmethod
+    def _search(self, filters: Dict[str, Any], text: str, limit: int,
+                offset: int) -> Optional[Tuple[int, List[Tuple[Any, ...]]]]:
+        """(всего совпадений, строки _SEARCH_FIELDS страницы) или None, если в запросе нет слов"""
+
+    def search(self, filters: Dict[str, Any], text: str, limit: int = DEFAULT_PAGE_SIZE,
+               offset: int = 0) -> Dict[str, Any]:
+        """Результаты, в ответах или ошибках которых встречаются слова запроса, самые релевантные первыми
+
+        Запрос: слова и "фразы" (все обязательны), OR, -исключение; snippet — фрагмент ответа
+        с совпадениями между SNIPPET_MARKERS
+        """
+        found = self._search(filters, text, limit, offset)
+        total, rows = found or (0, [])
+        results = []
+        for row in rows:
+            result = dict(zip(_SEARCH_FIELDS, row))
+            result["success"] = bool(result["success"])
+            if isinstance(result["test_timestamp"], datetime):
+                result["test_timestamp"] = result["test_timestamp"].isoformat()
+            results.append(result)
+        return {
+            "query": text,
+            "results": results,
+            "pagination": {"limit": limit, "offset": offset, "total": total, "returned": len(results)}
+        }
+
+    def dashboard(self, filters: Dict[str, Any], limit: int = DEFAULT_PAGE_SIZE, offset: int = 0) -> Dict[str, Any]:
+        """Ответ /test-results: агрегаты по всем отфильтрованным результатам и одна страница detailed_results
+
+        Все запросы ограничены id на момент начала (cursor), поэтому дельты после cursor не пересекаются с ответом
+        """
+        cursor = self.latest_id()
+        filters = {**filters, "max_id": cursor}
+        payload = self.aggregates(filters)
+        page = self.page(filters, limit, offset)
+        payload["cursor"] = cursor
+        payload["detailed_results"] = detailed_results(results_frame(page))
+        payload["pagination"] = {
+            "limit": limit,
+            "offset": offset,
+            "total": payload["summary"]["total_tests"],
+            "returned": len(page)
+        }
+        return payload
+
+
+class SQLiteResultsSource(ResultsSource):
+    """Источник API поверх SQLite-хранилища"""
+
+    def __init__(self, path: str = DEFAULT_SQLITE_PATH):
+        self.store = SQLiteResultsStore(path)
+
+    def query(self, sql: str, params: Sequence[Any] = ()) -> List[Tuple[Any, ...]]:
+        return self.store.query(sql, params)
+
+    def _search(self, filters: Dict[str, Any], text: str, limit: int,
+                offset: int) -> Optional[Tuple[int, List[Tuple[Any, ...]]]]:
+        match = fts_query(text)
+        if not match:
+            return None
+        where, params = self._where(filters, prefix="r.", conditions=["test_results_fts MATCH ?"])
+        params = [match, *params]
+        # Без фильтров совпадения считаются и ранжируются в самом индексе, без обращения к test_results
+        source = ("FROM test_results_fts WHERE test_results_fts MATCH ?" if len(params) == 1 else
+                  f"FROM test_results_fts JOIN test_results r ON r.id = test_results_fts.rowid {where}")
+        total = self.query(f"SELECT COUNT(*) {source}", params)[0][0]
+        # rank — bm25 (меньше — релевантнее), score — с обратным знаком. Фрагменты строятся вторым
+        # запросом только для строк страницы: в одном запросе с сортировкой snippet считался бы для всех совпадений
+        page = self.query(f"SELECT test_results_fts.rowid, -test_results_fts.rank {source} "
+                          f"ORDER BY test_results_fts.rank, test_results_fts.rowid DESC LIMIT ? OFFSET ?",
+                          [*params, limit, offset])
+        if not page:
+            return total, []
+        scores = dict(page)
+        rows = self.query(
+            f"SELECT r.id, r.test_id, json_extract(r.metadata, '$.session_id'), r.document_type, r.prompt_type, "
+            f"r.document_file, r.test_timestamp, r.success, "
+            f"snippet(test_results_fts, -1, '{SNIPPET_MARKERS[0]}', '{SNIPPET_MARKERS[1]}', '…', {SNIPPET_WORDS}) "
+            f"FROM test_results_fts JOIN test_results r ON r.id = test_results_fts.rowid "
+            f"WHERE test_results_fts MATCH ? AND test_results_fts.rowid IN ({', '.join('?' * len(scores))})",
+            [match, *scores])
+        rows = sorted(((*row[:8], scores[row[0]], row[8]) for row in rows),
+                      key=lambda row: (-row[8], -row[0]))
+        return total, rows
+
+    def close(self):
+        self.store.close()
+
+
+class PostgresResultsSource(ResultsSource):
+    """Источник API поверх PostgreSQL (схема database/init.sql), пул соединений на потоки сервера"""
+
+    placeholder = "%s"
+    session_column = "metadata->>'session_id'"
+    source_column = "r.metadata->>'source'"
+
+    def __init__(self, dsn: Optional[str] = None, pool_size: int = 4):
+        if psycopg2 is None:
+            raise RuntimeError("psycopg2 не установлен: pip install psycopg2-binary")
+        self.pool = psycopg2.pool.ThreadedConnectionPool(1, pool_size, dsn or database_url())
+        # Пул не ждет свободного соединения, поэтому запросы сверх pool_size ждут на семафоре
+        self._slots = threading.BoundedSemaphore(pool_size)
+
+    def query(self, sql: str, params: Sequence[Any] = ()) -> List[Tuple[Any, ...]]:
+        with self._slots:
+            return self._query(sql, params)
+
+    def _query(self, sql: str, params: Sequence[Any]) -> List[Tuple[Any, ...]]:
+        connection = self.pool.getconn()
+        try:
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(sql, list(params))
+                return cursor.fetchall()
+        finally:
+            self.pool.putconn(connection)
+
+    def _search(self, filters: Dict[str, Any], text: str, limit: int,
+                offset: int) -> Optional[Tuple[int, List[Tuple[Any, ...]]]]:
+        if not text or not text.strip():
+            return None
+        # search_vector и его GIN-индекс idx_test_results_search — см. database/init.sql
+        where, params = self._where(filters, prefix="r.", conditions=["r.search_vector @@ q.query"])
+        source = f"FROM test_results r, websearch_to_tsquery('english', %s) AS q(query) {where}"
+        params = [text, *params]
+        total = self.query(f"SELECT COUNT(*) {source}", params)[0][0]
+        # Фрагмент (ts_headline) строится только для строк страницы, не для всех совпадений
+        rows = self.query(f"""
+            SELECT id, test_id, session_id, document_type, prompt_type, document_file, test_timestamp, success, score,
+                   ts_headline('english', COALESCE(response_text, error_message, ''), query,
+                               'StartSel={SNIPPET_MARKERS[0]}, StopSel={SNIPPET_MARKERS[1]}, MaxWords={SNIPPET_WORDS}, MinWords=8')
+            FROM (
+                SELECT r.id, r.test_id, r.metadata->>'session_id' AS session_id, r.document_type, r.prompt_type,
+                       r.document_file, r.test_timestamp, r.success, r.response_text, r.error_message, q.query,
+                       ts_rank_cd(r.search_vector, q.query) AS score
+                {source}
+                ORDER BY score DESC, r.id DESC LIMIT %s OFFSET %s
+            ) hits
+            ORDER BY score DESC, id DESC""", [*params, limit, offset])
+        return total, rows
+
+    def close(self):
+        self.pool.closeall()
+
+
+def etag(version: str, query: Dict[str, Any]) -> str:
+    """ETag ответа: версия данных плюс нормализованные параметры запроса"""
+    key = json.dumps([version, query], sort_keys=True, default=str)
+    return f'"{hashlib.sha1(key.encode("utf-8")).hexdigest()[:24]}"'
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Инкрементальные сводки результатов (rollup) для test_statistics и дашборда
+Сводка хранится по (сессия, тип документа, промт, час) и итогом по (тип документа,
+промт): суммы и счетчики для средних плюс скетч задержки — счетчики по
+логарифмическим корзинам, из которых перцентили оцениваются с относительной
+ошибкой не больше половины шага корзины. Сводки обновляются при записи
+результатов, поэтому чтение статистики не зависит от объема истории.
+Корзины совпадают с функциями latency_bucket/latency_sketch в database/init.sql
+"""
+
+import math
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Корзина 0 — задержки до LATENCY_SKETCH_BASE секунд, корзина i — (base·g^(i-1); base·g^i]
+LATENCY_SKETCH_BASE = 0.01
+LATENCY_SKETCH_GROWTH = 1.25
+LATENCY_SKETCH_BUCKETS = 48
+
+ROLLUP_KEYS = ("session_id", "document_type", "prompt_type", "hour")
+
+# Аддитивные колонки сводки: сумма и число непустых значений для каждого среднего
+ROLLUP_SUMS = (
+    "total_tests", "successful_tests", "response_time_sum", "response_time_count", "quality_score_sum",
+    "quality_score_count", "safety_score_sum", "safety_score_count", "performance_score_sum",
+    "performance_score_count", "total_tokens_used"
+)
+
+
+def latency_bucket(seconds: float) -> int:
+    """Номер корзины скетча для задержки в секундах"""
+    if seconds <= LATENCY_SKETCH_BASE:
+        return 0
+    bucket = math.ceil(math.log(seconds / LATENCY_SKETCH_BASE) / math.log(LATENCY_SKETCH_GROWTH))
+    return min(LATENCY_SKETCH_BUCKETS - 1, bucket)
+
+
+def sketch_add(left: List[int], right: List[int]) -> List[int]:
+    """Поэлементная сумма скетчей (пустой список — пустой скетч)"""
+    size = max(len(left), len(right))
+    left = list(left) + [0] * (size - len(left))
+    right = list(right) + [0] * (size - len(right))
+    return [a + b for a, b in zip(left, right)]
+
+
+def sketch_quantile(sketch: List[int], q: float) -> Optional[float]:
+    """Оценка квантиля задержки: геометрическая середина корзины, в которую попадает квантиль"""
+    total = sum(sketch)
+    if not total:
+        return None
+    cumulative = 0
+    for bucket, count in enumerate(sketch):
+        cumulative += count
+        if cumulative >= q * total:
+            break
+    if bucket == 0:
+        return LATENCY_SKETCH_BASE
+    return LATENCY_SKETCH_BASE * LATENCY_SKETCH_GROWTH ** (bucket - 0.5)
+
+
+def rollup_hour(timestamp: Any) -> str:
+    """Начало часа метки времени результата (ISO)"""
+    if not isinstance(timestamp, datetime):
+        timestamp = datetime.fromisoformat(str(timestamp)) if timestamp else datetime.now()
+    return timestamp.replace(minute=0, second=0, microsecond=0).isoformat(sep=" ")
+
+
+def _empty_rollup() -> Dict[str, Any]:
+    rollup = {column: 0 for column in ROLLUP_SUMS}
+    rollup["latency_sketch"] = [0] * LATENCY_SKETCH_BUCKETS
+    return rollup
+
+
+def rollup_deltas(records: Iterable[Dict[str, Any]]) -> Dict[Tuple[str, str, str, str], Dict[str, Any]]:
+    """Приращения сводок по записям test_results (results_sink.result_record)
+
+    Средние считаются по всем тестам, как в test_statistics; скетч задержки — по успешным,
+    как перцентили results_analytics
+    """
+    deltas: Dict[Tuple[str, str, str, str], Dict[str, Any]] = {}
+    for record in records:
+        key = (record.get("session_id") or "", record["document_type"], record["prompt_type"],
+               rollup_hour(record.get("test_timestamp")))
+        rollup = deltas.setdefault(key, _empty_rollup())
+        rollup["total_tests"] += 1
+        rollup["successful_tests"] += int(bool(record["success"]))
+        for column in ("response_time", "quality_score", "safety_score", "performance_score"):
+            if record.get(column) is not None:
+                rollup[f"{column}_sum"] += record[column]
+                rollup[f"{column}_count"] += 1
+        rollup["total_tokens_used"] += record.get("total_tokens") or 0
+        if record["success"] and record.get("response_time") is not None:
+            rollup["latency_sketch"][latency_bucket(record["response_time"])] += 1
+    return deltas
+
+
+def merge_rollup(current: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """Сводка плюс приращение"""
+    merged = {column: (current.get(column) or 0) + delta[column] for column in ROLLUP_SUMS}
+    merged["latency_sketch"] = sketch_add(current.get("latency_sketch") or [], delta["latency_sketch"])
+    return merged
+
+
+def rollup_statistics(rollup: Dict[str, Any]) -> Dict[str, Any]:
+    """Строка статистики из сводки: средние, перцентили задержки из скетча"""
+    def mean(column: str) -> Optional[float]:
+        count = rollup[f"{column}_count"]
+        return rollup[f"{column}_sum"] / count if count else None
+
+    sketch = rollup["latency_sketch"]
+    return {
+        "total_tests": rollup["total_tests"],
+        "successful_tests": rollup["successful_tests"],
+        "failed_tests": rollup["total_tests"] - rollup["successful_tests"],
+        "avg_response_time": mean("response_time"),
+        "avg_quality_score": mean("quality_score"),
+        "avg_safety_score": mean("safety_score"),
+        "avg_performance_score": mean("performance_score"),
+        "total_tokens_used": rollup["total_tokens_used"],
+        "p50_response_time": sketch_quantile(sketch, 0.5),
+        "p95_response_time": sketch_quantile(sketch, 0.95),
+        "p99_response_time": sketch_quantile(sketch, 0.99)
+    }
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Конвейер тестировщика: загрузка → форматирование → разветвление по промтам → запрос → оценка → сохранение
+Стадии соединены ограниченными очередями и работают в своих потоках. Документ
+разбирается и форматируется один раз; подготовленный документ (PreparedDocument)
+общий для всех задач его промтов, стадии его не меняют. По каждой стадии считаются
+обработанные элементы, занятость, глубина входной очереди и ошибки по элементам
+"""
+
+import json
+import queue
+import reprlib
+import threading
+import time
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Tuple
+
+DEFAULT_QUEUE_SIZE = 16
+
+_DONE = object()
+
+# Описание элемента в отчете об ошибке обрезается: элементы несут документы и ответы целиком
+_ITEM_REPR = reprlib.Repr()
+_ITEM_REPR.maxstring = 120
+_ITEM_REPR.maxother = 200
+
+
+def document_complexity(document_data: Dict[str, Any]) -> str:
+    """Сложность документа по числу строк (услуг или лабораторных значений)"""
+    if document_data["document_type"] == "medical_bill":
+        if len(document_data.get("services", [])) > 3:
+            return "complex"
+        if len(document_data.get("services", [])) > 1:
+            return "medium"
+    elif document_data["document_type"] == "lab_results":
+        if len(document_data.get("lab_values", [])) > 8:
+            return "complex"
+        if len(document_data.get("lab_values", [])) > 4:
+            return "medium"
+    return "simple"
+
+
+@dataclass(frozen=True)
+class PreparedDocument:
+    """Разобранный и отформатированный документ; общий для всех задач промтов
+
+    Поля и тексты форматов неизменяемы. data — исходный словарь документа, который
+    не копируется ради скорости: стадии его только читают
+    """
+    file_path: str
+    document_type: str
+    complexity: str
+    data: Dict[str, Any] = field(repr=False)
+    texts: Mapping[str, str] = field(default_factory=lambda: MappingProxyType({}), repr=False)
+
+    def text(self, document_format: str) -> str:
+        return self.texts[document_format]
+
+
+def load_document(file_path: str) -> Dict[str, Any]:
+    """Стадия загрузки: чтение и разбор JSON документа"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def prepare_document(file_path: str, document_data: Dict[str, Any],
+                     formatters: Mapping[str, Callable[[Dict[str, Any]], str]]) -> PreparedDocument:
+    """Стадия форматирования: текст документа в каждом формате, один раз на документ"""
+    return PreparedDocument(
+        file_path=file_path,
+        document_type=document_data.get("document_type", "unknown"),
+        complexity=document_complexity(document_data) if "document_type" in document_data else "unknown",
+        data=document_data,
+        texts=MappingProxyType({name: formatter(document_data) for name, formatter in formatters.items()})
+    )
+
+
+@dataclass
+class PipelineStage:
+    """Стадия конвейера: fn(элемент) -> итерируемое выходных элементов (0, 1 или несколько)"""
+    name: str
+    fn: Callable[[Any], Iterable[Any]]
+    workers: int = 1
+
+
+@dataclass
+class StageMetrics:
+    """Счетчики стадии"""
+    name: str
+    workers: int
+    processed: int = 0
+    emitted: int = 0
+    errors: int = 0
+    busy_seconds: float = 0.0
+    queue_max_depth: int = 0
+    queue_depth_total: int = 0
+    queue_samples: int = 0
+    failures: List[Dict[str, str]] = field(default_factory=list)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def sample_queue(self, depth: int):
+        with self._lock:
+            self.queue_max_depth = max(self.queue_max_depth, depth)
+            self.queue_depth_total += depth
+            self.queue_samples += 1
+
+    def payload(self, wall_seconds: float) -> Dict[str, Any]:
+        return {
+            "stage": self.name,
+            "workers": self.workers,
+            "processed": self.processed,
+            "emitted": self.emitted,
+            "errors": self.errors,
+            "throughput": self.processed / wall_seconds if wall_seconds else 0.0,
+            "busy_seconds": self.busy_seconds,
+            "utilization": self.busy_seconds / (wall_seconds * self.workers) if wall_seconds else 0.0,
+            "queue_max_depth": self.queue_max_depth,
+            "queue_mean_depth": self.queue_depth_total / self.queue_samples if self.queue_samples else 0.0,
+            "failures": list(self.failures)
+        }
+
+
+class RunnerPipeline:
+    """Стадии в потоках, соединенные очередями ограниченного размера (обратное давление на источник)
+
+    Ошибка в обработке элемента записывается в метрики стадии (элемент и текст ошибки),
+    элемент отбрасывается, конвейер дорабатывает: результаты остальных элементов не теряются
+    """
+
+    def __init__(self, stages: List[PipelineStage], queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.metrics: List[StageMetrics] = []
+        self.wall_seconds = 0.0
+
+    def run(self, source: Iterable[Any]) -> List[Dict[str, Any]]:
+        """Пропускает элементы источника через все стадии; возвращает метрики стадий с ошибками по элементам"""
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        self.metrics = [StageMetrics(stage.name, stage.workers) for stage in self.stages]
+        remaining = [stage.workers for stage in self.stages]
+        remaining_lock = threading.Lock()
+
+        def put(index: int, item: Any):
+            queues[index].put(item)
+            self.metrics[index].sample_queue(queues[index].qsize())
+
+        def worker(index: int):
+            stage, metrics = self.stages[index], self.metrics[index]
+            while True:
+                item = queues[index].get()
+                if item is _DONE:
+                    break
+                started = time.perf_counter()
+                try:
+                    outputs = list(stage.fn(item))
+                except Exception as e:  # конвейер не должен зависнуть на одном элементе
+                    outputs = []
+                    with metrics._lock:
+                        metrics.errors += 1
+                        metrics.failures.append({"item": _ITEM_REPR.repr(item), "error": f"{type(e).__name__}: {e}"})
+                elapsed = time.perf_counter() - started
+                with metrics._lock:
+                    metrics.processed += 1
+                    metrics.emitted += len(outputs)
+                    metrics.busy_seconds += elapsed
+                if index + 1 < len(self.stages):
+                    for output in outputs:
+                        put(index + 1, output)
+
+            # Последний поток стадии закрывает вход следующей
+            with remaining_lock:
+                remaining[index] -= 1
+                last = remaining[index] == 0
+            if last and index + 1 < len(self.stages):
+                for _ in range(self.stages[index + 1].workers):
+                    queues[index + 1].put(_DONE)
+
+        threads = [threading.Thread(target=worker, args=(index,), name=f"{stage.name}-{number}", daemon=True)
+                   for index, stage in enumerate(self.stages) for number in range(stage.workers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for item in source:
+            put(0, item)
+        for _ in range(self.stages[0].workers):
+            queues[0].put(_DONE)
+        for thread in threads:
+            thread.join()
+        self.wall_seconds = time.perf_counter() - started
+        return self.summary()
+
+    def summary(self) -> List[Dict[str, Any]]:
+        return [metrics.payload(self.wall_seconds) for metrics in self.metrics]
+
+
+def print_pipeline_metrics(stages: List[Dict[str, Any]]):
+    """Метрики стадий в консоль"""
+    print("⚙️ Стадии конвейера:")
+    for stage in stages:
+        print(f"   {stage['stage']:<8} {stage['processed']:>5} шт, {stage['throughput']:.2f}/с, "
+              f"занятость {stage['utilization']:.0%}, очередь ср. {stage['queue_mean_depth']:.1f} "
+              f"/ макс. {stage['queue_max_depth']}")
+    for stage in stages:
+        for failure in stage["failures"]:
+            print(f"   ❌ {stage['stage']}: {failure['item']} — {failure['error']}")
+
+
+def write_pipeline_report(f, stages: List[Dict[str, Any]]):
+    """Раздел markdown-отчета о стадиях конвейера"""
+    f.write("\n## Стадии конвейера\n\n")
+    f.write("| Стадия | Потоков | Обработано | Выдано | Ошибок | Элементов/с | Занятость | Очередь (ср.) | Очередь (макс.) |\n")
+    f.write("|--------|---------|------------|--------|--------|-------------|-----------|---------------|-----------------|\n")
+    for stage in stages:
+        f.write(f"| {stage['stage']} | {stage['workers']} | {stage['processed']} | {stage['emitted']} | "
+                f"{stage['errors']} | {stage['throughput']:.2f} | {stage['utilization']:.0%} | "
+                f"{stage['queue_mean_depth']:.1f} | {stage['queue_max_depth']} |\n")
+    failures = [(stage["stage"], failure) for stage in stages for failure in stage["failures"]]
+    if failures:
+        f.write("\n| Стадия | Элемент | Ошибка |\n|--------|---------|--------|\n")
+        for stage_name, failure in failures:
+            f.write(f"| {stage_name} | `{failure['item']}` | {failure['error']} |\n")
+
+
+def fan_out(document: PreparedDocument, cases: Iterable[Tuple[Any, ...]]) -> List[Tuple[PreparedDocument, Tuple[Any, ...]]]:
+    """Стадия разветвления: задача на каждый промт (и формат) для одного подготовленного документа"""
+    return [(document, case) for case in cases]
+
+
+def stage_map(fn: Callable[[Any], Any]) -> Callable[[Any], Iterable[Any]]:
+    """Оборачивает функцию элемент -> элемент в стадию с одним выходом (None — элемент отбрасывается)"""
+    def stage(item: Any) -> Iterable[Any]:
+        output = fn(item)
+        return () if output is None else (output,)
+    return stage
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Стратифицированная выборка документов вместо "первых N файлов каждого типа"
+Страта — тип документа × сложность × тип ошибки × флаг отклонения. Планировщик
+жадно набирает наименьший набор документов, покрывающий все страты (сначала
+документы, открывающие больше новых значений и их пар), не выходя за бюджет
+запросов, и считает покрытие на каждый потраченный запрос
+"""
+
+import glob
+import json
+import os
+import random
+import re
+from itertools import combinations
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from billing_prescreen import BillingPrescreen
+from ground_truth import GroundTruthIndex
+
+STRATA_DIMENSIONS = ("document_type", "complexity", "error_type", "abnormal")
+
+_COMPLEXITY = re.compile(r"_(simple|medium|complex|basic|comprehensive|full)\.json$")
+
+# Правила предпроверки -> тип ошибки счета, если для корпуса нет эталонной разметки
+_RULE_ERROR_TYPES = {
+    "duplicate_charge": "duplicate_charge",
+    "upcoding": "upcoding",
+    "unbundling": "unbundling",
+    "service_date_window": "wrong_date",
+    "fractional_cents": "mathematical_error",
+    "total_mismatch": "mathematical_error"
+}
+
+
+def document_strata(file_path: str, document: Dict[str, Any], labels: Optional[Dict[str, Any]] = None,
+                    prescreen: Optional[BillingPrescreen] = None) -> Dict[str, str]:
+    """Значения измерений страты для документа
+
+    Тип ошибки берется из эталонной разметки генератора, а без нее — из находок предпроверки
+    """
+    doc_type = document.get("document_type", "unknown")
+    match = _COMPLEXITY.search(os.path.basename(file_path))
+    if match:
+        complexity = match.group(1)
+    elif "edge-cases" in file_path:
+        complexity = "edge_case"
+    elif "_stress_" in file_path:
+        complexity = "stress"
+    else:
+        complexity = "unknown"
+
+    error_type = "n/a"
+    if doc_type == "medical_bill":
+        if labels is not None:
+            error_types = sorted({error["error_type"] for error in labels.get("billing_errors", [])})
+        else:
+            findings = (prescreen or BillingPrescreen()).screen(document)
+            error_types = sorted({_RULE_ERROR_TYPES[finding.rule] for finding in findings
+                                  if finding.rule in _RULE_ERROR_TYPES})
+        error_type = "+".join(error_types) or "none"
+        abnormal = error_type != "none"
+    elif doc_type == "lab_results":
+        abnormal = any(value.get("status") != "normal" for value in document.get("lab_values", []))
+    elif doc_type == "eob":
+        abnormal = any(service.get("coverage_status") != "covered" for service in document.get("services", []))
+    else:
+        abnormal = False
+
+    return {
+        "document_type": doc_type,
+        "complexity": complexity,
+        "error_type": error_type,
+        "abnormal": "abnormal" if abnormal else "normal"
+    }
+
+
+def load_documents(data_dir: str) -> List[Tuple[str, Dict[str, Any]]]:
+    """Все документы корпуса (JSON с document_type), отсортированные по пути"""
+    documents = []
+    for file_path in sorted(glob.glob(os.path.join(data_dir, "**", "*.json"), recursive=True)):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if isinstance(data, dict) and "document_type" in data:
+            documents.append((file_path, data))
+    return documents
+
+
+def sample_corpus(test_files: List[Tuple[str, Dict[str, Any]]], calls_per_document: Union[int, Dict[str, int]],
+                  budget: Optional[int] = None, per_stratum: int = 1,
+                  manifest_path: Optional[str] = None) -> Dict[str, Any]:
+    """Стратифицированная выборка корпуса с выводом покрытия"""
+    planner = SamplingPlanner(calls_per_document, budget, per_stratum)
+    plan = planner.plan(test_files, corpus_strata(test_files, manifest_path))
+    print_sample_plan(plan)
+    return plan
+
+
+def corpus_strata(test_files: List[Tuple[str, Dict[str, Any]]], manifest_path: Optional[str] = None) -> Dict[str, Dict[str, str]]:
+    """Страты всех документов корпуса; метки ошибок — из манифеста разметки, если он есть"""
+    index = GroundTruthIndex.load([manifest_path] if manifest_path else [])
+    prescreen = BillingPrescreen()
+    return {
+        file_path: document_strata(file_path, document, (index.get(file_path) or {}).get("labels"), prescreen)
+        for file_path, document in test_files
+    }
+
+
+class SamplingPlanner:
+    """Жадное покрытие страт в пределах бюджета запросов
+
+    calls_per_document — число запросов на документ (все промты и форматы): одно число
+    или словарь по типу документа. per_stratum > 1 добирает документы в каждую страту
+    после того, как покрыты все
+    """
+
+    def __init__(self, calls_per_document: Union[int, Dict[str, int]], budget: Optional[int] = None,
+                 per_stratum: int = 1, seed: int = 42):
+        self.calls_per_document = calls_per_document
+        self.budget = budget
+        self.per_stratum = per_stratum
+        self.seed = seed
+
+    def calls_for(self, document_type: str) -> int:
+        if isinstance(self.calls_per_document, dict):
+            return self.calls_per_document.get(document_type, 0)
+        return self.calls_per_document
+
+    @staticmethod
+    def _features(strata: Dict[str, str]) -> set:
+        cell = tuple(strata[dimension] for dimension in STRATA_DIMENSIONS)
+        values = {(dimension, strata[dimension]) for dimension in STRATA_DIMENSIONS}
+        pairs = {pair for pair in combinations(sorted(values), 2)}
+        return {("cell", cell)} | {("value",) + value for value in values} | {("pair",) + pair for pair in pairs}
+
+    def plan(self, test_files: List[Tuple[str, Dict[str, Any]]],
+             strata: Dict[str, Dict[str, str]]) -> Dict[str, Any]:
+        """Выбирает документы; strata — путь -> значения измерений (document_strata)"""
+        rng = random.Random(self.seed)
+        candidates = list(test_files)
+        rng.shuffle(candidates)  # порядок путей не должен влиять на выбор при равенстве
+
+        features = {file_path: self._features(strata[file_path]) for file_path, _ in candidates}
+        cells = {file_path: tuple(strata[file_path][dimension] for dimension in STRATA_DIMENSIONS)
+                 for file_path, _ in candidates}
+        all_cells = set(cells.values())
+        all_values = {(dimension, values[dimension]) for values in strata.values() for dimension in STRATA_DIMENSIONS}
+
+        selected: List[Tuple[str, Dict[str, Any]]] = []
+        covered, covered_cells, covered_values = set(), set(), set()
+        calls = 0
+        curve = []
+
+        def take(file_path: str, document: Dict[str, Any], cost: int):
+            nonlocal calls
+            selected.append((file_path, document))
+            calls += cost
+            covered.update(features[file_path])
+            covered_cells.add(cells[file_path])
+            covered_values.update((dimension, strata[file_path][dimension]) for dimension in STRATA_DIMENSIONS)
+            curve.append({
+                "documents": len(selected),
+                "calls": calls,
+                "strata_covered": len(covered_cells),
+                "strata_coverage": len(covered_cells) / len(all_cells),
+                "values_coverage": len(covered_values) / len(all_values)
+            })
+
+        def affordable(document: Dict[str, Any]) -> Optional[int]:
+            cost = self.calls_for(document.get("document_type", "unknown"))
+            if self.budget is not None and calls + cost > self.budget:
+                return None
+            return cost
+
+        # Раунд 1: наименьший набор, покрывающий все страты
+        remaining = list(candidates)
+        while len(covered_cells) < len(all_cells):
+            best, best_gain, best_cost = None, 0, 0
+            for file_path, document in remaining:
+                if cells[file_path] in covered_cells:
+                    continue
+                cost = affordable(document)
+                if cost is None:
+                    continue
+                gain = len(features[file_path] - covered)
+                if gain > best_gain:
+                    best, best_gain, best_cost = (file_path, document), gain, cost
+            if best is None:
+                break
+            remaining.remove(best)
+            take(best[0], best[1], best_cost)
+
+        # Следующие раунды: еще по документу в каждую страту, начиная с самых населенных
+        population = {}
+        for file_path, _ in candidates:
+            population[cells[file_path]] = population.get(cells[file_path], 0) + 1
+        for _ in range(self.per_stratum - 1):
+            taken_cells = set()
+            for file_path, document in sorted(remaining, key=lambda item: -population[cells[item[0]]]):
+                cell = cells[file_path]
+                if cell in taken_cells:
+                    continue
+                cost = affordable(document)
+                if cost is None:
+                    continue
+                remaining.remove((file_path, document))
+                taken_cells.add(cell)
+                take(file_path, document, cost)
+
+        selected.sort(key=lambda item: item[0])
+        return {
+            "selected": selected,
+            "documents_total": len(test_files),
+            "strata_total": len(all_cells),
+            "strata_covered": len(covered_cells),
+            "uncovered_strata": sorted(" × ".join(cell) for cell in all_cells - covered_cells),
+            "strata_population": {" × ".join(cell): count for cell, count in sorted(population.items())},
+            "calls": calls,
+            "budget": self.budget,
+            "curve": curve
+        }
+
+
+def print_sample_plan(plan: Dict[str, Any], milestones: Tuple[float, ...] = (0.25, 0.5, 0.75, 1.0)):
+    """Итоги выборки и покрытие на потраченные запросы"""
+    budget = f" из бюджета {plan['budget']}" if plan["budget"] is not None else ""
+    print(f"🎯 Выборка: {len(plan['selected'])} документов из {plan['documents_total']}, "
+          f"страт покрыто {plan['strata_covered']}/{plan['strata_total']}, запросов {plan['calls']}{budget}")
+
+    rows, next_milestone = [], 0
+    for point in plan["curve"]:
+        while next_milestone < len(milestones) and point["strata_coverage"] >= milestones[next_milestone]:
+            rows.append((milestones[next_milestone], point))
+            next_milestone += 1
+    if rows:
+        print("| Покрытие страт | Документов | Запросов | Покрытие значений | Страт на 100 запросов |")
+        print("|----------------|------------|----------|-------------------|-----------------------|")
+        for milestone, point in rows:
+            per_100 = point["strata_covered"] / point["calls"] * 100 if point["calls"] else 0
+            print(f"| ≥{milestone:.0%} | {point['documents']} | {point['calls']} | "
+                  f"{point['values_coverage']:.0%} | {per_100:.1f} |")
+    if plan["uncovered_strata"]:
+        print(f"⚠️ Не покрыто бюджетом: {', '.join(plan['uncovered_strata'])}")
+
+
+def write_sample_report(f, plan: Dict[str, Any]):
+    """Раздел markdown-отчета о стратифицированной выборке"""
+    f.write("\n## Стратифицированная выборка\n\n")
+    f.write(f"- **Документов:** {plan['curve'][-1]['documents'] if plan['curve'] else 0} из {plan['documents_total']}\n")
+    f.write(f"- **Страт покрыто:** {plan['strata_covered']}/{plan['strata_total']}\n")
+    f.write(f"- **Запросов:** {plan['calls']}" + (f" (бюджет {plan['budget']})" if plan['budget'] is not None else "") + "\n")
+    if plan["uncovered_strata"]:
+        f.write(f"- **Не покрыто:** {', '.join(plan['uncovered_strata'])}\n")
+    if plan["curve"]:
+        f.write("\n| Документов | Запросов | Покрытие страт | Покрытие значений |\n"
+                "|------------|----------|----------------|-------------------|\n")
+        for point in plan["curve"]:
+            f.write(f"| {point['documents']} | {point['calls']} | {point['strata_coverage']:.0%} | "
+                    f"{point['values_coverage']:.0%} |\n")
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк полнотекстового поиска по ответам
+Пишет синтетическую сессию из сохраненных ответов в SQLite-хранилище с индексом
+FTS5 и без него (скорость записи пачками), затем замеряет задержку ранжированных
+запросов search() на первой и дальней странице. С --db замеряет только запросы
+к существующей базе PostgreSQL
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, List
+
+from results_api import PostgresResultsSource, SQLiteResultsSource
+from sqlite_store import SQLiteResultsStore
+
+DEFAULT_QUERIES = ("critical", "duplicate charges", "\"critical value\"", "insur*", "deductible OR copay", "the")
+
+# Слова, которые подмешиваются в ответы, чтобы синтетический корпус не состоял из одних повторов
+VOCABULARY = ("duplicate", "upcoding", "unbundling", "denied", "copay", "deductible", "modifier", "prior",
+              "authorization", "coinsurance", "network", "appeal", "overpayment", "adjustment", "referral")
+
+
+def load_templates(pattern: str) -> List[Dict[str, Any]]:
+    """Сохраненные результаты compact/comprehensive сессий как шаблоны строк"""
+    templates = []
+    for results_file in sorted(glob.glob(pattern)):
+        with open(results_file, 'r', encoding='utf-8') as f:
+            session = json.load(f)
+        if isinstance(session, dict) and isinstance(session.get("results"), list):
+            templates.extend(session["results"])
+    return templates
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def synthetic_results(templates: List[Dict[str, Any]], size: int, seed: int = 7) -> List[Dict[str, Any]]:
+    """size результатов с уникальными test_id; в каждый ответ добавлено несколько слов из VOCABULARY"""
+    rng = random.Random(seed)
+    session_id = f"search-benchmark-{uuid.uuid4()}"
+    results = []
+    for index in range(size):
+        template = templates[index % len(templates)]
+        extra = " ".join(rng.sample(VOCABULARY, 3))
+        results.append({**template, "test_id": str(uuid.uuid4()), "session_id": session_id,
+                        "response_text": f"{template.get('response_text') or ''} {extra}"})
+    return results
+
+
+def write_store(path: str, results: List[Dict[str, Any]], search_index: bool) -> float:
+    """Записывает результаты пачками; без search_index триггеры FTS5 удаляются до записи"""
+    store = SQLiteResultsStore(path)
+    if not search_index:
+        store.conn.executescript("DROP TRIGGER test_results_fts_insert; DROP TRIGGER test_results_fts_delete; "
+                                  "DROP TRIGGER test_results_fts_update; DROP TABLE test_results_fts;")
+    started = time.perf_counter()
+    store.add_many(results, source="benchmark")
+    store.close()
+    return time.perf_counter() - started
+
+
+def measure_queries(source, queries: List[str], repeats: int, offset: int) -> List[Dict[str, Any]]:
+    rows = []
+    for text in queries:
+        latencies = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            found = source.search({}, text, 20, offset)
+            latencies.append((time.perf_counter() - started) * 1000)
+        rows.append({"query": text, "total": found["pagination"]["total"],
+                     "p50": statistics.median(latencies), "p99": percentile(latencies, 0.99)})
+    return rows
+
+
+def print_queries(title: str, rows: List[Dict[str, Any]]):
+    print(f"\n{title}")
+    print("| Запрос | Совпадений | p50, мс | p99, мс |")
+    print("|--------|------------|---------|---------|")
+    for row in rows:
+        print(f"| `{row['query']}` | {row['total']} | {row['p50']:.2f} | {row['p99']:.2f} |")
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description="Бенчмарк полнотекстового поиска по ответам")
+    parser.add_argument("--results", default="test-results/*_test_*.json", help="шаблон файлов с результатами")
+    parser.add_argument("--rows", type=int, default=200000, help="результатов в синтетической сессии")
+    parser.add_argument("--query", action="append", help="запрос поиска (можно несколько раз)")
+    parser.add_argument("--repeats", type=int, default=20, help="повторов каждого запроса")
+    parser.add_argument("--db", action="store_true", help="замерить запросы к PostgreSQL вместо синтетического SQLite")
+    parser.add_argument("--database-url", help="строка подключения PostgreSQL (по умолчанию DATABASE_URL)")
+    args = parser.parse_args()
+    queries = args.query or list(DEFAULT_QUERIES)
+
+    if args.db:
+        source = PostgresResultsSource(args.database_url)
+        try:
+            print_queries("🐘 PostgreSQL, первая страница", measure_queries(source, queries, args.repeats, 0))
+            print_queries("🐘 PostgreSQL, страница с offset 1000", measure_queries(source, queries, args.repeats, 1000))
+        finally:
+            source.close()
+        return
+
+    templates = load_templates(args.results)
+    if not templates:
+        print(f"❌ Результаты не найдены по шаблону {args.results}! Запустите сначала тестирование")
+        return
+
+    results = synthetic_results(templates, args.rows)
+    print(f"🚀 Бенчмарк поиска: {len(results)} результатов из {len(templates)} шаблонов")
+    with tempfile.TemporaryDirectory() as directory:
+        plain_path = os.path.join(directory, "plain.sqlite")
+        indexed_path = os.path.join(directory, "indexed.sqlite")
+        plain = write_store(plain_path, results, search_index=False)
+        indexed = write_store(indexed_path, results, search_index=True)
+        print("\n| Хранилище | Запись, строк/с | Размер файла, МБ |")
+        print("|-----------|-----------------|------------------|")
+        for name, seconds, path in (("без индекса", plain, plain_path), ("FTS5", indexed, indexed_path)):
+            print(f"| {name} | {len(results) / seconds:.0f} | {os.path.getsize(path) / 1024 / 1024:.1f} |")
+
+        source = SQLiteResultsSource(indexed_path)
+        try:
+            print_queries("🔍 SQLite FTS5, первая страница", measure_queries(source, queries, args.repeats, 0))
+            print_queries("🔍 SQLite FTS5, страница с offset 1000", measure_queries(source, queries, args.repeats, 1000))
+        finally:
+            source.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@
 Запускает минимальные тесты без Docker инфраструктуры
 """
 
+import argparse
 import json
 import os
 import time
@@ -11,6 +12,9 @@ import requests
 from typing import Dict, List, Any
 from datetime import datetime
 
+from document_formatter import format_document
+from sampling_planner import load_documents, sample_corpus
+
 class SimplePromptTester:
     """Упрощенный тестер промтов"""
     
@@ -82,66 +86,13 @@ class SimplePromptTester:
     
     def format_document_for_prompt(self, document_data: Dict[str, Any]) -> str:
         """Форматирует данные документа для передачи в промт"""
-        if document_data["document_type"] == "medical_bill":
-            result = f"""
-MEDICAL BILL
-
-Provider: {document_data['provider']['name']}
-Patient: {document_data['patient']['name']}
-Service Date: {document_data['service_date']}
-
-Services:
-"""
-            for service in document_data.get("services", []):
-                result += f"""
-Code: {service['code']}
-Description: {service['description']}
-Charge: ${service['charge']}
-"""
-            result += f"""
-Total Charges: ${document_data['financial_summary']['total_charges']}
-Insurance Payment: ${document_data['financial_summary']['insurance_payment']}
-Patient Responsibility: ${document_data['financial_summary']['patient_responsibility']}
-"""
-            return result
-        
-        elif document_data["document_type"] == "lab_results":
-            result = f"""
-LABORATORY RESULTS
-
-Patient: {document_data['patient']['name']}
-Test Date: {document_data['test_date']}
-
-Results:
-"""
-            for value in document_data.get("lab_values", []):
-                status_symbol = "✅" if value["status"] == "normal" else "⚠️" if value["status"] in ["high", "low"] else "❌"
-                result += f"{status_symbol} {value['test_name']}: {value['value']} {value['unit']} (normal: {value['reference_range']})\n"
-            
-            return result
-        
-        elif document_data["document_type"] == "eob":
-            result = f"""
-EOB (EXPLANATION OF BENEFITS)
-
-Insurance Company: {document_data['insurance_company']['name']}
-Patient: {document_data['patient']['name']}
-Service Date: {document_data['service_date']}
-
-Coverage Details:
-"""
-            for service in document_data.get("services", []):
-                status_symbol = "✅" if service["coverage_status"] == "covered" else "❌"
-                result += f"{status_symbol} {service['code']}: ${service['billed_amount']} -> Insurance: ${service['insurance_payment']}, Patient: ${service['patient_responsibility']}\n"
-                if service.get("denial_reason"):
-                    result += f"   Denial Reason: {service['denial_reason']}\n"
-            
-            return result
-        
-        return json.dumps(document_data, ensure_ascii=False, indent=2)
+        return format_document(document_data)
     
-    def test_simple_prompts(self) -> None:
-        """Запускает простые тесты промтов"""
+    def test_simple_prompts(self, sample_budget: int = None) -> None:
+        """Запускает простые тесты промтов
+
+        С sample_budget файлы выбирает планировщик выборки (покрытие страт в пределах бюджета запросов)
+        """
         print("🚀 Запуск простых тестов промтов...")
         
         # Простые промты для тестирования
@@ -178,10 +129,15 @@ Provide specific recommendations for when users should seek additional professio
         
         # Загружаем несколько тестовых файлов
         test_files = []
-        for root, dirs, files in os.walk("test-data"):
-            for file in files:
-                if file.endswith('.json') and len(test_files) < 6:  # Берем только 6 файлов
-                    test_files.append(os.path.join(root, file))
+        if sample_budget is not None:
+            plan = sample_corpus(load_documents("test-data"), len(prompts), sample_budget,
+                                 manifest_path=os.path.join("test-data", "ground_truth.json"))
+            test_files = [file_path for file_path, _ in plan["selected"]]
+        else:
+            for root, dirs, files in os.walk("test-data"):
+                for file in files:
+                    if file.endswith('.json') and len(test_files) < 6:  # Берем только 6 файлов
+                        test_files.append(os.path.join(root, file))
         
         total_tests = 0
         successful_tests = 0
@@ -218,6 +174,11 @@ Provide specific recommendations for when users should seek additional professio
 
 def main():
     """Основная функция для запуска простых тестов"""
+    parser = argparse.ArgumentParser(description="Простые тесты промтов BillDecoder/LabDecoder")
+    parser.add_argument("--sample-budget", type=int,
+                        help="бюджет запросов: файлы выбираются стратифицированно вместо первых 6")
+    args = parser.parse_args()
+    
     # Конфигурация Hathr API (из TestCode/test2.sh - рабочие ключи)
     hathr_config = {
         "client_id": "4vau54clia0s5esf9ahojcn7kv",
@@ -238,7 +199,7 @@ def main():
     
     # Запускаем простые тесты
     try:
-        tester.test_simple_prompts()
+        tester.test_simple_prompts(sample_budget=args.sample_budget)
         print("\n🎉 Простые тесты завершены!")
         
     except Exception as e:
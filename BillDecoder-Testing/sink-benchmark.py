@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк записи результатов в PostgreSQL
+Сравнивает построчный INSERT с пакетной записью PostgresResultsSink (COPY и
+многострочный INSERT) на синтетической сессии из сохраненных ответов
+"""
+
+import argparse
+import glob
+import itertools
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from results_sink import (
+    DEFAULT_BATCH_SIZE, DEFAULT_POOL_SIZE, LOAD_METHODS, RESULT_COLUMNS, PostgresResultsSink, sql_value,
+    database_url, psycopg2, result_record
+)
+
+BENCHMARK_SESSION_PREFIX = "sink-benchmark-"
+
+
+def load_templates(pattern: str) -> List[Dict[str, Any]]:
+    """Сохраненные результаты compact/comprehensive сессий как шаблоны строк"""
+    templates = []
+    for results_file in sorted(glob.glob(pattern)):
+        with open(results_file, 'r', encoding='utf-8') as f:
+            session = json.load(f)
+        if isinstance(session, dict) and isinstance(session.get("results"), list):
+            templates.extend(session["results"])
+    return templates
+
+
+def synthetic_session(templates: List[Dict[str, Any]], size: int) -> List[Dict[str, Any]]:
+    """size результатов с уникальными test_id и новой сессией; ответы повторяются по кругу"""
+    session_id = f"{BENCHMARK_SESSION_PREFIX}{uuid.uuid4()}"
+    started = datetime.now()
+    return [
+        {**template, "test_id": str(uuid.uuid4()), "session_id": session_id,
+         "test_timestamp": (started + timedelta(milliseconds=index)).isoformat()}
+        for index, template in enumerate(itertools.islice(itertools.cycle(templates), size))
+    ]
+
+
+def row_by_row(dsn: str, results: List[Dict[str, Any]]) -> float:
+    """Базовая линия: INSERT на каждую строку и метрику, commit на каждый результат"""
+    connection = psycopg2.connect(dsn)
+    columns = ", ".join(RESULT_COLUMNS)
+    placeholders = ", ".join(["%s"] * len(RESULT_COLUMNS))
+    started = time.perf_counter()
+    try:
+        for result in results:
+            record = result_record(result, source="benchmark")
+            with connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(f"INSERT INTO test_results ({columns}) VALUES ({placeholders})",
+                                   [sql_value(record[column]) for column in RESULT_COLUMNS])
+                    for name, value in record["metrics"].items():
+                        cursor.execute("INSERT INTO test_metrics (test_id, metric_name, metric_value) VALUES (%s, %s, %s)",
+                                       (record["test_id"], name, value))
+    finally:
+        connection.close()
+    return time.perf_counter() - started
+
+
+def batched(dsn: str, results: List[Dict[str, Any]], method: str, batch_size: int, workers: int) -> float:
+    """Запись через сток: workers потоков делят результаты и общий пул соединений"""
+    sink = PostgresResultsSink(dsn, batch_size=batch_size, pool_size=max(workers, 1), method=method)
+    shards = [results[index::workers] for index in range(workers)]
+    started = time.perf_counter()
+    threads = [threading.Thread(target=sink.add_many, args=(shard, None, "benchmark")) for shard in shards]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    sink.close()
+    return time.perf_counter() - started
+
+
+def cleanup(dsn: str):
+    """Удаляет строки и сессии бенчмарка"""
+    connection = psycopg2.connect(dsn)
+    try:
+        with connection:
+            with connection.cursor() as cursor:
+                like = BENCHMARK_SESSION_PREFIX + "%"
+                cursor.execute("DELETE FROM test_metrics WHERE test_id IN (SELECT test_id FROM test_results "
+                               "WHERE metadata->>'session_id' LIKE %s)", (like,))
+                cursor.execute("DELETE FROM test_results WHERE metadata->>'session_id' LIKE %s", (like,))
+                cursor.execute("DELETE FROM test_sessions WHERE session_id LIKE %s", (like,))
+    finally:
+        connection.close()
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description="Бенчмарк пакетной записи результатов в PostgreSQL")
+    parser.add_argument("--database-url", help="строка подключения PostgreSQL (по умолчанию DATABASE_URL)")
+    parser.add_argument("--results", default="test-results/*_test_*.json", help="шаблон файлов с результатами")
+    parser.add_argument("--rows", type=int, default=100000, help="результатов в синтетической сессии")
+    parser.add_argument("--baseline-rows", type=int, default=2000,
+                        help="результатов для построчной базовой линии (она медленная)")
+    parser.add_argument("--batch-sizes", default=f"1000,{DEFAULT_BATCH_SIZE},20000", help="размеры пачек через запятую")
+    parser.add_argument("--workers", type=int, default=DEFAULT_POOL_SIZE, help="потоков записи (и соединений в пуле)")
+    parser.add_argument("--keep", action="store_true", help="не удалять записанные строки после бенчмарка")
+    args = parser.parse_args()
+
+    if psycopg2 is None:
+        print("❌ psycopg2 не установлен: pip install psycopg2-binary")
+        return
+    templates = load_templates(args.results)
+    if not templates:
+        print(f"❌ Результаты не найдены по шаблону {args.results}! Запустите сначала тестирование")
+        return
+
+    dsn = args.database_url or database_url()
+    batch_sizes = [int(size) for size in args.batch_sizes.split(",")]
+    print(f"🚀 Бенчмарк записи: {args.rows} результатов, {args.workers} потоков, база {dsn.split('@')[-1]}\n")
+
+    rows = []
+    try:
+        baseline = synthetic_session(templates, args.baseline_rows)
+        elapsed = row_by_row(dsn, baseline)
+        rows.append(("построчный INSERT", "-", 1, len(baseline), elapsed))
+
+        for method in LOAD_METHODS:
+            for batch_size in batch_sizes:
+                session = synthetic_session(templates, args.rows)
+                elapsed = batched(dsn, session, method, batch_size, args.workers)
+                rows.append((method, batch_size, args.workers, len(session), elapsed))
+    finally:
+        if not args.keep:
+            cleanup(dsn)
+
+    baseline_rate = rows[0][3] / rows[0][4] if rows and rows[0][4] else 0
+    print("| Способ | Пачка | Потоков | Результатов | Время, с | Результатов/с | Ускорение |")
+    print("|--------|-------|---------|-------------|----------|---------------|-----------|")
+    for method, batch_size, workers, count, elapsed in rows:
+        rate = count / elapsed if elapsed else 0
+        speedup = f"{rate / baseline_rate:.1f}×" if baseline_rate else "-"
+        print(f"| {method} | {batch_size} | {workers} | {count} | {elapsed:.2f} | {rate:,.0f} | {speedup} |")
+
+
+if __name__ == "__main__":
+    main()
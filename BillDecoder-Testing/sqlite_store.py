@@ -0,0 +1,555 @@
+#!/usr/bin/env python3
+"""
+Встроенное хранилище результатов в SQLite для запуска без PostgreSQL
+Схема повторяет database/init.sql (test_results, test_metrics, test_sessions,
+сводки test_rollups и представление test_statistics над ними) с теми же
+индексами; сводки обновляются в транзакции пачки, полнотекстовый индекс ответов
+(FTS5) — триггером при вставке. База работает в режиме WAL,
+результаты пишутся пачками: одна транзакция на пачку. Интерфейс записи тот же,
+что у PostgresResultsSink, поэтому тестировщики принимают любой из них
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from response_scorer import SCORER_VERSIONS
+from results_rollups import ROLLUP_KEYS, ROLLUP_SUMS, merge_rollup, rollup_deltas, rollup_statistics
+from results_sink import AUTOMATED_SCORE_NAMES, DEFAULT_BATCH_SIZE, RESULT_COLUMNS, result_record
+
+DEFAULT_SQLITE_PATH = "test-results/results.sqlite"
+
+# Параметров в одном запросе SQLite (SQLITE_MAX_VARIABLE_NUMBER старых сборок — 999)
+_IN_CHUNK = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS test_results (
+    id INTEGER PRIMARY KEY,
+    test_id TEXT UNIQUE NOT NULL,
+    document_type TEXT NOT NULL,
+    document_file TEXT NOT NULL,
+    prompt_type TEXT NOT NULL,
+    test_timestamp TEXT DEFAULT CURRENT_TIMESTAMP,
+    success INTEGER NOT NULL,
+    response_time REAL,
+    input_tokens INTEGER,
+    output_tokens INTEGER,
+    total_tokens INTEGER,
+    response_text TEXT,
+    error_message TEXT,
+    quality_score REAL,
+    safety_score REAL,
+    performance_score REAL,
+    metadata TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_test_results_document_type ON test_results(document_type);
+CREATE INDEX IF NOT EXISTS idx_test_results_prompt_type ON test_results(prompt_type);
+CREATE INDEX IF NOT EXISTS idx_test_results_timestamp ON test_results(test_timestamp);
+CREATE INDEX IF NOT EXISTS idx_test_results_success ON test_results(success);
+-- session_id хранится в metadata, как и в PostgreSQL; выборка по сессии — по индексу выражения
+CREATE INDEX IF NOT EXISTS idx_test_results_session ON test_results(json_extract(metadata, '$.session_id'));
+
+CREATE TABLE IF NOT EXISTS test_metrics (
+    id INTEGER PRIMARY KEY,
+    test_id TEXT NOT NULL REFERENCES test_results(test_id),
+    metric_name TEXT NOT NULL,
+    metric_value REAL NOT NULL,
+    metric_timestamp TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_test_metrics_test_id ON test_metrics(test_id);
+
+CREATE TABLE IF NOT EXISTS test_sessions (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT UNIQUE NOT NULL,
+    session_name TEXT,
+    start_time TEXT DEFAULT CURRENT_TIMESTAMP,
+    end_time TEXT,
+    total_tests INTEGER DEFAULT 0,
+    successful_tests INTEGER DEFAULT 0,
+    failed_tests INTEGER DEFAULT 0,
+    average_response_time REAL,
+    total_tokens_used INTEGER,
+    status TEXT DEFAULT 'running'
+);
+
+-- Сводки как в database/init.sql; скетч задержки — JSON-массив счетчиков корзин
+CREATE TABLE IF NOT EXISTS test_rollups (
+    session_id TEXT NOT NULL,
+    document_type TEXT NOT NULL,
+    prompt_type TEXT NOT NULL,
+    hour TEXT NOT NULL,
+    total_tests INTEGER NOT NULL DEFAULT 0,
+    successful_tests INTEGER NOT NULL DEFAULT 0,
+    response_time_sum REAL NOT NULL DEFAULT 0,
+    response_time_count INTEGER NOT NULL DEFAULT 0,
+    quality_score_sum REAL NOT NULL DEFAULT 0,
+    quality_score_count INTEGER NOT NULL DEFAULT 0,
+    safety_score_sum REAL NOT NULL DEFAULT 0,
+    safety_score_count INTEGER NOT NULL DEFAULT 0,
+    performance_score_sum REAL NOT NULL DEFAULT 0,
+    performance_score_count INTEGER NOT NULL DEFAULT 0,
+    total_tokens_used INTEGER NOT NULL DEFAULT 0,
+    latency_sketch TEXT NOT NULL DEFAULT '[]',
+    PRIMARY KEY (session_id, document_type, prompt_type, hour)
+);
+
+CREATE INDEX IF NOT EXISTS idx_test_rollups_hour ON test_rollups(hour);
+
+CREATE TABLE IF NOT EXISTS test_rollup_totals (
+    document_type TEXT NOT NULL,
+    prompt_type TEXT NOT NULL,
+    total_tests INTEGER NOT NULL DEFAULT 0,
+    successful_tests INTEGER NOT NULL DEFAULT 0,
+    response_time_sum REAL NOT NULL DEFAULT 0,
+    response_time_count INTEGER NOT NULL DEFAULT 0,
+    quality_score_sum REAL NOT NULL DEFAULT 0,
+    quality_score_count INTEGER NOT NULL DEFAULT 0,
+    safety_score_sum REAL NOT NULL DEFAULT 0,
+    safety_score_count INTEGER NOT NULL DEFAULT 0,
+    performance_score_sum REAL NOT NULL DEFAULT 0,
+    performance_score_count INTEGER NOT NULL DEFAULT 0,
+    total_tokens_used INTEGER NOT NULL DEFAULT 0,
+    latency_sketch TEXT NOT NULL DEFAULT '[]',
+    PRIMARY KEY (document_type, prompt_type)
+);
+
+-- Полнотекстовый индекс ответов и ошибок над test_results (внешнее содержимое: тексты не дублируются).
+-- Пополняется триггерами в транзакции пачки; porter сводит формы английских слов (duplicates -> duplic)
+CREATE VIRTUAL TABLE IF NOT EXISTS test_results_fts USING fts5(
+    response_text,
+    error_message,
+    content='test_results',
+    content_rowid='id',
+    tokenize='porter unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER IF NOT EXISTS test_results_fts_insert AFTER INSERT ON test_results BEGIN
+    INSERT INTO test_results_fts (rowid, response_text, error_message)
+    VALUES (new.id, new.response_text, new.error_message);
+END;
+
+CREATE TRIGGER IF NOT EXISTS test_results_fts_delete AFTER DELETE ON test_results BEGIN
+    INSERT INTO test_results_fts (test_results_fts, rowid, response_text, error_message)
+    VALUES ('delete', old.id, old.response_text, old.error_message);
+END;
+
+CREATE TRIGGER IF NOT EXISTS test_results_fts_update AFTER UPDATE OF response_text, error_message ON test_results BEGIN
+    INSERT INTO test_results_fts (test_results_fts, rowid, response_text, error_message)
+    VALUES ('delete', old.id, old.response_text, old.error_message);
+    INSERT INTO test_results_fts (rowid, response_text, error_message)
+    VALUES (new.id, new.response_text, new.error_message);
+END;
+
+DROP VIEW IF EXISTS test_statistics;
+CREATE VIEW test_statistics AS
+SELECT
+    document_type,
+    prompt_type,
+    total_tests,
+    successful_tests,
+    total_tests - successful_tests AS failed_tests,
+    ROUND(response_time_sum / NULLIF(response_time_count, 0), 2) AS avg_response_time,
+    ROUND(quality_score_sum / NULLIF(quality_score_count, 0), 2) AS avg_quality_score,
+    ROUND(safety_score_sum / NULLIF(safety_score_count, 0), 2) AS avg_safety_score,
+    ROUND(performance_score_sum / NULLIF(performance_score_count, 0), 2) AS avg_performance_score,
+    total_tokens_used
+FROM test_rollup_totals
+WHERE total_tests > 0;
+"""
+
+_INSERT_RESULT = (f"INSERT OR IGNORE INTO test_results ({', '.join(RESULT_COLUMNS)}) "
+                  f"VALUES ({', '.join('?' * len(RESULT_COLUMNS))})")
+
+_INSERT_METRIC = "INSERT INTO test_metrics (test_id, metric_name, metric_value, metric_timestamp) VALUES (?, ?, ?, ?)"
+
+# Те же правила, что у _UPSERT_SESSIONS в results_sink: итоги сессии увеличиваются на итоги пачки
+_UPSERT_SESSION = """
+INSERT INTO test_sessions (session_id, session_name, start_time, end_time, total_tests, successful_tests,
+                           failed_tests, average_response_time, total_tokens_used)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (session_id) DO UPDATE SET
+    start_time = MIN(start_time, excluded.start_time),
+    end_time = MAX(COALESCE(end_time, excluded.end_time), excluded.end_time),
+    total_tests = total_tests + excluded.total_tests,
+    successful_tests = successful_tests + excluded.successful_tests,
+    failed_tests = failed_tests + excluded.failed_tests,
+    average_response_time = CASE
+        WHEN average_response_time IS NULL THEN excluded.average_response_time
+        WHEN excluded.average_response_time IS NULL THEN average_response_time
+        ELSE (average_response_time * total_tests + excluded.average_response_time * excluded.total_tests)
+             / NULLIF(total_tests + excluded.total_tests, 0)
+    END,
+    total_tokens_used = COALESCE(total_tokens_used, 0) + excluded.total_tokens_used
+"""
+
+
+def _sqlite_value(value: Any) -> Any:
+    """Значение для параметров SQLite: словари — JSON, логические — 0/1, даты — ISO"""
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _chunks(values: Sequence[Any], size: int = _IN_CHUNK) -> Iterable[Sequence[Any]]:
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _split_metric(name: str) -> Tuple[str, str]:
+    """Имя метрики test_metrics -> (ключ в metrics результата, имя оценки)
+
+    Переоцененные метрики пишутся как <оценка>_<версия> и возвращаются в quality_metrics_<версия>
+    """
+    for version in SCORER_VERSIONS:
+        if name.endswith(f"_{version}"):
+            return f"quality_metrics_{version}", name[:-len(version) - 1]
+    return "quality_metrics", name
+
+
+def fts_query(text: str) -> str:
+    """Строка поиска -> запрос FTS5; пустая строка, если искать нечего
+
+    Слова и "фразы" объединяются через AND, OR между ними — альтернатива, слово* — префикс,
+    -слово исключает результаты. Синтаксис FTS5 в словах экранируется, поэтому запрос
+    пользователя не вызывает синтаксических ошибок
+    """
+    positive: List[str] = []
+    negative: List[str] = []
+    for match in re.finditer(r'(-?)"([^"]*)"?|(\S+)', text or ""):
+        negate, phrase, word = match.groups()
+        if word == "OR":
+            if positive and positive[-1] != "OR":
+                positive.append("OR")
+            continue
+        prefix = False
+        if word is not None:
+            negate = word.startswith("-")
+            prefix = word.endswith("*")
+            phrase = word
+        tokens = re.findall(r"\w+", phrase)
+        if not tokens:
+            continue
+        term = f'"{" ".join(tokens)}"' + ("*" if prefix else "")
+        (negative if negate else positive).append(term)
+    while positive and positive[-1] == "OR":
+        positive.pop()
+    if not positive:
+        return ""
+    if not negative:
+        return " ".join(positive)
+    # NOT в FTS5 связывает сильнее AND и OR: исключения применяются ко всему запросу в скобках
+    return f"({' '.join(positive)})" + "".join(f" NOT {term}" for term in negative)
+
+
+def stored_result(row: Dict[str, Any], metric_rows: List[Tuple[str, float]]) -> Dict[str, Any]:
+    """Строка test_results (SQLite или PostgreSQL) и ее метрики -> результат compact-тестировщика"""
+    metadata = row["metadata"] if isinstance(row["metadata"], dict) else json.loads(row["metadata"] or "{}")
+    metrics: Dict[str, Any] = {column: row[column] for column in ("input_tokens", "output_tokens", "total_tokens")}
+    result = {
+        "test_id": row["test_id"],
+        "session_id": metadata.get("session_id"),
+        "source": metadata.get("source"),
+        "document_type": row["document_type"],
+        "document_file": row["document_file"],
+        "document_format": metadata.get("document_format"),
+        "complexity": metadata.get("complexity"),
+        "prompt_type": row["prompt_type"],
+        "test_timestamp": _sqlite_value(row["test_timestamp"]),
+        "success": bool(row["success"]),
+        "response_time": row["response_time"],
+        "response_text": row["response_text"] if row["success"] else row["error_message"],
+        "metrics": metrics
+    }
+    if metadata.get("reused_from"):
+        result["reused_from"] = metadata["reused_from"]
+    for name, value in metric_rows:
+        # Оценки автоматизированного тестировщика (0-10) лежат в корне результата, не в quality_metrics
+        if name in AUTOMATED_SCORE_NAMES and metadata.get("source") == "automated":
+            result[name] = value
+            continue
+        key, score = _split_metric(name)
+        metrics.setdefault(key, {})[score] = value
+    return result
+
+
+class SQLiteResultsStore:
+    """Хранилище результатов в одном файле SQLite
+
+    add() копит записи и пишет пачку одной транзакцией, когда набирается batch_size;
+    close() сбрасывает остаток и помечает сессии завершенными. results() и statistics()
+    читают результаты обратно в формате сохраненных сессий
+    """
+
+    def __init__(self, path: str = DEFAULT_SQLITE_PATH, batch_size: int = DEFAULT_BATCH_SIZE):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.batch_size = batch_size
+        # Одно соединение на хранилище; потоки конвейера сериализуются блокировкой
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(_SCHEMA)
+        self._backfill_rollups()
+        self._backfill_search()
+        self._buffer: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self.sessions = set()
+        self.rows_written = 0
+        self.batches = 0
+
+    def add(self, result: Dict[str, Any], session_id: Optional[str] = None, source: str = "compact"):
+        """Добавляет результат; при заполнении буфера пачка записывается в вызывающем потоке"""
+        self.add_record(result_record(result, session_id, source))
+
+    def add_record(self, record: Dict[str, Any]):
+        with self._lock:
+            self._buffer.append(record)
+            if len(self._buffer) < self.batch_size:
+                return
+            batch, self._buffer = self._buffer, []
+        self.write_batch(batch)
+
+    def add_many(self, results: Iterable[Dict[str, Any]], session_id: Optional[str] = None, source: str = "compact"):
+        for result in results:
+            self.add(result, session_id, source)
+
+    def flush(self):
+        """Записывает накопленный буфер"""
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if batch:
+            self.write_batch(batch)
+
+    def _known(self, test_ids: List[str]) -> set:
+        known = set()
+        for chunk in _chunks(test_ids):
+            rows = self.conn.execute(
+                f"SELECT test_id FROM test_results WHERE test_id IN ({','.join('?' * len(chunk))})", chunk)
+            known.update(row[0] for row in rows)
+        return known
+
+    def write_batch(self, batch: List[Dict[str, Any]]) -> int:
+        """Одна пачка в одной транзакции: test_results, test_metrics, итоги test_sessions, сводки"""
+        unique = {}
+        for record in batch:
+            unique.setdefault(record["test_id"], record)
+        with self._lock, self.conn:
+            # Уже записанные test_id (повторный импорт той же сессии) не учитываются в итогах дважды
+            known = self._known(list(unique))
+            fresh = [record for test_id, record in unique.items() if test_id not in known]
+            self.conn.executemany(_INSERT_RESULT, [tuple(_sqlite_value(record[column]) for column in RESULT_COLUMNS)
+                                                   for record in fresh])
+            self.conn.executemany(_INSERT_METRIC, [
+                (record["test_id"], name, float(value), _sqlite_value(record["test_timestamp"]))
+                for record in fresh for name, value in record["metrics"].items()
+                if isinstance(value, (int, float)) and not isinstance(value, bool)
+            ])
+            self.conn.executemany(_UPSERT_SESSION, self._session_totals(fresh))
+            self._apply_rollups(fresh)
+            self.sessions.update(record["session_id"] for record in unique.values())
+            self.rows_written += len(fresh)
+            self.batches += 1
+        return len(fresh)
+
+    @staticmethod
+    def _session_totals(records: List[Dict[str, Any]]) -> List[Tuple[Any, ...]]:
+        """Итоги пачки по сессиям в порядке колонок _UPSERT_SESSION"""
+        sessions: Dict[Any, Dict[str, Any]] = {}
+        for record in records:
+            timestamp = _sqlite_value(record["test_timestamp"])
+            session = sessions.setdefault(record["session_id"], {
+                "name": record["session_name"], "start": timestamp, "end": timestamp,
+                "tests": 0, "successful": 0, "times": [], "tokens": 0
+            })
+            session["start"] = min(session["start"], timestamp)
+            session["end"] = max(session["end"], timestamp)
+            session["tests"] += 1
+            session["successful"] += int(record["success"])
+            if record["response_time"] is not None:
+                session["times"].append(record["response_time"])
+            session["tokens"] += record["total_tokens"] or 0
+        return [
+            (session_id, session["name"], session["start"], session["end"], session["tests"], session["successful"],
+             session["tests"] - session["successful"],
+             sum(session["times"]) / len(session["times"]) if session["times"] else None, session["tokens"])
+            for session_id, session in sessions.items()
+        ]
+
+    def _apply_rollups(self, records: List[Dict[str, Any]]):
+        """Прибавляет записи к часовым сводкам и итогам по (тип документа, промт)"""
+        hourly = rollup_deltas(records)
+        totals: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for (_, document_type, prompt_type, _), delta in hourly.items():
+            key = (document_type, prompt_type)
+            totals[key] = merge_rollup(totals.get(key, {}), delta)
+        self._merge_rollups("test_rollups", ROLLUP_KEYS, hourly)
+        self._merge_rollups("test_rollup_totals", ("document_type", "prompt_type"), totals)
+
+    def _merge_rollups(self, table: str, keys: Sequence[str], deltas: Dict[Tuple[str, ...], Dict[str, Any]]):
+        columns = (*ROLLUP_SUMS, "latency_sketch")
+        where = " AND ".join(f"{key} = ?" for key in keys)
+        for key, delta in sorted(deltas.items()):
+            row = self.conn.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE {where}", key).fetchone()
+            current = dict(zip(columns, row)) if row else {}
+            if current:
+                current["latency_sketch"] = json.loads(current["latency_sketch"])
+            merged = merge_rollup(current, delta)
+            merged["latency_sketch"] = json.dumps(merged["latency_sketch"])
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO {table} ({', '.join((*keys, *columns))}) "
+                f"VALUES ({', '.join('?' * (len(keys) + len(columns)))})",
+                (*key, *(merged[column] for column in columns))
+            )
+
+    def _backfill_rollups(self):
+        """Сводки по всей истории для базы, созданной до их появления"""
+        if self.conn.execute("SELECT 1 FROM test_rollup_totals LIMIT 1").fetchone():
+            return
+        if not self.conn.execute("SELECT 1 FROM test_results LIMIT 1").fetchone():
+            return
+        cursor = self.conn.execute(f"SELECT {', '.join(RESULT_COLUMNS)} FROM test_results")
+        records = []
+        for row in cursor:
+            record = dict(zip(RESULT_COLUMNS, row))
+            record["session_id"] = json.loads(record["metadata"] or "{}").get("session_id")
+            records.append(record)
+        with self.conn:
+            self._apply_rollups(records)
+
+    def _backfill_search(self):
+        """Полнотекстовый индекс по всей истории для базы, созданной до его появления"""
+        if self.conn.execute("SELECT 1 FROM test_results_fts_docsize LIMIT 1").fetchone():
+            return
+        if not self.conn.execute("SELECT 1 FROM test_results LIMIT 1").fetchone():
+            return
+        with self.conn:
+            self.conn.execute("INSERT INTO test_results_fts (test_results_fts) VALUES ('rebuild')")
+
+    def replace_metrics(self, rows: List[Tuple[str, str, float]]):
+        """Заменяет метрики (test_id, имя, значение) одной транзакцией; для переоценки"""
+        with self._lock, self.conn:
+            self.conn.executemany("DELETE FROM test_metrics WHERE test_id = ? AND metric_name = ?",
+                                  [(test_id, name) for test_id, name, _ in rows])
+            self.conn.executemany("INSERT INTO test_metrics (test_id, metric_name, metric_value) VALUES (?, ?, ?)",
+                                  rows)
+
+    def results(self, session_ids: Optional[Iterable[str]] = None, document_type: Optional[str] = None,
+                prompt_type: Optional[str] = None, success: Optional[bool] = None,
+                since: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Результаты в формате сохраненных сессий; фильтры идут по индексированным колонкам
+
+        Длинный список сессий запрашивается частями по _IN_CHUNK (лимит параметров SQLite)
+        """
+        conditions, params = [], []
+        for column, value in (("document_type", document_type), ("prompt_type", prompt_type)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if success is not None:
+            conditions.append("success = ?")
+            params.append(int(success))
+        if since is not None:
+            conditions.append("test_timestamp >= ?")
+            params.append(since)
+        session_chunks = [None] if session_ids is None else list(_chunks(list(dict.fromkeys(session_ids))))
+
+        with self._lock:
+            rows = []
+            for chunk in session_chunks:
+                chunk_conditions = list(conditions)
+                if chunk is not None:
+                    chunk_conditions.insert(
+                        0, f"json_extract(metadata, '$.session_id') IN ({','.join('?' * len(chunk))})")
+                where = f"WHERE {' AND '.join(chunk_conditions)}" if chunk_conditions else ""
+                cursor = self.conn.execute(
+                    f"SELECT id, {', '.join(RESULT_COLUMNS)} FROM test_results {where} ORDER BY id",
+                    [*(chunk or ()), *params])
+                rows.extend((row[0], dict(zip(RESULT_COLUMNS, row[1:]))) for row in cursor)
+            if len(session_chunks) > 1:
+                rows.sort(key=lambda row: row[0])
+            rows = [row for _, row in rows]
+            metrics: Dict[str, List[Tuple[str, float]]] = {}
+            for chunk in _chunks([row["test_id"] for row in rows]):
+                for test_id, name, value in self.conn.execute(
+                        f"SELECT test_id, metric_name, metric_value FROM test_metrics "
+                        f"WHERE test_id IN ({','.join('?' * len(chunk))}) ORDER BY id", chunk):
+                    metrics.setdefault(test_id, []).append((name, value))
+        return [stored_result(row, metrics.get(row["test_id"], [])) for row in rows]
+
+    def sessions_list(self) -> List[Dict[str, Any]]:
+        """Строки test_sessions, новые первыми"""
+        with self._lock:
+            cursor = self.conn.execute("SELECT * FROM test_sessions ORDER BY start_time DESC")
+            columns = [description[0] for description in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor]
+
+    def statistics(self) -> List[Dict[str, Any]]:
+        """Статистика по (тип документа, промт) из итогов сводок, с перцентилями задержки из скетча"""
+        return [{"document_type": row["document_type"], "prompt_type": row["prompt_type"], **rollup_statistics(row)}
+                for row in self._rollup_rows("SELECT * FROM test_rollup_totals WHERE total_tests > 0 "
+                                             "ORDER BY document_type, prompt_type")]
+
+    def rollups(self, session_ids: Optional[Iterable[str]] = None, since: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Часовые сводки (сессия, тип документа, промт, час) со статистикой
+
+        Длинный список сессий запрашивается частями по _IN_CHUNK, как в results()
+        """
+        conditions, params = ["total_tests > 0"], []
+        if since is not None:
+            conditions.append("hour >= ?")
+            params.append(since)
+        session_chunks = [None] if session_ids is None else list(_chunks(list(dict.fromkeys(session_ids))))
+        order = ("hour", "session_id", "document_type", "prompt_type")
+        rows = []
+        for chunk in session_chunks:
+            chunk_conditions = list(conditions)
+            if chunk is not None:
+                chunk_conditions.insert(0, f"session_id IN ({','.join('?' * len(chunk))})")
+            rows.extend(self._rollup_rows(f"SELECT * FROM test_rollups WHERE {' AND '.join(chunk_conditions)} "
+                                          f"ORDER BY {', '.join(order)}", [*(chunk or ()), *params]))
+        if len(session_chunks) > 1:
+            rows.sort(key=lambda row: tuple(row[column] for column in order))
+        return [{**{key: row[key] for key in ROLLUP_KEYS}, **rollup_statistics(row)} for row in rows]
+
+    def _rollup_rows(self, query: str, params: Sequence[Any] = ()) -> List[Dict[str, Any]]:
+        with self._lock:
+            cursor = self.conn.execute(query, params)
+            columns = [description[0] for description in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor]
+        for row in rows:
+            row["latency_sketch"] = json.loads(row["latency_sketch"])
+        return rows
+
+    def query(self, sql: str, params: Sequence[Any] = ()) -> List[Tuple[Any, ...]]:
+        """Строки произвольного запроса на чтение (для results_api)"""
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def close(self, status: str = "completed"):
+        """Сбрасывает буфер, помечает сессии завершенными и закрывает базу"""
+        self.flush()
+        sessions = sorted(session for session in self.sessions if session)
+        if sessions:
+            with self._lock, self.conn:
+                self.conn.executemany(
+                    "UPDATE test_sessions SET status = ?, end_time = MAX(COALESCE(end_time, ''), ?) WHERE session_id = ?",
+                    [(status, datetime.now().isoformat(), session) for session in sessions]
+                )
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close("completed" if exc_type is None else "failed")
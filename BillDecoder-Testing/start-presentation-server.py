@@ -1,82 +1,78 @@
 #!/usr/bin/env python3
 """
 Простой веб-сервер для просмотра презентации результатов тестирования
+Многопоточный, со сжатием файлов и условными ответами (presentation_server.py)
 """
 
-import http.server
-import socketserver
+import argparse
+import errno
 import webbrowser
-import os
-import sys
 from pathlib import Path
 
+from presentation_server import DEFAULT_INDEX, DEFAULT_PORT, brotli, make_server
+
+
 def start_server():
     """Запускает локальный веб-сервер"""
-    
-    # Определяем порт
-    PORT = 8080
-    
-    # Переходим в директорию с результатами
-    results_dir = Path("test-results")
+    parser = argparse.ArgumentParser(description="Веб-сервер презентации результатов тестирования")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"порт сервера (по умолчанию {DEFAULT_PORT})")
+    parser.add_argument("--bind", default="", help="адрес сервера (по умолчанию все интерфейсы)")
+    parser.add_argument("--directory", default="test-results", help="каталог с презентациями")
+    parser.add_argument("--index", default=DEFAULT_INDEX, help="файл, который отдается по адресу /")
+    parser.add_argument("--no-browser", action="store_true", help="не открывать браузер")
+    args = parser.parse_args()
+
+    # Проверяем директорию с результатами
+    results_dir = Path(args.directory)
     if not results_dir.exists():
-        print("❌ Директория test-results не найдена!")
+        print(f"❌ Директория {results_dir} не найдена!")
         return
-    
+
     # Проверяем наличие файла презентации
-    presentation_file = results_dir / "web-presentation-with-data.html"
+    presentation_file = results_dir / args.index
     if not presentation_file.exists():
         print("❌ Файл презентации не найден! Запустите сначала generate-web-presentation.py")
         return
-    
-    # Меняем рабочую директорию
-    os.chdir(results_dir)
-    
-    # Создаем обработчик для обслуживания файлов
-    class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
-        def end_headers(self):
-            # Добавляем заголовки для CORS
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-            self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-            super().end_headers()
-        
-        def do_GET(self):
-            # Если запрашивается корневая директория, показываем английскую презентацию
-            if self.path == '/' or self.path == '':
-                self.path = '/web-presentation-english.html'
-            return super().do_GET()
-    
+
     try:
-        # Создаем сервер
-        with socketserver.TCPServer(("", PORT), CustomHTTPRequestHandler) as httpd:
-            print(f"🚀 Веб-сервер запущен на http://localhost:{PORT}")
-            print(f"📊 Презентация доступна по адресу: http://localhost:{PORT}")
-            print(f"📁 Рабочая директория: {results_dir.absolute()}")
-            print("\n💡 Функции презентации:")
-            print("   - 📊 Общая статистика тестирования")
-            print("   - 🤖 Детальные результаты по каждому промту")
-            print("   - 📄 Анализ по типам документов")
-            print("   - 🔍 Поиск и фильтрация результатов")
-            print("   - 💬 Просмотр полных ответов AI")
-            print("\n⏹️  Для остановки сервера нажмите Ctrl+C")
-            
-            # Автоматически открываем браузер
-            try:
-                webbrowser.open(f'http://localhost:{PORT}')
-                print(f"\n🌐 Браузер автоматически открыт")
-            except:
-                print(f"\n🌐 Откройте браузер и перейдите по адресу: http://localhost:{PORT}")
-            
-            # Запускаем сервер
-            httpd.serve_forever()
-            
-    except KeyboardInterrupt:
-        print(f"\n⏹️  Сервер остановлен")
+        server = make_server(str(results_dir), args.bind, args.port, args.index)
     except OSError as e:
-        if e.errno == 48:  # Address already in use
-            print(f"❌ Порт {PORT} уже используется. Попробуйте другой порт.")
+        if e.errno == errno.EADDRINUSE:
+            print(f"❌ Порт {args.port} уже используется. Попробуйте другой порт: --port")
         else:
             print(f"❌ Ошибка запуска сервера: {e}")
+        return
+
+    # Сжимаем презентации заранее: первый зритель не ждет сжатия
+    warmed = server.cache.warm(str(results_dir))
+    url = f"http://{args.bind or 'localhost'}:{args.port}"
+
+    with server:
+        print(f"🚀 Веб-сервер запущен на {url}")
+        print(f"📊 Презентация доступна по адресу: {url}")
+        print(f"📁 Рабочая директория: {results_dir.absolute()}")
+        print(f"🗜️ Сжато файлов: {warmed} (gzip{', brotli' if brotli is not None else ''})")
+        print("\n💡 Функции презентации:")
+        print("   - 📊 Общая статистика тестирования")
+        print("   - 🤖 Детальные результаты по каждому промту")
+        print("   - 📄 Анализ по типам документов")
+        print("   - 🔍 Поиск и фильтрация результатов")
+        print("   - 💬 Просмотр полных ответов AI")
+        print("\n⏹️  Для остановки сервера нажмите Ctrl+C")
+
+        # Автоматически открываем браузер
+        if not args.no_browser:
+            try:
+                webbrowser.open(url)
+                print(f"\n🌐 Браузер автоматически открыт")
+            except Exception:
+                print(f"\n🌐 Откройте браузер и перейдите по адресу: {url}")
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print(f"\n⏹️  Сервер остановлен")
+
 
 if __name__ == "__main__":
     start_server()
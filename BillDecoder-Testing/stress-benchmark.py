@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк задержки и токенов в зависимости от размера документа
+Использует стресс-корпус из `test-data-generator.py --stress` и строит графики
+"""
+
+import argparse
+import json
+import os
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+from hathr_client import HathrClient, load_hathr_config
+
+BENCHMARK_PROMPT = """Classify this healthcare document and extract key metadata:
+
+Document types to identify:
+- Medical bill/invoice
+- EOB (Explanation of Benefits)
+- Lab results
+- Imaging reports
+- Insurance correspondence
+- Provider statements
+
+Extract:
+- Document type
+- Date of service
+- Provider name
+- Patient identifier (redacted)
+- Key services/tests mentioned
+- Urgency level (routine/urgent/emergency)"""
+
+
+def run_benchmark(client: HathrClient, manifest: List[Dict[str, Any]], repeats: int) -> List[Dict[str, Any]]:
+    """Отправляет каждый документ стресс-корпуса в API и собирает задержку и токены"""
+    measurements = []
+    total_calls = len(manifest) * repeats
+    current_call = 0
+
+    for entry in sorted(manifest, key=lambda item: (item["document_type"], item["line_items"])):
+        with open(entry["text_file"], 'r', encoding='utf-8') as f:
+            document_text = f.read()
+        message = f"{BENCHMARK_PROMPT}\n\n[DOCUMENT]\n{document_text}"
+
+        for _ in range(repeats):
+            current_call += 1
+            print(f"  🔍 {entry['document_type']} — {entry['line_items']} строк ({current_call}/{total_calls})")
+
+            success, response, response_time, usage = client.chat(message)
+            measurements.append({
+                "document_type": entry["document_type"],
+                "document_file": entry["document_file"],
+                "line_items": entry["line_items"],
+                "message_chars": len(message),
+                "success": success,
+                "response_time": response_time,
+                "input_tokens": usage.get("input_tokens", 0),
+                "output_tokens": usage.get("output_tokens", 0),
+                "error_message": None if success else response
+            })
+
+            if success:
+                print(f"    ✅ {response_time:.2f}с, {usage.get('input_tokens', 0)} входных токенов")
+            else:
+                print(f"    ❌ Ошибка: {response}")
+
+    return measurements
+
+
+def plot_measurements(measurements: List[Dict[str, Any]], plot_file: str):
+    """Строит графики задержки и входных/выходных токенов от числа строк документа"""
+    series = defaultdict(list)
+    for item in measurements:
+        if item["success"]:
+            series[item["document_type"]].append(item)
+
+    fig, (latency_ax, tokens_ax) = plt.subplots(1, 2, figsize=(14, 5))
+
+    for doc_type, items in sorted(series.items()):
+        items.sort(key=lambda item: item["line_items"])
+        sizes = [item["line_items"] for item in items]
+        latency_ax.plot(sizes, [item["response_time"] for item in items], marker="o", label=doc_type)
+        tokens_ax.plot(sizes, [item["input_tokens"] for item in items], marker="o", label=f"{doc_type} input")
+        tokens_ax.plot(sizes, [item["output_tokens"] for item in items], marker="x", linestyle="--",
+                       label=f"{doc_type} output")
+
+    latency_ax.set_title("Latency vs document size")
+    latency_ax.set_xlabel("Line items")
+    latency_ax.set_ylabel("Response time, s")
+    tokens_ax.set_title("Tokens vs document size")
+    tokens_ax.set_xlabel("Line items")
+    tokens_ax.set_ylabel("Tokens")
+
+    for ax in (latency_ax, tokens_ax):
+        ax.set_xscale("log")
+        ax.grid(True, alpha=0.3)
+        ax.legend()
+
+    fig.tight_layout()
+    fig.savefig(plot_file, dpi=120)
+    plt.close(fig)
+
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description="Бенчмарк задержки и токенов на стресс-корпусе")
+    parser.add_argument("--data-dir", default="stress-data", help="директория стресс-корпуса с manifest.json")
+    parser.add_argument("--repeats", type=int, default=1, help="повторов на документ")
+    parser.add_argument("--document-type", choices=["medical_bill", "lab_results", "eob"],
+                        help="ограничить бенчмарк одним типом документов")
+    parser.add_argument("--output-dir", default="test-results", help="куда сохранить результаты и график")
+    args = parser.parse_args()
+
+    manifest_path = os.path.join(args.data_dir, "manifest.json")
+    if not os.path.exists(manifest_path):
+        print(f"❌ {manifest_path} не найден!")
+        print("Запустите сначала: python3 test-data-generator.py --stress")
+        return
+
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if args.document_type:
+        manifest = [entry for entry in manifest if entry["document_type"] == args.document_type]
+
+    print(f"🚀 Стресс-бенчмарк: {len(manifest)} документов × {args.repeats} повторов")
+    measurements = run_benchmark(HathrClient(load_hathr_config()), manifest, args.repeats)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    benchmark_id = str(uuid.uuid4())
+    results_file = os.path.join(args.output_dir, f"stress_benchmark_{benchmark_id}.json")
+    plot_file = os.path.join(args.output_dir, f"stress_benchmark_{benchmark_id}.png")
+
+    with open(results_file, 'w', encoding='utf-8') as f:
+        json.dump({
+            "benchmark_id": benchmark_id,
+            "test_timestamp": datetime.now().isoformat(),
+            "repeats": args.repeats,
+            "measurements": measurements
+        }, f, indent=2, ensure_ascii=False)
+    plot_measurements(measurements, plot_file)
+
+    print(f"\n📊 Результаты сохранены:")
+    print(f"   Измерения: {results_file}")
+    print(f"   График: {plot_file}")
+
+
+if __name__ == "__main__":
+    main()
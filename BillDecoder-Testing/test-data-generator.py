@@ -4,22 +4,37 @@
 Создает различные типы медицинских документов для тестирования промтов
 """
 
+import argparse
 import json
 import random
 import datetime
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
 import os
 from dataclasses import dataclass
 from faker import Faker
 
+from document_formatter import format_document
+from ground_truth import GROUND_TRUTH_VERSION, document_labels
+from medical_codes import BUNDLED_PANELS, MEDICAL_CODES, SERVICE_CATALOG, UPCODING_TARGETS, MedicalCode
+
 fake = Faker('en_US')
 
-@dataclass
-class MedicalCode:
-    """Медицинский код с описанием"""
-    code: str
-    description: str
-    category: str
+# Базовые цены для массовой генерации строк счета (стресс-профили)
+STRESS_BASE_CHARGES = {
+    "99213": 150, "99214": 200, "36415": 25, "80053": 120, "85025": 60,
+    "93000": 45, "99281": 250, "99282": 400, "99283": 600, "99284": 800,
+    "99285": 1200, "A4253": 35, "J1815": 15, "G0008": 30
+}
+
+# Профили стресс-генерации: число строк услуг в счете/EOB и точек истории анализов
+STRESS_PROFILES = {
+    "small": {"service_lines": 50, "history_points": 12},
+    "hospital": {"service_lines": 500, "history_points": 60},
+    "extreme": {"service_lines": 5000, "history_points": 240}
+}
+
+# Строк услуг на одной странице EOB
+EOB_LINES_PER_PAGE = 25
 
 @dataclass
 class LabValue:
@@ -38,36 +53,12 @@ class TestDataGenerator:
         self.lab_tests = self._load_lab_tests()
         self.providers = self._generate_providers()
         self.insurance_companies = self._generate_insurance_companies()
+        # Эталонная разметка сохраненных JSON-документов: путь -> метки
+        self.ground_truth = []
     
     def _load_medical_codes(self) -> List[MedicalCode]:
         """Loads medical codes for testing"""
-        return [
-            # CPT codes
-            MedicalCode("99213", "Office visit, expanded problem focused", "CPT"),
-            MedicalCode("99214", "Office visit, detailed", "CPT"),
-            MedicalCode("36415", "Venipuncture", "CPT"),
-            MedicalCode("80053", "Comprehensive metabolic panel", "CPT"),
-            MedicalCode("85025", "Complete blood count with differential", "CPT"),
-            MedicalCode("93000", "Electrocardiogram", "CPT"),
-            MedicalCode("99281", "Emergency department visit, level 1", "CPT"),
-            MedicalCode("99282", "Emergency department visit, level 2", "CPT"),
-            MedicalCode("99283", "Emergency department visit, level 3", "CPT"),
-            MedicalCode("99284", "Emergency department visit, level 4", "CPT"),
-            MedicalCode("99285", "Emergency department visit, level 5", "CPT"),
-            
-            # ICD-10 codes
-            MedicalCode("Z00.00", "General adult medical examination", "ICD-10"),
-            MedicalCode("I10", "Essential hypertension", "ICD-10"),
-            MedicalCode("E11.9", "Type 2 diabetes mellitus without complications", "ICD-10"),
-            MedicalCode("M79.3", "Panniculitis, unspecified", "ICD-10"),
-            MedicalCode("R50.9", "Fever, unspecified", "ICD-10"),
-            MedicalCode("K21.9", "Gastro-esophageal reflux disease without esophagitis", "ICD-10"),
-            
-            # HCPCS codes
-            MedicalCode("A4253", "Blood glucose test strips", "HCPCS"),
-            MedicalCode("J1815", "Injection, insulin, per 5 units", "HCPCS"),
-            MedicalCode("G0008", "Administration of influenza virus vaccine", "HCPCS"),
-        ]
+        return list(MEDICAL_CODES)
     
     def _load_lab_tests(self) -> List[Dict[str, Any]]:
         """Loads laboratory test data"""
@@ -199,8 +190,11 @@ class TestDataGenerator:
             services = self._generate_complex_services()
         
         # Добавляем ошибки если нужно
+        billing_errors = []
         if include_errors:
-            services = self._add_billing_errors(services)
+            services, billing_error = self._add_billing_errors(services)
+            if billing_error:
+                billing_errors.append(billing_error)
         
         total_charges = sum(service['charge'] for service in services)
         insurance_payment = total_charges * random.uniform(0.6, 0.9)
@@ -233,7 +227,9 @@ class TestDataGenerator:
             "billing_codes": {
                 "diagnosis_codes": [random.choice(self.medical_codes).code for _ in range(random.randint(1, 3))],
                 "procedure_codes": [service['code'] for service in services]
-            }
+            },
+            # Внесенные ошибки; в сохраненный документ не попадают, только в манифест разметки
+            "ground_truth": {"billing_errors": billing_errors}
         }
         
         return bill
@@ -241,11 +237,7 @@ class TestDataGenerator:
     def _generate_simple_services(self) -> List[Dict[str, Any]]:
         """Generates simple medical services"""
         services = []
-        base_services = [
-            {"code": "99213", "description": "Office visit", "base_charge": 150},
-            {"code": "36415", "description": "Venipuncture", "base_charge": 25},
-            {"code": "80053", "description": "Basic metabolic panel", "base_charge": 80}
-        ]
+        base_services = SERVICE_CATALOG["simple"]
         
         for service in random.sample(base_services, random.randint(1, 2)):
             services.append({
@@ -262,11 +254,7 @@ class TestDataGenerator:
         """Generates medium complexity medical services"""
         services = self._generate_simple_services()
         
-        additional_services = [
-            {"code": "93000", "description": "Electrocardiogram", "base_charge": 45},
-            {"code": "99214", "description": "Detailed office visit", "base_charge": 200},
-            {"code": "85025", "description": "Complete blood count", "base_charge": 60}
-        ]
+        additional_services = SERVICE_CATALOG["medium"]
         
         for service in random.sample(additional_services, random.randint(1, 2)):
             services.append({
@@ -283,12 +271,7 @@ class TestDataGenerator:
         """Generates complex medical services"""
         services = self._generate_medium_services()
         
-        complex_services = [
-            {"code": "99284", "description": "Emergency department visit, level 4", "base_charge": 800},
-            {"code": "99285", "description": "Emergency department visit, level 5", "base_charge": 1200},
-            {"code": "36415", "description": "Additional venipuncture", "base_charge": 25},
-            {"code": "80053", "description": "Comprehensive metabolic panel", "base_charge": 120}
-        ]
+        complex_services = SERVICE_CATALOG["complex"]
         
         for service in random.sample(complex_services, random.randint(2, 4)):
             services.append({
@@ -301,8 +284,12 @@ class TestDataGenerator:
         
         return services
     
-    def _add_billing_errors(self, services: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Добавляет ошибки в медицинский счет"""
+    def _add_billing_errors(self, services: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Добавляет ошибки в медицинский счет
+
+        Возвращает услуги и разметку внесенной ошибки (тип, индексы затронутых строк, коды)
+        или None, если ошибка выбранного типа к этим услугам неприменима
+        """
         error_types = [
             "duplicate_charge",
             "upcoding",
@@ -312,50 +299,62 @@ class TestDataGenerator:
         ]
         
         error_type = random.choice(error_types)
+        affected_lines = []
         
         if error_type == "duplicate_charge":
             # Дублируем случайную услугу
-            duplicate_service = random.choice(services).copy()
+            original_index = random.randrange(len(services))
+            duplicate_service = services[original_index].copy()
             duplicate_service["charge"] = duplicate_service["charge"] * 1.1  # Небольшое изменение
             services.append(duplicate_service)
+            affected_lines = [original_index, len(services) - 1]
         
         elif error_type == "upcoding":
             # Заменяем простой код на более сложный
-            simple_codes = ["99213", "36415"]
-            complex_codes = ["99214", "99284"]
-            for service in services:
-                if service["code"] in simple_codes:
-                    service["code"] = random.choice(complex_codes)
+            for index, service in enumerate(services):
+                if service["code"] in UPCODING_TARGETS:
+                    service["code"] = random.choice(UPCODING_TARGETS[service["code"]])
                     service["charge"] *= 1.5
+                    affected_lines.append(index)
         
         elif error_type == "mathematical_error":
             # Добавляем математическую ошибку
-            for service in services:
+            for index, service in enumerate(services):
                 if random.random() < 0.3:
                     service["charge"] *= random.uniform(1.1, 1.3)
+                    affected_lines.append(index)
         
         elif error_type == "wrong_date":
             # Меняем дату на неправильную
-            for service in services:
+            for index, service in enumerate(services):
                 if random.random() < 0.5:
                     service["date"] = fake.date_between(start_date='-60d', end_date='-31d').strftime('%Y-%m-%d')
+                    affected_lines.append(index)
         
         elif error_type == "unbundling":
             # Split services that should be bundled
             new_services = []
             for service in services:
-                if service["code"] == "80053":  # Comprehensive metabolic panel
+                if service["code"] in BUNDLED_PANELS:  # e.g. comprehensive metabolic panel
                     # Split into separate components
                     components = [
-                        {"code": "80048", "description": "Basic metabolic panel", "charge": service["charge"] * 0.6},
-                        {"code": "80051", "description": "Electrolytes", "charge": service["charge"] * 0.4}
+                        {"code": component["code"], "description": component["description"],
+                         "charge": service["charge"] * component["share"]}
+                        for component in BUNDLED_PANELS[service["code"]]
                     ]
+                    affected_lines.extend(range(len(new_services), len(new_services) + len(components)))
                     new_services.extend(components)
                 else:
                     new_services.append(service)
             services = new_services
         
-        return services
+        if not affected_lines:
+            return services, None
+        return services, {
+            "error_type": error_type,
+            "affected_lines": affected_lines,
+            "codes": sorted({services[index]["code"] for index in affected_lines})
+        }
     
     def generate_lab_results(self, complexity: str = "normal", include_abnormal: bool = False) -> Dict[str, Any]:
         """Генерирует результаты лабораторных анализов"""
@@ -456,15 +455,18 @@ class TestDataGenerator:
             status=status
         )
     
-    def _generate_trend_data(self, tests: List[Dict[str, Any]], current_date: datetime.date) -> List[Dict[str, Any]]:
+    def _generate_trend_data(self, tests: List[Dict[str, Any]], current_date: datetime.date,
+                             points: int = 4, interval_days: int = 90,
+                             all_tests: bool = False) -> List[Dict[str, Any]]:
         """Генерирует трендовые данные за несколько месяцев"""
         trend_data = []
         
-        for months_ago in [3, 6, 9, 12]:
-            trend_date = current_date - datetime.timedelta(days=months_ago * 30)
+        for step in range(1, points + 1):
+            trend_date = current_date - datetime.timedelta(days=step * interval_days)
             
+            trend_tests = tests if all_tests else random.sample(tests, random.randint(3, len(tests)))
             trend_values = []
-            for test in random.sample(tests, random.randint(3, len(tests))):
+            for test in trend_tests:
                 value = self._generate_lab_value(test, include_abnormal=False)
                 trend_values.append({
                     "test_name": value.test_name,
@@ -547,6 +549,114 @@ class TestDataGenerator:
         
         return eob
     
+    def _generate_bulk_services(self, count: int, stay_start: datetime.date) -> List[Dict[str, Any]]:
+        """Generates a long list of service lines for a hospital-stay statement"""
+        billable_codes = [code for code in self.medical_codes if code.code in STRESS_BASE_CHARGES]
+        stay_days = max(1, count // 20)
+        
+        services = []
+        for index in range(count):
+            code = billable_codes[index % len(billable_codes)] if index < len(billable_codes) else random.choice(billable_codes)
+            service_date = stay_start + datetime.timedelta(days=index * stay_days // count)
+            services.append({
+                "code": code.code,
+                "description": code.description,
+                "charge": round(STRESS_BASE_CHARGES[code.code] * random.uniform(0.8, 1.2), 2),
+                "quantity": random.randint(1, 3),
+                "date": service_date.strftime('%Y-%m-%d')
+            })
+        
+        return services
+    
+    def generate_stress_bill(self, service_lines: int, include_errors: bool = False) -> Dict[str, Any]:
+        """Генерирует медицинский счет больничного масштаба с заданным числом строк услуг"""
+        bill = self.generate_medical_bill(complexity="simple")
+        stay_start = datetime.datetime.strptime(bill["service_date"], '%Y-%m-%d').date()
+        services = self._generate_bulk_services(service_lines, stay_start)
+        
+        billing_errors = []
+        if include_errors:
+            services, billing_error = self._add_billing_errors(services)
+            if billing_error:
+                billing_errors.append(billing_error)
+        
+        total_charges = sum(service['charge'] for service in services)
+        insurance_payment = total_charges * random.uniform(0.6, 0.9)
+        
+        bill["services"] = services
+        bill["ground_truth"] = {"billing_errors": billing_errors}
+        bill["financial_summary"]["total_charges"] = round(total_charges, 2)
+        bill["financial_summary"]["insurance_payment"] = round(insurance_payment, 2)
+        bill["financial_summary"]["patient_responsibility"] = round(total_charges - insurance_payment, 2)
+        bill["billing_codes"]["procedure_codes"] = [service['code'] for service in services]
+        
+        return bill
+    
+    def generate_stress_eob(self, service_lines: int, lines_per_page: int = EOB_LINES_PER_PAGE) -> Dict[str, Any]:
+        """Генерирует многостраничный EOB на основе стресс-счета"""
+        eob = self.generate_eob(self.generate_stress_bill(service_lines))
+        
+        eob["total_pages"] = max(1, -(-len(eob["services"]) // lines_per_page))
+        for index, service in enumerate(eob["services"]):
+            service["page"] = index // lines_per_page + 1
+        
+        return eob
+    
+    def generate_stress_lab_results(self, history_points: int, include_abnormal: bool = True,
+                                    interval_days: int = 30) -> Dict[str, Any]:
+        """Генерирует полные анализы с длинной историей (по всем тестам в каждой точке)"""
+        lab = self.generate_lab_results(complexity="full", include_abnormal=include_abnormal)
+        test_date = datetime.datetime.strptime(lab["test_date"], '%Y-%m-%d').date()
+        
+        lab["trend_data"] = self._generate_trend_data(
+            self.lab_tests, test_date,
+            points=history_points, interval_days=interval_days, all_tests=True
+        )
+        
+        return lab
+    
+    def generate_stress_corpus(self, sizes: List[int], output_dir: str = "stress-data",
+                               history_points: int = None) -> List[Dict[str, Any]]:
+        """Генерирует стресс-корпус для набора размеров и пишет manifest.json"""
+        manifest = []
+        
+        for size in sizes:
+            # По умолчанию история анализов дает примерно столько же строк, сколько услуг в счете
+            lab_points = history_points or max(1, size // len(self.lab_tests))
+            documents = [
+                ("bills", f"bill_stress_{size:05d}", self.generate_stress_bill(size, include_errors=True)),
+                ("eob", f"eob_stress_{size:05d}", self.generate_stress_eob(size)),
+                ("lab-results", f"lab_stress_{size:05d}", self.generate_stress_lab_results(lab_points))
+            ]
+            
+            for subdir, name, document in documents:
+                os.makedirs(os.path.join(output_dir, subdir), exist_ok=True)
+                json_path = self.save_test_data(document, f"{subdir}/{name}.json", output_dir)
+                txt_path = self.save_test_data(document, f"{subdir}/{name}.txt", output_dir)
+                
+                if document["document_type"] == "lab_results":
+                    line_items = len(document["lab_values"]) + sum(len(t["values"]) for t in document["trend_data"])
+                else:
+                    line_items = len(document["services"])
+                
+                manifest.append({
+                    "document_file": json_path,
+                    "text_file": txt_path,
+                    "document_type": document["document_type"],
+                    "requested_size": size,
+                    "line_items": line_items,
+                    "pages": document.get("total_pages", 1),
+                    "text_bytes": os.path.getsize(txt_path),
+                    "ground_truth": document_labels(document)
+                })
+        
+        manifest_path = os.path.join(output_dir, "manifest.json")
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        print(f"Сохранено: {manifest_path}")
+        
+        return manifest
+    
     def save_test_data(self, data: Dict[str, Any], filename: str, output_dir: str = "test-data"):
         """Сохраняет тестовые данные в файл"""
         os.makedirs(output_dir, exist_ok=True)
@@ -554,8 +664,15 @@ class TestDataGenerator:
         filepath = os.path.join(output_dir, filename)
         
         if filename.endswith('.json'):
+            # Разметка уходит в манифест, а не в документ, который видит модель
+            self.ground_truth.append({
+                "document_file": filepath,
+                "document_type": data.get("document_type"),
+                "ground_truth": document_labels(data)
+            })
             with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+                json.dump({key: value for key, value in data.items() if key != "ground_truth"},
+                          f, ensure_ascii=False, indent=2)
         elif filename.endswith('.txt'):
             with open(filepath, 'w', encoding='utf-8') as f:
                 f.write(self._format_as_text(data))
@@ -563,144 +680,47 @@ class TestDataGenerator:
         print(f"Сохранено: {filepath}")
         return filepath
     
+    def save_ground_truth(self, output_dir: str = "test-data") -> str:
+        """Пишет манифест эталонной разметки сохраненных JSON-документов"""
+        manifest_path = os.path.join(output_dir, "ground_truth.json")
+        documents = [entry for entry in self.ground_truth
+                     if os.path.normpath(entry["document_file"]).startswith(os.path.normpath(output_dir) + os.sep)]
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": GROUND_TRUTH_VERSION, "documents": documents}, f, ensure_ascii=False, indent=2)
+        print(f"Сохранено: {manifest_path}")
+        return manifest_path
+    
     def _format_as_text(self, data: Dict[str, Any]) -> str:
         """Форматирует данные как текст для имитации реального документа"""
-        if data["document_type"] == "medical_bill":
-            return self._format_bill_as_text(data)
-        elif data["document_type"] == "lab_results":
-            return self._format_lab_as_text(data)
-        elif data["document_type"] == "eob":
-            return self._format_eob_as_text(data)
-        else:
-            return json.dumps(data, ensure_ascii=False, indent=2)
-    
-    def _format_bill_as_text(self, bill: Dict[str, Any]) -> str:
-        """Formats bill as text"""
-        text = f"""
-MEDICAL BILL
-
-Provider: {bill['provider']['name']}
-NPI: {bill['provider']['npi']}
-Specialty: {bill['provider']['specialty']}
-
-Patient: {bill['patient']['name']}
-Date of Birth: {bill['patient']['dob']}
-Member ID: {bill['patient']['member_id']}
-Address: {bill['patient']['address']}
-
-Insurance Company: {bill['insurance']['company']['name']}
-Policy Number: {bill['insurance']['policy_number']}
-Group Number: {bill['insurance']['group_number']}
-
-Service Date: {bill['service_date']}
-Billing Date: {bill['billing_date']}
-
-SERVICES:
-"""
-        
-        for service in bill['services']:
-            text += f"""
-Code: {service['code']}
-Description: {service['description']}
-Date: {service.get('date', 'N/A')}
-Quantity: {service.get('quantity', 1)}
-Charge: ${service['charge']}
-"""
-        
-        text += f"""
-FINANCIAL SUMMARY:
-Total Charges: ${bill['financial_summary']['total_charges']}
-Insurance Payment: ${bill['financial_summary']['insurance_payment']}
-Patient Responsibility: ${bill['financial_summary']['patient_responsibility']}
-Deductible: ${bill['financial_summary']['deductible']}
-Copay: ${bill['financial_summary']['copay']}
-
-Diagnosis Codes: {', '.join(bill['billing_codes']['diagnosis_codes'])}
-Procedure Codes: {', '.join(bill['billing_codes']['procedure_codes'])}
-"""
-        
-        return text
-    
-    def _format_lab_as_text(self, lab: Dict[str, Any]) -> str:
-        """Formats laboratory results as text"""
-        text = f"""
-LABORATORY RESULTS
-
-Laboratory: {lab['provider']['name']}
-NPI: {lab['provider']['npi']}
-
-Patient: {lab['patient']['name']}
-Date of Birth: {lab['patient']['dob']}
-Gender: {lab['patient']['gender']}
-Member ID: {lab['patient']['member_id']}
-
-Test Date: {lab['test_date']}
-Report Date: {lab['report_date']}
-
-Ordering Physician: {lab['ordering_physician']['name']}
-NPI: {lab['ordering_physician']['npi']}
-Specialty: {lab['ordering_physician']['specialty']}
-
-RESULTS:
-"""
-        
-        for value in lab['lab_values']:
-            status_symbol = "✅" if value["status"] == "normal" else "⚠️" if value["status"] in ["high", "low"] else "❌"
-            text += f"""
-{status_symbol} {value['test_name']}: {value['value']} {value['unit']} (normal: {value['reference_range']})
-"""
-        
-        if lab['trend_data']:
-            text += "\nTREND DATA:\n"
-            for trend in lab['trend_data']:
-                text += f"\nDate: {trend['date']}\n"
-                for value in trend['values']:
-                    text += f"  {value['test_name']}: {value['value']} {value['unit']}\n"
-        
-        text += f"\nCLINICAL NOTES:\n{lab['clinical_notes']}\n"
-        
-        return text
-    
-    def _format_eob_as_text(self, eob: Dict[str, Any]) -> str:
-        """Formats EOB as text"""
-        text = f"""
-EXPLANATION OF BENEFITS (EOB)
-
-Insurance Company: {eob['insurance_company']['name']}
-Claim Number: {eob['claim_number']}
-
-Patient: {eob['patient']['name']}
-Member ID: {eob['patient']['member_id']}
-
-Provider: {eob['provider']['name']}
-NPI: {eob['provider']['npi']}
-
-Service Date: {eob['service_date']}
-Processed Date: {eob['processed_date']}
-
-COVERAGE DETAILS:
-"""
-        
-        for service in eob['services']:
-            status_symbol = "✅" if service['coverage_status'] == "covered" else "❌"
-            text += f"""
-{status_symbol} Code: {service['code']}
-   Description: {service['description']}
-   Date: {service['date']}
-   Billed Amount: ${service['billed_amount']}
-   Insurance Payment: ${service['insurance_payment']}
-   Patient Responsibility: ${service['patient_responsibility']}
-"""
-            if service['denial_reason']:
-                text += f"   Denial Reason: {service['denial_reason']}\n"
-        
-        return text
+        return format_document(data, style="document")
 
 
 def main():
     """Main function for generating test data"""
+    parser = argparse.ArgumentParser(description="Test data generator for BillDecoder/LabDecoder")
+    parser.add_argument("--stress", action="store_true",
+                        help="generate stress-scale documents instead of the regular corpus")
+    parser.add_argument("--profile", choices=sorted(STRESS_PROFILES),
+                        help="stress profile (number of service lines)")
+    parser.add_argument("--sizes", default="10,50,100,500,1000",
+                        help="comma-separated service line counts for --stress")
+    parser.add_argument("--output-dir", default="stress-data", help="output directory for --stress")
+    args = parser.parse_args()
+    
     generator = TestDataGenerator()
     
+    if args.stress:
+        history_points = None
+        if args.profile:
+            sizes = [STRESS_PROFILES[args.profile]["service_lines"]]
+            history_points = STRESS_PROFILES[args.profile]["history_points"]
+        else:
+            sizes = [int(size) for size in args.sizes.split(",")]
+        print(f"Generating stress documents for sizes: {sizes}")
+        manifest = generator.generate_stress_corpus(sizes, args.output_dir, history_points)
+        print(f"\n✅ Stress generation completed: {len(manifest)} documents in {args.output_dir}/")
+        return
+    
     # Create directories for different data types
     os.makedirs("test-data/bills", exist_ok=True)
     os.makedirs("test-data/lab-results", exist_ok=True)
@@ -791,6 +811,9 @@ def main():
     generator.save_test_data(denied_eob, "edge-cases/eob_multiple_denials.json")
     generator.save_test_data(denied_eob, "edge-cases/eob_multiple_denials.txt")
     
+    # Эталонная разметка корпуса для evaluate-ground-truth.py
+    generator.save_ground_truth()
+    
     print(f"\n✅ Generation completed!")
     print(f"📁 Files created:")
     print(f"   - Medical Bills: 20 files")
@@ -7,6 +7,8 @@ import json
 import requests
 import time
 
+from document_formatter import format_document
+
 def test_eob():
     """Тестирует анализ EOB документов"""
     
@@ -47,40 +49,7 @@ def test_eob():
         return
     
     # Форматируем документ для промта
-    document_text = f"""
-EXPLANATION OF BENEFITS (EOB)
-
-Patient: {eob_data['patient']['name']}
-Member ID: {eob_data['patient']['member_id']}
-Date of Service: {eob_data['service_date']}
-Provider: {eob_data['provider']['name']}
-Insurance: {eob_data['insurance_company']['name']}
-Claim Number: {eob_data['claim_number']}
-
-Claim Details:
-"""
-    for service in eob_data.get("services", []):
-        document_text += f"""
-Service: {service['description']}
-Code: {service['code']}
-Date: {service.get('date', 'N/A')}
-Billed Amount: ${service['billed_amount']}
-Insurance Paid: ${service['insurance_payment']}
-Patient Responsibility: ${service['patient_responsibility']}
-Coverage Status: {service['coverage_status']}
-"""
-    
-    # Вычисляем общие суммы
-    total_billed = sum(service['billed_amount'] for service in eob_data.get("services", []))
-    total_insurance = sum(service['insurance_payment'] for service in eob_data.get("services", []))
-    total_patient = sum(service['patient_responsibility'] for service in eob_data.get("services", []))
-    
-    document_text += f"""
-Financial Summary:
-Total Billed: ${total_billed:.2f}
-Insurance Payment: ${total_insurance:.2f}
-Patient Responsibility: ${total_patient:.2f}
-"""
+    document_text = format_document(eob_data)
     
     # Промт для анализа EOB
     prompt = """You are a healthcare financial counselor helping patients understand their insurance EOB. Analyze this document and provide:
@@ -7,6 +7,8 @@ import json
 import requests
 import time
 
+from document_formatter import format_document
+
 def test_lab_results():
     """Тестирует анализ лабораторных результатов"""
     
@@ -47,21 +49,7 @@ def test_lab_results():
         return
     
     # Форматируем документ для промта
-    document_text = f"""
-LABORATORY RESULTS
-
-Patient: {lab_data['patient']['name']}
-Test Date: {lab_data['test_date']}
-Laboratory: {lab_data['provider']['name']}
-
-Results:
-"""
-    for value in lab_data.get("lab_values", []):
-        status_symbol = "✅" if value["status"] == "normal" else "⚠️" if value["status"] in ["high", "low"] else "❌"
-        document_text += f"{status_symbol} {value['test_name']}: {value['value']} {value['unit']} (normal: {value['reference_range']})\n"
-    
-    if lab_data.get('clinical_notes'):
-        document_text += f"\nClinical Notes: {lab_data['clinical_notes']}"
+    document_text = format_document(lab_data)
     
     # Промт для анализа лабораторных результатов
     prompt = """You are a medical educator helping patients understand their lab results. Analyze these lab values and provide:
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Локальная оценка числа токенов для BillDecoder/LabDecoder
+Калибруется по `usage` и длине отправленных сообщений из сохраненных сессий
+(compact_test_*.json) и позволяет заранее
+спланировать токены, стоимость и время прогона, а также отклонить запросы сверх бюджета
+"""
+
+import glob
+import heapq
+import json
+import math
+import os
+import statistics
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from blob_store import DEFAULT_BLOB_PATH, BlobStore, load_blob_texts, result_text
+from document_formatter import format_document
+
+# Среднее число символов на токен для англоязычного медицинского текста
+CHARS_PER_TOKEN = 4.0
+
+# Стоимость по умолчанию, USD за 1000 токенов (переопределяется флагами --price-*)
+DEFAULT_INPUT_PRICE_PER_1K = 0.003
+DEFAULT_OUTPUT_PRICE_PER_1K = 0.015
+
+DEFAULT_RESULTS_PATTERN = "test-results/compact_test_*.json"
+
+# Стили форматтера для поля document_format в результатах
+_RESULT_FORMAT_STYLES = {"verbose": "prompt", "compact": "compact"}
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубо оценивает число токенов по длине текста"""
+    return int(math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def build_message(prompt_text: str, document_text: str) -> str:
+    """Сообщение в том же виде, в каком его отправляют тестировщики"""
+    return f"{prompt_text}\n\n[DOCUMENT]\n{document_text}"
+
+
+class TokenEstimator:
+    """Линейная модель токенов и задержки, откалиброванная по сохраненным сессиям"""
+
+    def __init__(self, tokens_per_char: float = 1 / CHARS_PER_TOKEN, input_intercept: float = 0.0,
+                 output_tokens_by_prompt: Dict[str, float] = None, default_output_tokens: float = 400.0,
+                 latency_intercept: float = 1.0, latency_per_output_token: float = 0.02,
+                 samples: int = 0):
+        self.tokens_per_char = tokens_per_char
+        self.input_intercept = input_intercept
+        self.output_tokens_by_prompt = output_tokens_by_prompt or {}
+        self.default_output_tokens = default_output_tokens
+        self.latency_intercept = latency_intercept
+        self.latency_per_output_token = latency_per_output_token
+        self.samples = samples
+
+    @classmethod
+    def from_results(cls, pattern: str = DEFAULT_RESULTS_PATTERN, blobs: Optional[BlobStore] = None,
+                     blob_path: str = DEFAULT_BLOB_PATH) -> "TokenEstimator":
+        """Калибрует модель по файлам результатов; без данных возвращает эвристику CHARS_PER_TOKEN
+
+        Длина сообщения берется из metrics.message_chars, записанной при отправке. В сессиях
+        без нее сообщение восстанавливается из текста промта (встроенного или из хранилища
+        блобов) и документа document_file; результаты, для которых нет ни того ни другого,
+        калибруют только выход и задержку
+        """
+        message_chars, input_tokens, output_tokens, response_times = [], [], [], []
+        outputs_by_prompt = {}
+        documents: Dict[Tuple[str, str], str] = {}
+
+        for results_file in sorted(glob.glob(pattern)):
+            with open(results_file, 'r', encoding='utf-8') as f:
+                session = json.load(f)
+
+            results = [result for result in session.get("results", [])
+                       if result.get("success") and (result.get("metrics") or {}).get("input_tokens")]
+            texts = {}
+            if blobs is not None or os.path.exists(blob_path):
+                texts = load_blob_texts([result for result in results
+                                         if not result["metrics"].get("message_chars")],
+                                        blobs, blob_path, ("prompt_text",))
+
+            for result in results:
+                metrics = result["metrics"]
+                output_tokens.append(metrics.get("output_tokens", 0))
+                response_times.append(result["response_time"])
+                outputs_by_prompt.setdefault(result["prompt_type"], []).append(metrics.get("output_tokens", 0))
+                chars = metrics.get("message_chars") or cls._rebuilt_message_chars(result, texts, documents)
+                if chars:
+                    message_chars.append(chars)
+                    input_tokens.append(metrics["input_tokens"])
+
+        if not output_tokens:
+            return cls()
+
+        tokens_per_char, input_intercept = 1 / CHARS_PER_TOKEN, 0.0
+        if len(set(message_chars)) > 1:
+            tokens_per_char, input_intercept = statistics.linear_regression(message_chars, input_tokens)
+        if len(set(output_tokens)) > 1:
+            latency_per_output_token, latency_intercept = statistics.linear_regression(output_tokens, response_times)
+        else:
+            latency_per_output_token, latency_intercept = 0.0, statistics.mean(response_times)
+
+        return cls(
+            tokens_per_char=tokens_per_char,
+            input_intercept=input_intercept,
+            output_tokens_by_prompt={name: statistics.mean(values) for name, values in outputs_by_prompt.items()},
+            default_output_tokens=statistics.mean(output_tokens),
+            latency_intercept=max(latency_intercept, 0.0),
+            latency_per_output_token=max(latency_per_output_token, 0.0),
+            samples=len(output_tokens)
+        )
+
+    @staticmethod
+    def _rebuilt_message_chars(result: Dict[str, Any], texts: Dict[str, str],
+                               documents: Dict[Tuple[str, str], str]) -> Optional[int]:
+        """Длина сообщения, восстановленного из промта и документа результата (None — восстановить нечем)"""
+        prompt_text = result_text(result, "prompt_text", texts)
+        document_file = result.get("document_file") or ""
+        if prompt_text is None or not os.path.exists(document_file):
+            return None
+        style = _RESULT_FORMAT_STYLES.get(result.get("document_format", "verbose"), "prompt")
+        key = (document_file, style)
+        if key not in documents:
+            with open(document_file, 'r', encoding='utf-8') as f:
+                documents[key] = format_document(json.load(f), style)
+        return len(build_message(prompt_text, documents[key]))
+
+    def estimate_input_tokens(self, message: str) -> int:
+        """Оценка входных токенов сообщения"""
+        return max(1, int(round(self.tokens_per_char * len(message) + self.input_intercept)))
+
+    def estimate_output_tokens(self, prompt_type: Optional[str] = None) -> int:
+        """Оценка выходных токенов ответа на промт"""
+        return int(round(self.output_tokens_by_prompt.get(prompt_type, self.default_output_tokens)))
+
+    def estimate_latency(self, output_tokens: int) -> float:
+        """Оценка времени ответа в секундах"""
+        return self.latency_intercept + self.latency_per_output_token * output_tokens
+
+    def estimate_call(self, message: str, prompt_type: Optional[str] = None) -> Dict[str, Any]:
+        """Оценка одного запроса: токены и время"""
+        input_tokens = self.estimate_input_tokens(message)
+        output_tokens = self.estimate_output_tokens(prompt_type)
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+            "response_time": self.estimate_latency(output_tokens)
+        }
+
+
+class TokenBudget:
+    """Ограничение токенов на запрос и на сессию; проверяется до отправки запроса"""
+
+    def __init__(self, max_call_tokens: Optional[int] = None, max_session_tokens: Optional[int] = None):
+        self.max_call_tokens = max_call_tokens
+        self.max_session_tokens = max_session_tokens
+        self.used_tokens = 0
+        self.reserved_tokens = 0
+        self.refused_calls = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, estimated_tokens: int) -> Optional[str]:
+        """Резервирует токены под запрос; возвращает причину отказа или None"""
+        with self._lock:
+            if self.max_call_tokens is not None and estimated_tokens > self.max_call_tokens:
+                self.refused_calls += 1
+                return f"~{estimated_tokens} токенов на запрос превышают лимит {self.max_call_tokens}"
+            if (self.max_session_tokens is not None
+                    and self.used_tokens + self.reserved_tokens + estimated_tokens > self.max_session_tokens):
+                self.refused_calls += 1
+                return (f"~{estimated_tokens} токенов превысят лимит сессии {self.max_session_tokens} "
+                        f"(израсходовано {self.used_tokens})")
+            self.reserved_tokens += estimated_tokens
+            return None
+
+    def commit(self, estimated_tokens: int, actual_tokens: int):
+        """Заменяет резерв фактическим расходом после ответа API"""
+        with self._lock:
+            self.reserved_tokens -= estimated_tokens
+            self.used_tokens += actual_tokens
+
+
+def plan_calls(estimator: TokenEstimator, calls: List[Tuple[str, str, str]], concurrency: int = 1,
+               budget: Optional[TokenBudget] = None, input_price_per_1k: float = DEFAULT_INPUT_PRICE_PER_1K,
+               output_price_per_1k: float = DEFAULT_OUTPUT_PRICE_PER_1K) -> Dict[str, Any]:
+    """Планирует прогон матрицы: calls — список (document_type, prompt_type, message)"""
+    per_cell = {}
+    workers = [0.0] * max(1, concurrency)
+    totals = {"calls": 0, "refused_calls": 0, "input_tokens": 0, "output_tokens": 0, "call_seconds": 0.0}
+
+    for document_type, prompt_type, message in calls:
+        estimate = estimator.estimate_call(message, prompt_type)
+        cell = per_cell.setdefault((document_type, prompt_type), {"calls": 0, "refused_calls": 0,
+                                                                  "input_tokens": 0, "output_tokens": 0})
+        if budget is not None and budget.reserve(estimate["total_tokens"]) is not None:
+            cell["refused_calls"] += 1
+            totals["refused_calls"] += 1
+            continue
+
+        cell["calls"] += 1
+        cell["input_tokens"] += estimate["input_tokens"]
+        cell["output_tokens"] += estimate["output_tokens"]
+        totals["calls"] += 1
+        totals["input_tokens"] += estimate["input_tokens"]
+        totals["output_tokens"] += estimate["output_tokens"]
+        totals["call_seconds"] += estimate["response_time"]
+        # Запрос уходит первому освободившемуся воркеру
+        heapq.heapreplace(workers, workers[0] + estimate["response_time"])
+
+    totals["total_tokens"] = totals["input_tokens"] + totals["output_tokens"]
+    totals["cost"] = (totals["input_tokens"] * input_price_per_1k
+                      + totals["output_tokens"] * output_price_per_1k) / 1000
+    totals["wall_seconds"] = max(workers)
+    totals["concurrency"] = len(workers)
+
+    return {"totals": totals, "per_cell": per_cell}
+
+
+def print_plan(plan: Dict[str, Any], estimator: TokenEstimator):
+    """Выводит план прогона в консоль"""
+    totals = plan["totals"]
+    calibration = f"{estimator.samples} сохраненных ответов" if estimator.samples else "эвристика, нет данных"
+    print(f"\n🧮 План прогона (калибровка: {calibration})")
+    print("| Тип документа | Промт | Запросов | Отклонено | Входные токены | Выходные токены |")
+    print("|---------------|-------|----------|-----------|----------------|-----------------|")
+    for (document_type, prompt_type), cell in sorted(plan["per_cell"].items()):
+        print(f"| {document_type} | {prompt_type} | {cell['calls']} | {cell['refused_calls']} | "
+              f"{cell['input_tokens']} | {cell['output_tokens']} |")
+    print(f"\n📊 Запросов: {totals['calls']} (отклонено бюджетом: {totals['refused_calls']})")
+    print(f"🔤 Токены: {totals['total_tokens']} (вход {totals['input_tokens']}, выход {totals['output_tokens']})")
+    print(f"💰 Стоимость: ${totals['cost']:.4f}")
+    print(f"⏱️ Время: ~{totals['wall_seconds'] / 60:.1f} мин при параллельности {totals['concurrency']} "
+          f"(суммарно {totals['call_seconds'] / 60:.1f} мин запросов)")